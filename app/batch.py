@@ -0,0 +1,308 @@
+# File: batch.py
+# Author: William Jahner
+#
+# Non-interactive batch mode of the New Parent AI Assistant, for
+# regression runs and bulk content QA. Questions are read from a JSON
+# lines or CSV file (or stdin), routed through the same milestone,
+# lookup and NLP logic as the interactive assistant, answered in batches
+# on worker threads or processes, and streamed as JSON lines with the
+# route, the answer, the retrieved entries and the timings of each
+# question. Only a few batches are held in memory at a time, so the
+# question file can be of any size.
+#
+#   python -m app.batch questions.jsonl --output answers.jsonl
+#   python -m app.batch questions.csv --worker-processes 4 > answers.jsonl
+#   cat questions.jsonl | python -m app.batch - --no-entries
+
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from .main import NewParentAIAssistantApp, ROUTE_NLP, RETRIEVAL_DENSE, RETRIEVAL_LEXICAL, RETRIEVAL_MODES, \
+    DEFAULT_DIRECT_ANSWER_MARGIN
+from .services.ai_service import BACKEND_TORCH, INFERENCE_BACKENDS, DEFAULT_CASCADE_SCORE
+from .services.embedding_cache import DEFAULT_CACHE_DIR
+from .services.kb_loader import DEFAULT_KB_PATH, load_knowledge_base
+from .services.model_registry import FAST_QA_MODEL_NAME
+from .workers import WorkerPool, worker_app
+
+# Question file formats
+FORMAT_JSONL = "jsonl"
+FORMAT_CSV = "csv"
+QUESTION_FORMATS = (FORMAT_JSONL, FORMAT_CSV)
+
+# Default number of questions answered per batch
+DEFAULT_BATCH_SIZE = 64
+
+# Number of entries retrieved for (and reported with) each NLP question
+RETRIEVED_ENTRIES = 3
+
+######################################################################
+# Module: question_format
+# Description: Infers the format of a question file from its name.
+# Input:
+#   - path: the path of the file ("-" for stdin)
+# Returns: "csv" for .csv files, otherwise "jsonl"
+######################################################################
+def question_format(path):
+    return FORMAT_CSV if str(path).lower().endswith(".csv") else FORMAT_JSONL
+
+######################################################################
+# Module: read_questions
+# Description: Streams the questions of a question file. A JSON lines
+#              file holds one object with a "question" (and optionally
+#              an "id") per line, or one JSON string per line; a CSV
+#              file has a header with a "question" (and optionally an
+#              "id") column. Questions without an ID are numbered by
+#              their position in the file, and blank questions are
+#              skipped.
+# Input:
+#   - f: a text file object of the questions
+#   - file_format: "jsonl" or "csv"
+# Returns: a generator of (ID, question) tuples
+######################################################################
+def read_questions(f, file_format=FORMAT_JSONL):
+    if file_format not in QUESTION_FORMATS:
+        raise ValueError(f"Unknown question format '{file_format}' (expected one of {QUESTION_FORMATS})")
+
+    if file_format == FORMAT_CSV:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None or "question" not in reader.fieldnames:
+            raise ValueError("The CSV question file needs a 'question' column")
+        rows = enumerate(reader, start=1)
+    else:
+        rows = ((number, json.loads(line)) for number, line in enumerate(f, start=1) if line.strip())
+
+    for number, row in rows:
+        if isinstance(row, str):
+            row = {"question": row}
+        if not isinstance(row, dict) or not isinstance(row.get("question"), str):
+            raise ValueError(f"Question {number} has no 'question' string")
+        question = row["question"].strip()
+        if not question:
+            continue
+        item_id = row.get("id")
+        yield (number if item_id in (None, "") else item_id, question)
+
+######################################################################
+# Module: answer_records
+# Description: Answers a batch of questions. Questions the milestone
+#              list or the structured lookup can answer are answered one
+#              by one; the NLP questions are encoded once and answered
+#              together by retrieval and the QA model (without the
+#              answer cache, so every question is answered afresh).
+# Input:
+#   - app: the NewParentAIAssistantApp
+#   - items: the list of (ID, question) tuples
+#   - with_entries: whether the retrieved entries of the NLP questions
+#                   are reported
+# Returns: the list of result records, in the order of the items. Each
+#          record has the "id", "question", "route", "answer" and
+#          "timings_ms" ("route", and for NLP questions "nlp": their
+#          share of the batched NLP time), and "entries" with the label
+#          and similarity of each retrieved entry when requested.
+######################################################################
+def answer_records(app, items, with_entries=True):
+    records, nlp = [], []
+    for item_id, question in items:
+        start = time.perf_counter()
+        route, answer = app.respond_without_model(question)
+        record = {"id": item_id, "question": question, "route": route, "answer": answer,
+                  "timings_ms": {"route": round((time.perf_counter() - start) * 1000, 3)}}
+        if route == ROUTE_NLP:
+            nlp.append(record)
+        records.append(record)
+    if not nlp:
+        return records
+
+    start = time.perf_counter()
+    questions = [record["question"] for record in nlp]
+    q_embeds = None
+    if app.retrieval_mode != RETRIEVAL_LEXICAL:
+        q_embeds = app.encode_questions(questions)
+    ranked, snapshot = None, app.snapshot
+    if with_entries:
+        # The retrieved entries are also the ones the answers are read from
+        ranked = app.search_entries_batch(questions, RETRIEVED_ENTRIES, q_embeds=q_embeds, snapshot=snapshot)
+        for record, (indices, similarities) in zip(nlp, ranked):
+            record["entries"] = [{"label": snapshot.store.label(i), "similarity": None if s is None else round(s, 4)}
+                                 for i, s in zip(indices, similarities)]
+    answers = app.read_answers(questions, q_embeds, ranked=ranked, snapshot=snapshot)
+    nlp_ms = round((time.perf_counter() - start) * 1000 / len(nlp), 3)
+    for record, answer in zip(nlp, answers):
+        record["answer"] = answer
+        record["timings_ms"]["nlp"] = nlp_ms
+    return records
+
+######################################################################
+# Module: answer_records_in_worker
+# Description: Answers a batch of questions in a worker process (see
+#              answer_records).
+# Input:
+#   - items: the list of (ID, question) tuples
+#   - with_entries: whether the retrieved entries are reported
+# Returns: the list of result records
+######################################################################
+def answer_records_in_worker(items, with_entries=True):
+    return answer_records(worker_app(), items, with_entries)
+
+######################################################################
+# Module: batches
+# Description: Splits a stream into lists of at most batch_size items
+#              without reading it ahead.
+# Input:
+#   - items: an iterable
+#   - batch_size: the maximum number of items per batch
+# Returns: a generator of lists
+######################################################################
+def batches(items, batch_size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+######################################################################
+# Module: run_batches
+# Description: Answers a stream of questions batch by batch and yields
+#              the records in input order. At most max_pending batches
+#              are submitted to the executor ahead of the one being
+#              yielded, which bounds the memory held by the run.
+# Input:
+#   - process_batch: a blocking callable taking a list of (ID, question)
+#                    tuples and returning their records
+#   - items: an iterable of (ID, question) tuples
+#   - batch_size: the number of questions per batch
+#   - executor: optional executor the batches run on (None runs them in
+#               the calling thread)
+#   - max_pending: the number of batches in flight
+# Returns: a generator of result records
+######################################################################
+def run_batches(process_batch, items, batch_size=DEFAULT_BATCH_SIZE, executor=None, max_pending=2):
+    if executor is None:
+        for batch in batches(items, batch_size):
+            yield from process_batch(batch)
+        return
+
+    pending = deque()
+    for batch in batches(items, batch_size):
+        pending.append(executor.submit(process_batch, batch))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+######################################################################
+# Module: write_records
+# Description: Writes result records as JSON lines.
+# Input:
+#   - records: an iterable of result records
+#   - f: the text file object written to
+# Returns: a Counter of the number of records per route
+######################################################################
+def write_records(records, f):
+    routes = Counter()
+    for record in records:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        routes[record["route"]] += 1
+    f.flush()
+    return routes
+
+######################################################################
+# Module: main
+# Description: The batch mode's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions with the New Parent AI Assistant")
+    parser.add_argument("questions", help="JSON lines or CSV question file ('-' reads JSON lines from stdin)")
+    parser.add_argument("--format", choices=QUESTION_FORMATS, default=None,
+                        help="question file format (defaults to the file extension)")
+    parser.add_argument("--output", default="-", help="JSON lines file the results are written to ('-' for stdout)")
+    parser.add_argument("--knowledge-base", default=str(DEFAULT_KB_PATH), help="knowledge base JSON file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="questions per batch")
+    parser.add_argument("--workers", type=int, default=1, help="inference worker threads")
+    parser.add_argument("--worker-processes", type=int, default=0,
+                        help="answer the batches in this many processes sharing the knowledge base embeddings "
+                             "(0 uses --workers threads)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="intra-op threads of each worker process (defaults to the cores split between them)")
+    parser.add_argument("--no-entries", action="store_true", help="do not report the retrieved entries")
+    parser.add_argument("--backend", choices=sorted(INFERENCE_BACKENDS), default=BACKEND_TORCH,
+                        help="inference backend (onnx needs the models exported with app.services.onnx_backend)")
+    parser.add_argument("--quantized", action="store_true", help="use the int8 ONNX models")
+    parser.add_argument("--fast-reader", default=None,
+                        help=f"small QA model reading every question first, e.g. {FAST_QA_MODEL_NAME} "
+                             "(questions it is not confident about escalate to the QA model; the onnx backend reads the "
+                             "one exported with --fast-qa-model)")
+    parser.add_argument("--cascade-score", type=float, default=DEFAULT_CASCADE_SCORE,
+                        help="span score under which the fast reader's answer escalates to the QA model")
+    parser.add_argument("--retrieval-mode", choices=RETRIEVAL_MODES, default=RETRIEVAL_DENSE,
+                        help="embedding, hybrid (embedding + BM25) or lexical (BM25 only) retrieval")
+    parser.add_argument("--direct-answer-score", type=float, default=None,
+                        help="cosine similarity from which the top entry answers without the QA model")
+    parser.add_argument("--direct-answer-margin", type=float, default=DEFAULT_DIRECT_ANSWER_MARGIN,
+                        help="similarity the top entry must beat the runner-up by to skip the QA model")
+    args = parser.parse_args()
+
+    ai_options = {"backend": args.backend, "quantized": args.quantized,
+                  "fast_qa_model_name": args.fast_reader, "cascade_score": args.cascade_score}
+    app_options = {"ai_options": ai_options, "retrieval_mode": args.retrieval_mode,
+                   "direct_answer_score": args.direct_answer_score, "direct_answer_margin": args.direct_answer_margin}
+    app = NewParentAIAssistantApp(load_knowledge_base(args.knowledge_base), cache_dir=DEFAULT_CACHE_DIR,
+                                  **app_options)
+    with_entries = not args.no_entries
+
+    worker_pool, executor = None, None
+    if args.worker_processes > 0:
+        worker_pool = WorkerPool(app, args.worker_processes, app_options=app_options,
+                                 threads=args.threads_per_worker)
+        app.store.embeddings = None
+        worker_pool.warm_up()
+        executor, workers = worker_pool.executor, args.worker_processes
+        process_batch = partial(answer_records_in_worker, with_entries=with_entries)
+    else:
+        app.warm_up()
+        workers = args.workers
+        if workers > 1:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        process_batch = partial(answer_records, app, with_entries=with_entries)
+
+    file_format = args.format or question_format(args.questions)
+    input_file = sys.stdin if args.questions == "-" else open(args.questions, "r", encoding="utf-8", newline="")
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        records = run_batches(process_batch, read_questions(input_file, file_format), args.batch_size, executor,
+                              max_pending=2 * workers)
+        routes = write_records(records, output_file)
+    except ValueError as e:
+        sys.exit(f"{args.questions}: {e}")
+    finally:
+        for f in (input_file, output_file):
+            if f not in (sys.stdin, sys.stdout):
+                f.close()
+        if worker_pool is not None:
+            worker_pool.close()
+        elif executor is not None:
+            executor.shutdown(wait=True)
+
+    elapsed = time.perf_counter() - start
+    total = sum(routes.values())
+    by_route = ", ".join(f"{route}: {count}" for route, count in sorted(routes.items()))
+    print(f"Answered {total} questions in {elapsed:.1f} s ({total / max(elapsed, 1e-9):.1f} q/s; {by_route})",
+          file=sys.stderr)
+
+###############################
+### Entry point of batch.py ###
+###############################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# File: faq_builder.py
+# Author: William Jahner
+#
+# Offline builder of the FAQ table (app.services.faq_table). Likely
+# questions are generated for every label of the knowledge base, routed
+# like live questions, and the ones that need the NLP path are answered
+# in batches (on worker processes like app.batch) and stored with their
+# embeddings and the labels of the entries their answers were read
+# from. An existing table is updated incrementally: only the labels
+# whose entries, or whose answers' entries, were added or changed since
+# its build are answered again, and the table is rebuilt from scratch
+# when the models differ. Serve it with python -m app.server --faq-table data/faq_table.
+#
+#   python -m app.faq_builder
+#   python -m app.faq_builder --worker-processes 4 --output data/faq_table
+#   python -m app.faq_builder --rebuild --fast-reader deepset/tinyroberta-squad2
+
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+from .batch import answer_records, answer_records_in_worker, run_batches, DEFAULT_BATCH_SIZE
+from .main import NewParentAIAssistantApp, ROUTE_NLP
+from .services.ai_service import BACKEND_TORCH, INFERENCE_BACKENDS, DEFAULT_CASCADE_SCORE
+from .services.embedding_cache import DEFAULT_CACHE_DIR
+from .services.faq_table import FAQTable, DEFAULT_FAQ_DIR, label_groups, paraphrase_questions
+from .services.kb_loader import DEFAULT_KB_PATH, load_knowledge_base
+from .services.model_registry import FAST_QA_MODEL_NAME
+from .workers import WorkerPool
+
+######################################################################
+# Module: table_models
+# Description: The names of the models the answers of an app depend on.
+# Input:
+#   - app: the NewParentAIAssistantApp
+# Returns: a dict of the embedding, QA and fast QA model names
+######################################################################
+def table_models(app):
+    return {"embedding": app.ai.embedding_model_name, "qa": app.ai.qa_model_name,
+            "fast_qa": app.ai.fast_qa_model_name}
+
+######################################################################
+# Module: pending_groups
+# Description: Splits the label groups of the app's knowledge base into
+#              those a previous table already holds and those to build.
+# Input:
+#   - app: the NewParentAIAssistantApp
+#   - previous: optional FAQTable of a previous build (ignored when it
+#               was built with other models)
+# Returns: a tuple (FAQTable of the kept rows, dict of {group key: label}
+#          of the groups to build)
+######################################################################
+def pending_groups(app, previous=None):
+    groups = label_groups(app.store)
+    models = table_models(app)
+    if previous is None or previous.models != models:
+        kept = FAQTable(models=models)
+    else:
+        kept = previous.retain(groups)
+    return kept, {key: label for key, label in groups.items() if key not in kept.groups}
+
+######################################################################
+# Module: build_faq_table
+# Description: Answers the paraphrases of the given label groups and
+#              adds them to a table. A paraphrase shared by several
+#              groups is answered once. Only the questions routed to the
+#              NLP path with an answer become rows (the others are
+#              answered without the QA model anyway); each row records
+#              the groups of the entries its answer was read from.
+# Input:
+#   - app: the NewParentAIAssistantApp
+#   - table: the FAQTable the rows are added to
+#   - groups: the dict of {group key: label} of the groups to build
+#   - process_batch: optional blocking callable answering a list of (ID,
+#                    question) tuples with their retrieved entries
+#                    (defaults to answer_records on the app)
+#   - executor: optional executor the batches run on
+#   - batch_size: the number of questions per batch
+#   - max_pending: the number of batches in flight
+# Returns: the new FAQTable
+######################################################################
+def build_faq_table(app, table, groups, process_batch=None, executor=None, batch_size=DEFAULT_BATCH_SIZE,
+                    max_pending=2):
+    question_groups = {}
+    for key, label in groups.items():
+        for question in paraphrase_questions(label):
+            question_groups.setdefault(question, []).append(key)
+    if process_batch is None:
+        process_batch = partial(answer_records, app)
+    label_keys = {label: key for key, label in label_groups(app.store).items()}
+
+    answered = {}
+    for record in run_batches(process_batch, enumerate(question_groups), batch_size, executor, max_pending):
+        if record["route"] == ROUTE_NLP and record["answer"]:
+            sources = sorted({label_keys[entry["label"]] for entry in record["entries"]})
+            answered[record["question"]] = (record["answer"], sources)
+    if not answered:
+        return table.extend([], [], None, [], groups)
+
+    rows = [(question, key) for question in answered for key in question_groups[question]]
+    embeddings = app.encode_questions(list(answered), batch_size)
+    positions = {question: position for position, question in enumerate(answered)}
+    return table.extend([question for question, _ in rows], [answered[question][0] for question, _ in rows],
+                        embeddings[[positions[question] for question, _ in rows]], [key for _, key in rows],
+                        groups, [answered[question][1] for question, _ in rows])
+
+######################################################################
+# Module: main
+# Description: The FAQ table builder's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Build the FAQ table of the New Parent AI Assistant")
+    parser.add_argument("--output", default=str(DEFAULT_FAQ_DIR), help="directory of the table")
+    parser.add_argument("--knowledge-base", default=str(DEFAULT_KB_PATH), help="knowledge base JSON file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="questions per batch")
+    parser.add_argument("--worker-processes", type=int, default=os.cpu_count() or 1,
+                        help="answer the batches in this many processes (1 answers them in this process)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="intra-op threads of each worker process (defaults to the cores split between them)")
+    parser.add_argument("--rebuild", action="store_true", help="answer every label again")
+    parser.add_argument("--backend", choices=sorted(INFERENCE_BACKENDS), default=BACKEND_TORCH,
+                        help="inference backend (onnx needs the models exported with app.services.onnx_backend)")
+    parser.add_argument("--quantized", action="store_true", help="use the int8 ONNX models")
+    parser.add_argument("--fast-reader", default=None,
+                        help=f"small QA model reading every question first, e.g. {FAST_QA_MODEL_NAME} "
+                             "(the onnx backend reads the one exported with --fast-qa-model)")
+    parser.add_argument("--cascade-score", type=float, default=DEFAULT_CASCADE_SCORE,
+                        help="span score under which the fast reader's answer escalates to the QA model")
+    args = parser.parse_args()
+
+    ai_options = {"backend": args.backend, "quantized": args.quantized,
+                  "fast_qa_model_name": args.fast_reader, "cascade_score": args.cascade_score}
+    app = NewParentAIAssistantApp(load_knowledge_base(args.knowledge_base), cache_dir=DEFAULT_CACHE_DIR,
+                                  ai_options=ai_options)
+    previous = None if args.rebuild else FAQTable.load(args.output)
+    table, groups = pending_groups(app, previous)
+
+    start = time.perf_counter()
+    worker_pool, executor, process_batch, workers = None, None, None, 1
+    if groups and args.worker_processes > 1:
+        worker_pool = WorkerPool(app, args.worker_processes, app_options={"ai_options": ai_options},
+                                 threads=args.threads_per_worker)
+        worker_pool.warm_up()
+        executor, workers = worker_pool.executor, args.worker_processes
+        process_batch = answer_records_in_worker
+    try:
+        new_table = build_faq_table(app, table, groups, process_batch, executor, args.batch_size,
+                                    max_pending=2 * workers)
+    finally:
+        if worker_pool is not None:
+            worker_pool.close()
+    new_table.save(args.output)
+
+    elapsed = time.perf_counter() - start
+    print(f"Built {len(groups)} of {len(new_table.groups)} labels in {elapsed:.1f} s: {len(new_table)} questions "
+          f"({len(new_table) - len(table)} new) written to {args.output}", file=sys.stderr)
+
+#####################################
+### Entry point of faq_builder.py ###
+#####################################
+if __name__ == "__main__":
+    main()
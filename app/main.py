@@ -1,11 +1,50 @@
 # File: main.py
 # Author: William Jahner
 
-from sentence_transformers import SentenceTransformer, util
-import torch
-from .services.ai_service import AIService
-from .services.kb_loader import load_knowledge_base
-from .services.list_service import get_milestone_list
+import copy
+import threading
+from collections import namedtuple
+import numpy as np
+from .services.ai_service import AIService, build_context, extract_sentence
+from .services.answer_cache import AnswerCache
+from .services.embedding_cache import EmbeddingCache, DEFAULT_CACHE_DIR, hash_text
+from .services.faq_table import label_groups
+from .services.intent_router import IntentRouter, ROUTE_MILESTONE, ROUTE_LOOKUP, ROUTE_NLP
+from .services.retrieval_index import create_index, fuse_rankings, normalize_rows, update_rows
+from .services.kb_loader import KnowledgeBaseWatcher
+from .services.knowledge_store import KnowledgeStore
+from .services.lexical_index import BM25Index
+from .services.list_service import MilestoneIndex
+from .services.metrics import Metrics, STAGE_RESPOND, STAGE_ROUTE, STAGE_MILESTONE_LIST, STAGE_LOOKUP, \
+    STAGE_ENCODE, STAGE_SEARCH, STAGE_INDEX_BUILD
+from .services.lookup_service import StructuredLookup, RetrievalFilters
+
+# Retrieval modes: embeddings only, embeddings fused with BM25, or BM25
+# only (the embedder is only used for questions sharing no term with
+# any entry)
+RETRIEVAL_DENSE = "dense"
+RETRIEVAL_HYBRID = "hybrid"
+RETRIEVAL_LEXICAL = "lexical"
+RETRIEVAL_MODES = (RETRIEVAL_DENSE, RETRIEVAL_HYBRID, RETRIEVAL_LEXICAL)
+
+# Entries taken from each retriever before the hybrid rankings are fused
+HYBRID_DEPTH = 20
+
+# Names of the paths an NLP answer can take: taken directly from a
+# confidently retrieved entry, or read by the QA model
+ANSWER_DIRECT = "direct"
+ANSWER_READER = "reader"
+
+# Default similarity gap between the top entry and the runner-up needed
+# to answer without the QA model
+DEFAULT_DIRECT_ANSWER_MARGIN = 0.05
+
+# The knowledge base state a request retrieves from: the store, its
+# retrieval index (None until built) and its BM25 index (None in dense
+# mode). A knowledge base edit publishes a new snapshot in one
+# assignment, and a request captures the snapshot once, so its row ids
+# always resolve against the store they were found in.
+KnowledgeSnapshot = namedtuple("KnowledgeSnapshot", ["store", "index", "lexical_index"])
 
 ######################################################################
 # Class: NewParentAIAssistantApp
@@ -16,24 +55,382 @@ class NewParentAIAssistantApp:
 
     ######################################################################
     # Module: __init__
-    # Description: Constructor for NewParentAIAssistantApp
+    # Description: Constructor for NewParentAIAssistantApp. The models
+    #              and knowledge base embeddings are loaded lazily on the
+    #              first NLP question, so routes that need no model (such
+    #              as the milestone list) start instantly.
     # Input:
     #   - self: instance of the class itself
     #   - knowledge_base: the knowledge base for the NLP model
+    #   - cache_dir: optional directory of the on-disk embedding store.
+    #                If None, every entry is encoded on first use.
+    #   - registry: optional model registry shared between apps
+    #   - index_backend: the retrieval index backend ("exact", "ivf" or
+    #                    "quantized")
+    #   - index_options: optional dict of retrieval index options
+    #   - answer_cache: optional AnswerCache for NLP answers
+    #   - ai_options: optional dict of AIService options (e.g. the
+    #                 inference backend)
+    #   - shard_sizes: optional list of (shard name, number of entries)
+    #                  of a sharded knowledge base, in knowledge base
+    #                  order. Each shard then has its own embedding store.
+    #   - embedding_dtype: the data type the embedding matrix is kept in
+    #                      ("float32" or "float16")
+    #   - infer_filters: whether retrieval is restricted to the categories
+    #                    and ages named in the question
+    #   - retrieval_mode: "dense", "hybrid" or "lexical" (see
+    #                     RETRIEVAL_MODES)
+    #   - direct_answer_score: optional cosine similarity from which the
+    #                          top entry answers the question without the
+    #                          QA model (None always runs the model)
+    #   - direct_answer_margin: the similarity the top entry must also
+    #                           beat the runner-up by
+    #   - metrics: optional Metrics the request path stages are timed in
+    #              (defaults to disabled metrics)
+    #   - router_factory: optional callable building the intent router
+    #                     from the knowledge base (defaults to
+    #                     IntentRouter)
+    #   - faq_table: optional FAQTable of answers materialized offline,
+    #                consulted after the answer cache
     # Returns: N/A
     ######################################################################
-    def __init__(self, knowledge_base):
-        # Store the raw knowledge base as label/text tuples
-        self.knowledge_base = knowledge_base
+    def __init__(self, knowledge_base, cache_dir=None, registry=None, index_backend="exact", index_options=None,
+                 answer_cache=None, ai_options=None, shard_sizes=None, embedding_dtype="float32", infer_filters=True,
+                 retrieval_mode=RETRIEVAL_DENSE, direct_answer_score=None,
+                 direct_answer_margin=DEFAULT_DIRECT_ANSWER_MARGIN, metrics=None, router_factory=None, faq_table=None):
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}' (expected one of {RETRIEVAL_MODES})")
+
+        # Keep the knowledge base (and later its embeddings) in one compact store
+        store = KnowledgeStore.from_entries(knowledge_base, embedding_dtype)
 
-        # Create the AI service
-        self.ai = AIService(knowledge_base)
+        # Stage timers and event counters (no-ops unless enabled)
+        self.metrics = metrics if metrics is not None else Metrics()
 
-        # Pre-compute labeled texts
-        self.texts = [f"{label}: {text}" for label, text in knowledge_base]
+        # Create the AI service (it reuses the app's retrieval index)
+        self.ai = AIService(store, registry=registry, retriever=self.find_best_entries, metrics=self.metrics,
+                            **(ai_options or {}))
 
-        # Pre-compute embeddings
-        self.embeddings = self.ai.embedder.encode(self.texts, convert_to_tensor=True)
+        # Build the intent router, the milestone index and the structured
+        # lookup engine once so each request they can answer is a lookup
+        self.router_factory = router_factory if router_factory is not None else IntentRouter
+        self.router = self.router_factory(store)
+        self.milestone_index = MilestoneIndex(store)
+        self.structured_lookup = StructuredLookup(store)
+
+        # The BM25 index needs no model, so it is built at load time; the
+        # retrieval index is built on first use
+        self.retrieval_mode = retrieval_mode
+        lexical_index = BM25Index(store.passages) if retrieval_mode != RETRIEVAL_DENSE else None
+        self.snapshot = KnowledgeSnapshot(store, None, lexical_index)
+
+        # Answers of previous NLP questions, and of the questions
+        # materialized from the knowledge base
+        self.answer_cache = answer_cache
+        self.faq_table = faq_table
+
+        # Confidence gate in front of the QA model, and the number of NLP
+        # answers that took each path
+        self.direct_answer_score = direct_answer_score
+        self.direct_answer_margin = direct_answer_margin
+        self.answer_paths = {ANSWER_DIRECT: 0, ANSWER_READER: 0}
+
+        # Embeddings and the retrieval index are built on first use
+        self.cache_dir = cache_dir
+        self.shard_sizes = shard_sizes
+        self.index_backend = index_backend
+        self.index_options = index_options or {}
+        self._embeddings_lock = threading.Lock()
+
+        # Rows selected by each retrieval filter, computed once per store
+        self.infer_filters = infer_filters
+        self._filter_rows = (store, {})
+
+    ######################################################################
+    # Module: store
+    # Description: The KnowledgeStore of the current snapshot
+    # Input:
+    #   - self: instance of the class
+    # Returns: the KnowledgeStore
+    ######################################################################
+    @property
+    def store(self):
+        return self.snapshot.store
+
+    ######################################################################
+    # Module: lexical_index
+    # Description: The BM25 index of the current snapshot
+    # Input:
+    #   - self: instance of the class
+    # Returns: the BM25Index, or None in dense mode
+    ######################################################################
+    @property
+    def lexical_index(self):
+        return self.snapshot.lexical_index
+
+    ######################################################################
+    # Module: texts
+    # Description: The "label: text" passages of the knowledge base, in
+    #              retrieval row order
+    # Input:
+    #   - self: instance of the class
+    # Returns: a read-only sequence of passages
+    ######################################################################
+    @property
+    def texts(self):
+        return self.store.passages
+
+    ######################################################################
+    # Module: embeddings
+    # Description: The knowledge base embedding matrix, computed on first
+    #              use (only new or edited entries are encoded when an
+    #              embedding store is used). The rows are normalized once
+    #              in the store, and the retrieval index scores against
+    #              the store's matrix.
+    # Input:
+    #   - self: instance of the class
+    # Returns: a matrix with one unit-length row per knowledge base entry,
+    #          in the store's embedding dtype
+    ######################################################################
+    @property
+    def embeddings(self):
+        return self.store_embeddings(self.store)
+
+    @embeddings.setter
+    def embeddings(self, value):
+        self.store.embeddings = None if value is None else normalize_rows(value)
+        self.snapshot = self.snapshot._replace(index=None)
+
+    ######################################################################
+    # Module: store_embeddings
+    # Description: The embedding matrix of a store, computed on first use
+    #              (see embeddings)
+    # Input:
+    #   - self: instance of the class
+    #   - store: the KnowledgeStore of a snapshot
+    # Returns: the store's embedding matrix
+    ######################################################################
+    def store_embeddings(self, store):
+        if store.embeddings is None:
+            with self._embeddings_lock, self.metrics.stage(STAGE_INDEX_BUILD):
+                if store.embeddings is None:
+                    if self.cache_dir is None:
+                        embeddings = self.ai.embedder.encode(list(store.passages), convert_to_numpy=True)
+                    elif self.shard_sizes is not None:
+                        embeddings = self.encode_shards()
+                    else:
+                        cache = EmbeddingCache(self.cache_dir, self.ai.embedding_model_name)
+                        embeddings = cache.encode(self.ai.embedder, list(store.passages))
+                    store.embeddings = normalize_rows(np.asarray(embeddings).reshape(len(store), -1))
+        return store.embeddings
+
+    ######################################################################
+    # Module: encode_shards
+    # Description: Computes the embedding matrix of a sharded knowledge
+    #              base shard by shard, each with its own embedding store,
+    #              so adding or retiring a shard leaves the stores of the
+    #              other shards untouched.
+    # Input:
+    #   - self: instance of the class
+    # Returns: a float32 matrix with one row per knowledge base entry
+    ######################################################################
+    def encode_shards(self):
+        parts = []
+        start = 0
+        for name, size in self.shard_sizes:
+            cache = EmbeddingCache(self.cache_dir, self.ai.embedding_model_name, shard=name)
+            part = cache.encode(self.ai.embedder, self.texts[start:start + size])
+            if part.shape[0]:
+                parts.append(part)
+            start += size
+        return np.vstack(parts) if parts else np.empty((0, 0), dtype=np.float32)
+
+    ######################################################################
+    # Module: index
+    # Description: The retrieval index over the embeddings, built on
+    #              first use
+    # Input:
+    #   - self: instance of the class
+    # Returns: the RetrievalIndex
+    ######################################################################
+    @property
+    def index(self):
+        return self.snapshot_index(self.snapshot)
+
+    ######################################################################
+    # Module: snapshot_index
+    # Description: The retrieval index of a snapshot, built on first use
+    #              and published with the current snapshot. A snapshot
+    #              replaced by a knowledge base edit meanwhile gets an
+    #              index of its own store for the request holding it.
+    # Input:
+    #   - self: instance of the class
+    #   - snapshot: the KnowledgeSnapshot
+    # Returns: the RetrievalIndex
+    ######################################################################
+    def snapshot_index(self, snapshot):
+        if snapshot.index is not None:
+            return snapshot.index
+
+        # The store's rows are already normalized, so the index scores
+        # against the store's matrix without a copy of its own
+        embeddings = self.store_embeddings(snapshot.store)
+        options = dict(self.index_options, normalized=True)
+        with self._embeddings_lock, self.metrics.stage(STAGE_INDEX_BUILD):
+            current = self.snapshot
+            if current.store is not snapshot.store:
+                return create_index(self.index_backend, embeddings, **options)
+            if current.index is None:
+                current = current._replace(index=create_index(self.index_backend, embeddings, **options))
+                self.snapshot = current
+        return current.index
+
+    ######################################################################
+    # Module: warm_up
+    # Description: Loads the models and embeddings ahead of the first
+    #              NLP question.
+    # Input:
+    #   - self: instance of the class
+    # Returns: N/A
+    ######################################################################
+    def warm_up(self):
+        # Accessing the lazy attributes loads them
+        self.ai.qa_pipeline
+        self.ai.embedder
+        self.index
+
+    ######################################################################
+    # Module: update_knowledge_base
+    # Description: Applies a knowledge base edit to the running app. Only
+    #              the added and changed entries are encoded, and only
+    #              their rows of the embedding matrix and retrieval index
+    #              are updated. The intent router, the milestone index and
+    #              the structured lookup are rebuilt (they need no model).
+    #              The new store and indexes are published as one
+    #              snapshot, then the reader's pre-tokenized passages are
+    #              refreshed, cached answers are dropped (including those
+    #              still being read from the old snapshot) and so are the
+    #              FAQ table groups of the changed labels or with answers
+    #              read from them.
+    # Input:
+    #   - self: instance of the class
+    #   - knowledge_base: the new list of (label, text) tuples
+    #   - diff: the KnowledgeBaseDiff from the current knowledge base
+    # Returns: N/A
+    ######################################################################
+    def update_knowledge_base(self, knowledge_base, diff):
+        with self._embeddings_lock:
+            # Find the row of each removed or changed entry
+            snapshot = self.snapshot
+            store = snapshot.store
+            rows = {}
+            for row, entry in enumerate(store):
+                rows.setdefault(entry, []).append(row)
+            replaced = [rows[tuple(old)].pop() for old, _ in diff.changed]
+            deleted = sorted(rows[tuple(entry)].pop() for entry in diff.removed)
+
+            # Retrieval rows: edited in place, deleted, then appended
+            entries = list(store)
+            for row, (_, new) in zip(replaced, diff.changed):
+                entries[row] = tuple(new)
+            deleted_rows = set(deleted)
+            entries = [entry for row, entry in enumerate(entries) if row not in deleted_rows]
+            entries.extend(tuple(entry) for entry in diff.added)
+            new_store = KnowledgeStore.from_entries(entries, store.embedding_dtype)
+
+            embeddings, index = store.embeddings, snapshot.index
+            if embeddings is not None:
+                new_rows = replaced + list(range(len(entries) - len(diff.added), len(entries)))
+                new_texts = [new_store.passage(row) for row in new_rows]
+                new_embeddings = np.empty((0, embeddings.shape[1]), dtype=np.float32)
+                if new_texts:
+                    encoded = self.ai.embedder.encode(new_texts, convert_to_numpy=True)
+                    new_embeddings = normalize_rows(np.asarray(encoded).reshape(len(new_texts), -1))
+                replaced_embeddings, appended_embeddings = np.split(new_embeddings, [len(replaced)])
+                embeddings = update_rows(embeddings, replaced, replaced_embeddings, deleted, appended_embeddings)
+
+                # Searches keep using the old index until the new one is
+                # swapped in; the new index shares the new store's matrix
+                if index is not None:
+                    index = copy.copy(index)
+                    index.update(replaced, replaced_embeddings, deleted, appended_embeddings, vectors=embeddings)
+
+                # The rows of a sharded knowledge base are no longer grouped
+                # by shard; its shard stores are refreshed on the next start
+                if self.cache_dir is not None and self.shard_sizes is None:
+                    cache = EmbeddingCache(self.cache_dir, self.ai.embedding_model_name)
+                    cache.save([hash_text(text) for text in new_store.passages], embeddings)
+                new_store.embeddings = embeddings
+
+            lexical_index = BM25Index(new_store.passages) if snapshot.lexical_index is not None else None
+            self.router = self.router_factory(knowledge_base)
+            self.milestone_index = MilestoneIndex(knowledge_base)
+            self.structured_lookup = StructuredLookup(knowledge_base)
+            self.snapshot = KnowledgeSnapshot(new_store, index, lexical_index)
+            self.shard_sizes = None
+
+            # The reader's passage cache is keyed by text, so contexts of
+            # the old snapshot are still read correctly (tokenized afresh)
+            self.ai.context, self.ai.passages = new_store, new_store.passages
+            self.ai.tokenize_passages()
+            if self.faq_table is not None:
+                self.faq_table = self.faq_table.retain(label_groups(knowledge_base))
+
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
+
+    ######################################################################
+    # Module: retrieval_filters
+    # Description: Returns the label filters of a question's search. The
+    #              filters are inferred from the question (when enabled)
+    #              and the explicit ones take precedence.
+    # Input:
+    #   - self: instance of the class
+    #   - question: the question or request from the user input
+    #   - category: optional category name or list of names
+    #   - age: optional age label or list of labels
+    # Returns: a RetrievalFilters
+    ######################################################################
+    def retrieval_filters(self, question, category=None, age=None):
+        inferred = RetrievalFilters(None, None)
+        if self.infer_filters:
+            inferred = self.structured_lookup.infer_filters(question)
+        if isinstance(category, str):
+            category = [category]
+        if isinstance(age, str):
+            age = [age]
+        return RetrievalFilters(tuple(category) if category is not None else inferred.category,
+                                tuple(age) if age is not None else inferred.age)
+
+    ######################################################################
+    # Module: filter_rows
+    # Description: Returns the rows selected by the retrieval filters.
+    #              Entries without an age apply to every age, so they pass
+    #              the age filter. The rows of each filter are computed
+    #              once per knowledge base with a store mask.
+    # Input:
+    #   - self: instance of the class
+    #   - filters: a RetrievalFilters
+    #   - store: optional KnowledgeStore of the request's snapshot
+    # Returns: an array of rows, or None to search every entry (no filter,
+    #          or no entry matches it)
+    ######################################################################
+    def filter_rows(self, filters, store=None):
+        if filters.category is None and filters.age is None:
+            return None
+
+        store = store if store is not None else self.store
+        cached_store, cache = self._filter_rows
+        if cached_store is not store:
+            cache = {}
+            self._filter_rows = (store, cache)
+
+        rows = cache.get(filters)
+        if rows is None:
+            age = filters.age + (None,) if filters.age is not None else None
+            rows = store.rows(category=filters.category, age=age)
+            cache[filters] = rows
+        return rows if len(rows) else None
 
     ######################################################################
     # Module: find_best_entries
@@ -43,13 +440,207 @@ class NewParentAIAssistantApp:
     #   - self: instance of the class
     #   - question: the question or request from the user input
     #   - top_k: the number of top relevant entries to return
+    #   - category: optional category name(s) to search
+    #   - age: optional age label(s) to search
     # Returns: a list of the top_k most relevant knowledge base entries
     ######################################################################
-    def find_best_entries(self, question, top_k=3):
-        q_embed = self.ai.embedder.encode(question, convert_to_tensor=True)
-        scores = util.pytorch_cos_sim(q_embed, self.embeddings)[0]
-        top_results = torch.topk(scores, k=top_k)
-        return [self.texts[i] for i in top_results.indices]
+    def find_best_entries(self, question, top_k=3, category=None, age=None):
+        snapshot = self.snapshot
+        top_indices, _ = self.search_entries(question, top_k, category, age, snapshot)
+        return [snapshot.store.passage(i) for i in top_indices]
+
+    ######################################################################
+    # Module: search_entries
+    # Description: Ranks the entries for one question.
+    # Input:
+    #   - self: instance of the class
+    #   - question: the question or request from the user input
+    #   - top_k: the number of top relevant entries to return
+    #   - category: optional category name(s) to search
+    #   - age: optional age label(s) to search
+    #   - snapshot: optional KnowledgeSnapshot to search (defaults to the
+    #               current one)
+    # Returns: a tuple (entry indices, similarities), best first (see
+    #          rank_entries)
+    ######################################################################
+    def search_entries(self, question, top_k=3, category=None, age=None, snapshot=None):
+        snapshot = snapshot if snapshot is not None else self.snapshot
+        rows = self.filter_rows(self.retrieval_filters(question, category, age), snapshot.store)
+        q_embeds = None
+        if self.retrieval_mode != RETRIEVAL_LEXICAL:
+            with self.metrics.stage(STAGE_ENCODE):
+                q_embed = self.ai.embedder.encode(question, convert_to_numpy=True)
+            q_embeds = np.asarray(q_embed, dtype=np.float32).reshape(1, -1)
+        with self.metrics.stage(STAGE_SEARCH):
+            return self.rank_entries([question], q_embeds, top_k, rows, snapshot)[0]
+
+    ######################################################################
+    # Module: rank_entries
+    # Description: Ranks the entries for a batch of questions with the
+    #              app's retrieval mode.
+    # Input:
+    #   - self: instance of the class
+    #   - questions: the list of questions
+    #   - q_embeds: the (questions x dim) question embeddings (None in
+    #               lexical mode)
+    #   - top_k: the number of top relevant entries to return
+    #   - rows: optional array of rows the search is restricted to
+    #   - snapshot: optional KnowledgeSnapshot to search
+    # Returns: a list with a tuple (entry indices, similarities) per
+    #          question, best first. A similarity is the cosine similarity
+    #          of the entry, or None when the entry was not ranked by the
+    #          embeddings (lexical matches).
+    ######################################################################
+    def rank_entries(self, questions, q_embeds, top_k=3, rows=None, snapshot=None):
+        snapshot = snapshot if snapshot is not None else self.snapshot
+        mode = self.retrieval_mode
+        if mode == RETRIEVAL_DENSE:
+            return self.top_entries(q_embeds, top_k, rows, snapshot)
+
+        depth = top_k if mode == RETRIEVAL_LEXICAL else max(top_k, HYBRID_DEPTH)
+        _, indices = snapshot.lexical_index.search(questions, depth, rows)
+        lexical = [[i for i in row if i >= 0] for row in indices.tolist()]
+
+        if mode == RETRIEVAL_LEXICAL:
+            ranked = [(row, [None] * len(row)) for row in lexical]
+            # Questions sharing no term with any entry fall back to the embedder
+            missing = [i for i, row in enumerate(lexical) if not row]
+            if missing:
+                dense = self.top_entries(self.encode_questions([questions[i] for i in missing]), top_k, rows,
+                                         snapshot)
+                for i, found in zip(missing, dense):
+                    ranked[i] = found
+            return ranked
+
+        ranked = []
+        for (dense, similarities), row in zip(self.top_entries(q_embeds, depth, rows, snapshot), lexical):
+            fused = fuse_rankings([dense, row], top_k)
+            similarity = dict(zip(dense, similarities))
+            ranked.append((fused, [similarity.get(i) for i in fused]))
+        return ranked
+
+    ######################################################################
+    # Module: top_entries
+    # Description: Searches the retrieval index for a batch of question
+    #              embeddings.
+    # Input:
+    #   - self: instance of the class
+    #   - q_embeds: a (questions x dim) matrix of question embeddings
+    #   - top_k: the number of top relevant entries to return
+    #   - rows: optional array of rows the search is restricted to
+    #   - snapshot: optional KnowledgeSnapshot to search
+    # Returns: a list with a tuple (entry indices, cosine similarities)
+    #          per question, best first
+    ######################################################################
+    def top_entries(self, q_embeds, top_k=3, rows=None, snapshot=None):
+        index = self.snapshot_index(snapshot if snapshot is not None else self.snapshot)
+        scores, indices = index.search(q_embeds, top_k, rows=rows)
+        found = []
+        for row_scores, row in zip(scores.tolist(), indices.tolist()):
+            kept = [position for position, i in enumerate(row) if i >= 0]
+            found.append(([row[p] for p in kept], [row_scores[p] for p in kept]))
+        return found
+
+    ######################################################################
+    # Module: encode_questions
+    # Description: Encodes a batch of questions with the embedder.
+    # Input:
+    #   - self: instance of the class
+    #   - questions: the list of questions
+    #   - batch_size: the embedder batch size
+    # Returns: a (questions x dim) float32 matrix of embeddings
+    ######################################################################
+    def encode_questions(self, questions, batch_size=32):
+        with self.metrics.stage(STAGE_ENCODE):
+            q_embeds = self.ai.embedder.encode(list(questions), batch_size=batch_size, convert_to_numpy=True)
+        return np.asarray(q_embeds, dtype=np.float32)
+
+    ######################################################################
+    # Module: find_best_entries_batch
+    # Description: Batched version of find_best_entries: all questions are
+    #              encoded in one call, and the questions with the same
+    #              filters are scored in one matrix product.
+    # Input:
+    #   - self: instance of the class
+    #   - questions: the list of questions
+    #   - top_k: the number of top relevant entries to return
+    #   - batch_size: the embedder batch size
+    #   - q_embeds: optional precomputed question embeddings
+    #   - category: optional category name(s) to search
+    #   - age: optional age label(s) to search
+    #   - snapshot: optional KnowledgeSnapshot to search
+    # Returns: a list with the top_k most relevant entries per question
+    ######################################################################
+    def find_best_entries_batch(self, questions, top_k=3, batch_size=32, q_embeds=None, category=None, age=None,
+                                snapshot=None):
+        snapshot = snapshot if snapshot is not None else self.snapshot
+        ranked = self.search_entries_batch(questions, top_k, batch_size, q_embeds, category, age, snapshot)
+        return [[snapshot.store.passage(i) for i in indices] for indices, _ in ranked]
+
+    ######################################################################
+    # Module: search_entries_batch
+    # Description: Batched version of search_entries (see
+    #              find_best_entries_batch).
+    # Input:
+    #   - self: instance of the class
+    #   - questions: the list of questions
+    #   - top_k: the number of top relevant entries to return
+    #   - batch_size: the embedder batch size
+    #   - q_embeds: optional precomputed question embeddings
+    #   - category: optional category name(s) to search
+    #   - age: optional age label(s) to search
+    #   - snapshot: optional KnowledgeSnapshot to search
+    # Returns: a list with a tuple (entry indices, similarities) per
+    #          question (see rank_entries)
+    ######################################################################
+    def search_entries_batch(self, questions, top_k=3, batch_size=32, q_embeds=None, category=None, age=None,
+                             snapshot=None):
+        if not questions:
+            return []
+        snapshot = snapshot if snapshot is not None else self.snapshot
+        if q_embeds is None and self.retrieval_mode != RETRIEVAL_LEXICAL:
+            q_embeds = self.encode_questions(questions, batch_size)
+
+        groups = {}
+        for i, question in enumerate(questions):
+            groups.setdefault(self.retrieval_filters(question, category, age), []).append(i)
+
+        ranked = [None] * len(questions)
+        with self.metrics.stage(STAGE_SEARCH):
+            for filters, members in groups.items():
+                group_embeds = q_embeds[members] if q_embeds is not None else None
+                found = self.rank_entries([questions[i] for i in members], group_embeds, top_k,
+                                          self.filter_rows(filters, snapshot.store), snapshot)
+                for i, result in zip(members, found):
+                    ranked[i] = result
+        return ranked
+
+    ######################################################################
+    # Module: direct_answer
+    # Description: Answers a question from its top entry without the QA
+    #              model when retrieval is confident: the top entry's
+    #              similarity reaches direct_answer_score and beats the
+    #              runner-up by direct_answer_margin. The answer is the
+    #              sentence of the entry that best matches the question.
+    # Input:
+    #   - self: instance of the class
+    #   - question: the question
+    #   - store: the KnowledgeStore the entries were retrieved from
+    #   - indices: the retrieved entry indices, best first
+    #   - similarities: their similarities (see rank_entries)
+    # Returns: the answer, or None when the reader must run
+    ######################################################################
+    def direct_answer(self, question, store, indices, similarities):
+        if self.direct_answer_score is None or not indices or similarities[0] is None:
+            return None
+        if similarities[0] < self.direct_answer_score:
+            return None
+        if len(similarities) > 1:
+            # A runner-up of unknown similarity (a lexical match) is never
+            # outscored with confidence
+            if similarities[1] is None or similarities[0] - similarities[1] < self.direct_answer_margin:
+                return None
+        return extract_sentence(question, store.text(indices[0]))
 
     ######################################################################
     # Module: answer_question
@@ -58,13 +649,204 @@ class NewParentAIAssistantApp:
     # Input:
     #   - self: instance of the class
     #   - question: the question or request from the user input
-    # Returns: the answer generated by the QA model
+    # Returns: the answer generated by the QA model (or taken directly
+    #          from a confidently retrieved entry)
     ######################################################################
     def answer_question(self, question):
-        contexts = self.find_best_entries(question)
-        context_str = " ".join(contexts)
-        result = self.ai.qa_pipeline(question=question, context=context_str)
-        return result["answer"]
+        if self.answer_cache is not None or self.faq_table is not None:
+            return self.answer_questions([question])[0]
+
+        if self.direct_answer_score is None:
+            best_entries = self.find_best_entries(question)
+        else:
+            snapshot = self.snapshot
+            store = snapshot.store
+            indices, similarities = self.search_entries(question, snapshot=snapshot)
+            answer = self.direct_answer(question, store, indices, similarities)
+            if answer is not None:
+                self.count_answer_paths(1, 0)
+                return answer
+            best_entries = [store.passage(i) for i in indices]
+
+        self.count_answer_paths(0, 1)
+        context_str = build_context(best_entries, self.ai.max_context_words)
+        return self.ai.read(question, context_str)
+
+    ######################################################################
+    # Module: count_answer_paths
+    # Description: Counts the NLP answers that took each path.
+    # Input:
+    #   - self: instance of the class
+    #   - direct: the number of answers taken from the top entry
+    #   - reader: the number of answers read by the QA model
+    # Returns: N/A
+    ######################################################################
+    def count_answer_paths(self, direct, reader):
+        self.answer_paths[ANSWER_DIRECT] += direct
+        self.answer_paths[ANSWER_READER] += reader
+        self.metrics.increment(f"answer_{ANSWER_DIRECT}", direct)
+        self.metrics.increment(f"answer_{ANSWER_READER}", reader)
+
+    ######################################################################
+    # Module: answer_questions
+    # Description: Batched version of answer_question. Retrieval runs as
+    #              one batched encode and similarity computation, and the
+    #              QA model is fed batched (question, context) pairs.
+    #              When an answer cache or a FAQ table is configured,
+    #              only the questions they cannot answer reach the reader.
+    # Input:
+    #   - self: instance of the class
+    #   - questions: the list of questions
+    #   - batch_size: the batch size for the embedder and the QA model
+    # Returns: the list of answers, in the order of the questions
+    ######################################################################
+    def answer_questions(self, questions, batch_size=32):
+        questions = list(questions)
+        if not questions:
+            return []
+
+        cache, faq_table = self.answer_cache, self.faq_table
+        if cache is None and faq_table is None:
+            return self.read_answers(questions, batch_size=batch_size)
+
+        answers = [None] * len(questions)
+        pending = list(range(len(questions)))
+        q_embeds = None
+        # Taken before retrieval, so answers read from a snapshot that a
+        # knowledge base edit replaces meanwhile are not cached
+        generation = cache.generation if cache is not None else None
+        if cache is not None:
+            # Exact tier: normalized question text
+            answers = [cache.get(question) for question in questions]
+            pending = [i for i, answer in enumerate(answers) if answer is None]
+            self.metrics.increment("answer_cache_hit", len(questions) - len(pending))
+            if not pending:
+                return answers
+
+            # Semantic tier: the embeddings are reused for retrieval on a miss
+            if cache.semantic:
+                q_embeds = self.encode_questions([questions[i] for i in pending], batch_size)
+                for row, i in enumerate(pending):
+                    answers[i] = cache.get_similar(q_embeds[row])
+                misses = [row for row, i in enumerate(pending) if answers[i] is None]
+                self.metrics.increment("semantic_cache_hit", len(pending) - len(misses))
+                pending = [pending[row] for row in misses]
+                q_embeds = q_embeds[misses]
+
+        # Materialized answers of the closest questions of the FAQ table
+        if faq_table is not None and pending:
+            if q_embeds is None:
+                q_embeds = self.encode_questions([questions[i] for i in pending], batch_size)
+            found = faq_table.lookup(q_embeds)
+            for row, i in enumerate(pending):
+                answers[i] = found[row]
+            misses = [row for row, answer in enumerate(found) if answer is None]
+            self.metrics.increment("faq_hit", len(pending) - len(misses))
+            pending = [pending[row] for row in misses]
+            q_embeds = q_embeds[misses]
+
+        if pending:
+            computed = self.read_answers([questions[i] for i in pending], q_embeds, batch_size)
+            for row, i in enumerate(pending):
+                answers[i] = computed[row]
+                if cache is not None:
+                    cache.put(questions[i], computed[row], None if q_embeds is None else q_embeds[row], generation)
+
+        return answers
+
+    ######################################################################
+    # Module: read_answers
+    # Description: Runs retrieval and the QA model for a batch of
+    #              questions, bypassing the answer cache. Only the
+    #              questions direct_answer cannot answer reach the model.
+    # Input:
+    #   - self: instance of the class
+    #   - questions: the list of questions
+    #   - q_embeds: optional precomputed question embeddings
+    #   - batch_size: the batch size for the embedder and the QA model
+    #   - ranked: optional (entry indices, similarities) of each question
+    #             from search_entries_batch, so they are not retrieved
+    #             again
+    #   - snapshot: optional KnowledgeSnapshot the questions are (or were,
+    #               with ranked) searched in
+    # Returns: the list of answers, in the order of the questions
+    ######################################################################
+    def read_answers(self, questions, q_embeds=None, batch_size=32, ranked=None, snapshot=None):
+        if not questions:
+            return []
+
+        snapshot = snapshot if snapshot is not None else self.snapshot
+        answers = [None] * len(questions)
+        if ranked is None and self.direct_answer_score is None:
+            best_entries = self.find_best_entries_batch(questions, batch_size=batch_size, q_embeds=q_embeds,
+                                                        snapshot=snapshot)
+        else:
+            store = snapshot.store
+            if ranked is None:
+                ranked = self.search_entries_batch(questions, batch_size=batch_size, q_embeds=q_embeds,
+                                                   snapshot=snapshot)
+            if self.direct_answer_score is not None:
+                answers = [self.direct_answer(q, store, indices, similarities)
+                           for q, (indices, similarities) in zip(questions, ranked)]
+            best_entries = [[store.passage(i) for i in indices] for indices, _ in ranked]
+
+        pending = [i for i, answer in enumerate(answers) if answer is None]
+        self.count_answer_paths(len(questions) - len(pending), len(pending))
+        if not pending:
+            return answers
+
+        contexts = [build_context(best_entries[p], self.ai.max_context_words) for p in pending]
+        read = self.ai.read([questions[p] for p in pending], contexts, batch_size)
+        for p, answer in zip(pending, read):
+            answers[p] = answer
+        return answers
+
+    ######################################################################
+    # Module: respond_without_model
+    # Description: Answers a question with the routes that need no model
+    #              (the milestone list and the structured lookup), as
+    #              decided by the intent router. A question the lookup
+    #              cannot answer falls back to the NLP service.
+    # Input:
+    #   - self: instance of the class
+    #   - question: the question or request from the user input
+    # Returns: a tuple (route, answer). The answer is None when the
+    #          question must be routed to the NLP service.
+    ######################################################################
+    def respond_without_model(self, question):
+        metrics = self.metrics
+        with metrics.stage(STAGE_ROUTE):
+            route = self.router.route(question).route
+        if route == ROUTE_MILESTONE:
+            metrics.increment(f"route_{ROUTE_MILESTONE}")
+            with metrics.stage(STAGE_MILESTONE_LIST):
+                return ROUTE_MILESTONE, self.milestone_index.get_milestone_list(question)
+
+        if route == ROUTE_LOOKUP:
+            with metrics.stage(STAGE_LOOKUP):
+                structured_answer = self.structured_lookup.lookup(question)
+            if structured_answer is not None:
+                metrics.increment(f"route_{ROUTE_LOOKUP}")
+                return ROUTE_LOOKUP, structured_answer
+
+        metrics.increment(f"route_{ROUTE_NLP}")
+        return ROUTE_NLP, None
+
+    ######################################################################
+    # Module: respond
+    # Description: Routes a question to the cheapest service that can
+    #              answer it, falling back to the NLP service.
+    # Input:
+    #   - self: instance of the class
+    #   - question: the question or request from the user input
+    # Returns: a tuple (route, answer)
+    ######################################################################
+    def respond(self, question):
+        with self.metrics.stage(STAGE_RESPOND):
+            route, answer = self.respond_without_model(question)
+            if route == ROUTE_NLP:
+                answer = self.answer_question(question)
+        return route, answer
 
 ######################################################################
 # Module: print_intro_message
@@ -88,20 +870,15 @@ def print_intro_message():
 # Returns: N/A
 ######################################################################
 def main():
-    # Load the knowledge base
-    knowledge_base = load_knowledge_base()
+    # Load the knowledge base and watch it for edits
+    watcher = KnowledgeBaseWatcher()
 
     # Create the new parent AI assistant application
-    app = NewParentAIAssistantApp(knowledge_base)
+    app = NewParentAIAssistantApp(watcher.entries, cache_dir=DEFAULT_CACHE_DIR, answer_cache=AnswerCache())
 
     # Print the introductory message
     print_intro_message()
 
-    # Create a list of keywords for listing services
-    # Note that for now this is only related to milestones, but in the future
-    # it could be expanded to other categories
-    list_keywords = ["milestone", "milestones", "developmental milestones"]
-
     # Main loop
     while True:
 
@@ -113,16 +890,19 @@ def main():
             print("\033[36mClosing the New Parent AI Assistant...\033[0m")
             break
 
-        # If keywords are detected, route the user input to the listing service.
-        # Otherwise, route the user input to the AI (NLP) question answering service.
-        if any(word in user_input for word in list_keywords):
-            # Route to the listing service for milestones
-            milestone_list = get_milestone_list(knowledge_base, user_input)
-            print(f"{milestone_list}\n")
-        else:
-            # Route to the AI (NLP) question answering service
-            response = app.answer_question(user_input)
+        # Pick up knowledge base edits made since the last question
+        diff = watcher.check()
+        if diff is not None:
+            app.update_knowledge_base(watcher.entries, diff)
+
+        # If keywords are detected, the user input is routed to the listing service.
+        # Otherwise, the structured lookup is tried and the user input is only routed
+        # to the AI (NLP) question answering service if it cannot answer.
+        route, response = app.respond(user_input)
+        if route == ROUTE_NLP:
             print(f"NLP RESPONSE: {response}\n")
+        else:
+            print(f"{response}\n")
 
 #############################################
 ### Entry point of the application (main) ###
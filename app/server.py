@@ -0,0 +1,592 @@
+# File: server.py
+# Author: William Jahner
+#
+# An asyncio HTTP service around NewParentAIAssistantApp. Questions that
+# need no model are answered on the event loop; NLP questions arriving
+# within a few milliseconds of each other are coalesced into a single
+# batched embed + QA call that runs on a worker thread pool, or with
+# --worker-processes on worker processes sharing a memory-mapped snapshot
+# of the knowledge base (app.workers).
+#
+#   python -m app.server --port 8000
+#   python -m app.server --port 8000 --worker-processes 4
+#   curl -d '{"question": "how often should a 3 month old nap?"}' localhost:8000/answer
+
+import argparse
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .main import NewParentAIAssistantApp, ROUTE_NLP, RETRIEVAL_DENSE, RETRIEVAL_MODES, DEFAULT_DIRECT_ANSWER_MARGIN
+from .services.ai_service import BACKEND_TORCH, INFERENCE_BACKENDS, DEFAULT_CASCADE_SCORE
+from .services.knowledge_store import EMBEDDING_DTYPES
+from .services.answer_cache import AnswerCache
+from .services.embedding_cache import DEFAULT_CACHE_DIR, remove_stale_shards
+from .services.faq_table import FAQTable, DEFAULT_FAQ_THRESHOLD, label_groups
+from .services.kb_loader import KnowledgeBaseWatcher, flatten_shards, load_shards
+from .services.metrics import Metrics, SamplingProfiler, DEFAULT_SAMPLE_INTERVAL_S
+from .services.model_registry import FAST_QA_MODEL_NAME
+from .workers import WorkerPool
+
+# Reason phrases of the status codes the server sends
+STATUS_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+# The largest request body the server accepts
+MAX_BODY_BYTES = 64 * 1024
+
+# Logger the server's status messages are written to
+SERVER_LOGGER = "assistant.server"
+
+logger = logging.getLogger(SERVER_LOGGER)
+
+######################################################################
+# Class: MicroBatcher
+# Description: Coalesces concurrent requests into batches. The first
+#              request of a batch waits at most max_wait_ms for others
+#              to arrive; the batch is then processed on the executor.
+#              Up to max_concurrent_batches batches run at the same time.
+######################################################################
+class MicroBatcher:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for MicroBatcher
+    # Input:
+    #   - self: instance of the class itself
+    #   - process_batch: a blocking callable taking a list of items and
+    #                    returning a list of results in the same order
+    #   - executor: the executor the batches run on
+    #   - max_batch_size: the largest number of items in a batch
+    #   - max_wait_ms: how long a batch waits for more items
+    #   - max_concurrent_batches: how many batches may run at once
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, process_batch, executor, max_batch_size=32, max_wait_ms=5, max_concurrent_batches=1):
+        self.process_batch = process_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000
+        self.max_concurrent_batches = max_concurrent_batches
+
+        # Counters of the dispatched batches and the items they contained
+        self.batch_count = 0
+        self.item_count = 0
+
+        self._queue = None
+        self._task = None
+        self._slots = None
+        self._running = set()
+
+    ######################################################################
+    # Module: start
+    # Description: Starts collecting batches on the running event loop.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._task = asyncio.create_task(self._collect())
+
+    ######################################################################
+    # Module: stop
+    # Description: Stops collecting batches and waits for running ones.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    ######################################################################
+    # Module: submit
+    # Description: Adds an item to the next batch and waits for its result.
+    # Input:
+    #   - self: instance of the class itself
+    #   - item: the item to process
+    # Returns: the result for the item
+    ######################################################################
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    ######################################################################
+    # Module: _collect
+    # Description: Forms batches from the queue and dispatches them.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+
+            # Wait a few milliseconds for more requests to join the batch
+            deadline = loop.time() + self.max_wait_s
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Take everything that queued up meanwhile, up to the limit
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    ######################################################################
+    # Module: _run
+    # Description: Processes one batch on the executor and resolves the
+    #              futures of its items.
+    # Input:
+    #   - self: instance of the class itself
+    #   - batch: a list of (item, future) pairs
+    # Returns: N/A
+    ######################################################################
+    async def _run(self, batch):
+        try:
+            self.batch_count += 1
+            self.item_count += len(batch)
+            items = [item for item, _ in batch]
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(self.executor, self.process_batch, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+######################################################################
+# Class: AssistantServer
+# Description: A minimal HTTP/1.1 server (standard library only) that
+#              answers questions with a NewParentAIAssistantApp.
+#
+#              POST /answer  {"question": "..."}
+#                  -> {"question": ..., "route": ..., "answer": ...}
+#              GET  /health
+#                  -> {"status": "ok"}
+#              GET  /metrics
+#                  -> the app's metrics as Prometheus text
+#              GET  /metrics?format=json
+#                  -> the app's metrics as a JSON snapshot
+######################################################################
+class AssistantServer:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for AssistantServer
+    # Input:
+    #   - self: instance of the class itself
+    #   - app: the NewParentAIAssistantApp answering the questions
+    #   - host: the host to listen on
+    #   - port: the port to listen on (0 picks a free port)
+    #   - workers: the number of inference worker threads
+    #   - max_batch_size: the largest number of NLP questions per batch
+    #   - max_wait_ms: how long a batch waits for more questions
+    #   - watcher: optional KnowledgeBaseWatcher whose edits are applied
+    #              to the app while serving
+    #   - reload_interval_s: how often the watcher is checked
+    #   - worker_pool: optional WorkerPool whose processes answer the NLP
+    #                  questions instead of inference threads (the app
+    #                  then only answers the routes that need no model).
+    #                  One thread per process waits for each batch, so the
+    #                  workers' metrics are merged into the app's.
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, app, host="127.0.0.1", port=8000, workers=1, max_batch_size=32, max_wait_ms=5,
+                 watcher=None, reload_interval_s=5.0, worker_pool=None):
+        self.app = app
+        self.watcher = watcher
+        self.reload_interval_s = reload_interval_s
+        self.host = host
+        self.port = port
+        process_batch = app.answer_questions
+        if worker_pool is not None:
+            process_batch, workers = worker_pool.answer_questions, worker_pool.processes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self.batcher = MicroBatcher(process_batch, self.executor, max_batch_size=max_batch_size,
+                                    max_wait_ms=max_wait_ms, max_concurrent_batches=workers)
+        self._server = None
+        self._reload_task = None
+
+    ######################################################################
+    # Module: start
+    # Description: Starts listening. The bound port is stored in self.port
+    #              and logged.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    async def start(self):
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Serving the New Parent AI Assistant on http://%s:%s", self.host, self.port)
+        if self.watcher is not None:
+            self._reload_task = asyncio.create_task(self._reload_loop())
+
+    ######################################################################
+    # Module: serve_forever
+    # Description: Starts the server (if needed) and serves until
+    #              cancelled.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    ######################################################################
+    # Module: close
+    # Description: Stops the server, the batcher and the worker threads.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    async def close(self):
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            try:
+                await self._reload_task
+            except asyncio.CancelledError:
+                pass
+            self._reload_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.batcher.stop()
+        self.executor.shutdown(wait=False)
+
+    ######################################################################
+    # Module: _reload_loop
+    # Description: Checks the knowledge base for edits and applies them to
+    #              the app. Reloads run on the default executor so the
+    #              inference workers keep answering meanwhile.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    async def _reload_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval_s)
+            diff = await loop.run_in_executor(None, self.watcher.check)
+            if diff is not None:
+                await loop.run_in_executor(None, self.app.update_knowledge_base, self.watcher.entries, diff)
+
+    ######################################################################
+    # Module: answer
+    # Description: Answers a question, batching it with concurrent NLP
+    #              questions when no cheaper route can answer it.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the user's question
+    # Returns: a tuple (route, answer)
+    ######################################################################
+    async def answer(self, question):
+        route, answer = self.app.respond_without_model(question)
+        if route == ROUTE_NLP:
+            answer = await self.batcher.submit(question)
+        return route, answer
+
+    ######################################################################
+    # Module: _handle_connection
+    # Description: Serves the requests of one (keep-alive) connection.
+    # Input:
+    #   - self: instance of the class itself
+    #   - reader: the connection's stream reader
+    #   - writer: the connection's stream writer
+    # Returns: N/A
+    ######################################################################
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if body is None:
+                    # The unread body would be parsed as the next request,
+                    # so the connection is closed instead
+                    self._write_response(writer, 413, {"error": "Request body is too large"}, keep_alive=False)
+                    await writer.drain()
+                    break
+
+                status, payload = await self._dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            # Dropped connections and malformed requests end the connection
+            pass
+        finally:
+            writer.close()
+
+    ######################################################################
+    # Module: _read_request
+    # Description: Reads one HTTP request from a connection. A body larger
+    #              than MAX_BODY_BYTES is not read.
+    # Input:
+    #   - self: instance of the class itself
+    #   - reader: the connection's stream reader
+    # Returns: a tuple (method, path, headers, body), or None at the end
+    #          of the connection (body is None when it was too large)
+    ######################################################################
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+
+        parts = request_line.decode("latin-1").split()
+        method, path = (parts[0], parts[1]) if len(parts) >= 2 else ("", "")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY_BYTES:
+            return method, path, headers, None
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    ######################################################################
+    # Module: _dispatch
+    # Description: Produces the response for a request.
+    # Input:
+    #   - self: instance of the class itself
+    #   - method: the HTTP method
+    #   - path: the request path
+    #   - body: the request body
+    # Returns: a tuple (status, payload dict, or text for the
+    #          Prometheus metrics)
+    ######################################################################
+    async def _dispatch(self, method, path, body):
+        path, _, query = path.partition("?")
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/metrics":
+            if "format=json" in query.split("&"):
+                return 200, self.app.metrics.snapshot()
+            return 200, self.app.metrics.to_prometheus()
+
+        if path != "/answer":
+            return 404, {"error": f"Unknown path '{path}'"}
+        if method != "POST":
+            return 405, {"error": "Use POST to ask a question"}
+
+        try:
+            question = json.loads(body or b"{}").get("question")
+        except (ValueError, AttributeError):
+            return 400, {"error": "Request body must be a JSON object"}
+        if not isinstance(question, str) or not question.strip():
+            return 400, {"error": "Request body must contain a non-empty 'question'"}
+
+        try:
+            route, answer = await self.answer(question.strip())
+        except Exception as e:
+            return 500, {"error": f"Sorry, the answer could not be determined. ({e})"}
+        return 200, {"question": question, "route": route, "answer": answer}
+
+    ######################################################################
+    # Module: _write_response
+    # Description: Writes a JSON (or plain text) response to a connection.
+    # Input:
+    #   - self: instance of the class itself
+    #   - writer: the connection's stream writer
+    #   - status: the HTTP status code
+    #   - payload: the dict sent as the JSON body, or a text body
+    #   - keep_alive: whether the connection stays open
+    # Returns: N/A
+    ######################################################################
+    def _write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        head = (f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+
+######################################################################
+# Module: main
+# Description: The server's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="HTTP service for the New Parent AI Assistant")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="inference worker threads")
+    parser.add_argument("--worker-processes", type=int, default=0,
+                        help="answer NLP questions in this many processes sharing the knowledge base embeddings "
+                             "(0 uses --workers threads; disables hot reload)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="intra-op threads of each worker process (defaults to the cores split between them)")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--cache-size", type=int, default=4096, help="answer cache size (0 disables it)")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="answer cache time to live in seconds")
+    parser.add_argument("--semantic-threshold", type=float, default=None,
+                        help="cosine similarity above which a cached answer is reused for a similar question")
+    parser.add_argument("--backend", choices=sorted(INFERENCE_BACKENDS), default=BACKEND_TORCH,
+                        help="inference backend (onnx needs the models exported with app.services.onnx_backend)")
+    parser.add_argument("--quantized", action="store_true", help="use the int8 ONNX models")
+    parser.add_argument("--fast-reader", default=None,
+                        help=f"small QA model reading every question first, e.g. {FAST_QA_MODEL_NAME} "
+                             "(questions it is not confident about escalate to the QA model; the onnx backend reads the "
+                             "one exported with --fast-qa-model)")
+    parser.add_argument("--cascade-score", type=float, default=DEFAULT_CASCADE_SCORE,
+                        help="span score under which the fast reader's answer escalates to the QA model")
+    parser.add_argument("--reload-interval", type=float, default=5.0,
+                        help="seconds between knowledge base edit checks (0 disables hot reload)")
+    parser.add_argument("--manifest", default=None,
+                        help="knowledge base manifest listing the shards to serve (disables hot reload)")
+    parser.add_argument("--loader-processes", type=int, default=None, help="processes loading the shards")
+    parser.add_argument("--embedding-dtype", choices=EMBEDDING_DTYPES, default="float32",
+                        help="data type the knowledge base embeddings are kept in")
+    parser.add_argument("--retrieval-mode", choices=RETRIEVAL_MODES, default=RETRIEVAL_DENSE,
+                        help="embedding, hybrid (embedding + BM25) or lexical (BM25 only) retrieval")
+    parser.add_argument("--direct-answer-score", type=float, default=None,
+                        help="cosine similarity from which the top entry answers without the QA model")
+    parser.add_argument("--direct-answer-margin", type=float, default=DEFAULT_DIRECT_ANSWER_MARGIN,
+                        help="similarity the top entry must beat the runner-up by to skip the QA model")
+    parser.add_argument("--faq-table", default=None,
+                        help="directory of a FAQ table built by app.faq_builder, answering close questions without "
+                             "the QA model")
+    parser.add_argument("--faq-threshold", type=float, default=DEFAULT_FAQ_THRESHOLD,
+                        help="cosine similarity from which a question takes a FAQ table answer")
+    parser.add_argument("--metrics", action="store_true", help="time the request path stages (served on /metrics)")
+    parser.add_argument("--metrics-log", action="store_true",
+                        help="also log every timed stage as a JSON line on stderr (implies --metrics)")
+    parser.add_argument("--profile", default=None,
+                        help="sample the stacks of every thread and write them as collapsed stacks to this file")
+    parser.add_argument("--profile-interval-ms", type=float, default=DEFAULT_SAMPLE_INTERVAL_S * 1000,
+                        help="time between two profiler samples")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    metrics = Metrics(enabled=args.metrics or args.metrics_log, log_json=args.metrics_log)
+
+    answer_cache, cache_options = None, None
+    if args.cache_size > 0:
+        cache_options = {"max_size": args.cache_size, "ttl_s": args.cache_ttl,
+                         "semantic_threshold": args.semantic_threshold}
+        answer_cache = AnswerCache(**cache_options)
+    ai_options = {"backend": args.backend, "quantized": args.quantized,
+                  "fast_qa_model_name": args.fast_reader, "cascade_score": args.cascade_score}
+    watcher, shard_sizes = None, None
+    if args.manifest is not None:
+        knowledge_base, shard_sizes = flatten_shards(load_shards(args.manifest, args.loader_processes))
+    else:
+        watcher = KnowledgeBaseWatcher()
+        knowledge_base = watcher.entries
+
+    faq_table = None
+    if args.faq_table is not None:
+        faq_table = FAQTable.load(args.faq_table, args.faq_threshold)
+        if faq_table is None:
+            logger.warning("No FAQ table in %s, answering without it", args.faq_table)
+
+    app = NewParentAIAssistantApp(knowledge_base, cache_dir=DEFAULT_CACHE_DIR, answer_cache=answer_cache,
+                                  ai_options=ai_options, shard_sizes=shard_sizes, embedding_dtype=args.embedding_dtype,
+                                  retrieval_mode=args.retrieval_mode, direct_answer_score=args.direct_answer_score,
+                                  direct_answer_margin=args.direct_answer_margin, metrics=metrics)
+    # A table built with another embedding model cannot be searched
+    if faq_table is not None and faq_table.models.get("embedding") != app.ai.embedding_model_name:
+        logger.warning("The FAQ table in %s was built with another embedding model, answering without it",
+                       args.faq_table)
+        faq_table = None
+    if faq_table is not None:
+        # Only the rows of the labels unchanged since the build are used
+        app.faq_table = faq_table.retain(label_groups(knowledge_base))
+    if shard_sizes is not None:
+        remove_stale_shards(DEFAULT_CACHE_DIR, app.ai.embedding_model_name, [name for name, _ in shard_sizes])
+
+    worker_pool = None
+    if args.worker_processes > 0:
+        # The workers load the models; this process only computes (or
+        # loads) the embeddings for the snapshot and serves the routes
+        # that need no model. Edits are not propagated to the snapshot.
+        app_options = {"ai_options": ai_options, "retrieval_mode": args.retrieval_mode,
+                       "direct_answer_score": args.direct_answer_score,
+                       "direct_answer_margin": args.direct_answer_margin, "faq_table": app.faq_table}
+        worker_pool = WorkerPool(app, args.worker_processes, app_options=app_options, cache_options=cache_options,
+                                 threads=args.threads_per_worker)
+        app.store.embeddings = None
+        worker_pool.warm_up()
+        watcher = None
+    else:
+        app.warm_up()
+
+    server = AssistantServer(app, args.host, args.port, workers=args.workers,
+                             max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                             watcher=watcher if args.reload_interval > 0 else None,
+                             reload_interval_s=args.reload_interval, worker_pool=worker_pool)
+    profiler = None
+    if args.profile is not None:
+        profiler = SamplingProfiler(args.profile_interval_ms / 1000)
+        profiler.start()
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.save(args.profile)
+        if worker_pool is not None:
+            worker_pool.close()
+
+################################
+### Entry point of server.py ###
+################################
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,411 @@
 # File: ai_service.py
 # Author: William Jahner
 
-from sentence_transformers import SentenceTransformer, util
-from transformers import pipeline
+import re
+import threading
+import numpy as np
+from .model_registry import default_registry, QA_MODEL_NAME, EMBEDDING_MODEL_NAME, QA_TASK, \
+    EMBEDDING_TASK, ONNX_QA_TASK, ONNX_EMBEDDING_TASK
+from .onnx_backend import DEFAULT_ONNX_DIR, QA_DIR, FAST_QA_DIR, EMBEDDER_DIR, onnx_model_path
+from .knowledge_store import KnowledgeStore
+from .lexical_index import tokenize
+from .metrics import Metrics, STAGE_MODEL_LOAD, STAGE_READ, STAGE_READ_FAST
+from .retrieval_index import ExactIndex
+
+# Inference backends: PyTorch models or exported ONNX Runtime graphs
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+INFERENCE_BACKENDS = {BACKEND_TORCH, BACKEND_ONNX}
+
+# Reader window settings. A window holds the question and a slice of the
+# context; a longer context is split into overlapping windows, each of
+# which is a full forward pass of the QA model.
+DEFAULT_MAX_SEQ_LEN = 384
+DEFAULT_DOC_STRIDE = 128
+
+# Word budget of the context passed to the reader. It keeps the question
+# and the context inside a single DEFAULT_MAX_SEQ_LEN token window.
+DEFAULT_MAX_CONTEXT_WORDS = 250
+
+# Tiers of the reader cascade: the small reader, and the large reader
+# the questions it is not confident about escalate to
+TIER_FAST = "fast"
+TIER_FULL = "full"
+
+# Default span score under which the small reader's answer escalates to
+# the large reader
+DEFAULT_CASCADE_SCORE = 0.3
+
+# Splits a text into sentences (a period inside a number such as "2.5"
+# is not followed by whitespace, so it does not split)
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+######################################################################
+# Module: to_passages
+# Description: Splits the AI service context into retrievable passages.
+# Input:
+#   - context: a string (one passage per non-empty line), a
+#              KnowledgeStore, a list of (label, text) knowledge base
+#              tuples or a list of strings
+# Returns: the list of passages (a PassageView for a KnowledgeStore)
+######################################################################
+def to_passages(context):
+    if isinstance(context, KnowledgeStore):
+        return context.passages
+    if isinstance(context, str):
+        lines = [line.strip() for line in context.splitlines()]
+        return [line for line in lines if line] or [context]
+    return [f"{item[0]}: {item[1]}" if isinstance(item, tuple) else str(item) for item in context]
+
+######################################################################
+# Class: ReaderContext
+# Description: The context string of the reader, remembering the
+#              passages it joins (None when the best passage was cut at
+#              the word budget). A reader holding pre-tokenized passages
+#              assembles the context tokens from them instead of
+#              tokenizing the string; any other reader sees a str.
+######################################################################
+class ReaderContext(str):
+
+    ######################################################################
+    # Module: __new__
+    # Description: Creates the context string
+    # Input:
+    #   - cls: the class
+    #   - text: the context text
+    #   - passages: the passages joined by single spaces into the text,
+    #               or None
+    # Returns: the ReaderContext
+    ######################################################################
+    def __new__(cls, text, passages=None):
+        context = super().__new__(cls, text)
+        context.passages = passages
+        return context
+
+######################################################################
+# Module: build_context
+# Description: Joins the retrieved passages, best first, into the reader
+#              context, cutting it off at the word budget.
+# Input:
+#   - passages: the retrieved passages, best first
+#   - max_words: the word budget (None for no limit)
+# Returns: the context string (a ReaderContext)
+######################################################################
+def build_context(passages, max_words=DEFAULT_MAX_CONTEXT_WORDS):
+    if max_words is None:
+        passages = tuple(passages)
+        return ReaderContext(" ".join(passages), passages)
+
+    kept = []
+    remaining = max_words
+    for passage in passages:
+        words = passage.split()
+        if len(words) > remaining:
+            # Always keep part of the best passage
+            if not kept:
+                return ReaderContext(" ".join(words[:remaining]))
+            break
+        kept.append(passage)
+        remaining -= len(words)
+    return ReaderContext(" ".join(kept), tuple(kept))
+
+######################################################################
+# Module: extract_sentence
+# Description: Picks the answer span of an entry without the QA model:
+#              the sentence sharing the most terms with the question
+#              (the first one on a tie).
+# Input:
+#   - question: the question
+#   - text: the entry text
+# Returns: the sentence, or the whole text if it is a single sentence
+######################################################################
+def extract_sentence(question, text):
+    sentences = [sentence for sentence in SENTENCE_BREAK.split(text.strip()) if sentence]
+    if len(sentences) <= 1:
+        return text.strip()
+
+    terms = set(tokenize(question))
+    overlaps = [len(terms.intersection(tokenize(sentence))) for sentence in sentences]
+    return sentences[overlaps.index(max(overlaps))]
+
 
 ######################################################################
 # Class: AIService
 # Description: The class that uses AI logic to answer user questions
 ######################################################################
 class AIService:
-    
+
     ######################################################################
     # Module: __init__
-    # Description: Constructor for AIService
+    # Description: Constructor for AIService. The models are not loaded
+    #              here; they are fetched from the model registry on
+    #              first use and shared with other AIService instances.
+    #              The context is split into passages; a question is
+    #              only read against its top_k passages.
     # Input:
     #   - self: instance of the class itself
-    #   - context_text: the knowledge base for the NLP model
+    #   - context_text: the knowledge base for the NLP model (see
+    #                   to_passages)
+    #   - registry: optional model registry (defaults to the process-wide
+    #               registry)
+    #   - top_k: the number of passages read per question
+    #   - max_seq_len: the token length of a reader window
+    #   - doc_stride: the token overlap between reader windows
+    #   - max_context_words: the word budget of the reader context
+    #   - retriever: optional function (question, top_k) -> passages that
+    #                replaces the built-in passage retrieval
+    #   - backend: the inference backend ("torch" or "onnx")
+    #   - onnx_dir: the directory of the exported ONNX models (defaults to
+    #               data/onnx)
+    #   - quantized: whether the ONNX backend uses the int8 models
+    #   - metrics: optional Metrics the model loads and reads are timed in
+    #   - fast_qa_model_name: optional name or path of a small QA model
+    #                         that reads every question first (None reads
+    #                         with the QA model only). Questions escalate
+    #                         to the QA model when the small model finds
+    #                         no answer or scores its span below
+    #                         cascade_score. The onnx backend reads the
+    #                         small model exported to its fast_qa
+    #                         directory instead.
+    #   - cascade_score: the span score the small model's answer needs
     # Returns: N/A
     ######################################################################
-    def __init__(self, context_text: str):
-        # Load the QA model and embedding model
-        self.qa_pipeline = pipeline("question-answering", model="deepset/roberta-base-squad2")
-        self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
+    def __init__(self, context_text, registry=None, top_k=3, max_seq_len=DEFAULT_MAX_SEQ_LEN,
+                 doc_stride=DEFAULT_DOC_STRIDE, max_context_words=DEFAULT_MAX_CONTEXT_WORDS, retriever=None,
+                 backend=BACKEND_TORCH, onnx_dir=None, quantized=False, metrics=None, fast_qa_model_name=None,
+                 cascade_score=DEFAULT_CASCADE_SCORE):
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}' (expected one of {sorted(INFERENCE_BACKENDS)})")
+
+        self.registry = registry if registry is not None else default_registry
+        self.backend = backend
+        if backend == BACKEND_ONNX:
+            # The exported models are addressed by the path of their graph
+            onnx_dir = onnx_dir if onnx_dir is not None else DEFAULT_ONNX_DIR
+            self.qa_task, self.embedding_task = ONNX_QA_TASK, ONNX_EMBEDDING_TASK
+            self.qa_model_name = str(onnx_model_path(onnx_dir, QA_DIR, quantized))
+            self.embedding_model_name = str(onnx_model_path(onnx_dir, EMBEDDER_DIR, quantized))
+            if fast_qa_model_name is not None:
+                fast_qa_model_name = str(onnx_model_path(onnx_dir, FAST_QA_DIR, quantized))
+        else:
+            self.qa_task, self.embedding_task = QA_TASK, EMBEDDING_TASK
+            self.qa_model_name = QA_MODEL_NAME
+            self.embedding_model_name = EMBEDDING_MODEL_NAME
         self.context = context_text
-    
+        self.passages = to_passages(context_text)
+        self.top_k = top_k
+        self.max_seq_len = max_seq_len
+        self.doc_stride = doc_stride
+        self.max_context_words = max_context_words
+        self.retriever = retriever
+        self.metrics = metrics if metrics is not None else Metrics()
+
+        # Reader cascade, and the number of questions answered by each tier
+        self.fast_qa_model_name = fast_qa_model_name
+        self.cascade_score = cascade_score
+        self.tier_counts = {TIER_FAST: 0, TIER_FULL: 0}
+
+        self._qa_pipeline = None
+        self._fast_qa_pipeline = None
+        self._embedder = None
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    ######################################################################
+    # Module: qa_pipeline
+    # Description: The QA model, loaded through the registry on first use
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the question answering pipeline
+    ######################################################################
+    @property
+    def qa_pipeline(self):
+        if self._qa_pipeline is None:
+            with self.metrics.stage(STAGE_MODEL_LOAD):
+                qa_pipeline = self.registry.get(self.qa_task, self.qa_model_name)
+                self.tokenize_passages(qa_pipeline)
+            self._qa_pipeline = qa_pipeline
+        return self._qa_pipeline
+
+    @qa_pipeline.setter
+    def qa_pipeline(self, value):
+        self._qa_pipeline = value
+
+    ######################################################################
+    # Module: fast_qa_pipeline
+    # Description: The small QA model of the reader cascade, loaded
+    #              through the registry on first use
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the question answering pipeline, or None without a cascade
+    ######################################################################
+    @property
+    def fast_qa_pipeline(self):
+        if self._fast_qa_pipeline is None and self.fast_qa_model_name is not None:
+            with self.metrics.stage(STAGE_MODEL_LOAD):
+                fast_qa_pipeline = self.registry.get(self.qa_task, self.fast_qa_model_name)
+                self.tokenize_passages(fast_qa_pipeline)
+            self._fast_qa_pipeline = fast_qa_pipeline
+        return self._fast_qa_pipeline
+
+    @fast_qa_pipeline.setter
+    def fast_qa_pipeline(self, value):
+        self._fast_qa_pipeline = value
+
+    ######################################################################
+    # Module: tokenize_passages
+    # Description: Hands the passages to the QA pipelines that keep them
+    #              pre-tokenized (the ONNX reader), so a request only
+    #              tokenizes its question. Called when a pipeline is
+    #              loaded and when the passages change.
+    # Input:
+    #   - self: instance of the class itself
+    #   - pipelines: the pipelines to update (defaults to the loaded
+    #                readers)
+    # Returns: N/A
+    ######################################################################
+    def tokenize_passages(self, *pipelines):
+        for pipeline in pipelines or (self._qa_pipeline, self._fast_qa_pipeline):
+            if hasattr(pipeline, "cache_passages"):
+                pipeline.cache_passages(self.passages)
+
+    ######################################################################
+    # Module: embedder
+    # Description: The embedding model, loaded through the registry on
+    #              first use
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the embedding model
+    ######################################################################
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            with self.metrics.stage(STAGE_MODEL_LOAD):
+                self._embedder = self.registry.get(self.embedding_task, self.embedding_model_name)
+        return self._embedder
+
+    @embedder.setter
+    def embedder(self, value):
+        self._embedder = value
+
+    ######################################################################
+    # Module: index
+    # Description: The retrieval index over the passage embeddings, built
+    #              on first use
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the ExactIndex over the passages
+    ######################################################################
+    @property
+    def index(self):
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    embeddings = self.embedder.encode(list(self.passages), convert_to_numpy=True)
+                    self._index = ExactIndex(embeddings)
+        return self._index
+
+    ######################################################################
+    # Module: retrieve
+    # Description: Returns the passages most relevant to a question. The
+    #              passages are not ranked when all of them fit in top_k.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the user's question
+    # Returns: the list of passages, best first
+    ######################################################################
+    def retrieve(self, question):
+        if self.retriever is not None:
+            return self.retriever(question, self.top_k)
+        if len(self.passages) <= self.top_k:
+            return list(self.passages)
+
+        index = self.index
+        q_embed = self.embedder.encode(question, convert_to_numpy=True)
+        _, indices = index.search(np.asarray(q_embed, dtype=np.float32).reshape(1, -1), self.top_k)
+        return [self.passages[i] for i in indices[0]]
+
+    ######################################################################
+    # Module: reader_options
+    # Description: The window settings passed to the QA pipeline
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a dict of QA pipeline keyword arguments
+    ######################################################################
+    def reader_options(self):
+        return {"max_seq_len": self.max_seq_len, "doc_stride": self.doc_stride}
+
+    ######################################################################
+    # Module: read
+    # Description: Reads the answers of questions from their contexts.
+    #              With a reader cascade, the small QA model reads every
+    #              question first and only the questions it finds no
+    #              answer to, or answers with a span score below
+    #              cascade_score, are read again by the QA model.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: a question, or a list of questions
+    #   - context: its context, or the list of their contexts
+    #   - batch_size: optional pipeline batch size (lists only)
+    # Returns: the answer, or the list of answers
+    ######################################################################
+    def read(self, question, context, batch_size=None):
+        single = isinstance(question, str)
+        questions, contexts = ([question], [context]) if single else (list(question), list(context))
+        options = self.reader_options()
+        if batch_size is not None:
+            options["batch_size"] = batch_size
+
+        answers = [None] * len(questions)
+        pending = list(range(len(questions)))
+        fast_qa_pipeline = self.fast_qa_pipeline
+        if fast_qa_pipeline is not None:
+            with self.metrics.stage(STAGE_READ_FAST):
+                results = fast_qa_pipeline(question=questions, context=contexts, handle_impossible_answer=True,
+                                           **options)
+            # The pipeline returns a bare dict rather than a list for one pair
+            if isinstance(results, dict):
+                results = [results]
+            for i, result in enumerate(results):
+                if result["answer"] and result["score"] >= self.cascade_score:
+                    answers[i] = result["answer"]
+            pending = [i for i, answer in enumerate(answers) if answer is None]
+            self.count_tiers(len(questions) - len(pending), len(pending))
+            if not pending:
+                return answers[0] if single else answers
+
+        qa_pipeline = self.qa_pipeline
+        with self.metrics.stage(STAGE_READ):
+            if single:
+                results = qa_pipeline(question=question, context=context, **options)
+            else:
+                results = qa_pipeline(question=[questions[i] for i in pending],
+                                      context=[contexts[i] for i in pending], **options)
+        if isinstance(results, dict):
+            results = [results]
+        for i, result in zip(pending, results):
+            answers[i] = result["answer"]
+        return answers[0] if single else answers
+
+    ######################################################################
+    # Module: count_tiers
+    # Description: Counts the questions answered by each reader tier.
+    # Input:
+    #   - self: instance of the class itself
+    #   - fast: the number of answers of the small QA model
+    #   - full: the number of questions escalated to the QA model
+    # Returns: N/A
+    ######################################################################
+    def count_tiers(self, fast, full):
+        self.tier_counts[TIER_FAST] += fast
+        self.tier_counts[TIER_FULL] += full
+        self.metrics.increment(f"reader_{TIER_FAST}", fast)
+        self.metrics.increment(f"reader_{TIER_FULL}", full)
+
     ######################################################################
     # Module: ask_question
     # Description: Returns an answer for a user's question by using the
-    #              AI pipeline
+    #              AI pipeline on the passages retrieved for it
     # Input:
     #   - self: instance of the class itself
     #   - question: the user's question
@@ -38,7 +416,7 @@ class AIService:
         # If able to answer the user's question, return the answer.
         # Otherwise, return a message to the user noting that the answer could not be determined
         try:
-            result = self.qa_pipeline(question=question, context=self.context)
-            return result["answer"]
+            context = build_context(self.retrieve(question), self.max_context_words)
+            return self.read(question, context)
         except Exception as e:
             return f"Sorry, the answer could not be determined. ({e})"
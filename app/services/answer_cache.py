@@ -0,0 +1,250 @@
+# File: answer_cache.py
+# Author: William Jahner
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+######################################################################
+# Module: normalize_question
+# Description: Normalizes a question into the key of the exact cache
+#              tier: lowercase words separated by single spaces, with
+#              punctuation dropped.
+# Input:
+#   - question: the user's question
+# Returns: the normalized question
+######################################################################
+def normalize_question(question):
+    return " ".join(WORD_PATTERN.findall(question.lower()))
+
+######################################################################
+# Class: AnswerCache
+# Description: A bounded LRU answer cache with an optional time to live.
+#              The exact tier is keyed on the normalized question text.
+#              The optional semantic tier reuses a cached answer when a
+#              new question's embedding has a cosine similarity of at
+#              least semantic_threshold with a cached question's.
+#              Hit, miss, eviction and expiration counters are kept per
+#              tier. All methods are thread safe.
+######################################################################
+class AnswerCache:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for AnswerCache
+    # Input:
+    #   - self: instance of the class itself
+    #   - max_size: the maximum number of cached answers
+    #   - ttl_s: optional number of seconds an answer stays valid
+    #   - semantic_threshold: optional cosine similarity threshold that
+    #                         enables the semantic tier
+    #   - clock: the time source (for testing)
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, max_size=1024, ttl_s=None, semantic_threshold=None, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.semantic_threshold = semantic_threshold
+        self.clock = clock
+
+        # {key: [answer, expires_at, slot]}, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Semantic tier: one row of unit-length embeddings per slot,
+        # allocated on the first embedding
+        self._vectors = None
+        self._slot_expires = np.full(max_size, -np.inf)
+        self._slot_keys = [None] * max_size
+        self._free_slots = list(range(max_size - 1, -1, -1))
+
+        self.exact_hits = 0
+        self.exact_misses = 0
+        self.semantic_hits = 0
+        self.semantic_misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        # Incremented by clear, so answers computed before it can be told
+        # apart from the ones computed after
+        self.generation = 0
+
+    ######################################################################
+    # Module: semantic
+    # Description: Whether the semantic tier is enabled.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: True if the semantic tier is enabled, otherwise False
+    ######################################################################
+    @property
+    def semantic(self):
+        return self.semantic_threshold is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    ######################################################################
+    # Module: get
+    # Description: Looks up the answer of a question in the exact tier.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the user's question
+    # Returns: the cached answer, or None on a miss
+    ######################################################################
+    def get(self, question):
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.exact_misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[0]
+
+    ######################################################################
+    # Module: get_similar
+    # Description: Looks up the answer of the most similar cached
+    #              question in the semantic tier.
+    # Input:
+    #   - self: instance of the class itself
+    #   - embedding: the embedding of the new question
+    # Returns: the cached answer, or None if the semantic tier is
+    #          disabled or no cached question is similar enough
+    ######################################################################
+    def get_similar(self, embedding):
+        if not self.semantic:
+            return None
+
+        with self._lock:
+            if self._vectors is None or not self._entries:
+                self.semantic_misses += 1
+                return None
+
+            # Score the question against every live slot
+            now = self.clock()
+            query = self._unit(embedding)
+            scores = self._vectors @ query
+            scores[self._slot_expires <= now] = -np.inf
+            slot = int(np.argmax(scores))
+
+            if scores[slot] < self.semantic_threshold:
+                self.semantic_misses += 1
+                return None
+
+            key = self._slot_keys[slot]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return self._entries[key][0]
+
+    ######################################################################
+    # Module: put
+    # Description: Caches the answer of a question, evicting the least
+    #              recently used answer when the cache is full.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the user's question
+    #   - answer: the answer to cache
+    #   - embedding: optional embedding of the question (used by the
+    #                semantic tier)
+    #   - generation: optional generation read before the answer was
+    #                 computed; the answer is dropped if the cache was
+    #                 cleared since
+    # Returns: N/A
+    ######################################################################
+    def put(self, question, answer, embedding=None, generation=None):
+        if self.max_size <= 0:
+            return
+
+        key = normalize_question(question)
+        expires_at = self.clock() + self.ttl_s if self.ttl_s is not None else np.inf
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            slot = None
+            if self.semantic and embedding is not None:
+                vector = self._unit(embedding)
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+                slot = self._free_slots.pop()
+                self._vectors[slot] = vector
+                self._slot_expires[slot] = expires_at
+                self._slot_keys[slot] = key
+
+            self._entries[key] = [answer, expires_at, slot]
+
+    ######################################################################
+    # Module: clear
+    # Description: Drops every cached answer (e.g. after the knowledge
+    #              base changed) and starts a new generation. The counters
+    #              are kept.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+            self.generation += 1
+
+    ######################################################################
+    # Module: stats
+    # Description: Returns the cache counters.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a dict of counters. "hits" counts the hits of both tiers
+    #          and "misses" the questions neither tier could answer.
+    ######################################################################
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.exact_hits + self.semantic_hits,
+                "misses": self.semantic_misses if self.semantic else self.exact_misses,
+                "exact_hits": self.exact_hits,
+                "exact_misses": self.exact_misses,
+                "semantic_hits": self.semantic_hits,
+                "semantic_misses": self.semantic_misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    ######################################################################
+    # Module: _remove
+    # Description: Removes an entry and frees its semantic slot. The lock
+    #              must be held.
+    # Input:
+    #   - self: instance of the class itself
+    #   - key: the normalized question
+    # Returns: N/A
+    ######################################################################
+    def _remove(self, key):
+        _, _, slot = self._entries.pop(key)
+        if slot is not None:
+            self._slot_expires[slot] = -np.inf
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        return vector / max(float(np.linalg.norm(vector)), 1e-8)
@@ -0,0 +1,191 @@
+# File: embedding_cache.py
+# Author: William Jahner
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+# Default location of the on-disk embedding store (ignored by git)
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent.parent / "data/embedding_cache"
+
+# Sub-directory of a model's store holding one store per shard
+SHARDS_DIR = "shards"
+
+######################################################################
+# Module: safe_name
+# Description: Turns a model or shard name into a directory name.
+# Input:
+#   - name: the name
+# Returns: the name with unsafe characters replaced
+######################################################################
+def safe_name(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+######################################################################
+# Module: hash_text
+# Description: Returns the content hash used to address a single
+#              knowledge base entry in the embedding store.
+# Input:
+#   - text: the text that is embedded
+# Returns: a hex sha256 digest of the text
+######################################################################
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+######################################################################
+# Class: EmbeddingCache
+# Description: A content-addressed, on-disk store of knowledge base
+#              embeddings. Each embedding model gets its own directory
+#              holding a float32 matrix (embeddings.npy) and an index
+#              (index.json) mapping each row to the hash of the text it
+#              was computed from. Warm starts memory-map the matrix and
+#              only encode the entries that were added or edited.
+######################################################################
+class EmbeddingCache:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for EmbeddingCache
+    # Input:
+    #   - self: instance of the class itself
+    #   - cache_dir: the root directory of the embedding store
+    #   - model_name: the name of the embedding model (part of the key)
+    #   - shard: optional name of a knowledge base shard; each shard of a
+    #            sharded knowledge base has its own store
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, cache_dir, model_name, shard=None):
+        self.cache_dir = Path(cache_dir)
+        self.model_name = model_name
+        self.shard = shard
+        self.model_dir = self.cache_dir / safe_name(model_name)
+        if shard is not None:
+            self.model_dir = self.model_dir / SHARDS_DIR / safe_name(shard)
+        self.matrix_path = self.model_dir / "embeddings.npy"
+        self.index_path = self.model_dir / "index.json"
+
+    ######################################################################
+    # Module: load
+    # Description: Loads the stored hashes and memory-maps the stored
+    #              embedding matrix.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a tuple (hashes, matrix), or ([], None) if nothing usable
+    #          is stored for this model
+    ######################################################################
+    def load(self):
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode="c")
+        except (OSError, ValueError):
+            return [], None
+
+        # Ignore a store that belongs to another model or is out of sync
+        hashes = index.get("hashes", [])
+        if index.get("model") != self.model_name or matrix.ndim != 2 or matrix.shape[0] != len(hashes):
+            return [], None
+
+        return hashes, matrix
+
+    ######################################################################
+    # Module: save
+    # Description: Atomically writes the embedding matrix and its index
+    #              to disk, replacing whatever was stored before.
+    # Input:
+    #   - self: instance of the class itself
+    #   - hashes: the text hash of each matrix row
+    #   - matrix: the float32 embedding matrix
+    # Returns: N/A
+    ######################################################################
+    def save(self, hashes, matrix):
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+
+        # Write to temporary files first so a crash never leaves a
+        # half-written store behind
+        tmp_matrix_path = self.matrix_path.with_suffix(".tmp.npy")
+        tmp_index_path = self.index_path.with_suffix(".tmp.json")
+        np.save(tmp_matrix_path, np.asarray(matrix, dtype=np.float32))
+        with open(tmp_index_path, "w") as f:
+            json.dump({"model": self.model_name, "hashes": list(hashes)}, f)
+
+        # Replace the matrix before the index since the index is what
+        # declares the matrix valid
+        os.replace(tmp_matrix_path, self.matrix_path)
+        os.replace(tmp_index_path, self.index_path)
+
+    ######################################################################
+    # Module: encode
+    # Description: Returns the embeddings for the given texts, encoding
+    #              only those that are not already in the store and
+    #              updating the store when anything changed.
+    # Input:
+    #   - self: instance of the class itself
+    #   - embedder: the SentenceTransformer (or compatible) model
+    #   - texts: the list of texts to embed
+    # Returns: a float32 matrix with one row per text
+    ######################################################################
+    def encode(self, embedder, texts):
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        hashes = [hash_text(t) for t in texts]
+        stored_hashes, stored_matrix = self.load()
+
+        # Warm start with an unchanged knowledge base: just use the file
+        if stored_matrix is not None and stored_hashes == hashes:
+            return stored_matrix
+
+        stored_rows = {h: row for row, h in enumerate(stored_hashes)}
+
+        # Encode each new text once, even if it appears more than once
+        missing = {}
+        for i, h in enumerate(hashes):
+            if h not in stored_rows and h not in missing:
+                missing[h] = i
+
+        new_embeddings = None
+        if missing:
+            new_texts = [texts[i] for i in missing.values()]
+            new_embeddings = np.asarray(embedder.encode(new_texts, convert_to_numpy=True), dtype=np.float32)
+        new_rows = {h: row for row, h in enumerate(missing)}
+
+        # Assemble the matrix in the order of the requested texts
+        dim = stored_matrix.shape[1] if stored_matrix is not None else new_embeddings.shape[1]
+        matrix = np.empty((len(texts), dim), dtype=np.float32)
+        for i, h in enumerate(hashes):
+            if h in stored_rows:
+                matrix[i] = stored_matrix[stored_rows[h]]
+            else:
+                matrix[i] = new_embeddings[new_rows[h]]
+
+        self.save(hashes, matrix)
+        return matrix
+
+######################################################################
+# Module: remove_stale_shards
+# Description: Deletes the stores of shards that were retired from the
+#              knowledge base.
+# Input:
+#   - cache_dir: the root directory of the embedding store
+#   - model_name: the name of the embedding model
+#   - shard_names: the names of the shards still in use
+# Returns: the list of removed shard directory names
+######################################################################
+def remove_stale_shards(cache_dir, model_name, shard_names):
+    shards_dir = Path(cache_dir) / safe_name(model_name) / SHARDS_DIR
+    if not shards_dir.is_dir():
+        return []
+
+    keep = {safe_name(name) for name in shard_names}
+    removed = []
+    for shard_dir in sorted(shards_dir.iterdir()):
+        if shard_dir.is_dir() and shard_dir.name not in keep:
+            shutil.rmtree(shard_dir)
+            removed.append(shard_dir.name)
+    return removed
@@ -0,0 +1,278 @@
+# File: faq_table.py
+# Author: William Jahner
+
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from .embedding_cache import hash_text
+from .kb_loader import split_label
+from .retrieval_index import ExactIndex
+
+# Default location of the materialized FAQ table (ignored by git)
+DEFAULT_FAQ_DIR = Path(__file__).parent.parent.parent / "data/faq_table"
+
+# Files of a saved table
+TABLE_FILE = "table.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+# Cosine similarity from which a question takes the answer of the
+# closest materialized question
+DEFAULT_FAQ_THRESHOLD = 0.9
+
+# Question templates of each category. {baby} is e.g. "a 2 month old",
+# {age_old} "2 month old", {age} "2 months" and {topic} the words of the
+# sub-category (or the category). They are phrased the way parents ask,
+# mostly without the keywords the structured lookup answers.
+PARAPHRASE_TEMPLATES = {
+    "milestones": [
+        "What should {baby} be able to do?",
+        "What can babies do at {age}?",
+        "What {topic} skills should {baby} have?",
+        "Is my {age_old} behind on {topic} skills?",
+        "How do I know if {baby} is on track?",
+    ],
+    "feeding": [
+        "How much should {baby} drink?",
+        "How much does a {topic} baby drink at {age}?",
+        "Is my {age_old} getting enough to drink?",
+        "How often does {baby} need a {topic} meal?",
+    ],
+    "sleeping": [
+        "How much rest does {baby} need?",
+        "What is a normal {topic} schedule for {baby}?",
+        "How long can {baby} stay up?",
+        "Is my {age_old} getting enough rest?",
+    ],
+}
+
+# Templates of the categories without their own
+DEFAULT_TEMPLATES = [
+    "What should I know about {topic} for {baby}?",
+    "What is normal for {baby}?",
+]
+
+######################################################################
+# Module: age_phrases
+# Description: Turns the age of a label into the phrases the question
+#              templates use.
+# Input:
+#   - age: the age part of a label (e.g. "2 months" or "newborn (first
+#          week)")
+# Returns: a dict with the "age", "age_old" and "baby" phrases
+######################################################################
+def age_phrases(age):
+    age = re.sub(r"\s*\(.*?\)", "", age).strip()
+    age_old = re.sub(r"\bmonths?$", "month old", age)
+    article = "an" if re.match(r"(8|11|18)\b|[aeiou]", age_old) else "a"
+    return {"age": age, "age_old": age_old, "baby": f"{article} {age_old}"}
+
+######################################################################
+# Module: paraphrase_questions
+# Description: Generates likely questions about the entries of a label
+#              from its category, age and sub-category.
+# Input:
+#   - label: the entry label (category - age [- sub-category])
+# Returns: the list of questions (empty for a label without an age)
+######################################################################
+def paraphrase_questions(label):
+    parts = split_label(label)
+    if len(parts) < 2:
+        return []
+
+    category = parts[0]
+    topic = (parts[2] if len(parts) > 2 else category).replace("_", " ")
+    phrases = dict(age_phrases(parts[1]), topic=topic)
+    questions = [template.format(**phrases) for template in PARAPHRASE_TEMPLATES.get(category, DEFAULT_TEMPLATES)]
+    return list(dict.fromkeys(questions))
+
+######################################################################
+# Module: label_groups
+# Description: Groups the knowledge base entries by label. The
+#              paraphrases are generated per label, so a group is the
+#              unit the table is built and rebuilt in; its key is the
+#              hash of the label and its texts, and changes when any of
+#              its entries does.
+# Input:
+#   - knowledge_base: the (label, text) entries (or a KnowledgeStore)
+# Returns: a dict of {group key: label}, in knowledge base order
+######################################################################
+def label_groups(knowledge_base):
+    texts = {}
+    for label, text in knowledge_base:
+        texts.setdefault(label, []).append(text)
+    return {hash_text("\n".join([label] + group)): label for label, group in texts.items()}
+
+######################################################################
+# Class: FAQTable
+# Description: A materialized table of questions about the knowledge
+#              base and their answers, computed offline by
+#              app.faq_builder. A question whose embedding has a cosine
+#              similarity of at least threshold with a table question
+#              takes its answer without running the reader. Each row
+#              belongs to the label group its question was generated
+#              from and records the groups of the entries its answer was
+#              read from, so only the groups whose own entries, or whose
+#              answers' entries, changed are rebuilt (the answers of the
+#              other groups were read from unchanged entries).
+######################################################################
+class FAQTable:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for FAQTable
+    # Input:
+    #   - self: instance of the class itself
+    #   - questions: the question of each row
+    #   - answers: the answer of each row
+    #   - embeddings: the (rows x dim) question embeddings
+    #   - row_groups: the group key of each row
+    #   - groups: the dict of {group key: label} of the built groups
+    #             (including the groups without a row)
+    #   - models: the dict of the model names the table was built with
+    #   - threshold: the similarity from which a question is answered
+    #   - row_sources: the group keys of the entries each row's answer was
+    #                  read from (defaults to none)
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, questions=(), answers=(), embeddings=None, row_groups=(), groups=None, models=None,
+                 threshold=DEFAULT_FAQ_THRESHOLD, row_sources=None):
+        self.questions = list(questions)
+        self.answers = list(answers)
+        self.row_groups = list(row_groups)
+        self.row_sources = [list(sources) for sources in row_sources] if row_sources is not None \
+            else [[] for _ in self.questions]
+        self.groups = dict(groups or {})
+        self.models = dict(models or {})
+        self.threshold = threshold
+
+        if embeddings is None or not self.questions:
+            self.embeddings = np.empty((0, 0), dtype=np.float32)
+            self.index = None
+        else:
+            self.embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(self.questions), -1)
+            self.index = ExactIndex(self.embeddings)
+
+    def __len__(self):
+        return len(self.questions)
+
+    ######################################################################
+    # Module: lookup
+    # Description: Answers questions from the closest table questions.
+    # Input:
+    #   - self: instance of the class itself
+    #   - q_embeds: the (questions x dim) question embeddings
+    # Returns: the list of answers (None where no table question is
+    #          similar enough)
+    ######################################################################
+    def lookup(self, q_embeds):
+        q_embeds = np.asarray(q_embeds, dtype=np.float32).reshape(len(q_embeds), -1)
+        if self.index is None:
+            return [None] * q_embeds.shape[0]
+
+        scores, indices = self.index.search(q_embeds, top_k=1)
+        return [self.answers[i] if score >= self.threshold else None for score, i in zip(scores[:, 0], indices[:, 0])]
+
+    ######################################################################
+    # Module: retain
+    # Description: Returns the table restricted to the given groups. A
+    #              group is dropped whole (so that it is built again) when
+    #              any of its rows was read from an entry of a group that
+    #              is not kept.
+    # Input:
+    #   - self: instance of the class itself
+    #   - group_keys: the keys of the groups to keep (the groups of the
+    #                 current knowledge base)
+    # Returns: the new FAQTable
+    ######################################################################
+    def retain(self, group_keys):
+        group_keys = set(group_keys)
+        stale = {key for key, sources in zip(self.row_groups, self.row_sources) if not group_keys.issuperset(sources)}
+        kept = group_keys - stale
+        rows = [row for row, key in enumerate(self.row_groups) if key in kept]
+        return FAQTable([self.questions[row] for row in rows], [self.answers[row] for row in rows],
+                        self.embeddings[rows] if rows else None, [self.row_groups[row] for row in rows],
+                        {key: label for key, label in self.groups.items() if key in kept},
+                        self.models, self.threshold, [self.row_sources[row] for row in rows])
+
+    ######################################################################
+    # Module: extend
+    # Description: Returns the table with the rows of newly built groups
+    #              added.
+    # Input:
+    #   - self: instance of the class itself
+    #   - questions: the questions of the new rows
+    #   - answers: their answers
+    #   - embeddings: their embeddings
+    #   - row_groups: their group keys
+    #   - groups: the dict of {group key: label} of the new groups
+    #   - row_sources: the group keys of the entries each new answer was
+    #                  read from
+    # Returns: the new FAQTable
+    ######################################################################
+    def extend(self, questions, answers, embeddings, row_groups, groups, row_sources=None):
+        if row_sources is None:
+            row_sources = [[] for _ in questions]
+        if len(questions) and len(self):
+            embeddings = np.vstack([self.embeddings, np.asarray(embeddings, dtype=np.float32)])
+        elif not len(questions):
+            embeddings = self.embeddings if len(self) else None
+        return FAQTable(self.questions + list(questions), self.answers + list(answers), embeddings,
+                        self.row_groups + list(row_groups), dict(self.groups, **groups), self.models, self.threshold,
+                        self.row_sources + list(row_sources))
+
+    ######################################################################
+    # Module: save
+    # Description: Atomically writes the table to a directory.
+    # Input:
+    #   - self: instance of the class itself
+    #   - directory: the directory of the table
+    # Returns: N/A
+    ######################################################################
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # Like the embedding store, the table file is replaced last since
+        # it declares the embeddings valid
+        tmp_embeddings_path = directory / (EMBEDDINGS_FILE + ".tmp")
+        tmp_table_path = directory / (TABLE_FILE + ".tmp")
+        with open(tmp_embeddings_path, "wb") as f:
+            np.save(f, self.embeddings)
+        with open(tmp_table_path, "w", encoding="utf-8") as f:
+            json.dump({"models": self.models, "groups": self.groups,
+                       "rows": [{"group": key, "sources": sources, "question": question, "answer": answer}
+                                for key, sources, question, answer in zip(self.row_groups, self.row_sources,
+                                                                          self.questions, self.answers)]},
+                      f, indent=1)
+        os.replace(tmp_embeddings_path, directory / EMBEDDINGS_FILE)
+        os.replace(tmp_table_path, directory / TABLE_FILE)
+
+    ######################################################################
+    # Module: load
+    # Description: Loads a table written by save.
+    # Input:
+    #   - directory: the directory of the table
+    #   - threshold: the similarity from which a question is answered
+    # Returns: the FAQTable, or None if no usable table is stored (a table
+    #          whose rows do not record their sources is not usable)
+    ######################################################################
+    @classmethod
+    def load(cls, directory, threshold=DEFAULT_FAQ_THRESHOLD):
+        directory = Path(directory)
+        try:
+            with open(directory / TABLE_FILE, "r", encoding="utf-8") as f:
+                table = json.load(f)
+            embeddings = np.load(directory / EMBEDDINGS_FILE)
+        except (OSError, ValueError):
+            return None
+
+        rows = table.get("rows", [])
+        if (rows and embeddings.shape[0] != len(rows)) or any("sources" not in row for row in rows):
+            return None
+        return cls([row["question"] for row in rows], [row["answer"] for row in rows], embeddings,
+                   [row["group"] for row in rows], table.get("groups"), table.get("models"), threshold,
+                   [row["sources"] for row in rows])
@@ -0,0 +1,128 @@
+# File: intent_router.py
+# Author: William Jahner
+
+import re
+from collections import namedtuple
+
+from .kb_loader import split_label
+from .lookup_service import CATEGORY_KEYWORDS, parse_question_age
+
+# Names of the routes a question can take
+ROUTE_MILESTONE = "milestone"
+ROUTE_LOOKUP = "lookup"
+ROUTE_NLP = "nlp"
+
+# Keywords that route a question to the listing service
+# Note that for now this is only related to milestones, but in the future
+# it could be expanded to other categories
+LIST_KEYWORDS = ("milestone", "milestones", "developmental milestones")
+
+# The category listed by the listing service
+LIST_CATEGORY = "milestones"
+
+# Estimated cost of answering a question on each route, in milliseconds
+# (the lookups are dictionary reads; the NLP route runs the embedder and
+# the QA model on a CPU)
+ROUTE_COSTS_MS = {
+    ROUTE_MILESTONE: 0.05,
+    ROUTE_LOOKUP: 0.1,
+    ROUTE_NLP: 60.0,
+}
+
+# The routing decision of a question: the route, its estimated cost in
+# milliseconds, the categories named in the question and, for a lookup,
+# the age in months
+RouteDecision = namedtuple("RouteDecision", ["route", "cost_ms", "categories", "age_months"])
+
+######################################################################
+# Module: compile_terms
+# Description: Compiles a list of terms into one regular expression
+#              matching any of them as whole words. Longer terms come
+#              first, so a phrase wins over the words it starts with.
+# Input:
+#   - terms: the terms (lowercase words or phrases)
+# Returns: the compiled pattern
+######################################################################
+def compile_terms(terms):
+    alternatives = "|".join(re.escape(term) for term in sorted(set(terms), key=lambda term: (-len(term), term)))
+    return re.compile(rf"(?<![a-z])(?:{alternatives})(?![a-z])")
+
+######################################################################
+# Class: IntentRouter
+# Description: Routes each question to the cheapest service that can
+#              answer it. The category keywords of the knowledge base
+#              and the listing keywords are compiled once into a single
+#              pattern, so a question is scanned once whatever the
+#              number of keywords. The milestone list takes questions
+#              that name milestones and no other category; the
+#              structured lookup is only tried for questions naming one
+#              category and an age (it cannot answer the others); the
+#              rest go to the NLP service.
+######################################################################
+class IntentRouter:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for IntentRouter
+    # Input:
+    #   - self: instance of the class itself
+    #   - knowledge_base: the flattened knowledge base as labeled text
+    #                     entries (or a KnowledgeStore)
+    #   - category_keywords: optional dict overriding CATEGORY_KEYWORDS.
+    #                        Categories that are not listed are matched
+    #                        by name.
+    #   - list_keywords: the keywords of the listing service
+    #   - costs_ms: optional dict overriding ROUTE_COSTS_MS
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, knowledge_base, category_keywords=None, list_keywords=LIST_KEYWORDS, costs_ms=None):
+        category_keywords = CATEGORY_KEYWORDS if category_keywords is None else category_keywords
+        self.costs_ms = dict(ROUTE_COSTS_MS, **(costs_ms or {}))
+
+        categories = []
+        for label, _ in knowledge_base:
+            category = split_label(label)[0]
+            if category not in categories:
+                categories.append(category)
+
+        # Map each term to the categories it names; the listing keywords
+        # name the listed category
+        term_categories = {}
+        for category in categories:
+            for term in category_keywords.get(category, [category]):
+                term_categories.setdefault(term.lower(), set()).add(category)
+        self.list_terms = frozenset(term.lower() for term in list_keywords)
+        for term in self.list_terms:
+            term_categories.setdefault(term, set()).add(LIST_CATEGORY)
+        self.term_categories = {term: frozenset(names) for term, names in term_categories.items()}
+
+        self.pattern = compile_terms(self.term_categories)
+        self.no_category = RouteDecision(ROUTE_NLP, self.costs_ms[ROUTE_NLP], frozenset(), None)
+
+    ######################################################################
+    # Module: route
+    # Description: Decides the route of a question. The age is only parsed
+    #              for questions naming one category (the others cannot
+    #              be looked up).
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the user's question
+    # Returns: a RouteDecision
+    ######################################################################
+    def route(self, question):
+        terms = self.pattern.findall(question.lower())
+        if not terms:
+            return self.no_category
+
+        term_categories = self.term_categories
+        categories = term_categories[terms[0]]
+        for term in terms[1:]:
+            categories = categories | term_categories[term]
+
+        if len(categories) == 1 and LIST_CATEGORY in categories and not self.list_terms.isdisjoint(terms):
+            return RouteDecision(ROUTE_MILESTONE, self.costs_ms[ROUTE_MILESTONE], categories, None)
+
+        age_months = parse_question_age(question) if len(categories) == 1 else None
+        if age_months is not None:
+            return RouteDecision(ROUTE_LOOKUP, self.costs_ms[ROUTE_LOOKUP], categories, age_months)
+        return RouteDecision(ROUTE_NLP, self.costs_ms[ROUTE_NLP], categories, None)
@@ -1,9 +1,211 @@
 # File: kb_loader.py
 # Author: William Jahner
 
+import hashlib
 import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
 from pathlib import Path
 
+# Default location of the knowledge base
+DEFAULT_KB_PATH = Path(__file__).parent.parent.parent / "data/baby_knowledge.json"
+
+# Separator of the parts of an entry label, e.g. "milestones - 6 months - cognitive"
+LABEL_SEPARATOR = " - "
+
+# Shard file formats: the hierarchical JSON knowledge base, or JSON lines
+# with one {"label": ..., "text": ...} entry per line
+SHARD_FORMATS = {".json": "json", ".jsonl": "jsonl"}
+
+# A knowledge base shard listed in a manifest. metadata holds the other
+# manifest fields (e.g. locale or source).
+Shard = namedtuple("Shard", ["name", "path", "format", "metadata"])
+
+# Number of characters read from the file at a time
+CHUNK_SIZE = 64 * 1024
+
+# The entries added, removed and changed (as (old, new) pairs) between
+# two versions of the knowledge base
+KnowledgeBaseDiff = namedtuple("KnowledgeBaseDiff", ["added", "removed", "changed"])
+
+######################################################################
+# Module: make_label
+# Description: Builds an entry label from its parts.
+# Input:
+#   - parts: the label parts, e.g. ("milestones", "6 months", "cognitive")
+# Returns: the label
+######################################################################
+def make_label(*parts):
+    return LABEL_SEPARATOR.join(parts)
+
+######################################################################
+# Module: split_label
+# Description: Splits an entry label into its parts.
+# Input:
+#   - label: the label
+# Returns: the list of label parts
+######################################################################
+def split_label(label):
+    return label.split(LABEL_SEPARATOR)
+
+######################################################################
+# Class: JsonStream
+# Description: A minimal incremental JSON reader. Objects are walked
+#              member by member, so only the value being read (such as
+#              one list of entries) and one chunk of the file are held
+#              in memory at a time.
+######################################################################
+class JsonStream:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for JsonStream
+    # Input:
+    #   - self: instance of the class itself
+    #   - f: a text file object
+    #   - chunk_size: the number of characters read at a time
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    ######################################################################
+    # Module: fill
+    # Description: Reads the next chunk of the file into the buffer.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: False at the end of the file, otherwise True
+    ######################################################################
+    def fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    ######################################################################
+    # Module: peek
+    # Description: Skips whitespace and returns the next character.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the next character, or "" at the end of the file
+    ######################################################################
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    ######################################################################
+    # Module: expect
+    # Description: Consumes the next character, which must be one of the
+    #              given characters.
+    # Input:
+    #   - self: instance of the class itself
+    #   - chars: the allowed characters
+    # Returns: the consumed character
+    ######################################################################
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    ######################################################################
+    # Module: value
+    # Description: Reads the next complete JSON value.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the decoded value
+    ######################################################################
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number may continue in the next chunk
+                if end < len(self.buffer) or isinstance(value, (dict, list, str)) or not self.fill():
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+
+    ######################################################################
+    # Module: members
+    # Description: Walks the members of the next JSON object. The caller
+    #              must read each member's value (with value or members)
+    #              before asking for the next key.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a generator of member keys
+    ######################################################################
+    def members(self):
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError("Expecting property name", self.buffer, self.pos)
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+######################################################################
+# Module: iter_entries
+# Description: Streams the labeled entries of a knowledge base.
+# Input:
+#   - f: a text file object of the knowledge base JSON
+# Returns: a generator of (label, text) tuples
+######################################################################
+def iter_entries(f):
+    stream = JsonStream(f)
+
+    # Loop through top-level categories (e.g., "milestones", "feeding", etc.)
+    for main_category in stream.members():
+        # Example: category_data = { "3 months": {...}, "6 months": {...}, etc. }
+        for subkey in stream.members():
+            # If the subdata is nested by subcategories (like milestone types)
+            if stream.peek() == "{":
+                for subcat in stream.members():
+                    # Add each entry with a descriptive label
+                    label = make_label(main_category, subkey, subcat)
+                    for e in stream.value():
+                        yield (label, e)
+            # Otherwise, it’s a simple list
+            else:
+                subdata = stream.value()
+                if isinstance(subdata, list):
+                    label = make_label(main_category, subkey)
+                    for e in subdata:
+                        yield (label, e)
+
+######################################################################
+# Module: iter_knowledge_base
+# Description: Streams a hierarchical baby knowledge base JSON file as
+#              labeled text entries without loading the whole file.
+# Input:
+#   - path: The path to the JSON file.
+# Returns:
+#   - A generator of tuples (label, text)
+######################################################################
+def iter_knowledge_base(path=DEFAULT_KB_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        yield from iter_entries(f)
+
 ######################################################################
 # Module: load_knowledge_base
 # Description: Loads a hierarchical baby knowledge base JSON file and
@@ -14,27 +216,243 @@ from pathlib import Path
 # Returns:
 #   - A list of tuples [(label, text), ...]
 ######################################################################
-def load_knowledge_base(path=Path(__file__).parent.parent.parent / "data/baby_knowledge.json"):
-    with open(path, "r") as f:
-        data = json.load(f)
+def load_knowledge_base(path=DEFAULT_KB_PATH):
+    return list(iter_knowledge_base(path))
 
-    knowledge_entries = []
+######################################################################
+# Module: iter_jsonl_entries
+# Description: Streams the entries of a JSON lines shard. Each line is an
+#              object with a "label" (a string or a list of label parts)
+#              and a "text".
+# Input:
+#   - f: a text file object of the shard
+# Returns: a generator of (label, text) tuples
+######################################################################
+def iter_jsonl_entries(f):
+    for line in f:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        label = entry["label"]
+        yield (label if isinstance(label, str) else make_label(*label), entry["text"])
 
-    # Loop through top-level categories (e.g., "milestones", "feeding", etc.)
-    for main_category, category_data in data.items():
-        # Example: category_data = { "3 months": {...}, "6 months": {...}, etc. }
-        for subkey, subdata in category_data.items():
-            # If the subdata is nested by subcategories (like milestone types)
-            if isinstance(subdata, dict):
-                for subcat, entries in subdata.items():
-                    # Add each entry with a descriptive label
-                    for e in entries:
-                        label = f"{main_category} - {subkey} - {subcat}"
-                        knowledge_entries.append((label, e))
-            # Otherwise, it’s a simple list
-            elif isinstance(subdata, list):
-                for e in subdata:
-                    label = f"{main_category} - {subkey}"
-                    knowledge_entries.append((label, e))
+######################################################################
+# Module: read_shard
+# Description: Reads all entries of a shard file. This runs in the
+#              loader's worker processes.
+# Input:
+#   - path: the path of the shard file
+#   - shard_format: "json" or "jsonl"
+# Returns: a list of (label, text) tuples
+######################################################################
+def read_shard(path, shard_format):
+    with open(path, "r", encoding="utf-8") as f:
+        return list(iter_entries(f) if shard_format == "json" else iter_jsonl_entries(f))
+
+######################################################################
+# Module: load_manifest
+# Description: Reads a knowledge base manifest, a JSON file listing the
+#              shards of the knowledge base:
+#
+#              {"shards": [{"path": "milestones.json"},
+#                          {"path": "feeding-es.jsonl", "name": "feeding-es",
+#                           "locale": "es", "source": "clinic"}]}
+#
+#              Paths are relative to the manifest. A shard's name
+#              defaults to its file name without the extension and its
+#              format to the one of the extension.
+# Input:
+#   - path: the path of the manifest
+# Returns: the list of Shards, in manifest order
+######################################################################
+def load_manifest(path):
+    path = Path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    shards = []
+    for item in manifest["shards"]:
+        shard_path = path.parent / item["path"]
+        shard_format = item.get("format", SHARD_FORMATS.get(shard_path.suffix))
+        if shard_format not in SHARD_FORMATS.values():
+            raise ValueError(f"Unknown format of knowledge base shard '{shard_path}'")
+        metadata = {k: v for k, v in item.items() if k not in ("name", "path", "format")}
+        shards.append(Shard(item.get("name", shard_path.stem), shard_path, shard_format, metadata))
+
+    names = [shard.name for shard in shards]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate shard names in manifest '{path}'")
+    return shards
+
+######################################################################
+# Module: load_shards
+# Description: Loads the shards of a manifest, in parallel with a
+#              process pool when there is more than one shard.
+# Input:
+#   - manifest_path: the path of the manifest
+#   - processes: the number of worker processes (defaults to the number
+#                of CPUs; 1 loads the shards in this process)
+# Returns: a list of (Shard, list of (label, text) tuples), in manifest
+#          order
+######################################################################
+def load_shards(manifest_path, processes=None):
+    shards = load_manifest(manifest_path)
+    paths = [shard.path for shard in shards]
+    formats = [shard.format for shard in shards]
+
+    processes = min(processes or os.cpu_count() or 1, len(shards))
+    if processes <= 1:
+        entries = map(read_shard, paths, formats)
+        return list(zip(shards, entries))
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(zip(shards, executor.map(read_shard, paths, formats)))
+
+######################################################################
+# Module: flatten_shards
+# Description: Concatenates loaded shards into one knowledge base.
+# Input:
+#   - loaded: the result of load_shards
+# Returns: a tuple (list of (label, text) tuples, list of (shard name,
+#          number of entries))
+######################################################################
+def flatten_shards(loaded):
+    knowledge_base = [entry for _, entries in loaded for entry in entries]
+    return knowledge_base, [(shard.name, len(entries)) for shard, entries in loaded]
+
+######################################################################
+# Class: HashingReader
+# Description: A text file wrapper that hashes everything read through
+#              it, so a file can be parsed and hashed in one pass.
+######################################################################
+class HashingReader:
+
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.sha.update(data.encode("utf-8"))
+        return data
+
+    ######################################################################
+    # Module: hexdigest
+    # Description: Reads the rest of the file and returns its hash.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the hex sha256 digest of the file content
+    ######################################################################
+    def hexdigest(self):
+        while self.read(CHUNK_SIZE):
+            pass
+        return self.sha.hexdigest()
+
+######################################################################
+# Module: diff_knowledge_bases
+# Description: Computes the entries added, removed and changed between
+#              two versions of a knowledge base. Entries are compared
+#              label by label in order, so an edited entry is reported
+#              as changed rather than as removed plus added.
+# Input:
+#   - old: the previous list of (label, text) tuples
+#   - new: the new list of (label, text) tuples
+# Returns: a KnowledgeBaseDiff
+######################################################################
+def diff_knowledge_bases(old, new):
+    old_texts = {}
+    for label, text in old:
+        old_texts.setdefault(label, []).append(text)
+    new_texts = {}
+    for label, text in new:
+        new_texts.setdefault(label, []).append(text)
+
+    added, removed, changed = [], [], []
+    for label in list(old_texts) + [label for label in new_texts if label not in old_texts]:
+        before = old_texts.get(label, [])
+        after = new_texts.get(label, [])
+        matcher = SequenceMatcher(None, before, after, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            # Pair up replaced entries; the rest were added or removed
+            paired = min(i2 - i1, j2 - j1) if tag == "replace" else 0
+            changed.extend(((label, before[i1 + k]), (label, after[j1 + k])) for k in range(paired))
+            removed.extend((label, text) for text in before[i1 + paired:i2])
+            added.extend((label, text) for text in after[j1 + paired:j2])
+
+    return KnowledgeBaseDiff(added, removed, changed)
+
+######################################################################
+# Class: KnowledgeBaseWatcher
+# Description: Tracks a knowledge base file and reports what changed
+#              since the last check. A check costs a stat call unless
+#              the modification time or size changed; then the file is
+#              hashed and, if its content changed, re-read and diffed.
+######################################################################
+class KnowledgeBaseWatcher:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for KnowledgeBaseWatcher. Loads the
+    #              current version of the knowledge base.
+    # Input:
+    #   - self: instance of the class itself
+    #   - path: The path to the JSON file.
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, path=DEFAULT_KB_PATH):
+        self.path = Path(path)
+        self.signature = self.file_signature()
+        self.entries, self.digest = self.read()
+
+    ######################################################################
+    # Module: file_signature
+    # Description: Returns the modification time and size of the file.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a tuple (mtime in ns, size in bytes)
+    ######################################################################
+    def file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    ######################################################################
+    # Module: read
+    # Description: Streams the entries of the file and hashes it.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a tuple (list of (label, text) tuples, hex digest)
+    ######################################################################
+    def read(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            reader = HashingReader(f)
+            entries = list(iter_entries(reader))
+            return entries, reader.hexdigest()
+
+    ######################################################################
+    # Module: check
+    # Description: Checks the file for changes. A file that cannot be
+    #              read or parsed (e.g. while it is being written) is
+    #              ignored until the next check.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the KnowledgeBaseDiff since the last check, or None if the
+    #          content did not change
+    ######################################################################
+    def check(self):
+        try:
+            signature = self.file_signature()
+            if signature == self.signature:
+                return None
+            entries, digest = self.read()
+        except (OSError, ValueError):
+            return None
+
+        self.signature = signature
+        if digest == self.digest:
+            return None
 
-    return knowledge_entries
+        diff = diff_knowledge_bases(self.entries, entries)
+        self.entries, self.digest = entries, digest
+        return diff
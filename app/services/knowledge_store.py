@@ -0,0 +1,279 @@
+# File: knowledge_store.py
+# Author: William Jahner
+
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+from .kb_loader import split_label
+
+# Label parts stored as interned IDs, in label order
+# ("milestones - 6 months - social_emotional")
+LEVELS = ("category", "age", "sub_category")
+
+# The ID of a missing label part
+NO_ID = -1
+
+# Data types the embedding matrix can be kept in
+EMBEDDING_DTYPES = ("float32", "float16")
+
+######################################################################
+# Class: PassageView
+# Description: A read-only sequence of the "label: text" passages of a
+#              KnowledgeStore. Passages are rendered on access, so the
+#              store never holds them as strings.
+######################################################################
+class PassageView(Sequence):
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for PassageView
+    # Input:
+    #   - self: instance of the class itself
+    #   - store: the KnowledgeStore
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    ######################################################################
+    # Module: __getitem__
+    # Description: Returns one passage, or a list of passages for a slice.
+    # Input:
+    #   - self: instance of the class itself
+    #   - row: the row number or a slice
+    # Returns: the passage or the list of passages
+    ######################################################################
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self.store.passage(i) for i in range(*row.indices(len(self.store)))]
+        return self.store.passage(row)
+
+######################################################################
+# Class: KnowledgeStore
+# Description: A compact, column-oriented copy of the flattened
+#              knowledge base. Labels are interned once and every label
+#              part (category, age and sub-category) is an integer ID per
+#              row, the texts are one UTF-8 buffer addressed by offsets,
+#              and the embeddings are one matrix. Filtering rows by label
+#              part is a vectorized mask. Iterating the store yields
+#              (label, text) tuples, so it can stand in for the list of
+#              tuples.
+######################################################################
+class KnowledgeStore:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for KnowledgeStore. Use from_entries to
+    #              build a store from (label, text) tuples.
+    # Input:
+    #   - self: instance of the class itself
+    #   - labels: the list of distinct labels
+    #   - label_ids: the label ID of each row
+    #   - buffer: the UTF-8 encoded texts, back to back (a memoryview is
+    #             used without a copy)
+    #   - offsets: the start of each row's text in the buffer, followed by
+    #              the length of the buffer
+    #   - embedding_dtype: the data type of the embedding matrix
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, labels, label_ids, buffer, offsets, embedding_dtype="float32"):
+        if embedding_dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unknown embedding dtype '{embedding_dtype}' (expected one of {EMBEDDING_DTYPES})")
+
+        self.labels = list(labels)
+        self.label_ids = np.asarray(label_ids, dtype=np.int32)
+        self.buffer = buffer if isinstance(buffer, (bytes, memoryview)) else bytes(buffer)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.embedding_dtype = embedding_dtype
+        self._embeddings = None
+
+        # Intern the label parts: names[level][id] is the name of an ID
+        self.names = {level: [] for level in LEVELS}
+        self.ids = {level: {} for level in LEVELS}
+        part_ids = np.full((len(self.labels), len(LEVELS)), NO_ID, dtype=np.int32)
+        depths = np.zeros(len(self.labels), dtype=np.int8)
+        for label_id, label in enumerate(self.labels):
+            parts = split_label(label)
+            depths[label_id] = len(parts)
+            for column, (level, part) in enumerate(zip(LEVELS, parts)):
+                ids = self.ids[level]
+                if part not in ids:
+                    ids[part] = len(self.names[level])
+                    self.names[level].append(part)
+                part_ids[label_id, column] = ids[part]
+
+        # Per-row columns (the label table is small, so these are cheap)
+        self.columns = {level: part_ids[self.label_ids, column] for column, level in enumerate(LEVELS)}
+        self.depths = depths[self.label_ids]
+
+    ######################################################################
+    # Module: from_entries
+    # Description: Builds a store from (label, text) tuples in one pass.
+    #              A store is returned as is when it already keeps the
+    #              given embedding dtype; otherwise a store sharing its
+    #              columns is returned with the embeddings converted.
+    # Input:
+    #   - entries: an iterable of (label, text) tuples, or a KnowledgeStore
+    #   - embedding_dtype: the data type of the embedding matrix
+    # Returns: the KnowledgeStore
+    ######################################################################
+    @classmethod
+    def from_entries(cls, entries, embedding_dtype="float32"):
+        if isinstance(entries, KnowledgeStore):
+            if entries.embedding_dtype == embedding_dtype:
+                return entries
+            store = cls(entries.labels, entries.label_ids, entries.buffer, entries.offsets, embedding_dtype)
+            store.embeddings = entries.embeddings
+            return store
+
+        labels = {}
+        label_ids = array("i")
+        buffer = bytearray()
+        offsets = array("q", [0])
+        for label, text in entries:
+            label_ids.append(labels.setdefault(label, len(labels)))
+            buffer += text.encode("utf-8")
+            offsets.append(len(buffer))
+        return cls(list(labels), label_ids, buffer, offsets, embedding_dtype)
+
+    ######################################################################
+    # Module: embeddings
+    # Description: The embedding matrix with one row per entry, or None
+    #              before it is computed. Assigned matrices are converted
+    #              to the store's embedding dtype.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the embedding matrix or None
+    ######################################################################
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    @embeddings.setter
+    def embeddings(self, value):
+        if value is not None:
+            value = np.asarray(value, dtype=self.embedding_dtype)
+            if value.shape[0] != len(self):
+                raise ValueError(f"Expected {len(self)} embeddings, got {value.shape[0]}")
+        self._embeddings = value
+
+    def __len__(self):
+        return len(self.label_ids)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    ######################################################################
+    # Module: __getitem__
+    # Description: Returns one entry as a (label, text) tuple.
+    # Input:
+    #   - self: instance of the class itself
+    #   - row: the row number
+    # Returns: the (label, text) tuple
+    ######################################################################
+    def __getitem__(self, row):
+        return self.label(row), self.text(row)
+
+    ######################################################################
+    # Module: label
+    # Description: Returns the label of a row.
+    # Input:
+    #   - self: instance of the class itself
+    #   - row: the row number
+    # Returns: the label
+    ######################################################################
+    def label(self, row):
+        return self.labels[self.label_ids[row]]
+
+    ######################################################################
+    # Module: text
+    # Description: Returns the text of a row, decoded from the buffer.
+    # Input:
+    #   - self: instance of the class itself
+    #   - row: the row number
+    # Returns: the text
+    ######################################################################
+    def text(self, row):
+        if row < 0:
+            row += len(self)
+        return str(self.buffer[self.offsets[row]:self.offsets[row + 1]], "utf-8")
+
+    ######################################################################
+    # Module: passage
+    # Description: Returns the "label: text" passage of a row, as
+    #              embedded and read by the models.
+    # Input:
+    #   - self: instance of the class itself
+    #   - row: the row number
+    # Returns: the passage
+    ######################################################################
+    def passage(self, row):
+        return f"{self.label(row)}: {self.text(row)}"
+
+    ######################################################################
+    # Module: passages
+    # Description: The passages of every row, rendered on access
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a PassageView
+    ######################################################################
+    @property
+    def passages(self):
+        return PassageView(self)
+
+    ######################################################################
+    # Module: mask
+    # Description: Selects the rows whose label parts match. Each level is
+    #              given as a name or a collection of names (None in a
+    #              collection matches rows without that part); levels that
+    #              are not given match every row.
+    # Input:
+    #   - self: instance of the class itself
+    #   - criteria: level=name(s), e.g. category="milestones"
+    # Returns: a boolean array with one value per row
+    ######################################################################
+    def mask(self, **criteria):
+        selected = np.ones(len(self), dtype=bool)
+        for level, names in criteria.items():
+            if level not in self.columns:
+                raise ValueError(f"Unknown label level '{level}' (expected one of {LEVELS})")
+            if names is None:
+                continue
+            if isinstance(names, str):
+                names = [names]
+            ids = [NO_ID if name is None else self.ids[level][name]
+                   for name in names if name is None or name in self.ids[level]]
+            selected &= np.isin(self.columns[level], ids)
+        return selected
+
+    ######################################################################
+    # Module: rows
+    # Description: Returns the rows whose label parts match (see mask).
+    # Input:
+    #   - self: instance of the class itself
+    #   - criteria: level=name(s), e.g. category="milestones"
+    # Returns: an array of row numbers in store order
+    ######################################################################
+    def rows(self, **criteria):
+        return np.flatnonzero(self.mask(**criteria))
+
+    ######################################################################
+    # Module: nbytes
+    # Description: Returns the memory held by the store's arrays and
+    #              buffers (the small label table is not counted).
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the size in bytes
+    ######################################################################
+    def nbytes(self):
+        size = len(self.buffer) + self.offsets.nbytes + self.label_ids.nbytes + self.depths.nbytes
+        size += sum(column.nbytes for column in self.columns.values())
+        if self._embeddings is not None:
+            size += self._embeddings.nbytes
+        return size
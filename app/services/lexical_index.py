@@ -0,0 +1,141 @@
+# File: lexical_index.py
+# Author: William Jahner
+
+import math
+import re
+
+import numpy as np
+
+# Matches the word tokens of a text
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Words too common in questions and entries to tell them apart
+STOPWORDS = frozenset([
+    "a", "about", "an", "and", "are", "at", "be", "by", "can", "do", "does", "for", "from", "get", "has",
+    "have", "how", "i", "if", "in", "is", "it", "my", "of", "on", "or", "should", "that", "the", "their",
+    "them", "they", "this", "to", "what", "when", "which", "why", "will", "with", "you", "your",
+])
+
+# BM25 parameters: term frequency saturation and length normalization
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+######################################################################
+# Module: tokenize
+# Description: Splits a text into the terms indexed by BM25: lowercase
+#              words without stopwords, with plurals folded so that
+#              "nap" matches "naps" and "baby" matches "babies".
+# Input:
+#   - text: the text to split
+# Returns: the list of terms
+######################################################################
+def tokenize(text):
+    terms = []
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+######################################################################
+# Class: BM25Index
+# Description: A BM25 inverted index over the knowledge base passages.
+#              Each posting list holds the entries containing a term
+#              and their precomputed BM25 weight, so scoring a question
+#              is a sum over the posting lists of its terms and needs no
+#              model.
+######################################################################
+class BM25Index:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for BM25Index
+    # Input:
+    #   - self: instance of the class itself
+    #   - passages: the passages to index, in row order
+    #   - k1: the term frequency saturation
+    #   - b: the document length normalization
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, passages, k1=DEFAULT_K1, b=DEFAULT_B):
+        counts = {}
+        lengths = []
+        for row, passage in enumerate(passages):
+            terms = tokenize(passage)
+            lengths.append(len(terms))
+            for term in terms:
+                postings = counts.setdefault(term, {})
+                postings[row] = postings.get(row, 0) + 1
+
+        self.size = len(lengths)
+        lengths = np.asarray(lengths, dtype=np.float32)
+        average = float(lengths.mean()) if self.size else 0.0
+        norms = k1 * (1 - b + b * lengths / max(average, 1e-8))
+
+        # {term: (rows, weights)}
+        self.postings = {}
+        for term, postings in counts.items():
+            rows = np.fromiter(postings, dtype=np.int64, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            idf = math.log(1 + (self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+            self.postings[term] = (rows, (idf * tf * (k1 + 1) / (tf + norms[rows])).astype(np.float32))
+
+    def __len__(self):
+        return self.size
+
+    ######################################################################
+    # Module: score
+    # Description: Computes the BM25 score of every entry for a question.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the question
+    # Returns: a float32 vector with one score per entry (0 for entries
+    #          sharing no term with the question)
+    ######################################################################
+    def score(self, question):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(question)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        return scores
+
+    ######################################################################
+    # Module: search
+    # Description: Finds the top_k entries of each question, with the same
+    #              result layout as RetrievalIndex.search. Only entries
+    #              sharing a term with the question are returned.
+    # Input:
+    #   - self: instance of the class itself
+    #   - questions: the list of questions
+    #   - top_k: the number of entries to return per question
+    #   - rows: optional array of entry ids the search is restricted to
+    # Returns: a tuple (scores, indices), each (questions x top_k), with the
+    #          best entry first and rows padded with index -1
+    ######################################################################
+    def search(self, questions, top_k=3, rows=None):
+        top_k = min(top_k, self.size)
+        scores = np.full((len(questions), top_k), -np.inf, dtype=np.float32)
+        indices = np.full((len(questions), top_k), -1, dtype=np.int64)
+
+        allowed = None
+        if rows is not None:
+            allowed = np.zeros(self.size, dtype=bool)
+            allowed[np.asarray(rows, dtype=np.int64)] = True
+
+        for row, question in enumerate(questions):
+            question_scores = self.score(question)
+            matched = np.flatnonzero(question_scores)
+            if allowed is not None:
+                matched = matched[allowed[matched]]
+            if matched.size == 0:
+                continue
+            order = np.argsort(-question_scores[matched], kind="stable")[:top_k]
+            scores[row, :order.size] = question_scores[matched[order]]
+            indices[row, :order.size] = matched[order]
+
+        return scores, indices
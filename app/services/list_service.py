@@ -3,14 +3,75 @@
 
 import re
 from collections import defaultdict
+import numpy as np
+from .kb_loader import split_label
+from .knowledge_store import KnowledgeStore
+
+# Matches the age in a question ("6 months", "4 Month old", etc.)
+AGE_PATTERN = re.compile(r"\b(\d{1,2})\s*month", re.IGNORECASE)
+
+# Returned when no age can be found in the question
+NO_AGE_MESSAGE = "Sorry, I couldn't determine an age from your question. " + \
+                 "Note that the age should be specified in months."
+
+######################################################################
+# Module: no_milestones_message
+# Description: Returns the message for a valid age without milestones.
+# Input:
+#   - age: the age, e.g. "5 months"
+# Returns: the error message
+######################################################################
+def no_milestones_message(age):
+    return f"No milestone data found for {age}. " + \
+           "Note that the milestone data is from the American Academy of Pediatrics (AAP), " + \
+           "which specifies milestones at 2, 4, 6, 9, and 12 months."
+
+######################################################################
+# Module: format_category_list
+# Description: Formats grouped knowledge base entries as a readable
+#              list with one heading per category.
+# Input:
+#   - title: the title of the list
+#   - categories: dict of {sub_category: [item, ...]} in display order.
+#                 Items under a None sub_category get no heading.
+#   - readable_names: optional dict of {sub_category: heading}
+#                     overriding the default headings
+# Returns: the formatted list
+######################################################################
+def format_category_list(title, categories, readable_names=None):
+    output = [f"{title}:\n"]
+    for category, items in categories.items():
+        if category is not None:
+            readable_category = (readable_names or {}).get(category) or category.replace("_", "/").title()
+            output.append(f"{readable_category}:")
+        for item in items:
+            output.append(f"- {item}")
+        output.append("")  # blank line between categories
+
+    return "\n".join(output)
+
+######################################################################
+# Module: format_milestone_list
+# Description: Formats the milestones for an age as a readable list.
+# Input:
+#   - age: the age, e.g. "6 months"
+#   - categories: dict of {sub_category: [milestone, ...]} in display
+#                 order
+# Returns: the formatted milestone list
+######################################################################
+def format_milestone_list(age, categories):
+    return format_category_list(f"Developmental milestones for {age}", categories)
 
 ######################################################################
 # Module: get_milestone_list
 # Description: Extracts and returns a list of developmental milestones
 #              for a specified age from the knowledge base.
+#              This scans the whole knowledge base on each call (a
+#              vectorized mask for a KnowledgeStore); use a
+#              MilestoneIndex to answer repeated requests.
 # Input:
 #   - knowledge_base: The flattened knowledge base as a list of
-#                     labeled text entries.
+#                     labeled text entries or a KnowledgeStore.
 #   - question: The user's question containing the age.
 # Returns:
 #   - A list of developmental milestones for the specified age,
@@ -19,47 +80,110 @@ from collections import defaultdict
 ######################################################################
 def get_milestone_list(knowledge_base, question):
     # Extract age from question ("6 months", "4 month old", etc.)
-    match = re.search(r"\b(\d{1,2})\s*month", question.lower())
+    match = AGE_PATTERN.search(question)
     if not match:
-        error_return = "Sorry, I couldn't determine an age from your question. " + \
-                       "Note that the age should be specified in months."
-        return error_return
+        return NO_AGE_MESSAGE
 
     age = f"{match.group(1)} months"
 
     # Prepare storage for categories and milestone items
     categories = defaultdict(list)
 
-    # Look through the flattened knowledge base
-    for label, text in knowledge_base:
-        parts = label.split(" - ")
+    # Look through the flattened knowledge base. A store selects the rows
+    # by their label part IDs without parsing any label.
+    if isinstance(knowledge_base, KnowledgeStore):
+        store = knowledge_base
+        for row in np.flatnonzero(store.mask(category="milestones", age=age) & (store.depths == 3)):
+            sub_category = store.names["sub_category"][store.columns["sub_category"][row]]
+            categories[sub_category].append(store.text(row))
+    else:
+        for label, text in knowledge_base:
+            parts = split_label(label)
 
-        if len(parts) != 3:
-            continue  # skip entry if it does not match the expected format
+            if len(parts) != 3:
+                continue  # skip entry if it does not match the expected format
 
-        main_category, entry_age, sub_category = parts
+            main_category, entry_age, sub_category = parts
 
-        if main_category != "milestones":
-            continue
+            if main_category != "milestones":
+                continue
 
-        if entry_age == age:
-            categories[sub_category].append(text)
+            if entry_age == age:
+                categories[sub_category].append(text)
 
     # Handle case where age is valid but no milestones are found
     if not categories:
-        error_return = f"No milestone data found for {age}. " + \
-                        "Note that the milestone data is from the American Academy of Pediatrics (AAP), " + \
-                        "which specifies milestones at 2, 4, 6, 9, and 12 months."
-        return error_return
+        return no_milestones_message(age)
 
     # Format output nicely
-    output = [f"Developmental milestones for {age}:\n"]
-    for category, items in categories.items():
-        readable_category = category.replace("_", "/").title()
-        output.append(f"{readable_category}:")
-        for item in items:
-            output.append(f"- {item}")
-        output.append("")  # blank line between categories
+    return format_milestone_list(age, categories)
+
+######################################################################
+# Class: MilestoneIndex
+# Description: A precomputed milestone index built once from the
+#              flattened knowledge base. Milestones are grouped by
+#              age and category and every response is rendered ahead of
+#              time, so answering a request is a regex match plus a
+#              dictionary lookup.
+######################################################################
+class MilestoneIndex:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for MilestoneIndex
+    # Input:
+    #   - self: instance of the class itself
+    #   - knowledge_base: the flattened knowledge base as a list of
+    #                     labeled text entries
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, knowledge_base):
+        # Group the milestones: {age: {sub_category: [item, ...]}}
+        self.milestones = {}
+        for label, text in knowledge_base:
+            parts = split_label(label)
+            if len(parts) != 3 or parts[0] != "milestones":
+                continue
+            _, entry_age, sub_category = parts
+            self.milestones.setdefault(entry_age, {}).setdefault(sub_category, []).append(text)
+
+        # Pre-render the response for every age with milestones. Keys are
+        # the number as written in the question, e.g. "6" for "6 months".
+        self.responses = {}
+        for age, categories in self.milestones.items():
+            number = age[:-len(" months")] if age.endswith(" months") else age
+            self.responses[number] = format_milestone_list(age, categories)
+
+    ######################################################################
+    # Module: ages
+    # Description: Returns the ages that have milestone data.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a list of ages, e.g. ["2 months", "4 months"]
+    ######################################################################
+    def ages(self):
+        return list(self.milestones)
+
+    ######################################################################
+    # Module: get_milestone_list
+    # Description: Returns the milestone list for the age in a question,
+    #              with the same responses as the get_milestone_list
+    #              function.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the user's question containing the age
+    # Returns: the formatted milestone list or an error message
+    ######################################################################
+    def get_milestone_list(self, question):
+        match = AGE_PATTERN.search(question)
+        if not match:
+            return NO_AGE_MESSAGE
 
-    final_list = "\n".join(output)
-    return final_list
+        number = match.group(1)
+        response = self.responses.get(number)
+        if response is None:
+            # Ages without data are rendered once and remembered (there
+            # are at most 110 one- or two-digit ages)
+            response = no_milestones_message(f"{number} months")
+            self.responses[number] = response
+        return response
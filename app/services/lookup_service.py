@@ -0,0 +1,301 @@
+# File: lookup_service.py
+# Author: William Jahner
+
+import re
+from collections import namedtuple
+
+from .kb_loader import split_label
+from .list_service import format_category_list
+
+# The knowledge base counts 4 weeks to a month, e.g. "6 to 12 weeks
+# (1.5 to 3 months)"
+WEEKS_PER_MONTH = 4
+DAYS_PER_MONTH = 30
+
+# Words that identify each top-level category in a question. Categories
+# of the knowledge base that are not listed here are matched by name.
+CATEGORY_KEYWORDS = {
+    "milestones": ["milestone", "milestones", "developmental", "development"],
+    "feeding": ["feed", "feeding", "feedings", "fed", "eat", "eating", "ounce", "ounces", "oz",
+                "milk", "formula", "breastfeed", "breastfeeding", "breastfed", "bottle", "bottles",
+                "nurse", "nursing", "hungry"],
+    "sleeping": ["sleep", "sleeping", "sleeps", "nap", "naps", "napping", "awake", "wake",
+                 "bedtime", "asleep"],
+}
+
+# Words that narrow a question down to one sub-category. Sub-categories
+# that are not listed here are matched by the words of their name.
+SUB_CATEGORY_KEYWORDS = {
+    "breastfed": ["breastfed", "breastfeed", "breastfeeding", "breast", "nursing", "nurse"],
+    "formula_fed": ["formula", "bottle", "bottles"],
+    "naps": ["nap", "naps", "napping"],
+    "awake_windows": ["awake", "wake"],
+    "daytime_sleep": ["daytime"],
+    "total_sleep": ["total", "night"],
+}
+
+# Titles of the answers for each category ({age} is the age label)
+TITLE_TEMPLATES = {
+    "milestones": "Developmental milestones for {age}",
+    "feeding": "Feeding guidance for {age}",
+    "sleeping": "Sleep guidance for {age}",
+}
+
+# Headings of sub-categories whose names are not "a_b" pairs
+READABLE_NAMES = {
+    "formula_fed": "Formula Fed",
+    "total_sleep": "Total Sleep",
+    "daytime_sleep": "Daytime Sleep",
+    "awake_windows": "Awake Windows",
+}
+
+# Matches an age in a question, e.g. "6 months", "10 week old", "1 year"
+QUESTION_AGE_PATTERN = re.compile(r"\b(\d{1,2}(?:\.\d+)?)[\s-]*(month|week|day|year)s?\b", re.IGNORECASE)
+NEWBORN_PATTERN = re.compile(r"\bnew\s*borns?\b", re.IGNORECASE)
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+# Matches the age labels of the knowledge base
+LABEL_RANGE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*to\s*(\d+(?:\.\d+)?)\s*(month|week)s?")
+LABEL_SINGLE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*(month|week)s?$")
+
+# The result of parsing a question
+ParsedQuestion = namedtuple("ParsedQuestion", ["category", "age_months", "sub_categories"])
+
+# Label filters of a retrieval search: tuples of category names and age
+# labels, or None for no filter
+RetrievalFilters = namedtuple("RetrievalFilters", ["category", "age"])
+
+######################################################################
+# Module: to_months
+# Description: Converts an amount of time to months.
+# Input:
+#   - amount: the amount of time
+#   - unit: "month", "week", "day" or "year"
+# Returns: the amount in months
+######################################################################
+def to_months(amount, unit):
+    unit = unit.lower()
+    if unit == "week":
+        return amount / WEEKS_PER_MONTH
+    if unit == "day":
+        return amount / DAYS_PER_MONTH
+    if unit == "year":
+        return amount * 12
+    return amount
+
+######################################################################
+# Module: parse_age_label
+# Description: Converts a knowledge base age label into the range of
+#              ages (in months) it covers. The upper bound is exclusive
+#              and a label such as "3 to 5 months" covers every age until
+#              the baby turns 6 months.
+# Input:
+#   - label: the age label, e.g. "3 to 5 months", "6 months",
+#            "newborn (0 to 6 weeks)" or "newborn (first week)"
+# Returns: a tuple (low, high) in months, or None if not understood
+######################################################################
+def parse_age_label(label):
+    label = label.lower().strip()
+
+    match = LABEL_RANGE_PATTERN.search(label)
+    if match:
+        low, high, unit = float(match.group(1)), float(match.group(2)), match.group(3)
+        # Weeks are already continuous ("0 to 6 weeks"); whole months
+        # cover the month that was named last
+        if unit == "month":
+            high += 1
+        return to_months(low, unit), to_months(high, unit)
+
+    match = LABEL_SINGLE_PATTERN.match(label)
+    if match:
+        value, unit = float(match.group(1)), match.group(2)
+        return to_months(value, unit), to_months(value + 1, unit)
+
+    if label.startswith("newborn"):
+        if "first week" in label:
+            return 0.0, to_months(1, "week")
+        return 0.0, 1.0
+
+    return None
+
+######################################################################
+# Module: parse_question_age
+# Description: Extracts the baby's age from a question.
+# Input:
+#   - question: the user's question
+# Returns: the age in months, or None if no age is mentioned
+######################################################################
+def parse_question_age(question):
+    match = QUESTION_AGE_PATTERN.search(question)
+    if match:
+        return to_months(float(match.group(1)), match.group(2))
+    if NEWBORN_PATTERN.search(question):
+        return 0.0
+    return None
+
+######################################################################
+# Class: StructuredLookup
+# Description: A deterministic lookup engine for questions about any
+#              top-level category of the knowledge base. The question's
+#              category and age are parsed, resolved against the age
+#              ranges of that category, and answered from a precomputed
+#              index without running any model. Questions that cannot
+#              be parsed unambiguously are left to the NLP path.
+######################################################################
+class StructuredLookup:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for StructuredLookup
+    # Input:
+    #   - self: instance of the class itself
+    #   - knowledge_base: the flattened knowledge base as a list of
+    #                     labeled text entries
+    #   - category_keywords: optional dict overriding CATEGORY_KEYWORDS
+    #   - sub_category_keywords: optional dict overriding
+    #                            SUB_CATEGORY_KEYWORDS
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, knowledge_base, category_keywords=None, sub_category_keywords=None):
+        category_keywords = CATEGORY_KEYWORDS if category_keywords is None else category_keywords
+        sub_category_keywords = SUB_CATEGORY_KEYWORDS if sub_category_keywords is None else sub_category_keywords
+
+        # Group the entries: {category: {age label: {sub_category: [text]}}}
+        grouped = {}
+        for label, text in knowledge_base:
+            parts = split_label(label)
+            if len(parts) not in (2, 3):
+                continue
+            category, age = parts[0], parts[1]
+            sub_category = parts[2] if len(parts) == 3 else None
+            grouped.setdefault(category, {}).setdefault(age, {}).setdefault(sub_category, []).append(text)
+
+        # Resolve the age label of every bucket to a range of months
+        self.buckets = {}
+        for category, ages in grouped.items():
+            self.buckets[category] = []
+            for age, sub_categories in ages.items():
+                age_range = parse_age_label(age)
+                if age_range is not None:
+                    self.buckets[category].append((age_range[0], age_range[1], age, sub_categories))
+
+        # Map each keyword to the categories and sub-categories it names
+        self.category_words = {}
+        for category in self.buckets:
+            for word in category_keywords.get(category, [category]):
+                self.category_words.setdefault(word, set()).add(category)
+
+        self.sub_category_words = {}
+        for category, buckets in self.buckets.items():
+            for _, _, _, sub_categories in buckets:
+                for sub_category in sub_categories:
+                    if sub_category is None:
+                        continue
+                    words = sub_category_keywords.get(sub_category, sub_category.split("_"))
+                    for word in words:
+                        self.sub_category_words.setdefault(word, set()).add(sub_category)
+
+        # Rendered answers, filled on first request:
+        # {(category, age label, sub_categories): answer}
+        self.responses = {}
+
+    ######################################################################
+    # Module: parse
+    # Description: Parses the category, age and optional sub-categories
+    #              of a question.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the user's question
+    # Returns: a ParsedQuestion, or None if the question does not name
+    #          exactly one category or has no age
+    ######################################################################
+    def parse(self, question):
+        age_months = parse_question_age(question)
+        if age_months is None:
+            return None
+
+        words = WORD_PATTERN.findall(question.lower())
+        categories = set()
+        sub_categories = set()
+        for word in words:
+            categories.update(self.category_words.get(word, ()))
+            sub_categories.update(self.sub_category_words.get(word, ()))
+
+        if len(categories) != 1:
+            return None
+
+        return ParsedQuestion(categories.pop(), age_months, frozenset(sub_categories))
+
+    ######################################################################
+    # Module: infer_filters
+    # Description: Infers the retrieval filters of a question: the
+    #              categories it names and the age labels covering the age
+    #              it mentions (within the named categories, if any).
+    #              Unlike parse, any number of categories is accepted.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the user's question
+    # Returns: a RetrievalFilters
+    ######################################################################
+    def infer_filters(self, question):
+        categories = set()
+        for word in WORD_PATTERN.findall(question.lower()):
+            categories.update(self.category_words.get(word, ()))
+
+        ages = set()
+        age_months = parse_question_age(question)
+        if age_months is not None:
+            for category in categories or self.buckets:
+                ages.update(age for low, high, age, _ in self.buckets[category] if low <= age_months < high)
+
+        return RetrievalFilters(tuple(sorted(categories)) or None, tuple(sorted(ages)) or None)
+
+    ######################################################################
+    # Module: find_bucket
+    # Description: Finds the age bucket of a category covering an age.
+    # Input:
+    #   - self: instance of the class itself
+    #   - category: the top-level category
+    #   - age_months: the age in months
+    # Returns: a tuple (age label, {sub_category: [text]}), or None
+    ######################################################################
+    def find_bucket(self, category, age_months):
+        for low, high, age, sub_categories in self.buckets.get(category, []):
+            if low <= age_months < high:
+                return age, sub_categories
+        return None
+
+    ######################################################################
+    # Module: lookup
+    # Description: Answers a question directly from the index.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the user's question
+    # Returns: the formatted answer, or None if the question should be
+    #          answered by the NLP path instead
+    ######################################################################
+    def lookup(self, question):
+        parsed = self.parse(question)
+        if parsed is None:
+            return None
+
+        bucket = self.find_bucket(parsed.category, parsed.age_months)
+        if bucket is None:
+            return None
+        age, sub_categories = bucket
+
+        # Narrow down to the sub-categories named in the question (if
+        # any of them exist for this age)
+        selected = parsed.sub_categories.intersection(sub_categories)
+        key = (parsed.category, age, frozenset(selected))
+
+        response = self.responses.get(key)
+        if response is None:
+            if selected:
+                entries = {name: items for name, items in sub_categories.items() if name in selected}
+            else:
+                entries = sub_categories
+            template = TITLE_TEMPLATES.get(parsed.category, parsed.category.replace("_", " ").title() + " for {age}")
+            response = format_category_list(template.format(age=age), entries, READABLE_NAMES)
+            self.responses[key] = response
+        return response
@@ -0,0 +1,413 @@
+# File: metrics.py
+# Author: William Jahner
+
+import cProfile
+import json
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# Stages of the request path timed by the app
+STAGE_RESPOND = "respond"
+STAGE_ROUTE = "route"
+STAGE_MILESTONE_LIST = "milestone_list"
+STAGE_LOOKUP = "lookup"
+STAGE_ENCODE = "encode"
+STAGE_SEARCH = "search"
+STAGE_READ = "read"
+STAGE_READ_FAST = "read_fast"
+STAGE_INDEX_BUILD = "index_build"
+STAGE_MODEL_LOAD = "model_load"
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS_S = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prefix of the exported metric names
+METRIC_PREFIX = "assistant"
+
+# Logger the structured JSON records are written to
+METRICS_LOGGER = "assistant.metrics"
+
+# Default interval between the stack samples of the sampling profiler
+DEFAULT_SAMPLE_INTERVAL_S = 0.005
+
+######################################################################
+# Class: NullTimer
+# Description: The stage timer handed out while metrics are disabled.
+#              One shared instance does nothing on enter and exit, so a
+#              disabled stage costs a method call and a with block.
+######################################################################
+class NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_TIMER = NullTimer()
+
+######################################################################
+# Class: StageTimer
+# Description: Times one run of a stage and records it on exit.
+######################################################################
+class StageTimer:
+
+    __slots__ = ("metrics", "stage", "start")
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for StageTimer
+    # Input:
+    #   - self: instance of the class itself
+    #   - metrics: the Metrics the time is recorded in
+    #   - stage: the name of the stage
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+######################################################################
+# Class: Metrics
+# Description: Per-stage latency histograms and event counters of the
+#              request path. Disabled metrics record nothing. Enabled
+#              metrics can be exported as Prometheus text or a JSON
+#              snapshot, and each observation can also be logged as a
+#              structured JSON record.
+######################################################################
+class Metrics:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for Metrics
+    # Input:
+    #   - self: instance of the class itself
+    #   - enabled: whether stages and events are recorded
+    #   - log_json: whether each observation is logged as a JSON record
+    #               on the METRICS_LOGGER logger
+    #   - buckets: the latency histogram bucket bounds in seconds
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, enabled=False, log_json=False, buckets=LATENCY_BUCKETS_S):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self.logger = logging.getLogger(METRICS_LOGGER) if log_json else None
+        self._lock = threading.Lock()
+        self.reset()
+
+    ######################################################################
+    # Module: reset
+    # Description: Drops every recorded observation and event.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    def reset(self):
+        with self._lock:
+            # {stage: [bucket counts..., count, sum, max]}
+            self._stages = {}
+            self.counters = Counter()
+
+    ######################################################################
+    # Module: stage
+    # Description: Returns a context manager timing a stage.
+    # Input:
+    #   - self: instance of the class itself
+    #   - name: the name of the stage
+    # Returns: a StageTimer, or NULL_TIMER when disabled
+    ######################################################################
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, name)
+
+    ######################################################################
+    # Module: observe
+    # Description: Records one run of a stage.
+    # Input:
+    #   - self: instance of the class itself
+    #   - name: the name of the stage
+    #   - seconds: the time the stage took
+    # Returns: N/A
+    ######################################################################
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        n_buckets = len(self.buckets)
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            values = self._stages.get(name)
+            if values is None:
+                values = self._stages[name] = [0] * n_buckets + [0, 0.0, 0.0]
+            if bucket < n_buckets:
+                values[bucket] += 1
+            values[n_buckets] += 1
+            values[n_buckets + 1] += seconds
+            values[n_buckets + 2] = max(values[n_buckets + 2], seconds)
+        if self.logger is not None:
+            self.log("stage", stage=name, ms=round(seconds * 1000, 3))
+
+    ######################################################################
+    # Module: increment
+    # Description: Counts an event.
+    # Input:
+    #   - self: instance of the class itself
+    #   - name: the name of the event
+    #   - value: the amount to add
+    # Returns: N/A
+    ######################################################################
+    def increment(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += value
+
+    ######################################################################
+    # Module: drain
+    # Description: Returns the raw observations and events recorded since
+    #              the last drain and drops them, so they can be merged
+    #              into the metrics of another process.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a dict {"buckets": bucket bounds, "stages": {stage: [bucket
+    #          counts..., count, sum, max]}, "counters": {event: count}}
+    ######################################################################
+    def drain(self):
+        with self._lock:
+            stages, counters = self._stages, dict(self.counters)
+            self._stages, self.counters = {}, Counter()
+        return {"buckets": self.buckets, "stages": stages, "counters": counters}
+
+    ######################################################################
+    # Module: merge
+    # Description: Adds observations and events drained from other
+    #              metrics (e.g. those of a worker process). They are not
+    #              logged again as JSON records.
+    # Input:
+    #   - self: instance of the class itself
+    #   - samples: the dict returned by drain
+    # Returns: N/A
+    ######################################################################
+    def merge(self, samples):
+        if not self.enabled or not samples:
+            return
+        if tuple(samples["buckets"]) != self.buckets:
+            raise ValueError("Cannot merge metrics recorded with other latency buckets")
+        n_buckets = len(self.buckets)
+        with self._lock:
+            for name, other in samples["stages"].items():
+                values = self._stages.get(name)
+                if values is None:
+                    values = self._stages[name] = [0] * n_buckets + [0, 0.0, 0.0]
+                for i in range(n_buckets + 2):
+                    values[i] += other[i]
+                values[n_buckets + 2] = max(values[n_buckets + 2], other[n_buckets + 2])
+            self.counters.update(samples["counters"])
+
+    ######################################################################
+    # Module: log
+    # Description: Writes a structured JSON record to the metrics logger
+    #              (when JSON logging is on).
+    # Input:
+    #   - self: instance of the class itself
+    #   - event: the kind of record
+    #   - fields: the record's fields
+    # Returns: N/A
+    ######################################################################
+    def log(self, event, **fields):
+        if self.logger is None:
+            return
+        record = {"ts": round(time.time(), 6), "event": event, "thread": threading.current_thread().name}
+        record.update(fields)
+        self.logger.info(json.dumps(record))
+
+    ######################################################################
+    # Module: snapshot
+    # Description: Returns the recorded metrics as plain data.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a dict {"stages": {stage: {"count", "total_ms", "mean_ms",
+    #          "max_ms"}}, "counters": {event: count}}
+    ######################################################################
+    def snapshot(self):
+        n_buckets = len(self.buckets)
+        with self._lock:
+            stages = {name: list(values) for name, values in self._stages.items()}
+            counters = dict(self.counters)
+        summary = {}
+        for name, values in sorted(stages.items()):
+            count, total, longest = values[n_buckets:]
+            summary[name] = {
+                "count": count,
+                "total_ms": total * 1000,
+                "mean_ms": total * 1000 / count if count else 0.0,
+                "max_ms": longest * 1000,
+            }
+        return {"stages": summary, "counters": dict(sorted(counters.items()))}
+
+    ######################################################################
+    # Module: to_prometheus
+    # Description: Renders the recorded metrics in the Prometheus text
+    #              exposition format: one latency histogram labeled by
+    #              stage and one counter labeled by event.
+    # Input:
+    #   - self: instance of the class itself
+    #   - prefix: the prefix of the metric names
+    # Returns: the exposition text
+    ######################################################################
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        n_buckets = len(self.buckets)
+        with self._lock:
+            stages = {name: list(values) for name, values in self._stages.items()}
+            counters = dict(self.counters)
+
+        lines = [f"# HELP {prefix}_stage_seconds Time spent in each stage of the request path",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        for name, values in sorted(stages.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {values[n_buckets]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {values[n_buckets + 1]:.9g}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {values[n_buckets]}')
+
+        lines += [f"# HELP {prefix}_events_total Events counted on the request path",
+                  f"# TYPE {prefix}_events_total counter"]
+        for name, count in sorted(counters.items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+######################################################################
+# Class: SamplingProfiler
+# Description: A low-overhead statistical profiler. A background thread
+#              samples the stack of every other thread at a fixed
+#              interval and counts each distinct stack; the result is
+#              written in the collapsed-stack format read by flamegraph
+#              tools and speedscope (as py-spy's raw output is).
+######################################################################
+class SamplingProfiler:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for SamplingProfiler
+    # Input:
+    #   - self: instance of the class itself
+    #   - interval_s: the time between two samples
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, interval_s=DEFAULT_SAMPLE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    ######################################################################
+    # Module: start
+    # Description: Starts sampling.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    ######################################################################
+    # Module: stop
+    # Description: Stops sampling and waits for the sampling thread.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    ######################################################################
+    # Module: _run
+    # Description: The sampling loop.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    ######################################################################
+    # Module: collapsed
+    # Description: Renders the samples as collapsed stacks, one
+    #              "frame;frame;frame count" line per distinct stack.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the collapsed-stack text
+    ######################################################################
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    ######################################################################
+    # Module: save
+    # Description: Writes the collapsed stacks to a file.
+    # Input:
+    #   - self: instance of the class itself
+    #   - path: the path of the output file
+    # Returns: N/A
+    ######################################################################
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+
+######################################################################
+# Module: profile
+# Description: Profiles the calling thread with cProfile and writes the
+#              statistics (readable with pstats or snakeviz) on exit.
+# Input:
+#   - path: the path of the output file
+# Returns: a context manager yielding the cProfile.Profile
+######################################################################
+@contextmanager
+def profile(path):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,186 @@
+# File: model_registry.py
+# Author: William Jahner
+
+import threading
+
+# Names of the models used by the AI service
+QA_MODEL_NAME = "deepset/roberta-base-squad2"
+FAST_QA_MODEL_NAME = "deepset/tinyroberta-squad2"
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Kinds of models the registry knows how to load
+QA_TASK = "question-answering"
+EMBEDDING_TASK = "sentence-embedding"
+ONNX_QA_TASK = "onnx-question-answering"
+ONNX_EMBEDDING_TASK = "onnx-sentence-embedding"
+
+######################################################################
+# Module: load_qa_pipeline
+# Description: Loads a Hugging Face question answering pipeline.
+#              transformers (and torch) are imported here so that they
+#              are only paid for when a QA model is actually needed.
+# Input:
+#   - model_name: the name or path of the QA model
+# Returns: the question answering pipeline
+######################################################################
+def load_qa_pipeline(model_name):
+    from transformers import pipeline
+    return pipeline(QA_TASK, model=model_name)
+
+######################################################################
+# Module: load_embedder
+# Description: Loads a SentenceTransformer embedding model.
+#              sentence_transformers (and torch) are imported here so
+#              that they are only paid for when embeddings are needed.
+# Input:
+#   - model_name: the name or path of the embedding model
+# Returns: the SentenceTransformer model
+######################################################################
+def load_embedder(model_name):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+######################################################################
+# Module: load_onnx_qa_pipeline
+# Description: Loads an exported QA model with ONNX Runtime.
+# Input:
+#   - model_path: the path of the exported .onnx file
+# Returns: the OnnxQAPipeline
+######################################################################
+def load_onnx_qa_pipeline(model_path):
+    from .onnx_backend import OnnxQAPipeline
+    return OnnxQAPipeline.load(model_path)
+
+######################################################################
+# Module: load_onnx_embedder
+# Description: Loads an exported embedder with ONNX Runtime.
+# Input:
+#   - model_path: the path of the exported .onnx file
+# Returns: the OnnxEmbedder
+######################################################################
+def load_onnx_embedder(model_path):
+    from .onnx_backend import OnnxEmbedder
+    return OnnxEmbedder.load(model_path)
+
+######################################################################
+# Class: ModelRegistry
+# Description: A process-wide registry that loads each model lazily on
+#              first use and shares the loaded instance with every
+#              caller asking for the same (kind, model name).
+######################################################################
+class ModelRegistry:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for ModelRegistry
+    # Input:
+    #   - self: instance of the class itself
+    #   - loaders: optional dict of {kind: loader(model_name)} overriding
+    #              the default loaders (e.g. stub models for testing)
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, loaders=None):
+        self.loaders = {
+            QA_TASK: load_qa_pipeline,
+            EMBEDDING_TASK: load_embedder,
+            ONNX_QA_TASK: load_onnx_qa_pipeline,
+            ONNX_EMBEDDING_TASK: load_onnx_embedder,
+        }
+        if loaders:
+            self.loaders.update(loaders)
+
+        self._models = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    ######################################################################
+    # Module: get
+    # Description: Returns the model for the given kind and name, loading
+    #              it on first use. Concurrent callers asking for the
+    #              same model wait for a single load.
+    # Input:
+    #   - self: instance of the class itself
+    #   - kind: the kind of model (e.g. QA_TASK or EMBEDDING_TASK)
+    #   - model_name: the name or path of the model
+    # Returns: the loaded model
+    ######################################################################
+    def get(self, kind, model_name):
+        key = (kind, model_name)
+
+        # Fast path: the model is already loaded
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        # Only hold the registry lock long enough to find the per-model
+        # lock, so loading one model never blocks loading another
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if key not in self._models:
+                if kind not in self.loaders:
+                    raise KeyError(f"No loader registered for model kind '{kind}'")
+                self._models[key] = self.loaders[kind](model_name)
+            return self._models[key]
+
+    ######################################################################
+    # Module: get_qa_pipeline
+    # Description: Returns the shared question answering pipeline.
+    # Input:
+    #   - self: instance of the class itself
+    #   - model_name: the name or path of the QA model
+    # Returns: the question answering pipeline
+    ######################################################################
+    def get_qa_pipeline(self, model_name=QA_MODEL_NAME):
+        return self.get(QA_TASK, model_name)
+
+    ######################################################################
+    # Module: get_embedder
+    # Description: Returns the shared embedding model.
+    # Input:
+    #   - self: instance of the class itself
+    #   - model_name: the name or path of the embedding model
+    # Returns: the embedding model
+    ######################################################################
+    def get_embedder(self, model_name=EMBEDDING_MODEL_NAME):
+        return self.get(EMBEDDING_TASK, model_name)
+
+    ######################################################################
+    # Module: set_loader
+    # Description: Registers (or replaces) the loader for a kind of model.
+    # Input:
+    #   - self: instance of the class itself
+    #   - kind: the kind of model
+    #   - loader: a callable taking a model name and returning the model
+    # Returns: N/A
+    ######################################################################
+    def set_loader(self, kind, loader):
+        self.loaders[kind] = loader
+
+    ######################################################################
+    # Module: is_loaded
+    # Description: Checks whether a model has already been loaded.
+    # Input:
+    #   - self: instance of the class itself
+    #   - kind: the kind of model
+    #   - model_name: the name or path of the model
+    # Returns: True if the model is loaded, otherwise False
+    ######################################################################
+    def is_loaded(self, kind, model_name):
+        return (kind, model_name) in self._models
+
+    ######################################################################
+    # Module: clear
+    # Description: Drops every loaded model so it is reloaded on next use.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._key_locks.clear()
+
+# The registry shared by every AIService in the process
+default_registry = ModelRegistry()
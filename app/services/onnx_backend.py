@@ -0,0 +1,733 @@
+# File: onnx_backend.py
+# Author: William Jahner
+#
+# ONNX Runtime inference backend for the embedder and the QA reader.
+# The models are exported once from local files (nothing is downloaded):
+#
+#   python -m app.services.onnx_backend --quantize
+#   python -m app.services.onnx_backend --fast-qa-model deepset/tinyroberta-squad2
+#
+# Inference then only needs onnxruntime, tokenizers and numpy; torch is
+# only imported by the export functions.
+
+import argparse
+import json
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from .model_registry import QA_MODEL_NAME, FAST_QA_MODEL_NAME, EMBEDDING_MODEL_NAME
+
+# Default location of the exported models (ignored by git)
+DEFAULT_ONNX_DIR = Path(__file__).parent.parent.parent / "data/onnx"
+
+# Sub-directories of the exported models and their file names
+QA_DIR = "qa"
+FAST_QA_DIR = "fast_qa"
+EMBEDDER_DIR = "embedder"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "config.json"
+
+# The ONNX graph opset used by the export
+OPSET_VERSION = 17
+
+# A reader window assembled from pre-tokenized passages. It has the
+# Encoding attributes the reader uses; sequence_ids is -1 for the
+# special tokens, 0 for the question and 1 for the context.
+Window = namedtuple("Window", ["ids", "type_ids", "attention_mask", "sequence_ids", "offsets"])
+
+######################################################################
+# Module: onnx_model_path
+# Description: Returns the path of an exported model.
+# Input:
+#   - onnx_dir: the directory the models were exported to
+#   - model_dir: QA_DIR, FAST_QA_DIR or EMBEDDER_DIR
+#   - quantized: whether to use the int8 model
+# Returns: the path of the .onnx file
+######################################################################
+def onnx_model_path(onnx_dir, model_dir, quantized=False):
+    return Path(onnx_dir) / model_dir / (QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+
+######################################################################
+# Module: create_session
+# Description: Creates an ONNX Runtime CPU inference session.
+# Input:
+#   - model_path: the path of the .onnx file
+#   - threads: optional number of intra-op threads
+# Returns: the InferenceSession
+######################################################################
+def create_session(model_path, threads=None):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return onnxruntime.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+
+######################################################################
+# Module: load_exported
+# Description: Loads the tokenizer and config saved next to a model.
+# Input:
+#   - model_path: the path of the .onnx file
+# Returns: a tuple (tokenizer, config dict)
+######################################################################
+def load_exported(model_path):
+    from tokenizers import Tokenizer
+
+    model_dir = Path(model_path).parent
+    with open(model_dir / CONFIG_FILE, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    return Tokenizer.from_file(str(model_dir / TOKENIZER_FILE)), config
+
+######################################################################
+# Module: pad_encodings
+# Description: Stacks tokenizer encodings into padded model inputs.
+# Input:
+#   - encodings: a list of tokenizers Encoding objects
+#   - input_names: the names of the model inputs
+#   - pad_id: the padding token id
+# Returns: a dict of {input name: (encodings x length) int64 array}
+######################################################################
+def pad_encodings(encodings, input_names, pad_id):
+    length = max(len(e.ids) for e in encodings)
+    columns = {"input_ids": "ids", "attention_mask": "attention_mask", "token_type_ids": "type_ids"}
+    inputs = {}
+    for name in input_names:
+        array = np.full((len(encodings), length), pad_id if name == "input_ids" else 0, dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            values = getattr(encoding, columns[name])
+            array[row, :len(values)] = values
+        inputs[name] = array
+    return inputs
+
+######################################################################
+# Module: token_arrays
+# Description: Copies the ids and character offsets of an encoding into
+#              arrays.
+# Input:
+#   - encoding: a tokenizers Encoding
+#   - shift: the number of characters added to the offsets
+# Returns: a tuple (int64 ids array, (tokens x 2) int64 offsets array)
+######################################################################
+def token_arrays(encoding, shift=0):
+    offsets = np.array(encoding.offsets, dtype=np.int64).reshape(-1, 2) + shift
+    return np.array(encoding.ids, dtype=np.int64), offsets
+
+######################################################################
+# Module: softmax
+# Description: Softmax over the last axis, ignoring -inf entries.
+# Input:
+#   - logits: an array of logits
+# Returns: an array of probabilities
+######################################################################
+def softmax(logits):
+    exp = np.exp(logits - np.max(logits, axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+######################################################################
+# Module: span_probabilities
+# Description: Normalizes the start and end logits of one reader window
+#              over its context tokens and, like the Hugging Face QA
+#              pipeline, its null (CLS) token.
+# Input:
+#   - start_logits: the start logits of the window
+#   - end_logits: the end logits of the window
+#   - context_mask: a boolean mask of the context tokens
+#   - null_index: optional position of the null token
+# Returns: a tuple (start probabilities, end probabilities)
+######################################################################
+def span_probabilities(start_logits, end_logits, context_mask, null_index=None):
+    mask = context_mask.copy()
+    if null_index is not None:
+        mask[null_index] = True
+    return softmax(np.where(mask, start_logits, -np.inf)), softmax(np.where(mask, end_logits, -np.inf))
+
+######################################################################
+# Module: null_score
+# Description: Scores the "no answer" prediction of one reader window
+#              (the null token as both start and end).
+# Input:
+#   - start_logits: the start logits of the window
+#   - end_logits: the end logits of the window
+#   - context_mask: a boolean mask of the context tokens
+#   - null_index: the position of the null token
+# Returns: the null score
+######################################################################
+def null_score(start_logits, end_logits, context_mask, null_index):
+    start, end = span_probabilities(start_logits, end_logits, context_mask, null_index)
+    return float(start[null_index] * end[null_index])
+
+######################################################################
+# Module: best_span
+# Description: Finds the most probable answer span of one reader window,
+#              scored like the Hugging Face QA pipeline (product of the
+#              start and end probabilities over the context tokens).
+# Input:
+#   - start_logits: the start logits of the window
+#   - end_logits: the end logits of the window
+#   - context_mask: a boolean mask of the context tokens
+#   - max_answer_len: the maximum number of tokens in an answer
+#   - null_index: optional position of the null token, included in the
+#                 normalization but never part of a span
+# Returns: a tuple (score, start token, end token), or None if the
+#          window holds no context
+######################################################################
+def best_span(start_logits, end_logits, context_mask, max_answer_len=15, null_index=None):
+    if not context_mask.any():
+        return None
+
+    start, end = span_probabilities(start_logits, end_logits, context_mask, null_index)
+    start, end = np.where(context_mask, start, 0.0), np.where(context_mask, end, 0.0)
+
+    # Spans must end after they start and hold at most max_answer_len tokens
+    scores = np.triu(np.outer(start, end))
+    scores = np.tril(scores, max_answer_len - 1)
+    start_token, end_token = np.unravel_index(np.argmax(scores), scores.shape)
+    return float(scores[start_token, end_token]), int(start_token), int(end_token)
+
+######################################################################
+# Class: OnnxEmbedder
+# Description: A SentenceTransformer-compatible embedder running an
+#              exported transformer with ONNX Runtime. Pooling and
+#              normalization are done in numpy.
+######################################################################
+class OnnxEmbedder:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for OnnxEmbedder
+    # Input:
+    #   - self: instance of the class itself
+    #   - session: the ONNX Runtime session of the transformer
+    #   - tokenizer: the tokenizers Tokenizer
+    #   - config: the exported config (pad_id, max_seq_length, pooling,
+    #             normalize)
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, session, tokenizer, config):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.config = config
+        self.input_names = [i.name for i in session.get_inputs()]
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(config["max_seq_length"])
+
+    ######################################################################
+    # Module: load
+    # Description: Loads an exported embedder.
+    # Input:
+    #   - model_path: the path of the .onnx file
+    #   - threads: optional number of intra-op threads
+    # Returns: the OnnxEmbedder
+    ######################################################################
+    @classmethod
+    def load(cls, model_path, threads=None):
+        tokenizer, config = load_exported(model_path)
+        return cls(create_session(model_path, threads), tokenizer, config)
+
+    ######################################################################
+    # Module: encode
+    # Description: Encodes sentences like SentenceTransformer.encode.
+    #              Sentences are sorted by length so each batch is padded
+    #              as little as possible.
+    # Input:
+    #   - self: instance of the class itself
+    #   - sentences: a sentence or a list of sentences
+    #   - batch_size: the number of sentences per forward pass
+    #   - normalize_embeddings: whether to normalize the embeddings
+    #     (always done when the exported model normalizes)
+    #   - kwargs: other SentenceTransformer.encode arguments (ignored)
+    # Returns: a float32 array (1D for a single sentence)
+    ######################################################################
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+
+        encodings = self.tokenizer.encode_batch(sentences)
+        order = np.argsort([-len(e.ids) for e in encodings], kind="stable")
+        embeddings = None
+
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            inputs = pad_encodings([encodings[i] for i in rows], self.input_names, self.config["pad_id"])
+            hidden = self.session.run(None, inputs)[0]
+            pooled = self.pool(hidden, inputs["attention_mask"])
+            if embeddings is None:
+                embeddings = np.empty((len(sentences), pooled.shape[1]), dtype=np.float32)
+            embeddings[rows] = pooled
+
+        if embeddings is None:
+            embeddings = np.empty((0, 0), dtype=np.float32)
+        if normalize_embeddings or self.config.get("normalize"):
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+    ######################################################################
+    # Module: pool
+    # Description: Pools token embeddings into sentence embeddings.
+    # Input:
+    #   - self: instance of the class itself
+    #   - hidden: the (batch x tokens x dim) token embeddings
+    #   - attention_mask: the (batch x tokens) attention mask
+    # Returns: a (batch x dim) float32 array
+    ######################################################################
+    def pool(self, hidden, attention_mask):
+        if self.config.get("pooling") == "cls":
+            return hidden[:, 0].astype(np.float32)
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return ((hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)).astype(np.float32)
+
+######################################################################
+# Class: OnnxQAPipeline
+# Description: A question answering pipeline running an exported QA
+#              model with ONNX Runtime. It is called like the Hugging
+#              Face pipeline: long contexts are split into overlapping
+#              windows of max_seq_len tokens and the best span of all
+#              windows is returned.
+######################################################################
+class OnnxQAPipeline:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for OnnxQAPipeline
+    # Input:
+    #   - self: instance of the class itself
+    #   - session: the ONNX Runtime session of the QA model
+    #   - tokenizer: the tokenizers Tokenizer
+    #   - config: the exported config (pad_id)
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, session, tokenizer, config):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.config = config
+        self.input_names = [i.name for i in session.get_inputs()]
+        self.tokenizer.no_padding()
+
+        # Truncation is tokenizer state, so windowing is serialized
+        self._tokenizer_lock = threading.Lock()
+
+        # Pre-tokenized passages: {passage: (tokens at the start of a
+        # context, tokens after a joining space)}, each a (ids, offsets)
+        # tuple, and the special tokens around the question and context
+        self.passage_tokens = {}
+        self.special_tokens = self.pair_template()
+
+    ######################################################################
+    # Module: load
+    # Description: Loads an exported QA model.
+    # Input:
+    #   - model_path: the path of the .onnx file
+    #   - threads: optional number of intra-op threads
+    # Returns: the OnnxQAPipeline
+    ######################################################################
+    @classmethod
+    def load(cls, model_path, threads=None):
+        tokenizer, config = load_exported(model_path)
+        return cls(create_session(model_path, threads), tokenizer, config)
+
+    ######################################################################
+    # Module: __call__
+    # Description: Answers one or more questions.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: a question or a list of questions
+    #   - context: a context or a list of contexts (one per question)
+    #   - batch_size: the number of windows per forward pass
+    #   - max_seq_len: the token length of a window
+    #   - doc_stride: the token overlap between windows
+    #   - max_answer_len: the maximum number of tokens in an answer
+    #   - handle_impossible_answer: whether an empty answer is returned
+    #                               when the null (CLS) score of every
+    #                               window beats the best span
+    #   - kwargs: other pipeline arguments (ignored)
+    # Returns: a dict with answer, score, start and end (a list of dicts
+    #          for a list of questions)
+    ######################################################################
+    def __call__(self, question=None, context=None, batch_size=32, max_seq_len=384, doc_stride=128,
+                 max_answer_len=15, handle_impossible_answer=False, **kwargs):
+        single = not isinstance(question, list)
+        questions = [question] if single else question
+        contexts = [context] if single else context
+
+        # Split every (question, context) pair into windows
+        windows = []
+        owners = []
+        for i, (q, c) in enumerate(zip(questions, contexts)):
+            for window in self.reader_windows(q, c, max_seq_len, doc_stride):
+                windows.append(window)
+                owners.append(i)
+
+        # Keep the best span of each question over its windows, and its
+        # lowest null score
+        best = [None] * len(questions)
+        nulls = [None] * len(questions)
+        for start in range(0, len(windows), batch_size):
+            batch = windows[start:start + batch_size]
+            inputs = pad_encodings(batch, self.input_names, self.config["pad_id"])
+            start_logits, end_logits = self.session.run(None, inputs)[:2]
+
+            for row, window in enumerate(batch):
+                length = len(window.ids)
+                context_mask = np.array([s == 1 for s in window.sequence_ids])
+                # The leading special token (CLS) stands for "no answer";
+                # tokenized windows mark it None, cached windows -1
+                null_index = 0 if window.sequence_ids[0] in (None, -1) else None
+                window_logits = (start_logits[row, :length], end_logits[row, :length], context_mask)
+                span = best_span(*window_logits, max_answer_len, null_index)
+                owner = owners[start + row]
+                if span is not None and (best[owner] is None or span[0] > best[owner][0]):
+                    best[owner] = (span[0], int(window.offsets[span[1]][0]), int(window.offsets[span[2]][1]))
+                if handle_impossible_answer and null_index is not None:
+                    score = null_score(*window_logits, null_index)
+                    nulls[owner] = score if nulls[owner] is None else min(nulls[owner], score)
+
+        results = []
+        for c, span, null in zip(contexts, best, nulls):
+            score, char_start, char_end = span if span is not None else (0.0, 0, 0)
+            if null is not None and null > score:
+                score, char_start, char_end = null, 0, 0
+            results.append({"score": score, "start": char_start, "end": char_end, "answer": c[char_start:char_end]})
+        return results[0] if single else results
+
+    ######################################################################
+    # Module: pair_template
+    # Description: Finds the special tokens the tokenizer adds around a
+    #              (question, context) pair, and the type ids of each part.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a dict of {part: (ids, type ids)} for the "prefix" (before
+    #          the question), "middle" and "suffix" special tokens, and
+    #          of {part: type id} for the "question" and "context"
+    ######################################################################
+    def pair_template(self):
+        with self._tokenizer_lock:
+            self.tokenizer.no_truncation()
+            encoding = self.tokenizer.encode("question", "context")
+
+        specials = {"prefix": [], "middle": [], "suffix": []}
+        template = {}
+        part = "prefix"
+        for token_id, type_id, sequence_id in zip(encoding.ids, encoding.type_ids, encoding.sequence_ids):
+            if sequence_id is None:
+                specials[part].append((token_id, type_id))
+            else:
+                # Special tokens after the question are in the middle,
+                # after the context in the suffix
+                part = "middle" if sequence_id == 0 else "suffix"
+                template["question" if sequence_id == 0 else "context"] = type_id
+
+        for part, tokens in specials.items():
+            array = np.array(tokens, dtype=np.int64).reshape(-1, 2)
+            template[part] = (array[:, 0], array[:, 1])
+        return template
+
+    ######################################################################
+    # Module: cache_passages
+    # Description: Tokenizes the passages of the knowledge base once, so
+    #              the contexts joined from them are not tokenized again
+    #              per request. Passages already tokenized are kept and
+    #              the ones no longer given are dropped. A passage is
+    #              tokenized both alone (it starts the context) and after
+    #              a space (it follows another passage), since byte-level
+    #              tokenizers mark a word after a space differently.
+    # Input:
+    #   - self: instance of the class itself
+    #   - passages: the passages
+    # Returns: N/A
+    ######################################################################
+    def cache_passages(self, passages):
+        cached = self.passage_tokens
+        tokens = {}
+        new = []
+        for passage in passages:
+            if passage in cached:
+                tokens[passage] = cached[passage]
+            elif passage not in tokens:
+                tokens[passage] = None
+                new.append(passage)
+
+        if new:
+            with self._tokenizer_lock:
+                self.tokenizer.no_truncation()
+                alone = self.tokenizer.encode_batch(new, add_special_tokens=False)
+                joined = self.tokenizer.encode_batch([" " + passage for passage in new], add_special_tokens=False)
+            for passage, first, following in zip(new, alone, joined):
+                first, following = token_arrays(first), token_arrays(following, shift=-1)
+                # Share the arrays when the joining space changes nothing
+                if all(np.array_equal(a, b) for a, b in zip(first, following)):
+                    following = first
+                tokens[passage] = (first, following)
+
+        # Swapped in whole, so concurrent requests see either set
+        self.passage_tokens = tokens
+
+    ######################################################################
+    # Module: context_tokens
+    # Description: Assembles the tokens of a context joined from
+    #              pre-tokenized passages. The offsets of each passage are
+    #              moved to where it starts in the context, so they map
+    #              into the context string exactly.
+    # Input:
+    #   - self: instance of the class itself
+    #   - context: the context (a ReaderContext)
+    # Returns: a tuple (ids, offsets), or None if the context does not
+    #          list its passages or one of them is not cached
+    ######################################################################
+    def context_tokens(self, context):
+        passages = getattr(context, "passages", None)
+        if not passages:
+            return None
+
+        cached = self.passage_tokens
+        ids, offsets = [], []
+        position = 0
+        for i, passage in enumerate(passages):
+            tokens = cached.get(passage)
+            if tokens is None:
+                return None
+            passage_ids, passage_offsets = tokens[i > 0]
+            ids.append(passage_ids)
+            offsets.append(passage_offsets + position)
+            position += len(passage) + 1
+        return np.concatenate(ids), np.concatenate(offsets)
+
+    ######################################################################
+    # Module: reader_windows
+    # Description: Splits a (question, context) pair into the windows of
+    #              the reader. When the context's passages are
+    #              pre-tokenized, only the question is tokenized and the
+    #              windows are cut from the cached tokens, as the
+    #              tokenizer's truncation would cut them; otherwise the
+    #              pair is tokenized.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the question
+    #   - context: the context
+    #   - max_seq_len: the token length of a window
+    #   - doc_stride: the token overlap between windows
+    # Returns: a list of Window tuples or tokenizers Encoding objects
+    ######################################################################
+    def reader_windows(self, question, context, max_seq_len, doc_stride):
+        tokens = self.context_tokens(context)
+        if tokens is None:
+            return self.windows(question, context, max_seq_len, doc_stride)
+
+        with self._tokenizer_lock:
+            self.tokenizer.no_truncation()
+            question_ids = np.array(self.tokenizer.encode(question, add_special_tokens=False).ids, dtype=np.int64)
+
+        template = self.special_tokens
+        prefix, middle, suffix = template["prefix"], template["middle"], template["suffix"]
+        room = max_seq_len - len(question_ids) - len(prefix[0]) - len(middle[0]) - len(suffix[0])
+        if room < 1:
+            return self.windows(question, context, max_seq_len, doc_stride)
+        stride = max(min(doc_stride, room - 1), 0)
+
+        context_ids, context_offsets = tokens
+        head = len(prefix[0]) + len(question_ids) + len(middle[0])
+        head_ids = np.concatenate([prefix[0], question_ids, middle[0]])
+        head_types = np.concatenate([prefix[1], np.full(len(question_ids), template["question"]), middle[1]])
+        head_sequence = np.concatenate([np.full(len(prefix[0]), -1), np.zeros(len(question_ids), dtype=np.int64),
+                                        np.full(len(middle[0]), -1)])
+
+        windows = []
+        start = 0
+        while True:
+            end = min(start + room, len(context_ids))
+            length = end - start
+            windows.append(Window(
+                ids=np.concatenate([head_ids, context_ids[start:end], suffix[0]]),
+                type_ids=np.concatenate([head_types, np.full(length, template["context"]), suffix[1]]),
+                attention_mask=np.ones(head + length + len(suffix[0]), dtype=np.int64),
+                sequence_ids=np.concatenate([head_sequence, np.ones(length, dtype=np.int64),
+                                             np.full(len(suffix[0]), -1)]),
+                offsets=np.concatenate([np.zeros((head, 2), dtype=np.int64), context_offsets[start:end],
+                                        np.zeros((len(suffix[0]), 2), dtype=np.int64)]),
+            ))
+            if end >= len(context_ids):
+                return windows
+            start += room - stride
+
+    ######################################################################
+    # Module: windows
+    # Description: Tokenizes a (question, context) pair into overlapping
+    #              windows of at most max_seq_len tokens.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the question
+    #   - context: the context
+    #   - max_seq_len: the token length of a window
+    #   - doc_stride: the token overlap between windows
+    # Returns: a list of tokenizers Encoding objects
+    ######################################################################
+    def windows(self, question, context, max_seq_len, doc_stride):
+        with self._tokenizer_lock:
+            self.tokenizer.no_truncation()
+            question_len = len(self.tokenizer.encode(question, add_special_tokens=False).ids)
+
+            # The stride must leave room for new context tokens in each window
+            room = max_seq_len - question_len - self.tokenizer.num_special_tokens_to_add(True)
+            stride = max(min(doc_stride, room - 1), 0)
+            self.tokenizer.enable_truncation(max_seq_len, stride=stride, strategy="only_second")
+            encoding = self.tokenizer.encode(question, context)
+        return [encoding] + encoding.overflowing
+
+######################################################################
+# Module: quantize_model
+# Description: Writes an int8 dynamically quantized copy of a model.
+# Input:
+#   - model_path: the path of the fp32 .onnx file
+#   - output_path: the path of the int8 .onnx file
+# Returns: N/A
+######################################################################
+def quantize_model(model_path, output_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(str(model_path), str(output_path), weight_type=QuantType.QInt8)
+
+######################################################################
+# Module: export_graph
+# Description: Exports a torch module to ONNX with dynamic batch and
+#              sequence axes.
+# Input:
+#   - module: the torch module
+#   - sample: a tuple of sample input tensors
+#   - path: the path of the .onnx file
+#   - input_names: the names of the inputs
+#   - output_names: the names of the outputs
+# Returns: N/A
+######################################################################
+def export_graph(module, sample, path, input_names, output_names):
+    import torch
+
+    axes = {name: {0: "batch", 1: "sequence"} for name in input_names + output_names}
+    with torch.no_grad():
+        torch.onnx.export(module, sample, str(path), input_names=input_names, output_names=output_names,
+                          dynamic_axes=axes, opset_version=OPSET_VERSION, dynamo=False)
+
+######################################################################
+# Module: export_qa_model
+# Description: Exports a locally available QA model to ONNX.
+# Input:
+#   - model_name: the name (in the local Hugging Face cache) or path of
+#                 the QA model
+#   - output_dir: the directory to write the model to
+#   - quantize: whether to also write an int8 model
+# Returns: the path of the fp32 .onnx file
+######################################################################
+def export_qa_model(model_name=QA_MODEL_NAME, output_dir=DEFAULT_ONNX_DIR / QA_DIR, quantize=False):
+    import torch
+    from transformers import AutoModelForQuestionAnswering, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+    model = AutoModelForQuestionAnswering.from_pretrained(model_name, local_files_only=True).eval()
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in tokenizer.model_input_names]
+
+    class QAOutputs(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            outputs = self.model(**dict(zip(input_names, inputs)))
+            return outputs.start_logits, outputs.end_logits
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sample = tokenizer("Which question?", "Some context.", return_tensors="pt")
+    export_graph(QAOutputs(), tuple(sample[n] for n in input_names), output_dir / MODEL_FILE,
+                 input_names, ["start_logits", "end_logits"])
+
+    tokenizer.backend_tokenizer.save(str(output_dir / TOKENIZER_FILE))
+    with open(output_dir / CONFIG_FILE, "w", encoding="utf-8") as f:
+        json.dump({"source": model_name, "pad_id": tokenizer.pad_token_id}, f, indent=2)
+
+    if quantize:
+        quantize_model(output_dir / MODEL_FILE, output_dir / QUANTIZED_MODEL_FILE)
+    return output_dir / MODEL_FILE
+
+######################################################################
+# Module: export_embedder
+# Description: Exports the transformer of a locally available
+#              SentenceTransformer to ONNX along with its pooling
+#              settings.
+# Input:
+#   - model_name: the name (in the local Hugging Face cache) or path of
+#                 the SentenceTransformer
+#   - output_dir: the directory to write the model to
+#   - quantize: whether to also write an int8 model
+# Returns: the path of the fp32 .onnx file
+######################################################################
+def export_embedder(model_name=EMBEDDING_MODEL_NAME, output_dir=DEFAULT_ONNX_DIR / EMBEDDER_DIR, quantize=False):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    sentence_model = SentenceTransformer(model_name, device="cpu", local_files_only=True).eval()
+    transformer = sentence_model[0].auto_model
+    tokenizer = sentence_model.tokenizer
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in tokenizer.model_input_names]
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs)))[0]
+
+    pooling = sentence_model[1].get_config_dict()
+    config = {
+        "source": model_name,
+        "pad_id": tokenizer.pad_token_id,
+        "max_seq_length": sentence_model.max_seq_length,
+        "pooling": "cls" if pooling.get("pooling_mode_cls_token") else "mean",
+        "normalize": any(type(module).__name__ == "Normalize" for module in sentence_model),
+    }
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sample = tokenizer(["Some sentence."], return_tensors="pt")
+    export_graph(TokenEmbeddings(), tuple(sample[n] for n in input_names), output_dir / MODEL_FILE,
+                 input_names, ["token_embeddings"])
+
+    tokenizer.backend_tokenizer.save(str(output_dir / TOKENIZER_FILE))
+    with open(output_dir / CONFIG_FILE, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    if quantize:
+        quantize_model(output_dir / MODEL_FILE, output_dir / QUANTIZED_MODEL_FILE)
+    return output_dir / MODEL_FILE
+
+######################################################################
+# Module: main
+# Description: Exports both models, and optionally the small QA model of
+#              the reader cascade, from the local Hugging Face cache
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Export the QA model and the embedder to ONNX")
+    parser.add_argument("--qa-model", default=QA_MODEL_NAME, help="name or path of the QA model")
+    parser.add_argument("--embedding-model", default=EMBEDDING_MODEL_NAME, help="name or path of the embedder")
+    parser.add_argument("--fast-qa-model", default=None,
+                        help=f"name or path of a small QA model for the reader cascade, e.g. {FAST_QA_MODEL_NAME}")
+    parser.add_argument("--output", default=str(DEFAULT_ONNX_DIR), help="directory to export to")
+    parser.add_argument("--quantize", action="store_true", help="also write int8 quantized models")
+    args = parser.parse_args()
+
+    print(export_qa_model(args.qa_model, Path(args.output) / QA_DIR, args.quantize))
+    print(export_embedder(args.embedding_model, Path(args.output) / EMBEDDER_DIR, args.quantize))
+    if args.fast_qa_model is not None:
+        print(export_qa_model(args.fast_qa_model, Path(args.output) / FAST_QA_DIR, args.quantize))
+
+######################################
+### Entry point of onnx_backend.py ###
+######################################
+if __name__ == "__main__":
+    main()
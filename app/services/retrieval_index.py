@@ -0,0 +1,635 @@
+# File: retrieval_index.py
+# Author: William Jahner
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+######################################################################
+# Module: normalize_rows
+# Description: Scales each row of a matrix to unit length so that a dot
+#              product between rows is their cosine similarity.
+# Input:
+#   - matrix: a 2D array
+# Returns: a float32 matrix with unit-length rows (zero rows stay zero)
+######################################################################
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-8)
+
+# Data types an index scores against without converting the whole matrix
+INDEX_DTYPES = (np.float32, np.float16)
+
+# Rows of int8 codes (or float16 entries) converted to float32 at a time
+# during a scan (small enough for the converted block to stay in the CPU
+# cache)
+SCAN_BLOCK_ROWS = 1024
+
+######################################################################
+# Module: index_vectors
+# Description: Returns the unit-length rows an index scores against.
+#              Rows that already have unit norm are used without a copy
+#              when they are float32 or float16 (e.g. the app's store
+#              matrix, or a memory-mapped matrix shared between
+#              processes); other rows are normalized into a float32 copy.
+# Input:
+#   - embeddings: the (entries x dim) embedding matrix
+#   - normalized: whether the rows already have unit norm
+# Returns: the unit-length matrix
+######################################################################
+def index_vectors(embeddings, normalized):
+    if normalized and np.asarray(embeddings).dtype in INDEX_DTYPES:
+        return np.asarray(embeddings)
+    return normalize_rows(embeddings)
+
+######################################################################
+# Module: score_rows
+# Description: Scores entries against queries (queries @ vectors.T). A
+#              float16 matrix is converted block by block, so no float32
+#              copy of it is made.
+# Input:
+#   - queries: a (queries x dim) float32 matrix
+#   - vectors: an (entries x dim) float32 or float16 matrix
+# Returns: a (queries x entries) float32 score matrix
+######################################################################
+def score_rows(queries, vectors):
+    if vectors.dtype == np.float32:
+        return queries @ vectors.T
+
+    scores = np.empty((queries.shape[0], vectors.shape[0]), dtype=np.float32)
+    for start in range(0, vectors.shape[0], SCAN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+        scores[:, start:start + len(block)] = queries @ block.T
+    return scores
+
+######################################################################
+# Module: top_k_rows
+# Description: Returns the top_k columns of each row of a score matrix,
+#              best first, without sorting the whole row.
+# Input:
+#   - scores: a (queries x entries) score matrix
+#   - top_k: the number of columns to keep per row
+# Returns: a tuple (top_scores, top_indices), each (queries x top_k)
+######################################################################
+def top_k_rows(scores, top_k):
+    top_k = min(top_k, scores.shape[1])
+    if top_k < scores.shape[1]:
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidate_scores, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+# Rank offset of reciprocal rank fusion: higher values flatten the
+# advantage of the first ranks
+RRF_K = 60
+
+######################################################################
+# Module: fuse_rankings
+# Description: Merges several rankings of the same entries with
+#              reciprocal rank fusion: each entry scores the sum of
+#              1 / (RRF_K + rank) over the rankings that contain it.
+#              Ranks are used rather than scores because the scores of
+#              different retrievers are not comparable.
+# Input:
+#   - rankings: lists of entry ids, best first (-1 entries are skipped)
+#   - top_k: the number of entries to return
+#   - k: the rank offset
+# Returns: the list of the top_k entry ids, best first
+######################################################################
+def fuse_rankings(rankings, top_k, k=RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, entry in enumerate(ranking):
+            if entry >= 0:
+                scores[entry] = scores.get(entry, 0.0) + 1.0 / (k + rank + 1)
+    # Ties keep the order in which the entries were first seen
+    return sorted(scores, key=lambda entry: -scores[entry])[:top_k]
+
+######################################################################
+# Class: RetrievalIndex
+# Description: The interface every retrieval backend implements. An
+#              index is built from the knowledge base embedding matrix
+#              and returns the entries with the highest cosine
+#              similarity to each query.
+######################################################################
+class RetrievalIndex:
+
+    ######################################################################
+    # Module: search
+    # Description: Finds the top_k entries for a batch of queries.
+    # Input:
+    #   - self: instance of the class itself
+    #   - q_embeds: a (queries x dim) matrix of query embeddings
+    #   - top_k: the number of entries to return per query
+    #   - rows: optional array of entry ids the search is restricted to
+    # Returns: a tuple (scores, indices), each (queries x top_k), with the
+    #          best entry first. Approximate backends pad rows with
+    #          index -1 when fewer than top_k entries were found.
+    ######################################################################
+    def search(self, q_embeds, top_k=3, rows=None):
+        raise NotImplementedError
+
+    ######################################################################
+    # Module: update
+    # Description: Applies a knowledge base edit to the index without
+    #              rebuilding it: rows are replaced in place, then
+    #              deleted (later rows move up), then appended. Each
+    #              array is swapped in whole, so concurrent searches see
+    #              either the old or the new rows.
+    # Input:
+    #   - self: instance of the class itself
+    #   - replaced: the ids of the rows whose embeddings changed
+    #   - replaced_embeddings: the new embeddings of those rows
+    #   - deleted: the ids of the rows to delete
+    #   - appended_embeddings: the embeddings of the rows to append
+    #   - vectors: optional unit-length matrix the caller already updated
+    #              with update_rows, used without a copy
+    # Returns: N/A
+    ######################################################################
+    def update(self, replaced=(), replaced_embeddings=None, deleted=(), appended_embeddings=None, vectors=None):
+        raise NotImplementedError
+
+######################################################################
+# Module: update_rows
+# Description: Returns a copy of a unit-length row matrix with rows
+#              replaced, deleted and appended (see RetrievalIndex.update).
+#              The copy keeps the data type of the matrix.
+# Input:
+#   - vectors: the (entries x dim) unit-length matrix
+#   - replaced: the ids of the rows to replace
+#   - replaced_embeddings: the new embeddings of those rows
+#   - deleted: the ids of the rows to delete
+#   - appended_embeddings: the embeddings of the rows to append
+# Returns: the new unit-length matrix
+######################################################################
+def update_rows(vectors, replaced=(), replaced_embeddings=None, deleted=(), appended_embeddings=None):
+    vectors = vectors.copy()
+    if len(replaced):
+        vectors[np.asarray(replaced)] = normalize_rows(replaced_embeddings)
+    if len(deleted):
+        vectors = np.delete(vectors, np.asarray(deleted), axis=0)
+    if appended_embeddings is not None and len(appended_embeddings):
+        vectors = np.vstack([vectors, normalize_rows(appended_embeddings).astype(vectors.dtype)])
+    return vectors
+
+######################################################################
+# Class: ExactIndex
+# Description: Brute-force cosine similarity against every entry. The
+#              entry embeddings are normalized once at build time, so a
+#              search is a single matrix product plus a partial sort.
+######################################################################
+class ExactIndex(RetrievalIndex):
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for ExactIndex
+    # Input:
+    #   - self: instance of the class itself
+    #   - embeddings: the (entries x dim) embedding matrix
+    #   - normalized: whether the rows already have unit norm, in which
+    #                 case a float32 or float16 matrix is used without a
+    #                 copy (see index_vectors)
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, embeddings, normalized=False):
+        self.vectors = index_vectors(embeddings, normalized)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    ######################################################################
+    # Module: search
+    # Description: Scores every entry, or only the given rows (see
+    #              RetrievalIndex.search).
+    ######################################################################
+    def search(self, q_embeds, top_k=3, rows=None):
+        queries = normalize_rows(q_embeds)
+        if rows is None:
+            return top_k_rows(score_rows(queries, self.vectors), top_k)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        scores, positions = top_k_rows(score_rows(queries, self.vectors[rows]), top_k)
+        return scores, rows[positions]
+
+    ######################################################################
+    # Module: update
+    # Description: Normalizes only the new rows (see
+    #              RetrievalIndex.update).
+    ######################################################################
+    def update(self, replaced=(), replaced_embeddings=None, deleted=(), appended_embeddings=None, vectors=None):
+        if vectors is None:
+            vectors = update_rows(self.vectors, replaced, replaced_embeddings, deleted, appended_embeddings)
+        self.vectors = vectors
+
+######################################################################
+# Class: IVFIndex
+# Description: An approximate inverted-file index. The entries are
+#              clustered with k-means into n_lists lists; a search only
+#              scores the entries of the n_probe lists whose centroids
+#              are closest to the query. With n_probe == n_lists the
+#              results are identical to ExactIndex.
+######################################################################
+class IVFIndex(RetrievalIndex):
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for IVFIndex. Trains the centroids and
+    #              assigns every entry to its closest list.
+    # Input:
+    #   - self: instance of the class itself
+    #   - embeddings: the (entries x dim) embedding matrix
+    #   - n_lists: the number of lists (defaults to ~sqrt(entries))
+    #   - n_probe: the number of lists scored per query
+    #   - n_iter: the number of k-means iterations
+    #   - max_train: the maximum number of entries used for training
+    #   - seed: the random seed used for training
+    #   - normalized: whether the rows already have unit norm (see
+    #                 ExactIndex)
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, embeddings, n_lists=None, n_probe=8, n_iter=10, max_train=50000, seed=0, normalized=False):
+        self.vectors = index_vectors(embeddings, normalized)
+        n_entries = self.vectors.shape[0]
+
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_entries))
+        self.n_lists = max(1, min(n_lists, n_entries))
+        self.n_probe = max(1, min(n_probe, self.n_lists))
+
+        rng = np.random.default_rng(seed)
+        self.centroids = self._train(rng, n_iter, max_train)
+
+        # Build the inverted lists: entry ids grouped by closest centroid
+        self.assignments = self._closest_centroids(self.vectors)
+        self.lists = self._build_lists(self.assignments)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    ######################################################################
+    # Module: _train
+    # Description: Runs spherical k-means on (a sample of) the entries.
+    # Input:
+    #   - self: instance of the class itself
+    #   - rng: the random generator
+    #   - n_iter: the number of iterations
+    #   - max_train: the maximum number of training entries
+    # Returns: the (n_lists x dim) unit-length centroid matrix
+    ######################################################################
+    def _train(self, rng, n_iter, max_train):
+        n_entries = self.vectors.shape[0]
+        if n_entries == 0:
+            return np.zeros((0, self.vectors.shape[1]), dtype=np.float32)
+
+        sample = self.vectors
+        if n_entries > max_train:
+            sample = self.vectors[rng.choice(n_entries, max_train, replace=False)]
+        sample = np.asarray(sample, dtype=np.float32)
+
+        centroids = sample[rng.choice(sample.shape[0], self.n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+
+            # Sum the members of each list (lists that lost all their
+            # entries keep their old centroid)
+            order = np.argsort(assignments, kind="stable")
+            members = np.unique(assignments)
+            starts = np.searchsorted(assignments[order], members)
+            sums = centroids.copy()
+            sums[members] = np.add.reduceat(sample[order], starts, axis=0)
+            centroids = normalize_rows(sums)
+
+        return centroids
+
+    ######################################################################
+    # Module: _build_lists
+    # Description: Groups the entry ids by their assigned list.
+    # Input:
+    #   - self: instance of the class itself
+    #   - assignments: the list id of each entry
+    # Returns: a list of n_lists arrays of entry ids
+    ######################################################################
+    def _build_lists(self, assignments):
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self.n_lists + 1))
+        return [order[bounds[i]:bounds[i + 1]] for i in range(self.n_lists)]
+
+    ######################################################################
+    # Module: update
+    # Description: Assigns only the new rows to their closest centroids;
+    #              the centroids are not retrained (see
+    #              RetrievalIndex.update).
+    ######################################################################
+    def update(self, replaced=(), replaced_embeddings=None, deleted=(), appended_embeddings=None, vectors=None):
+        if vectors is None:
+            vectors = update_rows(self.vectors, replaced, replaced_embeddings, deleted, appended_embeddings)
+        if self.centroids.shape[0] == 0:
+            # Nothing was trained on an empty index; train now
+            self.__init__(vectors, n_lists=None, n_probe=self.n_probe, normalized=True)
+            return
+
+        assignments = self.assignments.copy()
+        if len(replaced):
+            assignments[np.asarray(replaced)] = self._closest_centroids(vectors[np.asarray(replaced)])
+        if len(deleted):
+            assignments = np.delete(assignments, np.asarray(deleted))
+        appended = vectors[assignments.shape[0]:]
+        if appended.shape[0]:
+            assignments = np.concatenate([assignments, self._closest_centroids(appended)])
+
+        lists = self._build_lists(assignments)
+        self.vectors, self.assignments, self.lists = vectors, assignments, lists
+
+    ######################################################################
+    # Module: _closest_centroids
+    # Description: Returns the closest list of each vector, or the n
+    #              closest lists when n is given.
+    # Input:
+    #   - self: instance of the class itself
+    #   - vectors: a (vectors x dim) matrix of unit-length vectors
+    #   - n: optional number of lists to return per vector
+    # Returns: a vector of list ids, or a (vectors x n) matrix of list ids
+    ######################################################################
+    def _closest_centroids(self, vectors, n=None):
+        scores = score_rows(self.centroids, vectors).T
+        if n is None:
+            return np.argmax(scores, axis=1)
+        return top_k_rows(scores, n)[1]
+
+    ######################################################################
+    # Module: search
+    # Description: Scores only the entries of the n_probe closest lists
+    #              that are among the given rows (see
+    #              RetrievalIndex.search).
+    ######################################################################
+    def search(self, q_embeds, top_k=3, rows=None):
+        queries = normalize_rows(q_embeds)
+        top_k = min(top_k, len(self))
+
+        scores = np.full((queries.shape[0], top_k), -np.inf, dtype=np.float32)
+        indices = np.full((queries.shape[0], top_k), -1, dtype=np.int64)
+        if top_k == 0:
+            return scores, indices
+
+        allowed = None
+        if rows is not None:
+            allowed = np.zeros(len(self), dtype=bool)
+            allowed[np.asarray(rows, dtype=np.int64)] = True
+
+        probes = self._closest_centroids(queries, self.n_probe)
+        for row, query in enumerate(queries):
+            candidates = np.concatenate([self.lists[i] for i in probes[row]])
+            if allowed is not None:
+                candidates = candidates[allowed[candidates]]
+            if candidates.size == 0:
+                continue
+            candidate_scores, positions = top_k_rows(score_rows(query[None, :], self.vectors[candidates]), top_k)
+            found = positions.shape[1]
+            scores[row, :found] = candidate_scores[0]
+            indices[row, :found] = candidates[positions[0]]
+
+        return scores, indices
+
+# Quantizations of the first-pass scan of QuantizedIndex: int8 codes
+# scaled per row, or one sign bit per dimension compared by Hamming
+# distance
+QUANTIZATION_INT8 = "int8"
+QUANTIZATION_BINARY = "binary"
+QUANTIZATIONS = (QUANTIZATION_INT8, QUANTIZATION_BINARY)
+
+# Number of set bits of each byte (used when numpy has no bitwise_count)
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+######################################################################
+# Module: pack_signs
+# Description: Packs the sign bits of each row into 64-bit words (the
+#              last word is padded with zero bits).
+# Input:
+#   - vectors: a (rows x dim) matrix
+# Returns: a (rows x ceil(dim / 64)) uint64 matrix
+######################################################################
+def pack_signs(vectors):
+    bits = np.packbits(np.asarray(vectors) > 0, axis=1)
+    padding = -bits.shape[1] % 8
+    if padding:
+        bits = np.pad(bits, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(bits).view(np.uint64)
+
+######################################################################
+# Module: popcount_rows
+# Description: Counts the set bits of each row of a word matrix.
+# Input:
+#   - words: a (rows x words) uint64 matrix
+# Returns: an int32 vector of bit counts
+######################################################################
+def popcount_rows(words):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    return POPCOUNT[words.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+######################################################################
+# Module: save_vectors
+# Description: Writes a float32 matrix to a .npy file and maps it back
+#              read-only. The file is written next to the target and
+#              renamed over it, so a mapping of the previous file stays
+#              valid for the searches still using it.
+# Input:
+#   - vectors: the matrix
+#   - path: the path of the .npy file
+# Returns: the memory-mapped matrix
+######################################################################
+def save_vectors(vectors, path):
+    path = Path(path)
+    partial = path.with_name(path.name + ".partial")
+    with open(partial, "wb") as f:
+        np.save(f, np.asarray(vectors, dtype=np.float32))
+    os.replace(partial, path)
+    return np.load(path, mmap_mode="r")
+
+######################################################################
+# Module: maps_file
+# Description: Tells whether a matrix is memory-mapped from a file.
+# Input:
+#   - matrix: the matrix
+#   - path: the path of the file
+# Returns: True if the matrix is a np.memmap of that file
+######################################################################
+def maps_file(matrix, path):
+    filename = getattr(matrix, "filename", None)
+    return isinstance(matrix, np.memmap) and filename is not None and os.path.exists(path) \
+        and os.path.samefile(filename, path)
+
+######################################################################
+# Class: QuantizedIndex
+# Description: A two-pass index. A compact quantized copy of the entries
+#              (int8 codes, or sign bits compared by Hamming distance)
+#              is scanned to find rescore * top_k candidates per query,
+#              which are then rescored exactly against the full-precision
+#              rows. With vectors_path the full-precision rows are kept
+#              in a memory-mapped file, so only the rows of the
+#              candidates are read from disk and the resident index is
+#              the codes (1/4 of float32 for int8, 1/32 for binary).
+######################################################################
+class QuantizedIndex(RetrievalIndex):
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for QuantizedIndex
+    # Input:
+    #   - self: instance of the class itself
+    #   - embeddings: the (entries x dim) embedding matrix
+    #   - quantization: "int8" or "binary"
+    #   - rescore: the number of candidates rescored per result
+    #   - vectors_path: optional .npy file the full-precision rows are
+    #                   written to and mapped from
+    #   - normalized: whether the rows already have unit norm (see
+    #                 ExactIndex). A matrix already mapped from
+    #                 vectors_path is then rescored in place without
+    #                 writing the file again.
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, embeddings, quantization=QUANTIZATION_INT8, rescore=10, vectors_path=None, normalized=False):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}' (expected one of {QUANTIZATIONS})")
+        self.quantization = quantization
+        self.rescore = max(1, rescore)
+        self.vectors_path = vectors_path
+
+        vectors = index_vectors(embeddings, normalized)
+        self.codes, self.scales = self._quantize(vectors)
+        if vectors_path is not None and not (normalized and maps_file(embeddings, vectors_path)):
+            vectors = save_vectors(vectors, vectors_path)
+        self.vectors = vectors
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    ######################################################################
+    # Module: _quantize
+    # Description: Quantizes unit-length rows.
+    # Input:
+    #   - self: instance of the class itself
+    #   - vectors: a (rows x dim) matrix of unit-length rows
+    # Returns: a tuple (codes, scales). int8 codes are scaled so each
+    #          row's largest component is 127 (scales holds the inverse
+    #          factors); binary codes are the sign bits packed in 64-bit
+    #          words (scales is None).
+    ######################################################################
+    def _quantize(self, vectors):
+        if self.quantization == QUANTIZATION_BINARY:
+            return pack_signs(vectors), None
+
+        codes = np.empty(vectors.shape, dtype=np.int8)
+        scales = np.empty(vectors.shape[0], dtype=np.float32)
+        for start in range(0, vectors.shape[0], SCAN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            block_scales = np.maximum(np.abs(block).max(axis=1, initial=0.0), 1e-8) / 127
+            codes[start:start + len(block)] = np.rint(block / block_scales[:, None])
+            scales[start:start + len(block)] = block_scales
+        return codes, scales
+
+    ######################################################################
+    # Module: scan
+    # Description: Scores entries against the queries with the quantized
+    #              codes. The queries are not quantized for int8 (so the
+    #              scores approximate the cosine similarities); for binary
+    #              codes the score is minus the Hamming distance between
+    #              the sign bits.
+    # Input:
+    #   - self: instance of the class itself
+    #   - queries: a (queries x dim) matrix of unit-length queries
+    #   - rows: optional array of entry ids to score
+    # Returns: a (queries x entries) float32 score matrix
+    ######################################################################
+    def scan(self, queries, rows=None):
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.quantization == QUANTIZATION_BINARY:
+            scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+            for i, query_words in enumerate(pack_signs(queries)):
+                scores[i] = -popcount_rows(codes ^ query_words)
+            return scores
+
+        scales = self.scales if rows is None else self.scales[rows]
+        scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = (queries @ block.T) * scales[start:start + len(block)]
+        return scores
+
+    ######################################################################
+    # Module: search
+    # Description: Scans the quantized codes for candidates, then rescores
+    #              them against the full-precision rows (see
+    #              RetrievalIndex.search).
+    ######################################################################
+    def search(self, q_embeds, top_k=3, rows=None):
+        queries = normalize_rows(q_embeds)
+        rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+        n_rows = len(self) if rows is None else rows.shape[0]
+        top_k = min(top_k, n_rows)
+        if top_k == 0:
+            return np.empty((queries.shape[0], 0), dtype=np.float32), np.empty((queries.shape[0], 0), dtype=np.int64)
+
+        _, candidates = top_k_rows(self.scan(queries, rows), min(top_k * self.rescore, n_rows))
+        if rows is not None:
+            candidates = rows[candidates]
+
+        # Only the candidates' rows are read from the full-precision matrix
+        unique, inverse = np.unique(candidates, return_inverse=True)
+        exact = np.asarray(self.vectors[unique], dtype=np.float32)[inverse.reshape(candidates.shape)]
+        scores, order = top_k_rows(np.einsum("qd,qcd->qc", queries, exact), top_k)
+        return scores, np.take_along_axis(candidates, order, axis=1)
+
+    ######################################################################
+    # Module: update
+    # Description: Quantizes only the new rows and rewrites the
+    #              full-precision file (see RetrievalIndex.update).
+    ######################################################################
+    def update(self, replaced=(), replaced_embeddings=None, deleted=(), appended_embeddings=None, vectors=None):
+        codes, scales = self.codes.copy(), None if self.scales is None else self.scales.copy()
+        if len(replaced):
+            replaced_codes, replaced_scales = self._quantize(normalize_rows(replaced_embeddings))
+            codes[np.asarray(replaced)] = replaced_codes
+            if scales is not None:
+                scales[np.asarray(replaced)] = replaced_scales
+        if len(deleted):
+            codes = np.delete(codes, np.asarray(deleted), axis=0)
+            if scales is not None:
+                scales = np.delete(scales, np.asarray(deleted))
+        if appended_embeddings is not None and len(appended_embeddings):
+            appended_codes, appended_scales = self._quantize(normalize_rows(appended_embeddings))
+            codes = np.vstack([codes, appended_codes])
+            if scales is not None:
+                scales = np.concatenate([scales, appended_scales])
+
+        if vectors is None:
+            vectors = update_rows(self.vectors, replaced, replaced_embeddings, deleted, appended_embeddings)
+        if self.vectors_path is not None:
+            vectors = save_vectors(vectors, self.vectors_path)
+        self.vectors, self.codes, self.scales = vectors, codes, scales
+
+# The available retrieval backends by name
+INDEX_BACKENDS = {
+    "exact": ExactIndex,
+    "ivf": IVFIndex,
+    "quantized": QuantizedIndex,
+}
+
+######################################################################
+# Module: create_index
+# Description: Builds a retrieval index for the given embeddings.
+# Input:
+#   - backend: the backend name (a key of INDEX_BACKENDS)
+#   - embeddings: the (entries x dim) embedding matrix
+#   - **options: backend-specific options (e.g. n_lists, n_probe)
+# Returns: the RetrievalIndex
+######################################################################
+def create_index(backend, embeddings, **options):
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown retrieval index backend '{backend}'. "
+                         f"Available backends: {', '.join(sorted(INDEX_BACKENDS))}")
+    return INDEX_BACKENDS[backend](embeddings, **options)
@@ -0,0 +1,79 @@
+# File: store_snapshot.py
+# Author: William Jahner
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .knowledge_store import KnowledgeStore
+from .retrieval_index import normalize_rows
+
+# File holding the labels of a snapshot; the columns are .npy files
+LABELS_FILE = "labels.json"
+LABEL_IDS_FILE = "label_ids.npy"
+OFFSETS_FILE = "offsets.npy"
+BUFFER_FILE = "buffer.npy"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+# Memory-backed file system the snapshots are written to when available,
+# so a mapped snapshot is shared memory rather than a disk file
+SHARED_MEMORY_DIR = "/dev/shm"
+
+######################################################################
+# Module: default_snapshot_root
+# Description: The directory snapshots are created in by default.
+# Input: N/A
+# Returns: SHARED_MEMORY_DIR if it exists, otherwise None (the system
+#          temporary directory)
+######################################################################
+def default_snapshot_root():
+    return SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None
+
+######################################################################
+# Module: save_snapshot
+# Description: Writes a KnowledgeStore and its embeddings as flat files
+#              that other processes can map read-only. The embeddings
+#              are written as unit-norm float32 rows, ready to be used
+#              by a retrieval index without a copy.
+# Input:
+#   - store: the KnowledgeStore
+#   - directory: the (existing) directory of the snapshot
+#   - embeddings: the embedding matrix (defaults to store.embeddings)
+# Returns: N/A
+######################################################################
+def save_snapshot(store, directory, embeddings=None):
+    directory = Path(directory)
+    embeddings = store.embeddings if embeddings is None else embeddings
+    if embeddings is None:
+        raise ValueError("The store has no embeddings to snapshot")
+
+    with open(directory / LABELS_FILE, "w", encoding="utf-8") as f:
+        json.dump(store.labels, f)
+    np.save(directory / LABEL_IDS_FILE, store.label_ids)
+    np.save(directory / OFFSETS_FILE, store.offsets)
+    np.save(directory / BUFFER_FILE, np.frombuffer(store.buffer, dtype=np.uint8))
+    np.save(directory / EMBEDDINGS_FILE, normalize_rows(embeddings))
+
+######################################################################
+# Module: load_snapshot
+# Description: Maps a snapshot written by save_snapshot. The texts, the
+#              label IDs, the offsets and the embeddings stay in the
+#              mapped files, so every process loading the snapshot
+#              shares one copy of them through the page cache.
+# Input:
+#   - directory: the directory of the snapshot
+# Returns: a KnowledgeStore with float32, unit-norm embeddings
+######################################################################
+def load_snapshot(directory):
+    directory = Path(directory)
+    with open(directory / LABELS_FILE, "r", encoding="utf-8") as f:
+        labels = json.load(f)
+    label_ids = np.load(directory / LABEL_IDS_FILE, mmap_mode="r")
+    offsets = np.load(directory / OFFSETS_FILE, mmap_mode="r")
+    buffer = np.load(directory / BUFFER_FILE, mmap_mode="r")
+
+    store = KnowledgeStore(labels, label_ids, memoryview(buffer), offsets, "float32")
+    store.embeddings = np.load(directory / EMBEDDINGS_FILE, mmap_mode="r")
+    return store
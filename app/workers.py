@@ -0,0 +1,235 @@
+# File: workers.py
+# Author: William Jahner
+#
+# Process-pool serving of NLP questions. The app's knowledge base and
+# embeddings are written once to a read-only snapshot in shared memory
+# (app.services.store_snapshot); every worker process maps the snapshot
+# instead of holding its own copy, loads its own models once, and runs
+# answer_questions for the batches it is sent. Unlike inference threads,
+# worker processes do not share the GIL, so tokenization, retrieval and
+# the pipeline's Python code run in parallel. When the app records
+# metrics, each worker records its own and returns them with every batch,
+# and the pool merges them into the app's metrics.
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from .main import NewParentAIAssistantApp
+from .services.answer_cache import AnswerCache
+from .services.metrics import Metrics
+from .services.store_snapshot import default_snapshot_root, load_snapshot, save_snapshot
+
+# Environment variables sizing the thread pools of the native libraries
+# a worker loads after it starts (PyTorch, MKL and OpenBLAS)
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+# Seconds a worker waits for the others to start during warm-up
+WARM_UP_TIMEOUT_S = 600
+
+# The app of the current worker process, and the barrier the workers
+# meet at during warm-up
+_worker_app = None
+_worker_barrier = None
+
+######################################################################
+# Module: threads_per_worker
+# Description: The default number of intra-op threads of each worker:
+#              the CPU cores split evenly between the workers, so the
+#              workers do not oversubscribe the machine.
+# Input:
+#   - processes: the number of worker processes
+# Returns: the number of threads (at least 1)
+######################################################################
+def threads_per_worker(processes):
+    return max(1, (os.cpu_count() or 1) // max(1, processes))
+
+######################################################################
+# Module: set_torch_threads
+# Description: Sets the intra-op thread count of PyTorch if it has been
+#              imported (models that are not PyTorch models never
+#              import it).
+# Input:
+#   - threads: the number of threads
+# Returns: N/A
+######################################################################
+def set_torch_threads(threads):
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+######################################################################
+# Module: init_worker
+# Description: Initializes a worker process: maps the snapshot, builds
+#              the worker's app around it and loads the models.
+# Input:
+#   - snapshot_dir: the directory of the store snapshot
+#   - app_options: the NewParentAIAssistantApp keyword arguments
+#   - cache_options: optional AnswerCache keyword arguments (each worker
+#                    has its own answer cache)
+#   - threads: the intra-op thread count of the worker
+#   - registry_factory: optional picklable callable returning the model
+#                       registry (defaults to the process-wide registry)
+#   - barrier: optional barrier the workers meet at during warm-up
+#   - metrics: whether the worker records metrics (returned with each
+#              batch by answer_in_worker)
+# Returns: N/A
+######################################################################
+def init_worker(snapshot_dir, app_options, cache_options, threads, registry_factory=None, barrier=None,
+                metrics=False):
+    global _worker_app, _worker_barrier
+    _worker_barrier = barrier
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+    options = dict(app_options)
+    options["index_options"] = dict(options.get("index_options") or {}, normalized=True)
+    if cache_options is not None:
+        options["answer_cache"] = AnswerCache(**cache_options)
+    if registry_factory is not None:
+        options["registry"] = registry_factory()
+    if metrics:
+        options["metrics"] = Metrics(enabled=True)
+
+    _worker_app = NewParentAIAssistantApp(load_snapshot(snapshot_dir), **options)
+    _worker_app.warm_up()
+    set_torch_threads(threads)
+
+######################################################################
+# Module: worker_app
+# Description: The app of the current worker process.
+# Input: N/A
+# Returns: the NewParentAIAssistantApp built by init_worker (None outside
+#          a worker)
+######################################################################
+def worker_app():
+    return _worker_app
+
+######################################################################
+# Module: answer_in_worker
+# Description: Answers a batch of NLP questions in a worker process.
+# Input:
+#   - questions: the list of questions
+# Returns: a tuple (list of answers, the metrics recorded since the last
+#          batch as returned by Metrics.drain, or None when the worker
+#          records no metrics)
+######################################################################
+def answer_in_worker(questions):
+    answers = _worker_app.answer_questions(questions)
+    metrics = _worker_app.metrics
+    return answers, metrics.drain() if metrics.enabled else None
+
+######################################################################
+# Module: worker_pid
+# Description: Returns the process ID of the worker running it, after
+#              every worker has reached the warm-up barrier (so each
+#              worker runs exactly one of these calls).
+# Input:
+#   - _: ignored
+# Returns: the process ID
+######################################################################
+def worker_pid(_):
+    if _worker_barrier is not None:
+        _worker_barrier.wait(WARM_UP_TIMEOUT_S)
+    return os.getpid()
+
+######################################################################
+# Class: WorkerPool
+# Description: A pool of worker processes answering NLP questions
+#              against a shared-memory snapshot of an app's knowledge
+#              base. The pool's answer_questions takes the place of
+#              app.answer_questions, and the workers' metrics are merged
+#              into the app's.
+######################################################################
+class WorkerPool:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for WorkerPool. Writes the snapshot (the
+    #              app's embeddings are computed if needed) and starts the
+    #              worker processes. The workers record metrics when the
+    #              app does.
+    # Input:
+    #   - self: instance of the class itself
+    #   - app: the NewParentAIAssistantApp whose knowledge base is served
+    #   - processes: the number of worker processes
+    #   - app_options: optional NewParentAIAssistantApp keyword arguments
+    #                  of the workers' apps (e.g. index_backend)
+    #   - cache_options: optional AnswerCache keyword arguments
+    #   - threads: the intra-op threads per worker (defaults to the cores
+    #              split between the workers)
+    #   - registry_factory: optional picklable callable returning the
+    #                       workers' model registry
+    #   - snapshot_root: the directory the snapshot is created in
+    #                    (defaults to shared memory when available)
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, app, processes, app_options=None, cache_options=None, threads=None, registry_factory=None,
+                 snapshot_root=None):
+        self.processes = processes
+        self.metrics = app.metrics
+        self.threads = threads if threads is not None else threads_per_worker(processes)
+        root = snapshot_root if snapshot_root is not None else default_snapshot_root()
+        self.snapshot_dir = tempfile.mkdtemp(prefix="assistant-store-", dir=root)
+        try:
+            save_snapshot(app.store, self.snapshot_dir, app.embeddings)
+        except BaseException:
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+            raise
+
+        # Spawned (not forked) workers start clean of the parent's threads
+        # and loaded libraries
+        context = multiprocessing.get_context("spawn")
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(self.snapshot_dir, app_options or {}, cache_options, self.threads, registry_factory,
+                      context.Barrier(processes), app.metrics.enabled),
+        )
+
+    ######################################################################
+    # Module: warm_up
+    # Description: Starts every worker and waits until their models are
+    #              loaded.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: the set of worker process IDs
+    ######################################################################
+    def warm_up(self):
+        return set(self.executor.map(worker_pid, range(self.processes)))
+
+    ######################################################################
+    # Module: answer_questions
+    # Description: Answers a batch of NLP questions in one worker
+    #              (blocking) and merges the metrics it recorded.
+    # Input:
+    #   - self: instance of the class itself
+    #   - questions: the list of questions
+    # Returns: the list of answers
+    ######################################################################
+    def answer_questions(self, questions):
+        answers, samples = self.executor.submit(answer_in_worker, list(questions)).result()
+        self.metrics.merge(samples)
+        return answers
+
+    ######################################################################
+    # Module: close
+    # Description: Stops the workers and removes the snapshot.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: N/A
+    ######################################################################
+    def close(self):
+        self.executor.shutdown(wait=True)
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1 @@
+# Note that this is a placeholder python file...
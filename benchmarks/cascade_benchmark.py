@@ -0,0 +1,118 @@
+# File: cascade_benchmark.py
+# Author: William Jahner
+#
+# Replays a held-out question log through the NLP answer path with the
+# large reader only and with the reader cascade at several escalation
+# thresholds, and reports the fraction of questions answered by each
+# reader tier, how often the cascade gives the large reader's answer,
+# how often the answer is found in the relevant entry (for the labeled
+# evaluation questions) and the latency. By default the question log is
+# the evaluation set plus the load test questions and the real models
+# are used; --stub swaps in the offline stub models. Run from the
+# repository root:
+#
+#   python -m benchmarks.cascade_benchmark
+#   python -m benchmarks.cascade_benchmark --stub --qa-call-ms 40 --fast-call-ms 8 --json
+#   python -m benchmarks.cascade_benchmark --log held_out.txt --scores 0.2 0.4 0.6
+
+import argparse
+import json
+import time
+
+from app.main import NewParentAIAssistantApp
+from app.services.ai_service import TIER_FAST, TIER_FULL
+from app.services.kb_loader import load_knowledge_base
+from app.services.model_registry import FAST_QA_MODEL_NAME
+from benchmarks.shortcut_benchmark import format_ms, load_question_log, summarize
+from benchmarks.stub_models import stub_registry
+
+# Escalation thresholds compared against the large reader alone
+DEFAULT_SCORES = (0.1, 0.3, 0.5)
+
+######################################################################
+# Module: run_cascade
+# Description: Replays the question log with one reader setting.
+# Input:
+#   - log: the list of (question, relevant entry text or None) tuples
+#   - registry: the model registry
+#   - fast_model: the small reader's model name (None reads with the
+#                 large reader only)
+#   - score: the escalation threshold
+#   - reference: optional answers of the large reader, in log order
+# Returns: a tuple (result dict, list of answers)
+######################################################################
+def run_cascade(log, registry, fast_model, score, reference=None):
+    ai_options = {"fast_qa_model_name": fast_model, "cascade_score": score}
+    app = NewParentAIAssistantApp(load_knowledge_base(), registry=registry, ai_options=ai_options)
+    app.warm_up()
+    # Load the small reader before the questions are timed
+    _ = app.ai.fast_qa_pipeline
+
+    answers, latencies = [], []
+    labeled, found = 0, 0
+    for question, relevant in log:
+        start = time.perf_counter()
+        answer = app.answer_question(question)
+        latencies.append((time.perf_counter() - start) * 1000)
+        answers.append(answer)
+        if relevant is not None:
+            labeled += 1
+            found += bool(answer) and (answer in relevant or relevant in answer)
+
+    tiers = app.ai.tier_counts if fast_model is not None else {TIER_FAST: 0, TIER_FULL: len(log)}
+    result = {
+        "score": score if fast_model is not None else None,
+        "fast_fraction": tiers[TIER_FAST] / len(log),
+        "escalated_fraction": tiers[TIER_FULL] / len(log),
+        "agreement": None if reference is None else sum(a == b for a, b in zip(answers, reference)) / len(log),
+        "found_in_relevant": found / labeled if labeled else None,
+        "latency": summarize(latencies),
+    }
+    return result, answers
+
+######################################################################
+# Module: main
+# Description: The reader cascade benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Tier hit rates and latency of the reader cascade")
+    parser.add_argument("--log", default=None, help="held-out question log, one question per line")
+    parser.add_argument("--fast-model", default=FAST_QA_MODEL_NAME, help="small reader model")
+    parser.add_argument("--scores", type=float, nargs="+", default=list(DEFAULT_SCORES),
+                        help="escalation thresholds to compare")
+    parser.add_argument("--stub", action="store_true", help="use the offline stub models")
+    parser.add_argument("--qa-call-ms", type=float, default=40.0, help="stub large reader latency per call")
+    parser.add_argument("--fast-call-ms", type=float, default=8.0, help="stub small reader latency per call")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    log = load_question_log(args.log)
+    registry = None
+    if args.stub:
+        registry = stub_registry(qa_call_latency_s=args.qa_call_ms / 1000,
+                                 fast_qa_call_latency_s=args.fast_call_ms / 1000)
+
+    baseline, reference = run_cascade(log, registry, None, None)
+    results = [baseline] + [run_cascade(log, registry, args.fast_model, score, reference)[0]
+                            for score in args.scores]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'score':>6}{'fast':>7}{'full':>7}{'agree':>7}{'found':>7}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}")
+    for r in results:
+        score = "off" if r["score"] is None else f"{r['score']:.2f}"
+        agreement = "-" if r["agreement"] is None else f"{r['agreement']:.2f}"
+        found = "-" if r["found_in_relevant"] is None else f"{r['found_in_relevant']:.2f}"
+        latency = r["latency"]
+        print(f"{score:>6}{r['fast_fraction']:>7.2f}{r['escalated_fraction']:>7.2f}{agreement:>7}{found:>7}"
+              f"{format_ms(latency['p50_ms'])}{format_ms(latency['p95_ms'])}{format_ms(latency['p99_ms'])}")
+
+###########################################
+### Entry point of cascade_benchmark.py ###
+###########################################
+if __name__ == "__main__":
+    main()
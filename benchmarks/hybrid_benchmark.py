@@ -0,0 +1,117 @@
+# File: hybrid_benchmark.py
+# Author: William Jahner
+#
+# Measures the retrieval latency and recall@k of the dense, hybrid and
+# lexical retrieval modes on the labeled evaluation set
+# (data/retrieval_eval.json). By default the real embedding model is
+# used; --stub swaps in the offline stub embedder. Run from the
+# repository root:
+#
+#   python -m benchmarks.hybrid_benchmark
+#   python -m benchmarks.hybrid_benchmark --stub --json
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.main import NewParentAIAssistantApp, RETRIEVAL_MODES
+from app.services.kb_loader import load_knowledge_base
+from benchmarks.stub_models import stub_registry
+
+# Labeled retrieval questions drawn from the knowledge base
+DEFAULT_EVAL_PATH = Path(__file__).parent.parent / "data/retrieval_eval.json"
+
+# The k values recall is reported at
+RECALL_KS = (1, 3, 5)
+
+######################################################################
+# Module: load_eval_set
+# Description: Loads the labeled retrieval evaluation set.
+# Input:
+#   - path: the path of the evaluation set
+# Returns: a list of (question, relevant passage) tuples
+######################################################################
+def load_eval_set(path=DEFAULT_EVAL_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    return [(item["question"], f"{item['label']}: {item['text']}") for item in items]
+
+######################################################################
+# Module: run_mode
+# Description: Measures one retrieval mode.
+# Input:
+#   - mode: the retrieval mode
+#   - eval_set: the list of (question, relevant passage) tuples
+#   - registry: the model registry
+#   - repeat: the number of timed passes over the questions
+#   - infer_filters: whether the category/age filters are inferred
+# Returns: the result dict
+######################################################################
+def run_mode(mode, eval_set, registry, repeat, infer_filters):
+    start = time.perf_counter()
+    app = NewParentAIAssistantApp(load_knowledge_base(), registry=registry, retrieval_mode=mode,
+                                  infer_filters=infer_filters)
+    build_s = time.perf_counter() - start
+
+    # The models and the dense index are loaded outside the timings (the
+    # lexical mode only needs them as a fallback)
+    app.warm_up()
+
+    top_k = max(RECALL_KS)
+    latencies = []
+    results = []
+    for _ in range(repeat):
+        results = []
+        for question, _ in eval_set:
+            start = time.perf_counter()
+            results.append(app.find_best_entries(question, top_k=top_k))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    result = {
+        "mode": mode,
+        "build_s": build_s,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+    for k in RECALL_KS:
+        hits = [relevant in found[:k] for (_, relevant), found in zip(eval_set, results)]
+        result[f"recall@{k}"] = float(np.mean(hits))
+    return result
+
+######################################################################
+# Module: main
+# Description: The hybrid retrieval benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Latency vs recall@k of the dense, hybrid and lexical retrieval")
+    parser.add_argument("--eval-set", default=str(DEFAULT_EVAL_PATH), help="labeled retrieval questions")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the questions")
+    parser.add_argument("--no-filters", action="store_true", help="do not infer category/age filters")
+    parser.add_argument("--stub", action="store_true", help="use the offline stub embedder")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    eval_set = load_eval_set(args.eval_set)
+    registry = stub_registry() if args.stub else None
+    results = [run_mode(mode, eval_set, registry, args.repeat, not args.no_filters) for mode in RETRIEVAL_MODES]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    recall_headers = "".join(f"{'recall@' + str(k):>10}" for k in RECALL_KS)
+    print(f"{'mode':>8}{'build (s)':>11}{'p50 (ms)':>10}{'p99 (ms)':>10}{recall_headers}")
+    for r in results:
+        recalls = "".join(f"{r['recall@' + str(k)]:>10.2f}" for k in RECALL_KS)
+        print(f"{r['mode']:>8}{r['build_s']:>11.3f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{recalls}")
+
+##########################################
+### Entry point of hybrid_benchmark.py ###
+##########################################
+if __name__ == "__main__":
+    main()
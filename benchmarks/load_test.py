@@ -0,0 +1,154 @@
+# File: load_test.py
+# Author: William Jahner
+#
+# Local load test of the HTTP service (app/server.py). The server runs
+# in-process with stub models that simulate the cost of the QA model, so
+# the test runs offline. For each concurrency level, clients send
+# questions back to back over keep-alive connections and the p50/p99
+# latency and throughput are reported. Run from the repository root:
+#
+#   python -m benchmarks.load_test
+#   python -m benchmarks.load_test --concurrency 1 8 64 --no-batching
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from app.main import NewParentAIAssistantApp
+from app.server import AssistantServer
+from app.services.kb_loader import load_knowledge_base
+from benchmarks.stub_models import stub_registry
+
+# NLP questions (no cheaper route can answer them)
+QUESTIONS = [
+    "When can my baby start eating rice cereal?",
+    "Why does my baby wake up crying at night?",
+    "Is it normal for babies to spit up after feeding?",
+    "When do babies start to smile at people?",
+    "How can I tell if my baby is getting enough milk?",
+    "When should my baby start rolling over?",
+]
+
+######################################################################
+# Module: client
+# Description: Sends requests back to back over one connection until
+#              the deadline and records the latency of each.
+# Input:
+#   - port: the server port
+#   - deadline: the event loop time to stop at
+#   - offset: the index of the first question to send
+# Returns: a list of latencies in seconds
+######################################################################
+async def client(port, deadline, offset):
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    latencies = []
+    i = offset
+    try:
+        while loop.time() < deadline:
+            body = json.dumps({"question": QUESTIONS[i % len(QUESTIONS)]}).encode("utf-8")
+            request = (f"POST /answer HTTP/1.1\r\nHost: localhost\r\n"
+                       f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode("latin-1")
+
+            start = time.perf_counter()
+            writer.write(request + body)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+
+            if b" 200 " not in status_line:
+                raise RuntimeError(f"Unexpected response: {status_line!r}")
+            i += 1
+    finally:
+        writer.close()
+    return latencies
+
+######################################################################
+# Module: run_level
+# Description: Runs the load test at one concurrency level.
+# Input:
+#   - app: the NewParentAIAssistantApp
+#   - concurrency: the number of concurrent clients
+#   - duration_s: how long to send requests for
+#   - server_options: keyword arguments for AssistantServer
+# Returns: a dict with the latency percentiles and throughput
+######################################################################
+async def run_level(app, concurrency, duration_s, server_options):
+    server = AssistantServer(app, port=0, **server_options)
+    await server.start()
+    try:
+        deadline = asyncio.get_running_loop().time() + duration_s
+        start = time.perf_counter()
+        results = await asyncio.gather(*(client(server.port, deadline, i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    finally:
+        batches, items = server.batcher.batch_count, server.batcher.item_count
+        await server.close()
+
+    latencies = np.array([latency for result in results for latency in result]) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": int(latencies.size),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput_rps": latencies.size / elapsed,
+        "mean_batch_size": items / batches if batches else 0.0,
+    }
+
+######################################################################
+# Module: main
+# Description: The load test's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the HTTP service with stub models")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per concurrency level")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--no-batching", action="store_true", help="process one question per QA call")
+    parser.add_argument("--qa-call-ms", type=float, default=20, help="simulated fixed cost per QA call")
+    parser.add_argument("--qa-item-ms", type=float, default=2, help="simulated cost per question")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    registry = stub_registry(args.qa_call_ms / 1000, args.qa_item_ms / 1000)
+    app = NewParentAIAssistantApp(load_knowledge_base(), registry=registry)
+    app.warm_up()
+
+    server_options = {
+        "workers": args.workers,
+        "max_batch_size": 1 if args.no_batching else args.max_batch_size,
+        "max_wait_ms": 0 if args.no_batching else args.max_wait_ms,
+    }
+    results = [asyncio.run(run_level(app, c, args.duration, server_options)) for c in args.concurrency]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'concurrency':>11}{'requests':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'req/s':>10}{'batch':>8}")
+    for r in results:
+        print(f"{r['concurrency']:>11}{r['requests']:>10}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+              f"{r['throughput_rps']:>10.1f}{r['mean_batch_size']:>8.1f}")
+
+###################################
+### Entry point of load_test.py ###
+###################################
+if __name__ == "__main__":
+    main()
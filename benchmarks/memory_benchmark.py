@@ -0,0 +1,134 @@
+# File: memory_benchmark.py
+# Author: William Jahner
+#
+# Measures the memory held by the knowledge base in the app before (the
+# label/text tuples, the "label: text" passages, a float32 embedding
+# matrix and the retrieval index's own normalized copy of it) and after
+# (the app's KnowledgeStore with float32 or float16 embeddings and the
+# retrieval index built over the store's matrix), and the time to select
+# the milestones of one age by scanning labels vs a store mask. The
+# knowledge base is repeated to reach the target size. Run from the
+# repository root:
+#
+#   python -m benchmarks.memory_benchmark --scale 200
+#   python -m benchmarks.memory_benchmark --backend quantized
+
+import argparse
+import gc
+import json
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from app.main import NewParentAIAssistantApp
+from app.services.kb_loader import load_knowledge_base, split_label
+from app.services.knowledge_store import KnowledgeStore
+from app.services.retrieval_index import INDEX_BACKENDS, create_index
+from benchmarks.stub_models import stub_registry
+
+######################################################################
+# Module: scaled_knowledge_base
+# Description: Repeats the knowledge base with distinct texts. Every
+#              label is a new string, the way the loader returns them.
+# Input:
+#   - scale: the number of copies
+# Returns: the list of (label, text) tuples
+######################################################################
+def scaled_knowledge_base(scale):
+    knowledge_base = load_knowledge_base()
+    return [("".join(label), f"{text} ({copy})") for copy in range(scale) for label, text in knowledge_base]
+
+######################################################################
+# Module: traced_bytes
+# Description: Returns the memory allocated by a function that is still
+#              held by its result.
+# Input:
+#   - build: a function returning the objects to measure
+# Returns: the size in bytes
+######################################################################
+def traced_bytes(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+######################################################################
+# Module: main
+# Description: The benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Memory held by the knowledge base, tuples vs KnowledgeStore")
+    parser.add_argument("--scale", type=int, default=200, help="copies of the knowledge base")
+    parser.add_argument("--dim", type=int, default=384, help="embedding dimension")
+    parser.add_argument("--backend", choices=sorted(INDEX_BACKENDS), default="exact", help="retrieval index backend")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    source = scaled_knowledge_base(args.scale)
+    n = len(source)
+
+    def embeddings():
+        return np.random.default_rng(0).standard_normal((n, args.dim), dtype=np.float32)
+
+    # Each layout is built from a fresh copy of the knowledge base, so only
+    # what the layout keeps is counted
+    def before():
+        knowledge_base = scaled_knowledge_base(args.scale)
+        passages = [f"{label}: {text}" for label, text in knowledge_base]
+        matrix = embeddings()
+        return knowledge_base, passages, matrix, create_index(args.backend, matrix)
+
+    # The app keeps its router, milestone index and structured lookup
+    # besides the knowledge base, so the store is measured on its own and
+    # its embeddings and index as the app builds them
+    def after_store():
+        return KnowledgeStore.from_entries(scaled_knowledge_base(args.scale))
+
+    def after_embeddings(app):
+        app.embeddings = embeddings()
+        return app.index
+
+    def after(dtype):
+        app = NewParentAIAssistantApp(scaled_knowledge_base(args.scale), registry=stub_registry(),
+                                      index_backend=args.backend, embedding_dtype=dtype)
+        return traced_bytes(after_store) + traced_bytes(lambda: after_embeddings(app))
+
+    store = KnowledgeStore.from_entries(source)
+    age = "6 months"
+
+    def scan():
+        return [text for label, text in source if split_label(label)[:2] == ["milestones", age]]
+
+    results = {
+        "entries": n,
+        "tuples_bytes": traced_bytes(before),
+        "store_bytes": after("float32"),
+        "store_fp16_bytes": after("float16"),
+        "scan_ms": 1000 * min(timeit.repeat(scan, number=1, repeat=5)),
+        "mask_ms": 1000 * min(timeit.repeat(lambda: store.rows(category="milestones", age=age),
+                                            number=1, repeat=5)),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    mb = 1024 * 1024
+    print(f"knowledge base entries:             {results['entries']}")
+    print(f"tuples + passages + index (before): {results['tuples_bytes'] / mb:.1f} MiB")
+    print(f"store + index, float32 (after):     {results['store_bytes'] / mb:.1f} MiB")
+    print(f"store + index, float16 (after):     {results['store_fp16_bytes'] / mb:.1f} MiB")
+    print(f"select one age, scan:               {results['scan_ms']:.2f} ms")
+    print(f"select one age, mask:               {results['mask_ms']:.2f} ms")
+
+##########################################
+### Entry point of memory_benchmark.py ###
+##########################################
+if __name__ == "__main__":
+    main()
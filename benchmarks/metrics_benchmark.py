@@ -0,0 +1,126 @@
+# File: metrics_benchmark.py
+# Author: William Jahner
+#
+# Measures the overhead of the request path instrumentation: the cost
+# of one timed stage (an empty with block, disabled and enabled) and
+# the request latency of the app with metrics disabled, enabled, and
+# enabled with JSON logging. The offline stub models are used so the
+# instrumentation is not hidden behind model time. Run from the
+# repository root:
+#
+#   python -m benchmarks.metrics_benchmark
+#   python -m benchmarks.metrics_benchmark --requests 5000 --json
+
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+
+from app.main import NewParentAIAssistantApp
+from app.services.kb_loader import load_knowledge_base
+from app.services.metrics import Metrics, METRICS_LOGGER
+from benchmarks.load_test import QUESTIONS
+from benchmarks.stub_models import stub_registry
+
+# Metrics configurations compared end to end
+CONFIGS = {
+    "disabled": {"enabled": False},
+    "enabled": {"enabled": True},
+    "json_log": {"enabled": True, "log_json": True},
+}
+
+######################################################################
+# Module: stage_cost_ns
+# Description: Measures the cost of one timed stage around no work.
+# Input:
+#   - metrics: the Metrics, or None for a bare loop
+#   - iterations: the number of stages timed
+# Returns: the mean cost in nanoseconds
+######################################################################
+def stage_cost_ns(metrics, iterations):
+    start = time.perf_counter_ns()
+    if metrics is None:
+        for _ in range(iterations):
+            pass
+    else:
+        for _ in range(iterations):
+            with metrics.stage("noop"):
+                pass
+    return (time.perf_counter_ns() - start) / iterations
+
+######################################################################
+# Module: run_config
+# Description: Measures the request latency with one metrics
+#              configuration.
+# Input:
+#   - name: the configuration name
+#   - options: the Metrics keyword arguments
+#   - requests: the number of timed requests
+# Returns: the result dict
+######################################################################
+def run_config(name, options, requests):
+    metrics = Metrics(**options)
+    app = NewParentAIAssistantApp(load_knowledge_base(), registry=stub_registry(), metrics=metrics)
+    app.warm_up()
+
+    latencies = []
+    for i in range(requests):
+        question = QUESTIONS[i % len(QUESTIONS)]
+        start = time.perf_counter()
+        app.respond(question)
+        latencies.append((time.perf_counter() - start) * 1e6)
+
+    return {
+        "config": name,
+        "p50_us": float(np.percentile(latencies, 50)),
+        "p99_us": float(np.percentile(latencies, 99)),
+        "mean_us": float(np.mean(latencies)),
+    }
+
+######################################################################
+# Module: main
+# Description: The metrics overhead benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Overhead of the request path metrics")
+    parser.add_argument("--requests", type=int, default=2000, help="timed requests per configuration")
+    parser.add_argument("--iterations", type=int, default=1_000_000, help="timed stages in the stage cost loop")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    # JSON records are formatted but dropped, so the logging cost is
+    # measured without the cost of the terminal
+    logger = logging.getLogger(METRICS_LOGGER)
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    stage_costs = {
+        "bare_loop_ns": stage_cost_ns(None, args.iterations),
+        "disabled_ns": stage_cost_ns(Metrics(), args.iterations),
+        "enabled_ns": stage_cost_ns(Metrics(enabled=True), args.iterations),
+    }
+    results = [run_config(name, options, args.requests) for name, options in CONFIGS.items()]
+    baseline = results[0]["mean_us"]
+    for r in results:
+        r["overhead_pct"] = (r["mean_us"] / baseline - 1) * 100
+
+    if args.json:
+        print(json.dumps({"stage_cost": stage_costs, "requests": results}, indent=2))
+        return
+
+    print("Cost of one timed stage: " + ", ".join(f"{k[:-3]} {v:.0f} ns" for k, v in stage_costs.items()))
+    print(f"{'config':>10}{'p50 (us)':>10}{'p99 (us)':>10}{'mean (us)':>11}{'overhead':>10}")
+    for r in results:
+        print(f"{r['config']:>10}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['mean_us']:>11.1f}"
+              f"{r['overhead_pct']:>9.1f}%")
+
+###########################################
+### Entry point of metrics_benchmark.py ###
+###########################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# File: milestone_benchmark.py
+# Author: William Jahner
+#
+# Measures the per-call latency of the milestone list route before
+# (scanning get_milestone_list) and after (MilestoneIndex lookup). Run
+# from the repository root:
+#
+#   python -m benchmarks.milestone_benchmark
+
+import argparse
+import json
+import timeit
+
+from app.services.kb_loader import load_knowledge_base
+from app.services.list_service import get_milestone_list, MilestoneIndex
+
+# A mix of questions with and without milestone data
+QUESTIONS = [
+    "What are the milestones for a 6 month old?",
+    "what milestones should my 2 month old reach",
+    "milestones for 12 months",
+    "What are milestones for a 5 month old?",
+]
+
+######################################################################
+# Module: per_call_us
+# Description: Times a callable over every question and returns the
+#              best mean per-call latency.
+# Input:
+#   - function: a callable taking a question
+#   - number: the number of passes over the questions per repeat
+#   - repeat: the number of repeats
+# Returns: the per-call latency in microseconds
+######################################################################
+def per_call_us(function, number, repeat):
+    def run():
+        for question in QUESTIONS:
+            function(question)
+
+    best = min(timeit.repeat(run, number=number, repeat=repeat))
+    return 1e6 * best / (number * len(QUESTIONS))
+
+######################################################################
+# Module: main
+# Description: The benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Per-call latency of the milestone list route")
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    knowledge_base = load_knowledge_base()
+    index = MilestoneIndex(knowledge_base)
+
+    results = {
+        "entries": len(knowledge_base),
+        "scan_us": per_call_us(lambda q: get_milestone_list(knowledge_base, q), args.number, args.repeat),
+        "index_us": per_call_us(index.get_milestone_list, args.number, args.repeat),
+        "index_build_us": 1e6 * min(timeit.repeat(lambda: MilestoneIndex(knowledge_base), number=10, repeat=3)) / 10,
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"knowledge base entries:   {results['entries']}")
+    print(f"scan (before):            {results['scan_us']:.2f} us/call")
+    print(f"index lookup (after):     {results['index_us']:.2f} us/call")
+    print(f"speedup:                  {results['scan_us'] / results['index_us']:.1f}x")
+    print(f"index build (once):       {results['index_build_us']:.2f} us")
+
+#############################################
+### Entry point of milestone_benchmark.py ###
+#############################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# File: onnx_benchmark.py
+# Author: William Jahner
+#
+# Compares the per-question latency of the PyTorch models with the
+# exported ONNX Runtime models (fp32 and int8) on CPU, and checks that
+# their outputs agree with PyTorch on a fixed question set. The ONNX
+# models must first be exported from the local model cache:
+#
+#   python -m app.services.onnx_backend --quantize
+#   python -m benchmarks.onnx_benchmark
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.main import NewParentAIAssistantApp
+from app.services.ai_service import AIService, build_context
+from app.services.kb_loader import load_knowledge_base
+from app.services.model_registry import ModelRegistry
+from app.services.onnx_backend import DEFAULT_ONNX_DIR, QA_DIR, EMBEDDER_DIR, onnx_model_path
+
+# Fixed question set (answered by the QA model in production)
+QUESTIONS = [
+    "When can my baby start eating rice cereal?",
+    "Why does my baby wake up crying at night?",
+    "Is it normal for babies to spit up after feeding?",
+    "When do babies start to smile at people?",
+    "How can I tell if my baby is getting enough milk?",
+    "When should my baby start rolling over?",
+    "How much should a 2 month old eat?",
+    "How many naps does a 9 month old need?",
+]
+
+# The benchmarked variants: (name, AIService options)
+VARIANTS = [
+    ("torch", {"backend": "torch"}),
+    ("onnx", {"backend": "onnx"}),
+    ("onnx-int8", {"backend": "onnx", "quantized": True}),
+]
+
+######################################################################
+# Module: time_calls
+# Description: Times a function on each input.
+# Input:
+#   - function: the function to time
+#   - inputs: the inputs to call it with
+#   - repeat: the number of passes over the inputs
+# Returns: a tuple (latencies in ms, outputs of the last pass)
+######################################################################
+def time_calls(function, inputs, repeat):
+    latencies = []
+    outputs = []
+    for _ in range(repeat):
+        outputs = []
+        for item in inputs:
+            start = time.perf_counter()
+            outputs.append(function(item))
+            latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), outputs
+
+######################################################################
+# Module: run_variant
+# Description: Measures one backend variant.
+# Input:
+#   - options: the AIService options of the variant
+#   - contexts: the reader context of each question
+#   - repeat: the number of passes over the questions
+# Returns: a tuple (result dict, answers, embeddings)
+######################################################################
+def run_variant(options, contexts, repeat):
+    service = AIService("", registry=ModelRegistry(), **options)
+
+    start = time.perf_counter()
+    service.embedder, service.qa_pipeline
+    load_s = time.perf_counter() - start
+
+    # One untimed call so lazy initialization is not measured
+    service.embedder.encode(QUESTIONS[0], convert_to_numpy=True)
+    service.qa_pipeline(question=QUESTIONS[0], context=contexts[0], **service.reader_options())
+
+    embed_ms, embeddings = time_calls(lambda q: service.embedder.encode(q, convert_to_numpy=True), QUESTIONS, repeat)
+    qa_ms, results = time_calls(lambda pair: service.qa_pipeline(question=pair[0], context=pair[1],
+                                                                 **service.reader_options()),
+                                list(zip(QUESTIONS, contexts)), repeat)
+
+    result = {
+        "load_s": load_s,
+        "embed_p50_ms": float(np.percentile(embed_ms, 50)),
+        "embed_p99_ms": float(np.percentile(embed_ms, 99)),
+        "qa_p50_ms": float(np.percentile(qa_ms, 50)),
+        "qa_p99_ms": float(np.percentile(qa_ms, 99)),
+    }
+    embeddings = np.array(embeddings, dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return result, [r["answer"].strip() for r in results], embeddings
+
+######################################################################
+# Module: main
+# Description: The ONNX benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="PyTorch vs ONNX Runtime CPU inference benchmark")
+    parser.add_argument("--onnx-dir", default=str(DEFAULT_ONNX_DIR), help="directory of the exported models")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the question set")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    # Every variant reads the same contexts, retrieved with the PyTorch embedder
+    app = NewParentAIAssistantApp(load_knowledge_base())
+    contexts = [build_context(app.find_best_entries(q), app.ai.max_context_words) for q in QUESTIONS]
+
+    results = []
+    reference = None
+    for name, options in VARIANTS:
+        if options["backend"] == "onnx":
+            options = dict(options, onnx_dir=args.onnx_dir)
+            quantized = options.get("quantized", False)
+            paths = [onnx_model_path(args.onnx_dir, d, quantized) for d in (QA_DIR, EMBEDDER_DIR)]
+            if not all(path.exists() for path in paths):
+                results.append({"variant": name, "skipped": "not exported (python -m app.services.onnx_backend)"})
+                continue
+
+        result, answers, embeddings = run_variant(options, contexts, args.repeat)
+        if reference is None:
+            reference = (answers, embeddings)
+        result["answer_agreement"] = float(np.mean([a == b for a, b in zip(answers, reference[0])]))
+        result["min_embedding_cosine"] = float((embeddings * reference[1]).sum(axis=1).min())
+        results.append(dict({"variant": name}, **result))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'variant':>10}{'load (s)':>10}{'embed p50':>11}{'embed p99':>11}{'qa p50':>10}{'qa p99':>10}"
+          f"{'agree':>7}{'cosine':>8}")
+    for r in results:
+        if "skipped" in r:
+            print(f"{r['variant']:>10}  skipped: {r['skipped']}")
+            continue
+        print(f"{r['variant']:>10}{r['load_s']:>10.2f}{r['embed_p50_ms']:>11.2f}{r['embed_p99_ms']:>11.2f}"
+              f"{r['qa_p50_ms']:>10.1f}{r['qa_p99_ms']:>10.1f}{r['answer_agreement']:>7.2f}"
+              f"{r['min_embedding_cosine']:>8.4f}")
+
+########################################
+### Entry point of onnx_benchmark.py ###
+########################################
+if __name__ == "__main__":
+    main()
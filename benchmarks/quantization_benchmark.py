@@ -0,0 +1,98 @@
+# File: quantization_benchmark.py
+# Author: William Jahner
+#
+# Compares exact search with the quantized index (an int8 or binary
+# first-pass scan, then exact rescoring of the candidates against the
+# full-precision rows memory-mapped from disk) on synthetic knowledge
+# bases of increasing size. Reports recall@k against exact search, the
+# resident memory of each index (the mapped full-precision file is not
+# counted; only the candidates' rows of it are read) and the search
+# latency. Run from the repository root:
+#
+#   python -m benchmarks.quantization_benchmark
+#   python -m benchmarks.quantization_benchmark --sizes 10000 100000 1000000 --rescore 4 10 --json
+
+import argparse
+import json
+import os
+import time
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from app.services.retrieval_index import QUANTIZATIONS, create_index, normalize_rows
+from benchmarks.retrieval_benchmark import recall_at_k, time_search
+from benchmarks.synthetic import synthetic_embeddings
+
+######################################################################
+# Module: resident_bytes
+# Description: The memory an index keeps in RAM.
+# Input:
+#   - index: an ExactIndex or a QuantizedIndex
+# Returns: the number of bytes (memory-mapped arrays are not counted)
+######################################################################
+def resident_bytes(index):
+    arrays = [getattr(index, name, None) for name in ("vectors", "codes", "scales")]
+    return sum(array.nbytes for array in arrays if array is not None and not isinstance(array, np.memmap))
+
+######################################################################
+# Module: main
+# Description: The benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Recall, memory and latency of the quantized index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 4, 10],
+                        help="candidates rescored per result")
+    parser.add_argument("--quantizations", nargs="+", choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            embeddings, queries = synthetic_embeddings(size, args.queries, args.dim)
+            # Normalized once, so no index keeps a second float32 copy
+            vectors = normalize_rows(embeddings)
+            del embeddings
+
+            exact = create_index("exact", vectors, normalized=True)
+            exact_indices, exact_ms = time_search(exact, queries, args.top_k)
+            exact_bytes = resident_bytes(exact)
+            results.append({"size": size, "backend": "exact", "rescore": None, "build_s": 0.0,
+                            "latency_ms": exact_ms, "recall": 1.0, "resident_mb": exact_bytes / 2 ** 20})
+
+            for quantization in args.quantizations:
+                for rescore in args.rescore:
+                    start = time.perf_counter()
+                    index = create_index("quantized", vectors, quantization=quantization, rescore=rescore,
+                                         vectors_path=os.path.join(tmp, f"{quantization}.npy"), normalized=True)
+                    build_s = time.perf_counter() - start
+                    indices, latency_ms = time_search(index, queries, args.top_k)
+                    results.append({"size": size, "backend": quantization, "rescore": rescore, "build_s": build_s,
+                                    "latency_ms": latency_ms, "recall": recall_at_k(exact_indices, indices),
+                                    "resident_mb": resident_bytes(index) / 2 ** 20})
+                    del index
+            del exact, vectors
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'entries':>8}  {'backend':<8}{'rescore':>8}{'build (s)':>10}{'latency (ms)':>14}"
+          f"{'recall@' + str(args.top_k):>11}{'RAM (MB)':>10}")
+    for r in results:
+        rescore = "-" if r["rescore"] is None else r["rescore"]
+        print(f"{r['size']:>8}  {r['backend']:<8}{rescore:>8}{r['build_s']:>10.2f}{r['latency_ms']:>14.3f}"
+              f"{r['recall']:>11.3f}{r['resident_mb']:>10.1f}")
+
+################################################
+### Entry point of quantization_benchmark.py ###
+################################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# File: retrieval_benchmark.py
+# Author: William Jahner
+#
+# Compares the recall and latency of the retrieval index backends on
+# synthetic knowledge bases of increasing size. Run from the repository
+# root:
+#
+#   python -m benchmarks.retrieval_benchmark
+#   python -m benchmarks.retrieval_benchmark --sizes 1000 10000 --n-probe 4 16
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.services.retrieval_index import create_index
+from benchmarks.synthetic import synthetic_embeddings
+
+######################################################################
+# Module: recall_at_k
+# Description: The fraction of the exact top_k entries that an
+#              approximate search also returned.
+# Input:
+#   - exact: the (queries x top_k) exact result indices
+#   - approx: the (queries x top_k) approximate result indices
+# Returns: the mean recall@k
+######################################################################
+def recall_at_k(exact, approx):
+    hits = [len(set(e).intersection(a)) / len(e) for e, a in zip(exact.tolist(), approx.tolist())]
+    return float(np.mean(hits))
+
+######################################################################
+# Module: time_search
+# Description: Times single-query searches (the serving pattern).
+# Input:
+#   - index: the retrieval index
+#   - queries: the query matrix
+#   - top_k: the number of entries per query
+# Returns: a tuple (indices, mean latency in milliseconds)
+######################################################################
+def time_search(index, queries, top_k):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(index.search(query[None, :], top_k)[1][0])
+    elapsed = time.perf_counter() - start
+    return np.array(results), 1000 * elapsed / len(queries)
+
+######################################################################
+# Module: main
+# Description: The benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark of the retrieval index backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        embeddings, queries = synthetic_embeddings(size, args.queries, args.dim)
+
+        start = time.perf_counter()
+        exact = create_index("exact", embeddings)
+        build_s = time.perf_counter() - start
+        exact_indices, exact_ms = time_search(exact, queries, args.top_k)
+        results.append({"size": size, "backend": "exact", "build_s": build_s,
+                        "latency_ms": exact_ms, "recall": 1.0})
+
+        for n_probe in args.n_probe:
+            start = time.perf_counter()
+            ivf = create_index("ivf", embeddings, n_probe=n_probe)
+            build_s = time.perf_counter() - start
+            ivf_indices, ivf_ms = time_search(ivf, queries, args.top_k)
+            results.append({"size": size, "backend": f"ivf(n_probe={n_probe})", "build_s": build_s,
+                            "latency_ms": ivf_ms, "recall": recall_at_k(exact_indices, ivf_indices)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'entries':>8}  {'backend':<18}{'build (s)':>10}{'latency (ms)':>14}{'recall@' + str(args.top_k):>10}")
+    for r in results:
+        print(f"{r['size']:>8}  {r['backend']:<18}{r['build_s']:>10.2f}{r['latency_ms']:>14.3f}{r['recall']:>10.3f}")
+
+#############################################
+### Entry point of retrieval_benchmark.py ###
+#############################################
+if __name__ == "__main__":
+    main()
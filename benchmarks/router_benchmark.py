@@ -0,0 +1,162 @@
+# File: router_benchmark.py
+# Author: William Jahner
+#
+# Measures the routing throughput over a large synthetic question corpus
+# before (a substring check of the listing keywords, then the structured
+# lookup tried on every other question) and after (the compiled
+# IntentRouter, with the lookup only tried on the questions it can
+# answer). Also reports how the questions are routed, the estimated
+# cost of answering the corpus on those routes, and the questions routed
+# differently (e.g. a milestone mentioned in a feeding question is no
+# longer sent to the milestone list). Run from the repository root:
+#
+#   python -m benchmarks.router_benchmark
+#   python -m benchmarks.router_benchmark --questions 500000 --json
+
+import argparse
+import json
+import random
+import time
+from collections import Counter
+
+from app.services.intent_router import IntentRouter, LIST_KEYWORDS, ROUTE_MILESTONE, ROUTE_LOOKUP, ROUTE_NLP
+from app.services.kb_loader import load_knowledge_base
+from app.services.lookup_service import StructuredLookup
+
+# Question templates of the corpus ({age} is an age, {topic} a free-text
+# topic). The last ones name milestones in passing.
+TEMPLATES = [
+    "What are the milestones for a {age} old?",
+    "milestones for {age}",
+    "How many naps does a {age} old need?",
+    "How much formula should my {age} old drink?",
+    "How often should I breastfeed a {age} old?",
+    "Why does my baby {topic}?",
+    "Is it normal that my baby {topic}?",
+    "When do babies start to {topic}?",
+    "My {age} old just hit a milestone, how much formula should she drink?",
+    "Is it a milestone when my baby starts to {topic}?",
+]
+AGES = ["2 month", "4 month", "6 month", "9 month", "12 month", "6 week", "newborn"]
+TOPICS = ["cry at night", "spit up", "teethe", "roll over", "sneeze a lot", "hiccup", "pull her ears", "drool"]
+
+######################################################################
+# Module: make_corpus
+# Description: Generates a deterministic question corpus.
+# Input:
+#   - count: the number of questions
+#   - seed: the random seed
+# Returns: the list of questions
+######################################################################
+def make_corpus(count, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(TEMPLATES).format(age=rng.choice(AGES), topic=rng.choice(TOPICS)) for _ in range(count)]
+
+######################################################################
+# Module: keyword_route
+# Description: The routing before the intent router: a substring check
+#              of the listing keywords, then the structured lookup.
+# Input:
+#   - lookup: the StructuredLookup
+#   - question: the question
+# Returns: the route
+######################################################################
+def keyword_route(lookup, question):
+    lowered = question.lower()
+    if any(word in lowered for word in LIST_KEYWORDS):
+        return ROUTE_MILESTONE
+    if lookup.lookup(question) is not None:
+        return ROUTE_LOOKUP
+    return ROUTE_NLP
+
+######################################################################
+# Module: router_route
+# Description: The routing with the intent router (the lookup is only
+#              tried when the router expects it to answer).
+# Input:
+#   - router: the IntentRouter
+#   - lookup: the StructuredLookup
+#   - question: the question
+# Returns: the route
+######################################################################
+def router_route(router, lookup, question):
+    route = router.route(question).route
+    if route == ROUTE_LOOKUP and lookup.lookup(question) is None:
+        return ROUTE_NLP
+    return route
+
+######################################################################
+# Module: measure
+# Description: Routes every question of the corpus, keeping the fastest
+#              of several passes.
+# Input:
+#   - function: a callable taking a question and returning its route
+#   - corpus: the list of questions
+#   - repeat: the number of passes
+# Returns: a tuple (questions per second, Counter of the routes)
+######################################################################
+def measure(function, corpus, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        routes = Counter(function(question) for question in corpus)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best, routes
+
+######################################################################
+# Module: main
+# Description: The benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Routing throughput of the intent router")
+    parser.add_argument("--questions", type=int, default=100_000, help="questions in the corpus")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    knowledge_base = load_knowledge_base()
+    lookup = StructuredLookup(knowledge_base)
+    start = time.perf_counter()
+    router = IntentRouter(knowledge_base)
+    build_ms = (time.perf_counter() - start) * 1000
+    corpus = make_corpus(args.questions)
+
+    # Warm the lookup's rendered answers so both passes read them
+    for question in corpus[:1000]:
+        lookup.lookup(question)
+
+    before_qps, before_routes = measure(lambda q: keyword_route(lookup, q), corpus, args.repeat)
+    after_qps, after_routes = measure(lambda q: router_route(router, lookup, q), corpus, args.repeat)
+    changed = Counter((before, after) for before, after in
+                      ((keyword_route(lookup, q), router_route(router, lookup, q)) for q in corpus) if before != after)
+    results = {
+        "questions": len(corpus),
+        "router_build_ms": build_ms,
+        "rerouted": {f"{before}->{after}": count for (before, after), count in sorted(changed.items())},
+        "keywords": {"qps": before_qps, "routes": dict(before_routes),
+                     "cost_ms": sum(router.costs_ms[r] * n for r, n in before_routes.items())},
+        "router": {"qps": after_qps, "routes": dict(after_routes),
+                   "cost_ms": sum(router.costs_ms[r] * n for r, n in after_routes.items())},
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"questions:           {results['questions']}")
+    print(f"router build:        {build_ms:.2f} ms")
+    for name in ("keywords", "router"):
+        result = results[name]
+        routes = ", ".join(f"{route}: {count}" for route, count in sorted(result["routes"].items()))
+        print(f"{name + ':':<21}{result['qps']:>10.0f} q/s  estimated answer cost {result['cost_ms'] / 1000:.1f} s"
+              f"  ({routes})")
+    for change, count in results["rerouted"].items():
+        print(f"rerouted {change + ':':<12}{count:>8}")
+
+##########################################
+### Entry point of router_benchmark.py ###
+##########################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# File: shortcut_benchmark.py
+# Author: William Jahner
+#
+# Replays a question log through the NLP answer path with the reader
+# short-circuit disabled and at several confidence thresholds, and
+# reports the fraction of questions answered directly from the top entry
+# vs by the QA model, with the latency of each path. For the labeled
+# evaluation questions it also reports how often a direct answer was
+# taken from the relevant entry. By default the question log is the
+# evaluation set plus the load test questions and the real models are
+# used; --stub swaps in the offline stub models. Run from the repository
+# root:
+#
+#   python -m benchmarks.shortcut_benchmark
+#   python -m benchmarks.shortcut_benchmark --stub --qa-call-ms 40 --json
+#   python -m benchmarks.shortcut_benchmark --log questions.txt --scores 0.6 0.7
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.main import NewParentAIAssistantApp, ANSWER_DIRECT, ANSWER_READER, DEFAULT_DIRECT_ANSWER_MARGIN
+from app.services.kb_loader import load_knowledge_base
+from benchmarks.hybrid_benchmark import DEFAULT_EVAL_PATH
+from benchmarks.load_test import QUESTIONS
+from benchmarks.stub_models import stub_registry
+
+# Confidence thresholds compared against the reader-only baseline
+DEFAULT_SCORES = (0.6, 0.7, 0.8)
+
+######################################################################
+# Module: load_question_log
+# Description: Loads the questions to replay, with the text of their
+#              relevant entry when it is known.
+# Input:
+#   - path: optional file with one question per line. If None, the
+#           evaluation set and the load test questions are used.
+# Returns: a list of (question, relevant entry text or None) tuples
+######################################################################
+def load_question_log(path=None):
+    if path is not None:
+        with open(path, "r", encoding="utf-8") as f:
+            return [(line.strip(), None) for line in f if line.strip()]
+
+    with open(DEFAULT_EVAL_PATH, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    return [(item["question"], item["text"]) for item in items] + [(question, None) for question in QUESTIONS]
+
+######################################################################
+# Module: summarize
+# Description: Summarizes a list of latencies.
+# Input:
+#   - latencies: the latencies in milliseconds
+# Returns: a dict with the p50, p95 and p99 latency (None when empty)
+######################################################################
+def summarize(latencies):
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {f"p{p}_ms": float(np.percentile(latencies, p)) for p in (50, 95, 99)}
+
+######################################################################
+# Module: run_gate
+# Description: Replays the question log with one gate setting.
+# Input:
+#   - log: the list of (question, relevant entry text or None) tuples
+#   - registry: the model registry
+#   - score: the direct answer threshold (None disables the gate)
+#   - margin: the direct answer margin
+#   - repeat: the number of passes over the log
+# Returns: the result dict
+######################################################################
+def run_gate(log, registry, score, margin, repeat):
+    app = NewParentAIAssistantApp(load_knowledge_base(), registry=registry, direct_answer_score=score,
+                                  direct_answer_margin=margin)
+    app.warm_up()
+
+    latencies = {ANSWER_DIRECT: [], ANSWER_READER: []}
+    direct_labeled, direct_correct = 0, 0
+    for _ in range(repeat):
+        for question, relevant in log:
+            direct_before = app.answer_paths[ANSWER_DIRECT]
+            start = time.perf_counter()
+            answer = app.answer_question(question)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            path = ANSWER_DIRECT if app.answer_paths[ANSWER_DIRECT] > direct_before else ANSWER_READER
+            latencies[path].append(elapsed_ms)
+            if path == ANSWER_DIRECT and relevant is not None:
+                direct_labeled += 1
+                direct_correct += answer in relevant
+
+    total = sum(len(values) for values in latencies.values())
+    result = {
+        "score": score,
+        "margin": margin,
+        "direct_fraction": len(latencies[ANSWER_DIRECT]) / total,
+        "direct_correct": direct_correct / direct_labeled if direct_labeled else None,
+        "overall": summarize(latencies[ANSWER_DIRECT] + latencies[ANSWER_READER]),
+    }
+    for path, values in latencies.items():
+        result[path] = summarize(values)
+    return result
+
+######################################################################
+# Module: format_ms
+# Description: Formats a latency for the results table.
+# Input:
+#   - value: the latency in milliseconds or None
+# Returns: the formatted latency
+######################################################################
+def format_ms(value):
+    return f"{'-':>10}" if value is None else f"{value:>10.2f}"
+
+######################################################################
+# Module: main
+# Description: The reader short-circuit benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Answer paths and latency of the reader short-circuit")
+    parser.add_argument("--log", default=None, help="question log, one question per line")
+    parser.add_argument("--scores", type=float, nargs="+", default=list(DEFAULT_SCORES),
+                        help="direct answer thresholds to compare")
+    parser.add_argument("--margin", type=float, default=DEFAULT_DIRECT_ANSWER_MARGIN,
+                        help="similarity the top entry must beat the runner-up by")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the question log")
+    parser.add_argument("--stub", action="store_true", help="use the offline stub models")
+    parser.add_argument("--qa-call-ms", type=float, default=40.0, help="stub QA latency per call")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    log = load_question_log(args.log)
+    registry = stub_registry(qa_call_latency_s=args.qa_call_ms / 1000) if args.stub else None
+    results = [run_gate(log, registry, score, args.margin, args.repeat) for score in [None] + args.scores]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'score':>6}{'direct':>8}{'correct':>9}{'p50 (ms)':>10}{'p99 (ms)':>10}"
+          f"{'direct p50':>12}{'reader p50':>12}")
+    for r in results:
+        score = "off" if r["score"] is None else f"{r['score']:.2f}"
+        correct = "-" if r["direct_correct"] is None else f"{r['direct_correct']:.2f}"
+        print(f"{score:>6}{r['direct_fraction']:>8.2f}{correct:>9}{format_ms(r['overall']['p50_ms'])}"
+              f"{format_ms(r['overall']['p99_ms'])}  {format_ms(r[ANSWER_DIRECT]['p50_ms'])}"
+              f"  {format_ms(r[ANSWER_READER]['p50_ms'])}")
+
+############################################
+### Entry point of shortcut_benchmark.py ###
+############################################
+if __name__ == "__main__":
+    main()
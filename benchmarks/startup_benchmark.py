@@ -0,0 +1,114 @@
+# File: startup_benchmark.py
+# Author: William Jahner
+#
+# Measures the startup cost of the assistant for each route in a fresh
+# interpreter: the time to import the app, and the time from process
+# start to the first answer. Run from the repository root:
+#
+#   python -m benchmarks.startup_benchmark            # real models
+#   python -m benchmarks.startup_benchmark --stub     # offline stub models
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# The routes that can be benchmarked and a sample question for each
+ROUTES = {
+    "milestone": "What are the milestones for a 6 month old?",
+    "nlp": "How much should a 2 month old eat?",
+}
+
+######################################################################
+# Module: run_child
+# Description: Runs a single measurement inside this (fresh) process
+#              and prints the result as JSON.
+# Input:
+#   - route: the route to measure ("milestone" or "nlp")
+#   - stub: whether to use the offline stub models
+# Returns: N/A
+######################################################################
+def run_child(route, stub):
+    start = time.perf_counter()
+
+    from app.main import NewParentAIAssistantApp
+    from app.services.kb_loader import load_knowledge_base
+    from app.services.list_service import get_milestone_list
+    import_s = time.perf_counter() - start
+
+    registry = None
+    if stub:
+        from benchmarks.stub_models import stub_registry
+        registry = stub_registry()
+
+    knowledge_base = load_knowledge_base()
+    app = NewParentAIAssistantApp(knowledge_base, registry=registry)
+
+    question = ROUTES[route]
+    if route == "milestone":
+        get_milestone_list(knowledge_base, question)
+    else:
+        app.answer_question(question)
+    first_answer_s = time.perf_counter() - start
+
+    print(json.dumps({
+        "route": route,
+        "import_s": import_s,
+        "first_answer_s": first_answer_s,
+        "torch_imported": "torch" in sys.modules,
+    }))
+
+######################################################################
+# Module: measure
+# Description: Measures a route in a fresh interpreter.
+# Input:
+#   - route: the route to measure
+#   - stub: whether to use the offline stub models
+# Returns: the measurement as a dict
+######################################################################
+def measure(route, stub):
+    command = [sys.executable, "-m", "benchmarks.startup_benchmark", "--child", route]
+    if stub:
+        command.append("--stub")
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+######################################################################
+# Module: main
+# Description: The benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Startup time benchmark for each route")
+    parser.add_argument("--stub", action="store_true", help="use offline stub models")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per route (the best is reported)")
+    parser.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=list(ROUTES))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--child", choices=sorted(ROUTES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.stub)
+        return
+
+    results = []
+    for route in args.routes:
+        runs = [measure(route, args.stub) for _ in range(args.repeat)]
+        best = min(runs, key=lambda r: r["first_answer_s"])
+        results.append(best)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'route':<12}{'import (s)':>12}{'first answer (s)':>18}{'torch imported':>16}")
+    for r in results:
+        print(f"{r['route']:<12}{r['import_s']:>12.3f}{r['first_answer_s']:>18.3f}{str(r['torch_imported']):>16}")
+
+###########################################
+### Entry point of startup_benchmark.py ###
+###########################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# File: stub_models.py
+# Author: William Jahner
+
+import re
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services.model_registry import ModelRegistry, QA_MODEL_NAME, QA_TASK, EMBEDDING_TASK
+
+######################################################################
+# Module: tokenize
+# Description: Splits text into lowercase word tokens.
+# Input:
+#   - text: the text to split
+# Returns: a list of word tokens
+######################################################################
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+######################################################################
+# Class: StubEmbedder
+# Description: A deterministic, dependency-free stand-in for the
+#              SentenceTransformer. Texts are embedded by hashing their
+#              words into a fixed number of buckets, so texts that share
+#              words have a high cosine similarity.
+######################################################################
+class StubEmbedder:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for StubEmbedder
+    # Input:
+    #   - self: instance of the class itself
+    #   - dim: the embedding dimension
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    ######################################################################
+    # Module: encode
+    # Description: Embeds one text or a list of texts, mirroring the
+    #              SentenceTransformer.encode return shapes.
+    # Input:
+    #   - self: instance of the class itself
+    #   - sentences: a string or a list of strings
+    #   - **kwargs: accepted and ignored for API compatibility
+    # Returns: a float32 vector (single string) or matrix (list)
+    ######################################################################
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                matrix[row, zlib.crc32(token.encode("utf-8")) % self.dim] += 1.0
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-8)
+        return matrix[0] if single else matrix
+
+######################################################################
+# Class: StubQAPipeline
+# Description: A deterministic stand-in for the Hugging Face question
+#              answering pipeline. The answer is the sentence of the
+#              context that shares the most words with the question.
+######################################################################
+class StubQAPipeline:
+
+    ######################################################################
+    # Module: __init__
+    # Description: Constructor for StubQAPipeline
+    # Input:
+    #   - self: instance of the class itself
+    #   - call_latency_s: simulated fixed cost of each call
+    #   - item_latency_s: simulated cost of each (question, context) pair
+    # Returns: N/A
+    ######################################################################
+    def __init__(self, call_latency_s=0.0, item_latency_s=0.0):
+        self.call_latency_s = call_latency_s
+        self.item_latency_s = item_latency_s
+
+    ######################################################################
+    # Module: __call__
+    # Description: Answers a question from a context, mirroring the
+    #              pipeline's call signature and result dict. Lists of
+    #              questions and contexts are answered pairwise.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the question (or list of questions)
+    #   - context: the context (or list of contexts)
+    #   - **kwargs: accepted and ignored for API compatibility
+    # Returns: a dict with "answer", "score", "start" and "end" (or a
+    #          list of such dicts)
+    ######################################################################
+    def __call__(self, question=None, context=None, **kwargs):
+        questions = question if isinstance(question, list) else [question]
+        if self.call_latency_s or self.item_latency_s:
+            time.sleep(self.call_latency_s + self.item_latency_s * len(questions))
+
+        if isinstance(question, list):
+            results = [self._answer(q, c) for q, c in zip(question, context)]
+            return results[0] if len(results) == 1 else results
+        return self._answer(question, context)
+
+    ######################################################################
+    # Module: _answer
+    # Description: Answers a single question from a single context.
+    # Input:
+    #   - self: instance of the class itself
+    #   - question: the question
+    #   - context: the context to extract the answer from
+    # Returns: a dict with "answer", "score", "start" and "end"
+    ######################################################################
+    def _answer(self, question, context):
+        question_tokens = set(tokenize(question))
+
+        best = {"answer": "", "score": 0.0, "start": 0, "end": 0}
+        for match in re.finditer(r"[^.!?]+", context):
+            sentence = match.group().strip()
+            if not sentence:
+                continue
+            tokens = tokenize(sentence)
+            overlap = len(question_tokens.intersection(tokens)) / max(len(question_tokens), 1)
+            if overlap > best["score"] or not best["answer"]:
+                start = match.start() + match.group().index(sentence)
+                best = {"answer": sentence, "score": overlap, "start": start, "end": start + len(sentence)}
+
+        return best
+
+######################################################################
+# Class: StubOnnxSession
+# Description: A stand-in for an ONNX Runtime session of the QA model,
+#              so the ONNX reader's tokenization can be measured without
+#              an exported model. Every token gets zero logits.
+######################################################################
+class StubOnnxSession:
+
+    ######################################################################
+    # Module: get_inputs
+    # Description: Lists the model inputs, like InferenceSession.
+    # Input:
+    #   - self: instance of the class itself
+    # Returns: a list of objects with a name attribute
+    ######################################################################
+    def get_inputs(self):
+        return [SimpleNamespace(name=name) for name in ("input_ids", "attention_mask", "token_type_ids")]
+
+    ######################################################################
+    # Module: run
+    # Description: Returns zero start and end logits, like
+    #              InferenceSession.run on the QA model.
+    # Input:
+    #   - self: instance of the class itself
+    #   - output_names: the requested outputs (ignored)
+    #   - inputs: the dict of model inputs
+    # Returns: a list [start logits, end logits]
+    ######################################################################
+    def run(self, output_names, inputs):
+        logits = np.zeros(inputs["input_ids"].shape, dtype=np.float32)
+        return [logits, logits]
+
+######################################################################
+# Module: stub_registry
+# Description: Returns a model registry that loads the stub models, so
+#              benchmarks can run offline.
+# Input:
+#   - qa_call_latency_s: simulated fixed cost of each QA call
+#   - qa_item_latency_s: simulated cost of each QA (question, context)
+#   - fast_qa_call_latency_s: optional simulated fixed cost of each call
+#                             of the QA models other than QA_MODEL_NAME
+#                             (the small readers of a cascade)
+# Returns: a ModelRegistry
+######################################################################
+def stub_registry(qa_call_latency_s=0.0, qa_item_latency_s=0.0, fast_qa_call_latency_s=None):
+    def load_qa(model_name):
+        if model_name != QA_MODEL_NAME and fast_qa_call_latency_s is not None:
+            return StubQAPipeline(fast_qa_call_latency_s)
+        return StubQAPipeline(qa_call_latency_s, qa_item_latency_s)
+
+    return ModelRegistry({
+        QA_TASK: load_qa,
+        EMBEDDING_TASK: lambda model_name: StubEmbedder(),
+    })
@@ -0,0 +1,336 @@
+# File: suite.py
+# Author: William Jahner
+#
+# The reproducible benchmark suite of the assistant. Every case runs on
+# synthetic knowledge bases of several sizes (benchmarks/synthetic.py)
+# with the deterministic stub models by default, or the real models
+# with --real. Results are written as sorted JSON, one "case/size" key
+# per measurement, so two runs can be diffed; --compare reports the
+# changes against an earlier run and fails on regressions. Run from the
+# repository root:
+#
+#   python -m benchmarks.suite --output before.json
+#   python -m benchmarks.suite --output after.json --compare before.json
+#   python -m benchmarks.suite --real --sizes 1000 --cases retrieval answer
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from app.main import NewParentAIAssistantApp
+from app.services.kb_loader import load_knowledge_base
+from app.services.list_service import get_milestone_list, MilestoneIndex
+from benchmarks.stub_models import stub_registry
+from benchmarks.synthetic import synthetic_knowledge_base, write_knowledge_base, SYNTHETIC_MONTHS, \
+    SYNTHETIC_VERBS, SYNTHETIC_OBJECTS
+
+# Knowledge base sizes (in entries) the cases run at
+DEFAULT_SIZES = (1_000, 10_000, 50_000)
+
+# Questions asked per case
+DEFAULT_QUESTIONS = 64
+
+# Default regression threshold of --compare, in percent
+DEFAULT_THRESHOLD_PCT = 10.0
+
+# Suffixes of the metrics where a higher value is better (the others are
+# latencies, where a lower value is better)
+HIGHER_IS_BETTER = ("_qps",)
+
+######################################################################
+# Module: make_questions
+# Description: Generates deterministic NLP questions about a synthetic
+#              knowledge base.
+# Input:
+#   - count: the number of questions
+# Returns: the list of questions
+######################################################################
+def make_questions(count):
+    months = list(SYNTHETIC_MONTHS)
+    return [f"When should my {months[i % len(months)]} month old "
+            f"{SYNTHETIC_VERBS[i % len(SYNTHETIC_VERBS)]} {SYNTHETIC_OBJECTS[(i * 7) % len(SYNTHETIC_OBJECTS)]}?"
+            for i in range(count)]
+
+######################################################################
+# Module: time_calls
+# Description: Times a callable on each argument.
+# Input:
+#   - function: the callable
+#   - arguments: the argument of each call
+# Returns: the list of call latencies in milliseconds
+######################################################################
+def time_calls(function, arguments):
+    latencies = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+######################################################################
+# Module: best_of
+# Description: Runs a measurement several times and keeps the fastest.
+# Input:
+#   - function: a callable returning a duration
+#   - repeat: the number of runs
+# Returns: the smallest duration
+######################################################################
+def best_of(function, repeat):
+    return min(function() for _ in range(repeat))
+
+######################################################################
+# Module: elapsed_ms
+# Description: Times a single call.
+# Input:
+#   - function: the callable (no arguments)
+# Returns: the duration in milliseconds
+######################################################################
+def elapsed_ms(function):
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) * 1000
+
+######################################################################
+# Module: latency_percentiles
+# Description: Times a callable on each argument over several passes.
+#              Each percentile is the best over the passes, which keeps
+#              it stable against noise from the rest of the machine.
+# Input:
+#   - function: the callable
+#   - arguments: the argument of each call
+#   - repeat: the number of passes
+# Returns: a dict with the p50 and p99 latency in milliseconds
+######################################################################
+def latency_percentiles(function, arguments, repeat):
+    passes = [time_calls(function, arguments) for _ in range(repeat)]
+    return {
+        "p50_ms": min(float(np.percentile(latencies, 50)) for latencies in passes),
+        "p99_ms": min(float(np.percentile(latencies, 99)) for latencies in passes),
+    }
+
+######################################################################
+# Module: bench_load
+# Description: Loading (streaming and flattening) the knowledge base.
+# Input:
+#   - context: the case context dict
+# Returns: the metrics dict
+######################################################################
+def bench_load(context):
+    return {"load_ms": best_of(lambda: elapsed_ms(lambda: load_knowledge_base(context["path"])), context["repeat"])}
+
+######################################################################
+# Module: bench_startup
+# Description: Building the app (no model is loaded) and warming it up
+#              (models, knowledge base embeddings and retrieval index).
+# Input:
+#   - context: the case context dict
+# Returns: the metrics dict
+######################################################################
+def bench_startup(context):
+    init_ms = best_of(lambda: elapsed_ms(lambda: NewParentAIAssistantApp(context["entries"],
+                                                                          registry=context["registry"])),
+                      context["repeat"])
+    app = NewParentAIAssistantApp(context["entries"], registry=context["registry"])
+    return {"init_ms": init_ms, "warm_up_ms": elapsed_ms(app.warm_up)}
+
+######################################################################
+# Module: bench_milestone_list
+# Description: The milestone list route, scanning the knowledge base and
+#              with the MilestoneIndex.
+# Input:
+#   - context: the case context dict
+# Returns: the metrics dict
+######################################################################
+def bench_milestone_list(context):
+    entries = context["entries"]
+    questions = [f"What are the milestones for a {month} month old?" for month in SYNTHETIC_MONTHS]
+    index = MilestoneIndex(entries)
+    repeat = context["repeat"]
+    return {
+        "scan_ms": best_of(lambda: np.mean(time_calls(lambda q: get_milestone_list(entries, q), questions)), repeat),
+        "index_ms": best_of(lambda: np.mean(time_calls(index.get_milestone_list, questions)), repeat),
+    }
+
+######################################################################
+# Module: bench_retrieval
+# Description: Retrieval latency of single questions and throughput of
+#              batched questions.
+# Input:
+#   - context: the case context dict
+# Returns: the metrics dict
+######################################################################
+def bench_retrieval(context):
+    app, questions = context["app"], context["questions"]
+    metrics = latency_percentiles(app.find_best_entries, questions, context["repeat"])
+    batch_ms = best_of(lambda: elapsed_ms(lambda: app.find_best_entries_batch(questions)), context["repeat"])
+    metrics["batch_qps"] = len(questions) / (batch_ms / 1000)
+    return metrics
+
+######################################################################
+# Module: bench_answer
+# Description: End-to-end NLP answers (retrieval and reader), one at a
+#              time and batched.
+# Input:
+#   - context: the case context dict
+# Returns: the metrics dict
+######################################################################
+def bench_answer(context):
+    app, questions = context["app"], context["questions"]
+    metrics = latency_percentiles(app.answer_question, questions, context["repeat"])
+    batch_ms = best_of(lambda: elapsed_ms(lambda: app.answer_questions(questions)), context["repeat"])
+    metrics["batch_qps"] = len(questions) / (batch_ms / 1000)
+    return metrics
+
+# The benchmark cases, in run order
+CASES = {
+    "load": bench_load,
+    "startup": bench_startup,
+    "milestone_list": bench_milestone_list,
+    "retrieval": bench_retrieval,
+    "answer": bench_answer,
+}
+
+######################################################################
+# Module: environment
+# Description: Describes the run, so results from different machines or
+#              settings are not compared by mistake.
+# Input:
+#   - args: the parsed command line arguments
+# Returns: the metadata dict
+######################################################################
+def environment(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "models": "real" if args.real else "stub",
+        "sizes": args.sizes,
+        "questions": args.questions,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+    }
+
+######################################################################
+# Module: run_suite
+# Description: Runs the selected cases at every size.
+# Input:
+#   - sizes: the knowledge base sizes
+#   - cases: the names of the cases to run
+#   - registry: the model registry (None for the real models)
+#   - n_questions: the number of questions per case
+#   - repeat: the number of timed passes
+# Returns: a dict {"case/size": metrics dict}
+######################################################################
+def run_suite(sizes, cases, registry, n_questions, repeat):
+    questions = make_questions(n_questions)
+    results = {}
+    with TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f"kb_{size}.json")
+            write_knowledge_base(synthetic_knowledge_base(size), path)
+            entries = load_knowledge_base(path)
+
+            # One warmed-up app is shared by the cases that only query it
+            app = NewParentAIAssistantApp(entries, registry=registry)
+            app.warm_up()
+            context = {"path": path, "entries": entries, "registry": registry, "app": app,
+                       "questions": questions, "repeat": repeat}
+            for name in cases:
+                print(f"{name} @ {size} entries", file=sys.stderr)
+                metrics = CASES[name](context)
+                results[f"{name}/{size}"] = {metric: round(float(value), 4) for metric, value in metrics.items()}
+    return results
+
+######################################################################
+# Module: compare
+# Description: Compares a run against a baseline run.
+# Input:
+#   - results: the {"case/size": metrics} dict of this run
+#   - baseline: the {"case/size": metrics} dict of the baseline run
+#   - threshold_pct: the change (in percent, in the worse direction)
+#                    counted as a regression
+# Returns: a list of (key, metric, baseline value, value, change in
+#          percent, whether it regressed) tuples
+######################################################################
+def compare(results, baseline, threshold_pct=DEFAULT_THRESHOLD_PCT):
+    rows = []
+    for key in sorted(set(results) & set(baseline)):
+        for metric in sorted(set(results[key]) & set(baseline[key])):
+            old, new = baseline[key][metric], results[key][metric]
+            change = (new / old - 1) * 100 if old else 0.0
+            worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+            rows.append((key, metric, old, new, change, worse > threshold_pct))
+    return rows
+
+######################################################################
+# Module: main
+# Description: The benchmark suite's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible benchmark suite of the assistant")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="synthetic knowledge base sizes (entries)")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="cases to run")
+    parser.add_argument("--questions", type=int, default=DEFAULT_QUESTIONS, help="questions per case")
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes per measurement")
+    parser.add_argument("--real", action="store_true", help="use the real models instead of the stub models")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD_PCT,
+                        help="percent change in the worse direction reported as a regression")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    registry = None if args.real else stub_registry()
+    report = {
+        "environment": environment(args),
+        "results": run_suite(args.sizes, args.cases, registry, args.questions, args.repeat),
+    }
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(f"{'case':>24}{'metric':>12}{'value':>12}")
+        for key, metrics in report["results"].items():
+            for metric, value in metrics.items():
+                print(f"{key:>24}{metric:>12}{value:>12.4f}")
+
+    if args.compare is None:
+        return
+    with open(args.compare, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["environment"]["models"] != report["environment"]["models"]:
+        print("Warning: the baseline was run with different models", file=sys.stderr)
+
+    rows = compare(report["results"], baseline["results"], args.threshold)
+    print(f"\n{'case':>24}{'metric':>12}{'before':>12}{'after':>12}{'change':>9}")
+    for key, metric, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{key:>24}{metric:>12}{old:>12.4f}{new:>12.4f}{change:>8.1f}%{flag}")
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+###############################
+### Entry point of suite.py ###
+###############################
+if __name__ == "__main__":
+    main()
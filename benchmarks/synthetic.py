@@ -0,0 +1,108 @@
+# File: synthetic.py
+# Author: William Jahner
+
+import json
+import random
+
+import numpy as np
+
+# Layout of the synthetic knowledge bases: each category holds one list
+# per age, split by the given sub-categories (None for a plain list)
+SYNTHETIC_LAYOUT = {
+    "milestones": ["social_emotional", "language_communication", "cognitive", "movement_physical"],
+    "feeding": ["breastfed", "formula_fed"],
+    "sleeping": None,
+}
+
+# Ages of the synthetic knowledge bases, in months
+SYNTHETIC_MONTHS = range(1, 25)
+
+# Words the synthetic entries are made of
+SYNTHETIC_VERBS = ["reach for", "smile at", "look at", "roll toward", "babble about", "drink", "sleep near",
+                   "hold", "turn to", "point at", "crawl to", "settle with"]
+SYNTHETIC_OBJECTS = ["a toy", "your face", "a bottle", "the crib", "a book", "soft music", "a blanket",
+                     "a spoon", "bright colors", "a mirror", "new foods", "the nursery light"]
+SYNTHETIC_DETAILS = ["every 2 to 3 hours", "several times a day", "before naps", "after feeding",
+                     "during tummy time", "at bedtime", "for a few seconds", "about 4 ounces at a time"]
+
+######################################################################
+# Module: synthetic_embeddings
+# Description: Generates a clustered embedding matrix that resembles a
+#              knowledge base (entries grouped around topics), along with
+#              queries that are noisy copies of random entries.
+# Input:
+#   - n_entries: the number of knowledge base entries
+#   - n_queries: the number of queries
+#   - dim: the embedding dimension
+#   - n_topics: the number of topic clusters (defaults to ~sqrt(entries))
+#   - noise: the norm of the noise added to each entry's topic
+#   - query_noise: the norm of the noise added to each query's entry
+#   - seed: the random seed
+# Returns: a tuple (embeddings, queries) of float32 matrices
+######################################################################
+def synthetic_embeddings(n_entries, n_queries=100, dim=384, n_topics=None, noise=1.2, query_noise=0.6, seed=0):
+    rng = np.random.default_rng(seed)
+    if n_topics is None:
+        n_topics = max(1, int(np.sqrt(n_entries)))
+
+    # Real sentence embeddings occupy a low-dimensional subspace, which is
+    # what makes neighbouring topics overlap
+    rank = min(dim, 32)
+    basis = np.linalg.qr(rng.standard_normal((dim, rank)))[0].T
+
+    topics = rng.standard_normal((n_topics, rank))
+    topics /= np.linalg.norm(topics, axis=1, keepdims=True)
+
+    members = rng.integers(0, n_topics, n_entries)
+    latent = topics[members] + rng.normal(0, noise / np.sqrt(rank), (n_entries, rank))
+
+    sources = rng.integers(0, n_entries, n_queries)
+    query_latent = latent[sources] + rng.normal(0, query_noise / np.sqrt(rank), (n_queries, rank))
+
+    return (latent @ basis).astype(np.float32), (query_latent @ basis).astype(np.float32)
+
+######################################################################
+# Module: synthetic_knowledge_base
+# Description: Generates a knowledge base with the layout of
+#              data/baby_knowledge.json (category -> age -> sub-category
+#              -> entries) and a given number of entries. Entries are
+#              dealt round-robin over the lists, so every list grows with
+#              the size, and every text is distinct.
+# Input:
+#   - n_entries: the number of entries
+#   - seed: the random seed
+# Returns: the knowledge base as nested dicts
+######################################################################
+def synthetic_knowledge_base(n_entries, seed=0):
+    rng = random.Random(seed)
+    lists = []
+    knowledge_base = {}
+    for category, sub_categories in SYNTHETIC_LAYOUT.items():
+        ages = knowledge_base.setdefault(category, {})
+        for month in SYNTHETIC_MONTHS:
+            age = f"{month} month" if month == 1 else f"{month} months"
+            if sub_categories is None:
+                ages[age] = []
+                lists.append((age, ages[age]))
+            else:
+                ages[age] = {sub_category: [] for sub_category in sub_categories}
+                lists.extend((age, entries) for entries in ages[age].values())
+
+    for i in range(n_entries):
+        age, entries = lists[i % len(lists)]
+        entries.append(f"By {age}, babies should {rng.choice(SYNTHETIC_VERBS)} {rng.choice(SYNTHETIC_OBJECTS)} "
+                       f"{rng.choice(SYNTHETIC_DETAILS)} (note {i}).")
+    return knowledge_base
+
+######################################################################
+# Module: write_knowledge_base
+# Description: Writes a knowledge base as a JSON file readable by
+#              load_knowledge_base.
+# Input:
+#   - knowledge_base: the knowledge base as nested dicts
+#   - path: the path of the JSON file
+# Returns: N/A
+######################################################################
+def write_knowledge_base(knowledge_base, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(knowledge_base, f, indent=1)
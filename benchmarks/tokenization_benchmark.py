@@ -0,0 +1,140 @@
+# File: tokenization_benchmark.py
+# Author: William Jahner
+#
+# Measures the per-request tokenization time of the ONNX reader before
+# (the question and the context are tokenized together on every
+# request) and after (the knowledge base passages are tokenized once and
+# only the question is tokenized per request), and checks that both
+# give identical reader windows. The contexts are the ones the assistant
+# builds for the question log; the reader's model is replaced by a stub
+# session, so only the tokenization is timed. The tokenizer is the one
+# exported with the QA model:
+#
+#   python -m app.services.onnx_backend
+#   python -m benchmarks.tokenization_benchmark
+#   python -m benchmarks.tokenization_benchmark --tokenizer path/to/tokenizer.json --json
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.main import NewParentAIAssistantApp
+from app.services.ai_service import build_context
+from app.services.kb_loader import load_knowledge_base
+from app.services.onnx_backend import DEFAULT_ONNX_DIR, QA_DIR, TOKENIZER_FILE, OnnxQAPipeline
+from benchmarks.shortcut_benchmark import format_ms, load_question_log, summarize
+from benchmarks.stub_models import StubOnnxSession, stub_registry
+
+######################################################################
+# Module: time_windows
+# Description: Times one window function on every (question, context)
+#              pair, keeping the fastest of several passes per pair.
+# Input:
+#   - function: a callable taking (question, context, max_seq_len,
+#               doc_stride) and returning the windows
+#   - pairs: the list of (question, context) pairs
+#   - max_seq_len: the token length of a window
+#   - doc_stride: the token overlap between windows
+#   - repeat: the number of passes
+# Returns: a tuple (latencies in ms, windows of each pair)
+######################################################################
+def time_windows(function, pairs, max_seq_len, doc_stride, repeat):
+    best = [float("inf")] * len(pairs)
+    windows = []
+    for _ in range(repeat):
+        windows = []
+        for i, (question, context) in enumerate(pairs):
+            start = time.perf_counter()
+            windows.append(function(question, context, max_seq_len, doc_stride))
+            best[i] = min(best[i], (time.perf_counter() - start) * 1000)
+    return best, windows
+
+######################################################################
+# Module: same_windows
+# Description: Checks that two window lists give the reader the same
+#              inputs and the same context character offsets.
+# Input:
+#   - expected: the tokenizer's windows
+#   - windows: the windows assembled from the cached passages
+# Returns: True if they are identical
+######################################################################
+def same_windows(expected, windows):
+    if len(expected) != len(windows):
+        return False
+    for e, w in zip(expected, windows):
+        if list(e.ids) != list(w.ids) or list(e.type_ids) != list(w.type_ids):
+            return False
+        context_offsets = [tuple(o) for o, s in zip(e.offsets, e.sequence_ids) if s == 1]
+        if context_offsets != [tuple(o) for o, s in zip(w.offsets, w.sequence_ids) if s == 1]:
+            return False
+    return True
+
+######################################################################
+# Module: main
+# Description: The tokenization benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Per-request tokenization time of the ONNX reader")
+    parser.add_argument("--tokenizer", default=str(DEFAULT_ONNX_DIR / QA_DIR / TOKENIZER_FILE),
+                        help="tokenizer.json of the QA model")
+    parser.add_argument("--log", default=None, help="question log, one question per line")
+    parser.add_argument("--max-seq-len", type=int, default=384, help="token length of a reader window")
+    parser.add_argument("--doc-stride", type=int, default=128, help="token overlap between windows")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    from tokenizers import Tokenizer
+
+    # The contexts the assistant reads for the question log
+    app = NewParentAIAssistantApp(load_knowledge_base(), registry=stub_registry())
+    questions = [question for question, _ in load_question_log(args.log)]
+    pairs = [(question, build_context(entries, app.ai.max_context_words))
+             for question, entries in zip(questions, app.find_best_entries_batch(questions))]
+
+    qa = OnnxQAPipeline(StubOnnxSession(), Tokenizer.from_file(args.tokenizer), {"pad_id": 0})
+    start = time.perf_counter()
+    qa.cache_passages(app.texts)
+    cache_ms = (time.perf_counter() - start) * 1000
+    cache_bytes = 0
+    for first, following in qa.passage_tokens.values():
+        cache_bytes += sum(array.nbytes for array in first)
+        if following is not first:
+            cache_bytes += sum(array.nbytes for array in following)
+
+    before, expected = time_windows(qa.windows, pairs, args.max_seq_len, args.doc_stride, args.repeat)
+    after, windows = time_windows(qa.reader_windows, pairs, args.max_seq_len, args.doc_stride, args.repeat)
+    results = {
+        "requests": len(pairs),
+        "passages": len(qa.passage_tokens),
+        "cache_build_ms": cache_ms,
+        "cache_bytes": cache_bytes,
+        "cached_contexts": sum(qa.context_tokens(context) is not None for _, context in pairs) / len(pairs),
+        "identical_windows": sum(same_windows(e, w) for e, w in zip(expected, windows)) / len(pairs),
+        "before": dict(summarize(before), mean_ms=float(np.mean(before))),
+        "after": dict(summarize(after), mean_ms=float(np.mean(after))),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"requests:            {results['requests']}")
+    print(f"passage cache:       {results['passages']} passages, {cache_ms:.1f} ms, {cache_bytes / 1024:.0f} KiB")
+    print(f"cached contexts:     {results['cached_contexts']:.2%}")
+    print(f"identical windows:   {results['identical_windows']:.2%}")
+    print(f"{'':<21}{'mean (ms)':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}")
+    for name in ("before", "after"):
+        latency = results[name]
+        print(f"{name:<21}{format_ms(latency['mean_ms'])}{format_ms(latency['p50_ms'])}"
+              f"{format_ms(latency['p95_ms'])}{format_ms(latency['p99_ms'])}")
+
+################################################
+### Entry point of tokenization_benchmark.py ###
+################################################
+if __name__ == "__main__":
+    main()
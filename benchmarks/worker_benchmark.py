@@ -0,0 +1,145 @@
+# File: worker_benchmark.py
+# Author: William Jahner
+#
+# Measures NLP answer throughput against the number of workers, with
+# inference threads sharing one app and with worker processes sharing a
+# memory-mapped snapshot of the knowledge base (app.workers). It also
+# reports the proportional set size (PSS) of the process(es) holding the
+# models: the one process for threads, the workers for processes, where
+# the shared snapshot is only counted once across them.
+# By default the real models are used; --stub swaps in the offline stub
+# models, whose pure Python work shows the GIL contention of threads.
+# Run from the repository root on a multi-core machine:
+#
+#   python -m benchmarks.worker_benchmark --stub --workers 1 2 4
+#   python -m benchmarks.worker_benchmark --workers 1 2 4 8 --json
+
+import argparse
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.main import NewParentAIAssistantApp
+from app.services.kb_loader import iter_entries, load_knowledge_base
+from app.workers import WorkerPool, answer_in_worker
+from benchmarks.stub_models import stub_registry
+from benchmarks.suite import make_questions
+from benchmarks.synthetic import synthetic_knowledge_base
+
+######################################################################
+# Module: pss_mb
+# Description: Reads the proportional set size of a process (Linux).
+# Input:
+#   - pid: the process ID
+# Returns: the PSS in MB, or None when it cannot be read
+######################################################################
+def pss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+######################################################################
+# Module: run_batches
+# Description: Answers the questions in batches spread over an
+#              executor's workers.
+# Input:
+#   - executor: the thread or process pool
+#   - process_batch: the function answering a batch
+#   - questions: the list of questions
+#   - batch_size: the number of questions per batch
+# Returns: the throughput in questions per second
+######################################################################
+def run_batches(executor, process_batch, questions, batch_size):
+    batches = [questions[i:i + batch_size] for i in range(0, len(questions), batch_size)]
+    start = time.perf_counter()
+    for _ in executor.map(process_batch, batches):
+        pass
+    return len(questions) / (time.perf_counter() - start)
+
+######################################################################
+# Module: run_threads
+# Description: Measures inference threads sharing one app.
+# Input:
+#   - app: the warmed-up app
+#   - workers: the number of threads
+#   - questions: the list of questions
+#   - batch_size: the number of questions per batch
+# Returns: the result dict
+######################################################################
+def run_threads(app, workers, questions, batch_size):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        run_batches(executor, app.read_answers, questions[:batch_size * workers], batch_size)
+        qps = run_batches(executor, app.read_answers, questions, batch_size)
+    return {"mode": "threads", "workers": workers, "qps": qps, "pss_mb": pss_mb(os.getpid())}
+
+######################################################################
+# Module: run_processes
+# Description: Measures worker processes sharing a snapshot.
+# Input:
+#   - app: the app whose knowledge base is served
+#   - workers: the number of processes
+#   - questions: the list of questions
+#   - batch_size: the number of questions per batch
+#   - stub: whether the workers use the stub models
+# Returns: the result dict
+######################################################################
+def run_processes(app, workers, questions, batch_size, stub):
+    with WorkerPool(app, workers, registry_factory=stub_registry if stub else None) as pool:
+        pids = pool.warm_up()
+        run_batches(pool.executor, answer_in_worker, questions[:batch_size * workers], batch_size)
+        qps = run_batches(pool.executor, answer_in_worker, questions, batch_size)
+        sizes = [pss_mb(pid) for pid in pids]
+    total = None if None in sizes else sum(sizes)
+    return {"mode": "processes", "workers": workers, "qps": qps, "pss_mb": total}
+
+######################################################################
+# Module: main
+# Description: The worker scaling benchmark's main function
+# Input: N/A
+# Returns: N/A
+######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="NLP answer throughput vs worker threads and processes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to measure")
+    parser.add_argument("--questions", type=int, default=512, help="questions answered per measurement")
+    parser.add_argument("--batch-size", type=int, default=8, help="questions per batch")
+    parser.add_argument("--kb-size", type=int, default=None,
+                        help="serve a synthetic knowledge base of this many entries instead of the real one")
+    parser.add_argument("--stub", action="store_true", help="use the offline stub models")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    knowledge_base = load_knowledge_base()
+    if args.kb_size is not None:
+        knowledge_base = list(iter_entries(io.StringIO(json.dumps(synthetic_knowledge_base(args.kb_size)))))
+    app = NewParentAIAssistantApp(knowledge_base, registry=stub_registry() if args.stub else None)
+    app.warm_up()
+    questions = make_questions(args.questions)
+
+    results = []
+    for workers in args.workers:
+        results.append(run_threads(app, workers, questions, args.batch_size))
+        results.append(run_processes(app, workers, questions, args.batch_size, args.stub))
+
+    if args.json:
+        print(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2))
+        return
+
+    print(f"{os.cpu_count()} cpus")
+    print(f"{'mode':>10}{'workers':>9}{'q/s':>10}{'PSS (MB)':>10}")
+    for r in results:
+        pss = "-" if r["pss_mb"] is None else f"{r['pss_mb']:.0f}"
+        print(f"{r['mode']:>10}{r['workers']:>9}{r['qps']:>10.1f}{pss:>10}")
+
+##########################################
+### Entry point of worker_benchmark.py ###
+##########################################
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,11 @@
 # Author: William Jahner
 
 import unittest
-from unittest.mock import patch, MagicMock
-from app.services.ai_service import AIService
+from unittest.mock import MagicMock
+import numpy as np
+from app.services.ai_service import AIService, build_context, extract_sentence, to_passages, TIER_FAST, TIER_FULL
+from app.services.metrics import Metrics
+from app.services.model_registry import ModelRegistry, QA_TASK, EMBEDDING_TASK
 
 ######################################################################
 # Class: TestAIService
@@ -12,38 +15,74 @@ from app.services.ai_service import AIService
 class TestAIService(unittest.TestCase):
 
     ######################################################################
-    # Module: test_init_loads_models
-    # Description: Tests that the models load during initialization.
+    # Module: make_registry
+    # Description: A helper function that returns a model registry whose
+    #              loaders are mocks, along with the mocked loaders.
     ######################################################################
-    @patch("app.services.ai_service.SentenceTransformer")
-    @patch("app.services.ai_service.pipeline")
-    def test_init_loads_models(self, mock_pipeline, mock_embedder):
-        # Mock qa_pipeline and embedder
-        mock_pipeline.return_value = MagicMock(name="mock_qa_pipeline")
-        mock_embedder.return_value = MagicMock(name="mock_embedder")
+    def make_registry(self):
+        mock_pipeline = MagicMock(return_value=MagicMock(name="mock_qa_pipeline"))
+        mock_embedder = MagicMock(return_value=MagicMock(name="mock_embedder"))
+        registry = ModelRegistry({QA_TASK: mock_pipeline, EMBEDDING_TASK: mock_embedder})
+        return registry, mock_pipeline, mock_embedder
+
+    ######################################################################
+    # Module: test_init_does_not_load_models
+    # Description: Tests that no model is loaded during initialization.
+    ######################################################################
+    def test_init_does_not_load_models(self):
+        registry, mock_pipeline, mock_embedder = self.make_registry()
 
         # Create a new AIService
-        service = AIService("test context")
+        service = AIService("test context", registry=registry)
 
-        # Verify the models load correctly
-        mock_pipeline.assert_called_once_with("question-answering", model="deepset/roberta-base-squad2")
-        mock_embedder.assert_called_once_with("all-MiniLM-L6-v2")
+        # Verify that neither model was loaded
+        mock_pipeline.assert_not_called()
+        mock_embedder.assert_not_called()
         self.assertEqual(service.context, "test context")
 
+    ######################################################################
+    # Module: test_models_load_on_first_use
+    # Description: Tests that the models load once, on first use.
+    ######################################################################
+    def test_models_load_on_first_use(self):
+        registry, mock_pipeline, mock_embedder = self.make_registry()
+        service = AIService("test context", registry=registry)
+
+        # Use each model twice
+        qa_pipeline = service.qa_pipeline
+        embedder = service.embedder
+        self.assertIs(service.qa_pipeline, qa_pipeline)
+        self.assertIs(service.embedder, embedder)
+
+        # Verify the models load correctly, exactly once
+        mock_pipeline.assert_called_once_with("deepset/roberta-base-squad2")
+        mock_embedder.assert_called_once_with("all-MiniLM-L6-v2")
+
+    ######################################################################
+    # Module: test_models_are_shared_between_services
+    # Description: Tests that services using the same registry share one
+    #              instance of each model.
+    ######################################################################
+    def test_models_are_shared_between_services(self):
+        registry, mock_pipeline, mock_embedder = self.make_registry()
+
+        first = AIService("first context", registry=registry)
+        second = AIService("second context", registry=registry)
+
+        self.assertIs(first.qa_pipeline, second.qa_pipeline)
+        self.assertIs(first.embedder, second.embedder)
+        mock_pipeline.assert_called_once()
+        mock_embedder.assert_called_once()
+
     ######################################################################
     # Module: test_ask_question_success
     # Description: Tests that a call to ask_question returns an answer
     #              when the pipeline works.
     ######################################################################
-    @patch("app.services.ai_service.SentenceTransformer")
-    @patch("app.services.ai_service.pipeline")
-    def test_ask_question_success(self, mock_pipeline, mock_embedder):
-        # Mock qa_pipeline and embedder
-        mock_pipeline.return_value = MagicMock(name="mock_qa_pipeline")
-        mock_embedder.return_value = MagicMock(name="mock_embedder")
-
-        # Create a new AIService
-        service = AIService("test context")
+    def test_ask_question_success(self):
+        # Create a new AIService with mocked models
+        registry, _, _ = self.make_registry()
+        service = AIService("test context", registry=registry)
 
         # Mock the return value for qa_pipeline
         service.qa_pipeline = MagicMock()
@@ -57,7 +96,9 @@ class TestAIService(unittest.TestCase):
         # Verify the call and returned answer
         service.qa_pipeline.assert_called_once_with(
             question="How often should my 5 month old baby nap?",
-            context="test context"
+            context="test context",
+            max_seq_len=384,
+            doc_stride=128
         )
         self.assertEqual(answer, "The baby should nap 3 times a day.")
 
@@ -66,15 +107,10 @@ class TestAIService(unittest.TestCase):
     # Description: Tests that a call to ask_question returns a friendly
     #              error message when the pipeline fails.
     ######################################################################
-    @patch("app.services.ai_service.SentenceTransformer")
-    @patch("app.services.ai_service.pipeline")
-    def test_ask_question_exception(self, mock_pipeline, mock_embedder):
-        # Mock qa_pipeline and embedder
-        mock_pipeline.return_value = MagicMock(name="mock_qa_pipeline")
-        mock_embedder.return_value = MagicMock(name="mock_embedder")
-
-        # Create a new AIService
-        service = AIService("test context")
+    def test_ask_question_exception(self):
+        # Create a new AIService with mocked models
+        registry, _, _ = self.make_registry()
+        service = AIService("test context", registry=registry)
 
         # Mock the qa_pipeline to result in a runtime error
         service.qa_pipeline = MagicMock()
@@ -87,6 +123,131 @@ class TestAIService(unittest.TestCase):
         self.assertIn("Sorry, the answer could not be determined.", answer)
         self.assertIn("Model failure", answer)
 
+    ######################################################################
+    # Module: test_ask_question_reads_retrieved_passages
+    # Description: Tests that only the top_k passages most similar to the
+    #              question are passed to the reader.
+    ######################################################################
+    def test_ask_question_reads_retrieved_passages(self):
+        registry, _, _ = self.make_registry()
+        service = AIService([("feeding", "Feed often"), ("sleep", "Sleep a lot"), ("teething", "Teeth appear")],
+                            registry=registry, top_k=1, max_seq_len=256, doc_stride=64)
+        service.embedder = MagicMock()
+        service.embedder.encode.side_effect = [np.eye(3), np.array([0.1, 0.9, 0.0])]
+        service.qa_pipeline = MagicMock(return_value={"answer": "Sleep a lot"})
+
+        answer = service.ask_question("How much do babies sleep?")
+
+        service.qa_pipeline.assert_called_once_with(question="How much do babies sleep?", context="sleep: Sleep a lot",
+                                                    max_seq_len=256, doc_stride=64)
+        self.assertEqual(answer, "Sleep a lot")
+
+        # The passage embeddings are computed once
+        service.embedder.encode.side_effect = [np.array([0.0, 0.0, 1.0])]
+        service.ask_question("When do teeth appear?")
+        self.assertEqual(service.embedder.encode.call_count, 3)
+
+    ######################################################################
+    # Module: test_ask_question_uses_retriever
+    # Description: Tests that a supplied retriever replaces the built-in
+    #              passage retrieval.
+    ######################################################################
+    def test_ask_question_uses_retriever(self):
+        registry, _, mock_embedder = self.make_registry()
+        retriever = MagicMock(return_value=["first", "second"])
+        service = AIService(["a", "b", "c", "d"], registry=registry, retriever=retriever)
+        service.qa_pipeline = MagicMock(return_value={"answer": "first"})
+
+        service.ask_question("question")
+
+        retriever.assert_called_once_with("question", 3)
+        self.assertEqual(service.qa_pipeline.call_args.kwargs["context"], "first second")
+        mock_embedder.assert_not_called()
+
+    ######################################################################
+    # Module: test_to_passages
+    # Description: Tests that each supported context type is split into
+    #              passages.
+    ######################################################################
+    def test_to_passages(self):
+        self.assertEqual(to_passages("first line\n\nsecond line"), ["first line", "second line"])
+        self.assertEqual(to_passages([("sleep", "Sleep a lot")]), ["sleep: Sleep a lot"])
+        self.assertEqual(to_passages(["a", "b"]), ["a", "b"])
+
+    ######################################################################
+    # Module: test_build_context
+    # Description: Tests that the context is cut off at the word budget
+    #              and remembers the passages it joins.
+    ######################################################################
+    def test_build_context(self):
+        passages = ["one two three", "four five", "six"]
+
+        self.assertEqual(build_context(passages, None), "one two three four five six")
+        self.assertEqual(build_context(passages, 5), "one two three four five")
+        self.assertEqual(build_context(passages, 4), "one two three")
+        self.assertEqual(build_context(passages, 2), "one two")
+
+        self.assertEqual(build_context(passages, None).passages, tuple(passages))
+        self.assertEqual(build_context(passages, 4).passages, ("one two three",))
+        self.assertIsNone(build_context(passages, 2).passages)
+
+    ######################################################################
+    # Module: test_extract_sentence
+    # Description: Tests that the sentence matching the question best is
+    #              picked from an entry.
+    ######################################################################
+    def test_extract_sentence(self):
+        text = "Newborns sleep 14 to 17 hours a day. Feed them every 2.5 hours. Naps get longer with age."
+
+        self.assertEqual(extract_sentence("How often should I feed them?", text), "Feed them every 2.5 hours.")
+        self.assertEqual(extract_sentence("How long do newborns sleep?", text), "Newborns sleep 14 to 17 hours a day.")
+        self.assertEqual(extract_sentence("anything", "One sentence only."), "One sentence only.")
+
+    ######################################################################
+    # Module: test_reader_cascade
+    # Description: Tests that the small reader answers the questions it is
+    #              confident about and only the others escalate to the
+    #              QA model.
+    ######################################################################
+    def test_reader_cascade(self):
+        fast = MagicMock(return_value=[{"answer": "a", "score": 0.9}, {"answer": "", "score": 0.8},
+                                       {"answer": "c", "score": 0.1}])
+        full = MagicMock(return_value=[{"answer": "B", "score": 0.7}, {"answer": "C", "score": 0.6}])
+        metrics = Metrics(enabled=True)
+        registry = ModelRegistry({QA_TASK: lambda name: fast if name == "small-reader" else full})
+        service = AIService("context", registry=registry, fast_qa_model_name="small-reader", cascade_score=0.5,
+                            metrics=metrics)
+
+        self.assertEqual(service.read(["qa", "qb", "qc"], ["ca", "cb", "cc"], batch_size=8), ["a", "B", "C"])
+
+        self.assertTrue(fast.call_args.kwargs["handle_impossible_answer"])
+        full.assert_called_once_with(question=["qb", "qc"], context=["cb", "cc"], batch_size=8,
+                                     max_seq_len=384, doc_stride=128)
+        self.assertEqual(service.tier_counts, {TIER_FAST: 1, TIER_FULL: 2})
+        self.assertEqual(metrics.counters, {"reader_fast": 1, "reader_full": 2})
+        self.assertEqual(set(metrics.snapshot()["stages"]), {"model_load", "read_fast", "read"})
+
+        # A confident single answer never loads the QA model
+        fast.return_value = {"answer": "only", "score": 0.6}
+        full.reset_mock()
+        self.assertEqual(service.read("q", "c"), "only")
+        full.assert_not_called()
+
+    ######################################################################
+    # Module: test_read_without_cascade
+    # Description: Tests that without a small reader every question is
+    #              read by the QA model.
+    ######################################################################
+    def test_read_without_cascade(self):
+        registry, _, _ = self.make_registry()
+        service = AIService("context", registry=registry)
+        service.qa_pipeline = MagicMock(return_value={"answer": "read"})
+
+        self.assertIsNone(service.fast_qa_pipeline)
+        self.assertEqual(service.read(["q"], ["c"]), ["read"])
+        service.qa_pipeline.assert_called_once_with(question=["q"], context=["c"], max_seq_len=384, doc_stride=128)
+        self.assertEqual(service.tier_counts, {TIER_FAST: 0, TIER_FULL: 0})
+
 #########################################
 ### Entry point of test_ai_service.py ###
 #########################################
@@ -0,0 +1,145 @@
+# File: test_answer_cache.py
+# Author: William Jahner
+
+import unittest
+from app.services.answer_cache import AnswerCache, normalize_question
+
+######################################################################
+# Class: FakeClock
+# Description: A manually advanced time source.
+######################################################################
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+######################################################################
+# Class: TestAnswerCache
+# Description: This class is for testing the AnswerCache.
+######################################################################
+class TestAnswerCache(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_normalize_question
+    # Description: Tests that case, punctuation and spacing are ignored.
+    ######################################################################
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question("  Why does my baby   HICCUP?! "), "why does my baby hiccup")
+        self.assertEqual(normalize_question("Is spit-up normal?"), normalize_question("is spit up normal"))
+
+    ######################################################################
+    # Module: test_exact_hit_and_miss
+    # Description: Tests the exact tier and its counters.
+    ######################################################################
+    def test_exact_hit_and_miss(self):
+        cache = AnswerCache()
+        self.assertIsNone(cache.get("Why does my baby hiccup?"))
+
+        cache.put("Why does my baby hiccup?", "answer")
+
+        self.assertEqual(cache.get("why does my baby hiccup"), "answer")
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"]), (1, 1, 1))
+
+    ######################################################################
+    # Module: test_evicts_least_recently_used
+    # Description: Tests that the least recently used answer is evicted
+    #              when the cache is full.
+    ######################################################################
+    def test_evicts_least_recently_used(self):
+        cache = AnswerCache(max_size=2)
+        cache.put("a", "A")
+        cache.put("b", "B")
+        cache.get("a")
+        cache.put("c", "C")
+
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "C")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    ######################################################################
+    # Module: test_expires_answers
+    # Description: Tests that answers older than the time to live are
+    #              dropped.
+    ######################################################################
+    def test_expires_answers(self):
+        clock = FakeClock()
+        cache = AnswerCache(ttl_s=10, clock=clock)
+        cache.put("a", "A")
+
+        clock.now = 9
+        self.assertEqual(cache.get("a"), "A")
+        clock.now = 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(len(cache), 0)
+
+    ######################################################################
+    # Module: test_semantic_tier
+    # Description: Tests that a similar question reuses a cached answer
+    #              only above the threshold.
+    ######################################################################
+    def test_semantic_tier(self):
+        cache = AnswerCache(semantic_threshold=0.9)
+        cache.put("a", "A", embedding=[1.0, 0.0])
+
+        self.assertEqual(cache.get_similar([0.99, 0.1]), "A")
+        self.assertIsNone(cache.get_similar([0.5, 0.5]))
+        self.assertEqual((cache.semantic_hits, cache.semantic_misses), (1, 1))
+
+    ######################################################################
+    # Module: test_semantic_slots_are_reused
+    # Description: Tests that evicted and expired answers are no longer
+    #              matched by the semantic tier.
+    ######################################################################
+    def test_semantic_slots_are_reused(self):
+        clock = FakeClock()
+        cache = AnswerCache(max_size=1, ttl_s=5, semantic_threshold=0.9, clock=clock)
+        cache.put("a", "A", embedding=[1.0, 0.0])
+        cache.put("b", "B", embedding=[0.0, 1.0])
+
+        self.assertIsNone(cache.get_similar([1.0, 0.0]))
+        self.assertEqual(cache.get_similar([0.0, 1.0]), "B")
+        clock.now = 5
+        self.assertIsNone(cache.get_similar([0.0, 1.0]))
+
+    ######################################################################
+    # Module: test_semantic_disabled
+    # Description: Tests that get_similar always misses without a
+    #              threshold.
+    ######################################################################
+    def test_semantic_disabled(self):
+        cache = AnswerCache()
+        cache.put("a", "A", embedding=[1.0, 0.0])
+
+        self.assertFalse(cache.semantic)
+        self.assertIsNone(cache.get_similar([1.0, 0.0]))
+
+    ######################################################################
+    # Module: test_clear
+    # Description: Tests that clear drops every answer, including the
+    #              ones computed before it and cached after it.
+    ######################################################################
+    def test_clear(self):
+        cache = AnswerCache(semantic_threshold=0.9)
+        cache.put("a", "A", embedding=[1.0, 0.0])
+        generation = cache.generation
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get_similar([1.0, 0.0]))
+
+        cache.put("b", "stale", generation=generation)
+        cache.put("c", "C", generation=cache.generation)
+        self.assertEqual((cache.get("b"), cache.get("c")), (None, "C"))
+
+###########################################
+### Entry point of test_answer_cache.py ###
+###########################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# File: test_batch.py
+# Author: William Jahner
+
+import io
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from app.batch import answer_records, read_questions, run_batches, write_records
+from app.main import NewParentAIAssistantApp
+from app.services.kb_loader import load_knowledge_base
+from benchmarks.stub_models import stub_registry
+
+######################################################################
+# Class: TestBatch
+# Description: This class is for testing the batch question mode.
+######################################################################
+class TestBatch(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_read_questions_jsonl
+    # Description: Tests that JSON lines questions are read as objects or
+    #              strings, numbered by line and skipped when blank.
+    ######################################################################
+    def test_read_questions_jsonl(self):
+        f = io.StringIO('{"id": "q1", "question": "How much do babies sleep?"}\n'
+                        '\n'
+                        '"When do babies crawl?"\n'
+                        '{"question": "   "}\n'
+                        '{"id": 0, "question": "Is formula ok?"}\n')
+        self.assertEqual(list(read_questions(f)),
+                         [("q1", "How much do babies sleep?"), (3, "When do babies crawl?"), (0, "Is formula ok?")])
+
+        with self.assertRaises(ValueError):
+            list(read_questions(io.StringIO('{"text": "no question"}\n')))
+
+    ######################################################################
+    # Module: test_read_questions_csv
+    # Description: Tests that CSV questions are read by column name.
+    ######################################################################
+    def test_read_questions_csv(self):
+        f = io.StringIO('id,question\na,"Why, oh why, does my baby cry?"\n,When do babies walk?\n')
+        self.assertEqual(list(read_questions(f, "csv")),
+                         [("a", "Why, oh why, does my baby cry?"), (2, "When do babies walk?")])
+
+        with self.assertRaises(ValueError):
+            list(read_questions(io.StringIO("text\nhello\n"), "csv"))
+
+    ######################################################################
+    # Module: test_answer_records
+    # Description: Tests that a batch is routed like the interactive
+    #              assistant and reports the retrieved entries and timings.
+    ######################################################################
+    def test_answer_records(self):
+        app = NewParentAIAssistantApp(load_knowledge_base(), registry=stub_registry())
+        milestone = "What are the milestones for a 6 month old?"
+        question = "When can my baby start eating rice cereal?"
+
+        records = answer_records(app, [(1, milestone), (2, question)])
+
+        self.assertEqual([record["id"] for record in records], [1, 2])
+        self.assertEqual((records[0]["route"], records[0]["answer"]), app.respond(milestone))
+        self.assertNotIn("entries", records[0])
+        self.assertEqual((records[1]["route"], records[1]["answer"]), app.respond(question))
+        self.assertEqual(len(records[1]["entries"]), 3)
+        self.assertEqual(set(records[1]["timings_ms"]), {"route", "nlp"})
+        self.assertNotIn("entries", answer_records(app, [(2, question)], with_entries=False)[0])
+
+        # The reported entries are retrieved once and read from
+        with patch.object(app, "search_entries_batch", wraps=app.search_entries_batch) as mock_search:
+            self.assertEqual(answer_records(app, [(2, question)])[0]["answer"], records[1]["answer"])
+        mock_search.assert_called_once()
+
+    ######################################################################
+    # Module: test_run_batches_bounded
+    # Description: Tests that the records keep the input order and that
+    #              the questions are not read ahead of the batches in
+    #              flight.
+    ######################################################################
+    def test_run_batches_bounded(self):
+        read = []
+
+        def items():
+            for i in range(100):
+                read.append(i)
+                yield (i, f"question {i}")
+
+        read_ahead = []
+
+        def process_batch(batch):
+            read_ahead.append(len(read) - batch[0][0])
+            return [{"id": item_id, "route": "nlp"} for item_id, _ in batch]
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            records = list(run_batches(process_batch, items(), batch_size=10, executor=executor, max_pending=2))
+
+        self.assertEqual([record["id"] for record in records], list(range(100)))
+        self.assertLessEqual(max(read_ahead), 3 * 10)
+
+        out = io.StringIO()
+        self.assertEqual(write_records(records, out), {"nlp": 100})
+        self.assertEqual(json.loads(out.getvalue().splitlines()[-1]), {"id": 99, "route": "nlp"})
+
+####################################
+### Entry point of test_batch.py ###
+####################################
+if __name__ == "__main__":
+    unittest.main()
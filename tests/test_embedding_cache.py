@@ -0,0 +1,141 @@
+# File: test_embedding_cache.py
+# Author: William Jahner
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import numpy as np
+from app.services.embedding_cache import EmbeddingCache, remove_stale_shards
+
+######################################################################
+# Class: FakeEmbedder
+# Description: A deterministic stand-in for the SentenceTransformer
+#              that records which texts it was asked to encode.
+######################################################################
+class FakeEmbedder:
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.encoded.extend(texts)
+        return np.array([[len(t), sum(map(ord, t)) % 97, 1.0] for t in texts], dtype=np.float32)
+
+######################################################################
+# Class: EmbeddingCacheTests
+# Description: This class is for testing embedding_cache.py
+#              functionalities.
+######################################################################
+class EmbeddingCacheTests(unittest.TestCase):
+
+    ######################################################################
+    # Module: setUp
+    # Description: A special method used to prepare the test environment
+    #              before each test method runs.
+    ######################################################################
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.cache_dir = Path(self.temp_dir.name)
+        self.texts = [
+            "feeding - 6 months: Introduce solids",
+            "sleeping - newborn: Sleeps 14 to 17 hours a day",
+            "milestones - 4 months - cognitive: Watches faces",
+        ]
+
+    ######################################################################
+    # Module: tearDown
+    # Description: A special method used to clean up the test environment
+    #              after each test method runs.
+    ######################################################################
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    ######################################################################
+    # Module: test_cold_start_encodes_everything
+    # Description: Tests that an empty store encodes every text and
+    #              writes the matrix to disk.
+    ######################################################################
+    def test_cold_start_encodes_everything(self):
+        embedder = FakeEmbedder()
+        cache = EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2")
+
+        matrix = cache.encode(embedder, self.texts)
+
+        self.assertEqual(embedder.encoded, self.texts)
+        self.assertEqual(matrix.shape, (3, 3))
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertTrue(cache.matrix_path.exists())
+        self.assertTrue(cache.index_path.exists())
+
+    ######################################################################
+    # Module: test_warm_start_encodes_nothing
+    # Description: Tests that an unchanged knowledge base is loaded from
+    #              disk without calling the embedder.
+    ######################################################################
+    def test_warm_start_encodes_nothing(self):
+        expected = EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2").encode(FakeEmbedder(), self.texts)
+
+        embedder = FakeEmbedder()
+        matrix = EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2").encode(embedder, self.texts)
+
+        self.assertEqual(embedder.encoded, [])
+        self.assertIsInstance(matrix, np.memmap)
+        np.testing.assert_array_equal(matrix, expected)
+
+    ######################################################################
+    # Module: test_only_changed_entries_are_encoded
+    # Description: Tests that added and edited entries are the only ones
+    #              re-encoded, and that reordering needs no encoding.
+    ######################################################################
+    def test_only_changed_entries_are_encoded(self):
+        EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2").encode(FakeEmbedder(), self.texts)
+
+        # Edit one entry, add one entry and reorder the rest
+        changed = [
+            "feeding - 6 months: Introduce iron-rich solids",
+            self.texts[2],
+            self.texts[1],
+            "sleeping - 3 to 4 months: 3 to 4 naps per day",
+        ]
+        embedder = FakeEmbedder()
+        matrix = EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2").encode(embedder, changed)
+
+        self.assertEqual(embedder.encoded, [changed[0], changed[3]])
+        np.testing.assert_array_equal(matrix, FakeEmbedder().encode(changed))
+
+    ######################################################################
+    # Module: test_models_are_stored_separately
+    # Description: Tests that the store is keyed on the model name.
+    ######################################################################
+    def test_models_are_stored_separately(self):
+        EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2").encode(FakeEmbedder(), self.texts)
+
+        embedder = FakeEmbedder()
+        EmbeddingCache(self.cache_dir, "sentence-transformers/other-model").encode(embedder, self.texts)
+
+        self.assertEqual(embedder.encoded, self.texts)
+
+    ######################################################################
+    # Module: test_shards_are_stored_separately
+    # Description: Tests that each shard has its own store, so adding a
+    #              shard only encodes its entries, and that the stores of
+    #              retired shards can be removed.
+    ######################################################################
+    def test_shards_are_stored_separately(self):
+        EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2", shard="feeding").encode(FakeEmbedder(), self.texts[:1])
+        EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2", shard="sleep").encode(FakeEmbedder(), self.texts[1:2])
+
+        embedder = FakeEmbedder()
+        EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2", shard="feeding").encode(embedder, self.texts[:1])
+        EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2", shard="milestones").encode(embedder, self.texts[2:])
+        self.assertEqual(embedder.encoded, self.texts[2:])
+
+        removed = remove_stale_shards(self.cache_dir, "all-MiniLM-L6-v2", ["feeding", "milestones"])
+        self.assertEqual(removed, ["sleep"])
+        self.assertEqual(EmbeddingCache(self.cache_dir, "all-MiniLM-L6-v2", shard="sleep").load(), ([], None))
+
+##############################################
+### Entry point of test_embedding_cache.py ###
+##############################################
+if __name__ == "__main__":
+    unittest.main()
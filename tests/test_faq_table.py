@@ -0,0 +1,119 @@
+# File: test_faq_table.py
+# Author: William Jahner
+
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock
+import numpy as np
+from app.faq_builder import build_faq_table, pending_groups
+from app.main import NewParentAIAssistantApp
+from app.services.faq_table import FAQTable, age_phrases, label_groups, paraphrase_questions
+from app.services.kb_loader import load_knowledge_base
+from benchmarks.stub_models import stub_registry
+
+######################################################################
+# Class: TestFAQTable
+# Description: This class is for testing the FAQ table and its builder.
+######################################################################
+class TestFAQTable(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_paraphrase_questions
+    # Description: Tests the questions generated from a label.
+    ######################################################################
+    def test_paraphrase_questions(self):
+        self.assertEqual(age_phrases("2 months"), {"age": "2 months", "age_old": "2 month old", "baby": "a 2 month old"})
+        self.assertEqual(age_phrases("8 months")["baby"], "an 8 month old")
+        self.assertEqual(age_phrases("newborn (first week)")["baby"], "a newborn")
+
+        questions = paraphrase_questions("feeding - 6 months - formula_fed")
+        self.assertIn("How much does a formula fed baby drink at 6 months?", questions)
+        self.assertEqual(len(questions), len(set(questions)))
+        self.assertEqual(paraphrase_questions("teething"), [])
+
+    ######################################################################
+    # Module: test_lookup_threshold
+    # Description: Tests that only questions close enough to a table
+    #              question take its answer.
+    ######################################################################
+    def test_lookup_threshold(self):
+        table = FAQTable(["q1", "q2"], ["a1", "a2"], np.array([[1.0, 0.0], [0.0, 1.0]]), ["g", "g"], {"g": "label"},
+                         threshold=0.9)
+        self.assertEqual(table.lookup(np.array([[0.99, 0.1], [0.6, 0.8], [0.1, 0.99]])), ["a1", None, "a2"])
+        self.assertEqual(FAQTable().lookup(np.array([[1.0, 0.0]])), [None])
+
+    ######################################################################
+    # Module: test_save_load_retain
+    # Description: Tests that a saved table loads back, and that retain
+    #              keeps the rows of the given groups only, dropping the
+    #              groups whose answers were read from another group.
+    ######################################################################
+    def test_save_load_retain(self):
+        table = FAQTable(["q1", "q2", "q3"], ["a1", "a2", "a3"], np.eye(3), ["g1", "g2", "g2"],
+                         {"g1": "l1", "g2": "l2", "g3": "l3"}, {"embedding": "model"},
+                         row_sources=[["g1", "g3"], ["g2"], ["g2", "g3"]])
+        with TemporaryDirectory() as tmp:
+            self.assertIsNone(FAQTable.load(tmp))
+            table.save(tmp)
+            loaded = FAQTable.load(tmp, threshold=0.5)
+
+        self.assertEqual((loaded.questions, loaded.answers, loaded.row_groups, loaded.row_sources),
+                         (table.questions, table.answers, table.row_groups, table.row_sources))
+        self.assertEqual((loaded.groups, loaded.models, loaded.threshold), (table.groups, table.models, 0.5))
+        np.testing.assert_array_equal(loaded.embeddings, table.embeddings)
+
+        retained = loaded.retain(["g2", "g3"])
+        self.assertEqual((retained.questions, set(retained.groups)), (["q2", "q3"], {"g2", "g3"}))
+        self.assertEqual(retained.lookup(np.eye(3)), [None, "a2", "a3"])
+
+        # g2 read q3's answer from g3, so a change of g3 drops all of g2
+        retained = loaded.retain(["g1", "g2"])
+        self.assertEqual((retained.questions, set(retained.groups)), ([], set()))
+        self.assertEqual(loaded.retain(["g1", "g2", "g3"]).questions, ["q1", "q2", "q3"])
+
+    ######################################################################
+    # Module: test_incremental_build
+    # Description: Tests that the built answers are served without the
+    #              reader, and that an edit rebuilds only its label and
+    #              the labels whose answers were read from it.
+    ######################################################################
+    def test_incremental_build(self):
+        knowledge_base = load_knowledge_base()
+        app = NewParentAIAssistantApp(knowledge_base, registry=stub_registry())
+        table, groups = pending_groups(app)
+        self.assertEqual(groups, label_groups(knowledge_base))
+        table = build_faq_table(app, table, groups, batch_size=16)
+        self.assertGreater(len(table), 0)
+        self.assertEqual(table.groups, groups)
+
+        # A materialized question is answered from the table
+        question, answer = table.questions[0], table.answers[0]
+        app.faq_table = table
+        app.ai.qa_pipeline = MagicMock()
+        self.assertEqual(app.answer_question(question), answer)
+        app.ai.qa_pipeline.assert_not_called()
+
+        # Only the label of the changed entry and the labels whose answers
+        # were read from it are built again
+        label, text = knowledge_base[0]
+        edited = [(label, text + " and smile")] + knowledge_base[1:]
+        edited_app = NewParentAIAssistantApp(edited, registry=stub_registry())
+        kept, pending = pending_groups(edited_app, table)
+        key = next(key for key, group_label in groups.items() if group_label == label)
+        readers = {table.row_groups[row] for row, sources in enumerate(table.row_sources) if key in sources}
+        self.assertGreater(len(readers - {key}), 0)
+        self.assertEqual(set(pending.values()), {label} | {groups[reader] for reader in readers})
+        self.assertEqual(len(kept.groups), len(groups) - len(pending))
+        self.assertTrue(all(key not in sources for sources in kept.row_sources))
+        rebuilt = build_faq_table(edited_app, kept, pending)
+        self.assertEqual(set(rebuilt.groups), set(label_groups(edited)))
+
+        # A table built with other models is rebuilt entirely
+        table.models = {"embedding": "other"}
+        self.assertEqual(len(pending_groups(app, table)[1]), len(groups))
+
+########################################
+### Entry point of test_faq_table.py ###
+########################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+# File: test_intent_router.py
+# Author: William Jahner
+
+import unittest
+from app.services.intent_router import IntentRouter, compile_terms, ROUTE_MILESTONE, ROUTE_LOOKUP, ROUTE_NLP
+
+######################################################################
+# Class: TestIntentRouter
+# Description: This class is for testing the IntentRouter.
+######################################################################
+class TestIntentRouter(unittest.TestCase):
+
+    ######################################################################
+    # Module: setUp
+    # Description: A special method used to prepare the test environment
+    #              before each test method runs.
+    ######################################################################
+    def setUp(self):
+        self.router = IntentRouter([
+            ("milestones - 6 months - cognitive", "Looks for objects"),
+            ("feeding - 6 months - formula_fed", "6 to 8 ounces"),
+            ("sleeping - 5 to 6 months - naps", "Takes 3 naps per day"),
+            ("teething - 6 months", "First teeth appear"),
+        ])
+
+    ######################################################################
+    # Module: test_compile_terms
+    # Description: Tests that terms match as whole words, longest first.
+    ######################################################################
+    def test_compile_terms(self):
+        pattern = compile_terms(["milestone", "developmental milestones", "oz"])
+        self.assertEqual(pattern.findall("developmental milestones and a milestone of 6oz"),
+                         ["developmental milestones", "milestone", "oz"])
+        self.assertEqual(pattern.findall("milestoned cozy"), [])
+
+    ######################################################################
+    # Module: test_routes
+    # Description: Tests the route and cost of each kind of question.
+    ######################################################################
+    def test_routes(self):
+        decision = self.router.route("What are the Milestones for a 6 month old?")
+        self.assertEqual((decision.route, decision.categories), (ROUTE_MILESTONE, {"milestones"}))
+        self.assertLess(decision.cost_ms, self.router.costs_ms[ROUTE_NLP])
+
+        decision = self.router.route("How many naps for a 5 month old?")
+        self.assertEqual((decision.route, decision.categories, decision.age_months),
+                         (ROUTE_LOOKUP, {"sleeping"}, 5.0))
+
+        # Categories without keywords are matched by name
+        self.assertEqual(self.router.route("When does teething start, at 6 months?").route, ROUTE_LOOKUP)
+
+        self.assertEqual(self.router.route("Why do babies cry?"), (ROUTE_NLP, 60.0, frozenset(), None))
+        self.assertEqual(self.router.route("How much formula do babies drink?").route, ROUTE_NLP)
+
+    ######################################################################
+    # Module: test_milestone_mentioned_in_passing
+    # Description: Tests that a milestone named next to another category
+    #              does not trigger the milestone list.
+    ######################################################################
+    def test_milestone_mentioned_in_passing(self):
+        decision = self.router.route("My 6 month old hit a milestone, how much formula should she drink?")
+        self.assertEqual((decision.route, decision.categories), (ROUTE_NLP, {"milestones", "feeding"}))
+
+    ######################################################################
+    # Module: test_custom_keywords_and_costs
+    # Description: Tests that the keywords and the costs can be replaced.
+    ######################################################################
+    def test_custom_keywords_and_costs(self):
+        router = IntentRouter([("feeding - 6 months", "Purées")], category_keywords={"feeding": ["solids"]},
+                              costs_ms={ROUTE_NLP: 5.0})
+        self.assertEqual(router.route("Solids at 6 months?").route, ROUTE_LOOKUP)
+        self.assertEqual(router.route("Feeding at 6 months?").cost_ms, 5.0)
+
+############################################
+### Entry point of test_intent_router.py ###
+############################################
+if __name__ == "__main__":
+    unittest.main()
@@ -2,10 +2,13 @@
 # Author: William Jahner
 
 import unittest
+import io
 import json
+import os
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from app.services.kb_loader import load_knowledge_base
+from app.services.kb_loader import KnowledgeBaseWatcher, diff_knowledge_bases, flatten_shards, iter_entries, \
+    iter_knowledge_base, load_knowledge_base, load_manifest, load_shards, make_label, split_label
 
 ######################################################################
 # Class: KBLoaderTests
@@ -160,6 +163,155 @@ class KBLoaderTests(unittest.TestCase):
         ]
         self.assertEqual(sorted(result), sorted(expected))
 
+    ######################################################################
+    # Module: test_streams_entries
+    # Description: Tests that entries are streamed in file order, even
+    #              when the file is read one character at a time.
+    ######################################################################
+    def test_streams_entries(self):
+        data = {
+            "sleeping": {
+                "newborn": ["Sleeps a lot", "Wakes to feed \"often\""],
+                "4 months": {"naps": ["3 naps"], "night": []},
+                "notes": "ignored",
+            },
+            "feeding": {},
+        }
+        self.write_json(data)
+
+        # A file object returning one character per read
+        f = io.StringIO(json.dumps(data, indent=4))
+        reader = type("OneCharReader", (), {"read": lambda _, size: f.read(1)})()
+
+        expected = [
+            ("sleeping - newborn", "Sleeps a lot"),
+            ("sleeping - newborn", 'Wakes to feed "often"'),
+            ("sleeping - 4 months - naps", "3 naps"),
+        ]
+        self.assertEqual(list(iter_entries(reader)), expected)
+        self.assertEqual(next(iter_knowledge_base(self.test_json_path)), expected[0])
+
+    ######################################################################
+    # Module: test_malformed_json
+    # Description: Tests that a malformed file raises a decode error.
+    ######################################################################
+    def test_malformed_json(self):
+        with open(self.test_json_path, "w") as f:
+            f.write('{"sleeping": {"newborn": ["Sleeps a lot"]')
+
+        with self.assertRaises(json.JSONDecodeError):
+            load_knowledge_base(self.test_json_path)
+
+    ######################################################################
+    # Module: test_diff_knowledge_bases
+    # Description: Tests that edits are reported as changed entries and
+    #              insertions and deletions as added and removed entries.
+    ######################################################################
+    def test_diff_knowledge_bases(self):
+        old = [("a", "one"), ("a", "two"), ("a", "three"), ("b", "four")]
+        new = [("a", "zero"), ("a", "one"), ("a", "TWO"), ("a", "three"), ("c", "five")]
+
+        diff = diff_knowledge_bases(old, new)
+
+        self.assertEqual(sorted(diff.added), [("a", "zero"), ("c", "five")])
+        self.assertEqual(diff.removed, [("b", "four")])
+        self.assertEqual(diff.changed, [(("a", "two"), ("a", "TWO"))])
+        self.assertEqual(diff_knowledge_bases(old, old), ([], [], []))
+
+    ######################################################################
+    # Module: test_watcher_reports_edits
+    # Description: Tests that the watcher only reports content changes
+    #              and ignores a file that cannot be parsed.
+    ######################################################################
+    def test_watcher_reports_edits(self):
+        self.write_json({"feeding": {"6 months": ["Introduce solids"]}})
+        watcher = KnowledgeBaseWatcher(self.test_json_path)
+        self.assertEqual(watcher.entries, [("feeding - 6 months", "Introduce solids")])
+        self.assertIsNone(watcher.check())
+
+        # Touching the file without changing it is not an edit
+        os.utime(self.test_json_path, ns=(0, 0))
+        self.assertIsNone(watcher.check())
+
+        # A half-written file is skipped until it parses
+        with open(self.test_json_path, "w") as f:
+            f.write('{"feeding": {"6 months": [')
+        self.assertIsNone(watcher.check())
+
+        self.write_json({"feeding": {"6 months": ["Introduce solids", "Offer water"]}})
+        diff = watcher.check()
+        self.assertEqual(diff.added, [("feeding - 6 months", "Offer water")])
+        self.assertEqual(len(watcher.entries), 2)
+
+    ######################################################################
+    # Module: write_manifest
+    # Description: A helper function that writes a manifest with a JSON
+    #              shard and a JSON lines shard.
+    ######################################################################
+    def write_manifest(self):
+        self.write_json({"feeding": {"6 months": ["Introduce solids"]}})
+        with open(Path(self.temp_dir.name) / "sleep-es.jsonl", "w") as f:
+            f.write(json.dumps({"label": ["sleeping", "newborn"], "text": "Duerme mucho"}) + "\n\n")
+            f.write(json.dumps({"label": "sleeping - 4 months - naps", "text": "3 siestas"}) + "\n")
+
+        manifest_path = Path(self.temp_dir.name) / "manifest.json"
+        with open(manifest_path, "w") as f:
+            json.dump({"shards": [
+                {"path": "test_knowledge_base.json"},
+                {"path": "sleep-es.jsonl", "name": "sleep", "locale": "es"},
+            ]}, f)
+        return manifest_path
+
+    ######################################################################
+    # Module: test_labels
+    # Description: Tests that labels are built from and split into parts.
+    ######################################################################
+    def test_labels(self):
+        self.assertEqual(make_label("milestones", "6 months", "cognitive"), "milestones - 6 months - cognitive")
+        self.assertEqual(split_label("feeding - 6 months"), ["feeding", "6 months"])
+
+    ######################################################################
+    # Module: test_load_manifest
+    # Description: Tests that shard names, paths, formats and metadata are
+    #              read from the manifest.
+    ######################################################################
+    def test_load_manifest(self):
+        shards = load_manifest(self.write_manifest())
+
+        self.assertEqual([(s.name, s.format, s.metadata) for s in shards],
+                         [("test_knowledge_base", "json", {}), ("sleep", "jsonl", {"locale": "es"})])
+        self.assertEqual(shards[1].path, Path(self.temp_dir.name) / "sleep-es.jsonl")
+
+    ######################################################################
+    # Module: test_load_manifest_errors
+    # Description: Tests that unknown formats and duplicate names fail.
+    ######################################################################
+    def test_load_manifest_errors(self):
+        manifest_path = Path(self.temp_dir.name) / "manifest.json"
+        for shards in ([{"path": "kb.csv"}], [{"path": "a.json", "name": "x"}, {"path": "b.json", "name": "x"}]):
+            with open(manifest_path, "w") as f:
+                json.dump({"shards": shards}, f)
+            with self.assertRaises(ValueError):
+                load_manifest(manifest_path)
+
+    ######################################################################
+    # Module: test_load_shards
+    # Description: Tests that shards load the same in worker processes as
+    #              in this process, in manifest order.
+    ######################################################################
+    def test_load_shards(self):
+        manifest_path = self.write_manifest()
+
+        knowledge_base, shard_sizes = flatten_shards(load_shards(manifest_path, processes=1))
+
+        self.assertEqual(knowledge_base, [
+            ("feeding - 6 months", "Introduce solids"),
+            ("sleeping - newborn", "Duerme mucho"),
+            ("sleeping - 4 months - naps", "3 siestas"),
+        ])
+        self.assertEqual(shard_sizes, [("test_knowledge_base", 1), ("sleep", 2)])
+        self.assertEqual(flatten_shards(load_shards(manifest_path, processes=2)), (knowledge_base, shard_sizes))
+
 ########################################
 ### Entry point of test_kb_loader.py ###
 ########################################
@@ -0,0 +1,118 @@
+# File: test_knowledge_store.py
+# Author: William Jahner
+
+import sys
+import unittest
+import numpy as np
+from app.services.kb_loader import load_knowledge_base
+from app.services.knowledge_store import KnowledgeStore, NO_ID
+
+# A small knowledge base with a short label and non-ASCII text
+KB = [
+    ("milestones - 6 months - social_emotional", "Smiles at people"),
+    ("feeding - 6 months - solids", "Introduce purées"),
+    ("milestones - 4 months - movement_physical", "Holds head steady"),
+    ("milestones - 6 months - social_emotional", "Laughs"),
+    ("sleeping", "Newborns sleep 14 to 17 hours"),
+]
+
+######################################################################
+# Class: TestKnowledgeStore
+# Description: This class is for testing the KnowledgeStore.
+######################################################################
+class TestKnowledgeStore(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_round_trip
+    # Description: Tests that the store returns every entry and passage
+    #              of the knowledge base it was built from.
+    ######################################################################
+    def test_round_trip(self):
+        kb = load_knowledge_base() + KB
+        store = KnowledgeStore.from_entries(kb)
+
+        self.assertEqual(len(store), len(kb))
+        self.assertEqual(list(store), kb)
+        self.assertEqual(list(store.passages), [f"{label}: {text}" for label, text in kb])
+        self.assertEqual(store.passages[-2:], [f"{label}: {text}" for label, text in kb[-2:]])
+
+    ######################################################################
+    # Module: test_interns_labels
+    # Description: Tests that labels and label parts are stored once and
+    #              that missing parts get NO_ID.
+    ######################################################################
+    def test_interns_labels(self):
+        store = KnowledgeStore.from_entries(KB)
+
+        self.assertEqual(len(store.labels), 4)
+        self.assertEqual(store.names["category"], ["milestones", "feeding", "sleeping"])
+        self.assertEqual(store.names["age"], ["6 months", "4 months"])
+        self.assertEqual(store.columns["age"].tolist(), [0, 0, 1, 0, NO_ID])
+        self.assertEqual(store.depths.tolist(), [3, 3, 3, 3, 1])
+
+    ######################################################################
+    # Module: test_mask
+    # Description: Tests filtering rows by one or several label parts.
+    ######################################################################
+    def test_mask(self):
+        store = KnowledgeStore.from_entries(KB)
+
+        self.assertEqual(store.rows(category="milestones").tolist(), [0, 2, 3])
+        self.assertEqual(store.rows(category="milestones", age="6 months").tolist(), [0, 3])
+        self.assertEqual(store.rows(category=["feeding", "sleeping"]).tolist(), [1, 4])
+        self.assertEqual(store.rows(age="9 months").tolist(), [])
+        self.assertEqual(store.mask(age=None).sum(), len(KB))
+        with self.assertRaises(ValueError):
+            store.mask(locale="en")
+
+    ######################################################################
+    # Module: test_mask_rows_without_part
+    # Description: Tests that None selects the rows without a label part.
+    ######################################################################
+    def test_mask_rows_without_part(self):
+        store = KnowledgeStore.from_entries(KB)
+
+        self.assertEqual(store.rows(age=[None]).tolist(), [4])
+        self.assertEqual(store.rows(age=["4 months", None]).tolist(), [2, 4])
+
+    ######################################################################
+    # Module: test_embeddings
+    # Description: Tests that embeddings are kept in the store's dtype and
+    #              must have one row per entry, and that a store is
+    #              converted to a requested dtype.
+    ######################################################################
+    def test_embeddings(self):
+        store = KnowledgeStore.from_entries(KB, embedding_dtype="float16")
+        store.embeddings = np.ones((len(KB), 4))
+
+        self.assertEqual(store.embeddings.dtype, np.float16)
+        with self.assertRaises(ValueError):
+            store.embeddings = np.ones((2, 4))
+
+        # A store is converted to another embedding dtype, not passed through
+        self.assertIs(KnowledgeStore.from_entries(store, "float16"), store)
+        converted = KnowledgeStore.from_entries(store, "float32")
+        self.assertEqual((converted.embedding_dtype, converted.embeddings.dtype), ("float32", np.float32))
+        self.assertEqual(list(converted), list(store))
+        with self.assertRaises(ValueError):
+            KnowledgeStore.from_entries(KB, embedding_dtype="int8")
+
+    ######################################################################
+    # Module: test_smaller_than_tuples
+    # Description: Tests that the store is several times smaller than the
+    #              label/text tuples and passages it replaces.
+    ######################################################################
+    def test_smaller_than_tuples(self):
+        kb = load_knowledge_base()
+        store = KnowledgeStore.from_entries(kb)
+        passages = [f"{label}: {text}" for label, text in kb]
+
+        tuple_bytes = sum(sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[1]) for entry in kb)
+        passage_bytes = sum(sys.getsizeof(passage) for passage in passages)
+        self.assertLess(store.nbytes() * 3, tuple_bytes + passage_bytes)
+
+##############################################
+### Entry point of test_knowledge_store.py ###
+##############################################
+if __name__ == "__main__":
+    unittest.main()
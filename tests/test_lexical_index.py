@@ -0,0 +1,85 @@
+# File: test_lexical_index.py
+# Author: William Jahner
+
+import json
+import unittest
+from pathlib import Path
+from app.services.ai_service import to_passages
+from app.services.kb_loader import load_knowledge_base
+from app.services.lexical_index import BM25Index, tokenize
+
+# The labeled retrieval evaluation set
+EVAL_PATH = Path(__file__).parent.parent / "data/retrieval_eval.json"
+
+######################################################################
+# Class: TestLexicalIndex
+# Description: This class is for testing the BM25 index.
+######################################################################
+class TestLexicalIndex(unittest.TestCase):
+
+    ######################################################################
+    # Module: setUp
+    # Description: A special method used to prepare the test environment
+    #              before each test method runs.
+    ######################################################################
+    def setUp(self):
+        self.passages = [
+            "sleeping: A 6 month old baby takes 3 naps per day.",
+            "feeding: Start rice cereal at about 6 months.",
+            "sleeping: Place babies on their back to sleep to lower the risk of SIDS.",
+            "milestones: Babies enjoy tummy time and roll over by 6 months.",
+        ]
+        self.index = BM25Index(self.passages)
+
+    ######################################################################
+    # Module: test_tokenize
+    # Description: Tests that stopwords are dropped and plurals folded.
+    ######################################################################
+    def test_tokenize(self):
+        self.assertEqual(tokenize("How many naps should my baby take?"), ["many", "nap", "baby", "take"])
+        self.assertEqual(tokenize("Is the SIDS risk less?"), ["sid", "risk", "less"])
+        self.assertEqual(tokenize("babies"), tokenize("baby"))
+
+    ######################################################################
+    # Module: test_exact_terms_rank_first
+    # Description: Tests that the entries sharing the rare terms of a
+    #              question rank first and unmatched entries are padded.
+    ######################################################################
+    def test_exact_terms_rank_first(self):
+        scores, indices = self.index.search(["When can we start rice cereal?", "What is SIDS?", "hello"], top_k=2)
+
+        self.assertEqual(indices[0, 0], 1)
+        self.assertEqual(indices[1].tolist(), [2, -1])
+        self.assertEqual(indices[2].tolist(), [-1, -1])
+        self.assertGreater(scores[0, 0], scores[0, 1])
+
+    ######################################################################
+    # Module: test_search_restricted_to_rows
+    # Description: Tests that only the given rows are returned.
+    ######################################################################
+    def test_search_restricted_to_rows(self):
+        _, indices = self.index.search(["6 months"], top_k=4, rows=[0, 3])
+
+        self.assertEqual(sorted(i for i in indices[0].tolist() if i >= 0), [0, 3])
+
+    ######################################################################
+    # Module: test_eval_set_recall
+    # Description: Tests that BM25 finds the labeled entry of every
+    #              evaluation question within its top 3.
+    ######################################################################
+    def test_eval_set_recall(self):
+        with open(EVAL_PATH, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        passages = to_passages(load_knowledge_base())
+        index = BM25Index(passages)
+
+        _, indices = index.search([item["question"] for item in items], top_k=3)
+
+        for item, row in zip(items, indices.tolist()):
+            self.assertIn(f"{item['label']}: {item['text']}", [passages[i] for i in row], item["question"])
+
+############################################
+### Entry point of test_lexical_index.py ###
+############################################
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,9 @@
 # Author: William Jahner
 
 import unittest
-from app.services.list_service import get_milestone_list
+from app.services.kb_loader import load_knowledge_base
+from app.services.knowledge_store import KnowledgeStore
+from app.services.list_service import get_milestone_list, MilestoneIndex
 
 ######################################################################
 # Class: TestGetMilestoneList
@@ -147,6 +149,73 @@ class TestGetMilestoneList(unittest.TestCase):
         # Verify that there is only one "Movement/Physical" header
         self.assertEqual(result.count("Movement/Physical:"), 1)
 
+    ######################################################################
+    # Module: test_knowledge_store_matches_list
+    # Description: Tests that a KnowledgeStore returns the same responses
+    #              as the list of tuples it was built from.
+    ######################################################################
+    def test_knowledge_store_matches_list(self):
+        kb = load_knowledge_base() + [("milestones - 6 months", "Invalid label format")]
+        store = KnowledgeStore.from_entries(kb)
+
+        for question in ["milestones at 2 months", "6 month milestones", "milestones for 5 months", "milestones"]:
+            self.assertEqual(get_milestone_list(store, question), get_milestone_list(kb, question))
+
+######################################################################
+# Class: TestMilestoneIndex
+# Description: This class is for testing the MilestoneIndex.
+######################################################################
+class TestMilestoneIndex(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_matches_get_milestone_list
+    # Description: Tests that the index returns exactly the responses of
+    #              the scanning get_milestone_list function.
+    ######################################################################
+    def test_matches_get_milestone_list(self):
+        kb = load_knowledge_base()
+        index = MilestoneIndex(kb)
+
+        questions = [
+            "What are the milestones for a 6 month old?",
+            "milestones at 2 months",
+            "What MILESTONES should my 12 Month old reach?",
+            "What are milestones for a 5 month old?",
+            "What milestones should my baby reach?",
+        ]
+        for question in questions:
+            self.assertEqual(index.get_milestone_list(question), get_milestone_list(kb, question))
+
+    ######################################################################
+    # Module: test_groups_by_age_and_category
+    # Description: Tests that milestones are grouped by age and category
+    #              in knowledge base order, skipping other entries.
+    ######################################################################
+    def test_groups_by_age_and_category(self):
+        kb = [
+            ("milestones - 6 months - social_emotional", "Smiles at people"),
+            ("milestones - 6 months", "Invalid label format"),
+            ("feeding - 6 months - solids", "Introduce purees"),
+            ("milestones - 4 months - movement_physical", "Holds head steady"),
+            ("milestones - 6 months - social_emotional", "Laughs"),
+        ]
+        index = MilestoneIndex(kb)
+
+        self.assertEqual(index.ages(), ["6 months", "4 months"])
+        self.assertEqual(index.milestones["6 months"], {"social_emotional": ["Smiles at people", "Laughs"]})
+
+    ######################################################################
+    # Module: test_responses_are_reused
+    # Description: Tests that repeated requests return the same
+    #              pre-rendered string rather than building a new one.
+    ######################################################################
+    def test_responses_are_reused(self):
+        index = MilestoneIndex([("milestones - 6 months - cognitive", "Looks for objects")])
+
+        self.assertIs(index.get_milestone_list("6 months"), index.get_milestone_list("a 6 month old"))
+        self.assertIs(index.get_milestone_list("7 months"), index.get_milestone_list("7 month old"))
+        self.assertIn("No milestone data found for 7 months", index.get_milestone_list("7 months"))
+
 ###########################################
 ### Entry point of test_list_service.py ###
 ###########################################
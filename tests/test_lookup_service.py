@@ -0,0 +1,134 @@
+# File: test_lookup_service.py
+# Author: William Jahner
+
+import unittest
+from app.services.kb_loader import load_knowledge_base
+from app.services.lookup_service import StructuredLookup, RetrievalFilters, parse_age_label, \
+    parse_question_age
+
+######################################################################
+# Class: TestAgeParsing
+# Description: This class is for testing the age parsing helpers of
+#              lookup_service.py.
+######################################################################
+class TestAgeParsing(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_parse_age_label
+    # Description: Tests that knowledge base age labels are converted to
+    #              the ranges of months they cover.
+    ######################################################################
+    def test_parse_age_label(self):
+        self.assertEqual(parse_age_label("3 to 5 months"), (3.0, 6.0))
+        self.assertEqual(parse_age_label("6 months"), (6.0, 7.0))
+        self.assertEqual(parse_age_label("2 month"), (2.0, 3.0))
+        self.assertEqual(parse_age_label("newborn (0 to 6 weeks)"), (0.0, 1.5))
+        self.assertEqual(parse_age_label("newborn (6 to 12 weeks)"), (1.5, 3.0))
+        self.assertEqual(parse_age_label("newborn (first week)"), (0.0, 0.25))
+        self.assertIsNone(parse_age_label("toddler"))
+
+    ######################################################################
+    # Module: test_parse_question_age
+    # Description: Tests that ages in months, weeks and years are found.
+    ######################################################################
+    def test_parse_question_age(self):
+        self.assertEqual(parse_question_age("how much should a 2 month old eat"), 2.0)
+        self.assertEqual(parse_question_age("naps for a 10 week old"), 2.5)
+        self.assertEqual(parse_question_age("my 1 year old"), 12.0)
+        self.assertEqual(parse_question_age("how often do newborns feed"), 0.0)
+        self.assertEqual(parse_question_age("how often does a newborn feed"), 0.0)
+        self.assertIsNone(parse_question_age("how often should my baby eat"))
+
+######################################################################
+# Class: TestStructuredLookup
+# Description: This class is for testing the StructuredLookup engine.
+######################################################################
+class TestStructuredLookup(unittest.TestCase):
+
+    ######################################################################
+    # Module: setUp
+    # Description: A special method used to prepare the test environment
+    #              before each test method runs.
+    ######################################################################
+    def setUp(self):
+        self.lookup = StructuredLookup(load_knowledge_base())
+
+    ######################################################################
+    # Module: test_answers_feeding_question_for_age_range
+    # Description: Tests that a feeding question is answered from the
+    #              bucket covering the age.
+    ######################################################################
+    def test_answers_feeding_question_for_age_range(self):
+        answer = self.lookup.lookup("How much should a 4 month old eat?")
+
+        self.assertIn("Feeding guidance for 3 to 5 months", answer)
+        self.assertIn("Breastfed:", answer)
+        self.assertIn("Formula Fed:", answer)
+        self.assertIn("should get about 4 to 6 ounces per feeding", answer)
+
+    ######################################################################
+    # Module: test_narrows_to_sub_category
+    # Description: Tests that a question naming a sub-category only gets
+    #              the entries of that sub-category.
+    ######################################################################
+    def test_narrows_to_sub_category(self):
+        answer = self.lookup.lookup("How many naps should my 8 month old take?")
+
+        self.assertIn("Sleep guidance for 7 to 9 months", answer)
+        self.assertIn("takes 2 to 3 naps per day", answer)
+        self.assertNotIn("wake windows", answer)
+
+    ######################################################################
+    # Module: test_falls_back_when_parse_fails
+    # Description: Tests that questions without an age, without a
+    #              category, with two categories or with an age outside
+    #              every range are left to the NLP path.
+    ######################################################################
+    def test_falls_back_when_parse_fails(self):
+        self.assertIsNone(self.lookup.lookup("How often should my baby eat?"))
+        self.assertIsNone(self.lookup.lookup("Can my 6 month old have water?"))
+        self.assertIsNone(self.lookup.lookup("Should my 4 month old nap after feeding?"))
+        self.assertIsNone(self.lookup.lookup("How much should a 9 month old eat?"))
+
+    ######################################################################
+    # Module: test_handles_categories_without_keywords
+    # Description: Tests that categories without configured keywords are
+    #              matched by name, including two-part labels.
+    ######################################################################
+    def test_handles_categories_without_keywords(self):
+        lookup = StructuredLookup([("teething - 6 to 12 months", "First teeth usually appear")])
+
+        answer = lookup.lookup("Is teething normal at 7 months?")
+
+        self.assertIn("Teething for 6 to 12 months", answer)
+        self.assertIn("- First teeth usually appear", answer)
+
+    ######################################################################
+    # Module: test_responses_are_reused
+    # Description: Tests that repeated questions return the same rendered
+    #              answer.
+    ######################################################################
+    def test_responses_are_reused(self):
+        first = self.lookup.lookup("how long should a 3 month old sleep")
+        second = self.lookup.lookup("how much sleep does a 4 month old need")
+
+        self.assertIs(first, second)
+
+    ######################################################################
+    # Module: test_infer_filters
+    # Description: Tests that the retrieval filters name every category in
+    #              the question and the age labels covering its age.
+    ######################################################################
+    def test_infer_filters(self):
+        self.assertEqual(self.lookup.infer_filters("how much should a 2 month old eat"),
+                         RetrievalFilters(("feeding",), ("2 month",)))
+        self.assertEqual(self.lookup.infer_filters("milestones and naps for a 9 month old"),
+                         RetrievalFilters(("milestones", "sleeping"), ("7 to 9 months", "9 months")))
+        self.assertEqual(self.lookup.infer_filters("when do babies crawl at 6 months").category, None)
+        self.assertEqual(self.lookup.infer_filters("how do I burp my baby"), RetrievalFilters(None, None))
+
+#############################################
+### Entry point of test_lookup_service.py ###
+#############################################
+if __name__ == "__main__":
+    unittest.main()
@@ -2,9 +2,18 @@
 # Author: William Jahner
 
 import unittest
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
 from unittest.mock import patch, MagicMock
-import torch
-from app.main import NewParentAIAssistantApp, print_intro_message
+import numpy as np
+from app.main import NewParentAIAssistantApp, print_intro_message, ANSWER_DIRECT, ANSWER_READER
+from app.services.answer_cache import AnswerCache
+from app.services.faq_table import FAQTable, label_groups
+from app.services.kb_loader import diff_knowledge_bases
+from app.services.metrics import Metrics
+from app.services.model_registry import ModelRegistry, QA_TASK, EMBEDDING_TASK
+from app.services.retrieval_index import normalize_rows
 
 ######################################################################
 # Class: MainTests
@@ -26,7 +35,9 @@ class MainTests(unittest.TestCase):
         ]
 
         # Create app (note that AI internals will be mocked)
-        self.app = NewParentAIAssistantApp(self.fake_kb)
+        self.mock_loader = MagicMock()
+        self.registry = ModelRegistry({QA_TASK: self.mock_loader, EMBEDDING_TASK: self.mock_loader})
+        self.app = NewParentAIAssistantApp(self.fake_kb, registry=self.registry)
 
     ######################################################################
     # Module: test_print_intro_message
@@ -49,18 +60,17 @@ class MainTests(unittest.TestCase):
     # Description: Tests that the function find_best_entries returns top
     #              entries based on mocked scores.
     ######################################################################
-    @patch("app.main.util")
-    def test_find_best_entries(self, mock_util):        
+    def test_find_best_entries(self):
         # Mock embedder.encode on the embedded AI service
         mock_embedder = MagicMock()
-        mock_embedder.encode.return_value = torch.tensor([1, 1, 1])
+        mock_embedder.encode.return_value = np.array([1.0, 0.0])
 
         # Replace the real embedder with our mock
         self.app.ai.embedder = mock_embedder
 
-        # Mock cosine similarity scores
-        # (higher score → more relevant)
-        mock_util.pytorch_cos_sim.return_value = torch.tensor([[0.7, 0.2, 0.9]])
+        # Set embeddings whose cosine similarity scores with the question
+        # are 0.7, 0.2 and 0.9 (higher score → more relevant)
+        self.app.embeddings = [[0.7, 0.714], [0.2, 0.98], [0.9, 0.436]]
 
         # Run function
         results = self.app.find_best_entries("Do babies sleep differently than adults?", top_k=2)
@@ -92,11 +102,453 @@ class MainTests(unittest.TestCase):
             answer = self.app.answer_question("test question")
 
             # Ensure the QA model is called correctly
-            mock_qa.assert_called_once_with(question="test question", context="context1 context2")
+            mock_qa.assert_called_once_with(question="test question", context="context1 context2",
+                                            max_seq_len=384, doc_stride=128)
 
             # Check the returned answer
             self.assertEqual(answer, "Mocked answer")
 
+    ######################################################################
+    # Module: test_find_best_entries_ivf_backend
+    # Description: Tests that the retrieval index backend is configurable.
+    ######################################################################
+    def test_find_best_entries_ivf_backend(self):
+        app = NewParentAIAssistantApp(self.fake_kb, registry=ModelRegistry({EMBEDDING_TASK: self.mock_loader}),
+                                      index_backend="ivf", index_options={"n_lists": 2, "n_probe": 2})
+        app.ai.embedder = MagicMock()
+        app.ai.embedder.encode.return_value = np.array([1.0, 0.0])
+        app.embeddings = [[0.7, 0.714], [0.2, 0.98], [0.9, 0.436]]
+
+        results = app.find_best_entries("Do babies sleep differently than adults?", top_k=2)
+
+        self.assertEqual(type(app.index).__name__, "IVFIndex")
+        self.assertEqual(results, [app.texts[2], app.texts[0]])
+
+    ######################################################################
+    # Module: test_find_best_entries_batch
+    # Description: Tests that batched retrieval encodes all questions in
+    #              one call and matches the single-question results.
+    ######################################################################
+    def test_find_best_entries_batch(self):
+        mock_embedder = MagicMock()
+        mock_embedder.encode.return_value = np.array([[1.0, 0.0], [0.0, 1.0]])
+        self.app.ai.embedder = mock_embedder
+        self.app.embeddings = [[0.7, 0.714], [0.2, 0.98], [0.9, 0.436]]
+
+        results = self.app.find_best_entries_batch(["first question", "second question"], top_k=2)
+
+        mock_embedder.encode.assert_called_once_with(["first question", "second question"],
+                                                     batch_size=32, convert_to_numpy=True)
+        self.assertEqual(results, [
+            [self.app.texts[2], self.app.texts[0]],
+            [self.app.texts[1], self.app.texts[0]],
+        ])
+
+    ######################################################################
+    # Module: test_answer_questions
+    # Description: Tests that the QA model is called once with batched
+    #              (question, context) pairs.
+    ######################################################################
+    def test_answer_questions(self):
+        with patch.object(self.app, "find_best_entries_batch", return_value=[["c1", "c2"], ["c3", "c4"]]):
+            mock_qa = MagicMock()
+            mock_qa.return_value = [{"answer": "first"}, {"answer": "second"}]
+            self.app.ai.qa_pipeline = mock_qa
+
+            answers = self.app.answer_questions(["q1", "q2"])
+
+            mock_qa.assert_called_once_with(question=["q1", "q2"], context=["c1 c2", "c3 c4"], batch_size=32,
+                                            max_seq_len=384, doc_stride=128)
+            self.assertEqual(answers, ["first", "second"])
+
+    ######################################################################
+    # Module: test_answer_questions_single_and_empty
+    # Description: Tests that a single question (for which the pipeline
+    #              returns a bare dict) and an empty list are handled.
+    ######################################################################
+    def test_answer_questions_single_and_empty(self):
+        with patch.object(self.app, "find_best_entries_batch", return_value=[["c1"]]):
+            self.app.ai.qa_pipeline = MagicMock(return_value={"answer": "only"})
+            self.assertEqual(self.app.answer_questions(["q1"]), ["only"])
+
+        self.assertEqual(self.app.answer_questions([]), [])
+
+    ######################################################################
+    # Module: test_answer_cache_skips_models
+    # Description: Tests that a repeated question is answered from the
+    #              answer cache without retrieval or the QA model.
+    ######################################################################
+    def test_answer_cache_skips_models(self):
+        self.app.answer_cache = AnswerCache()
+        with patch.object(self.app, "find_best_entries_batch", return_value=[["c1"]]) as mock_find:
+            self.app.ai.qa_pipeline = MagicMock(return_value={"answer": "cached"})
+
+            self.assertEqual(self.app.answer_question("Why does my baby hiccup?"), "cached")
+            self.assertEqual(self.app.answer_questions(["why does my baby hiccup"]), ["cached"])
+
+            mock_find.assert_called_once()
+            self.app.ai.qa_pipeline.assert_called_once()
+
+    ######################################################################
+    # Module: test_semantic_answer_cache
+    # Description: Tests that a similar question reuses a cached answer and
+    #              that question embeddings are reused for retrieval.
+    ######################################################################
+    def test_semantic_answer_cache(self):
+        self.app.answer_cache = AnswerCache(semantic_threshold=0.95)
+        self.app.embeddings = np.array([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]])
+        mock_embedder = MagicMock()
+        mock_embedder.encode.side_effect = [np.array([[1.0, 0.0], [0.0, 1.0]]), np.array([[0.99, 0.05]])]
+        self.app.ai.embedder = mock_embedder
+        self.app.ai.qa_pipeline = MagicMock(return_value=[{"answer": "first"}, {"answer": "second"}])
+
+        self.assertEqual(self.app.answer_questions(["q1", "q2"]), ["first", "second"])
+        self.assertEqual(self.app.answer_questions(["q1 reworded"]), ["first"])
+
+        self.assertEqual(mock_embedder.encode.call_count, 2)
+        self.app.ai.qa_pipeline.assert_called_once()
+
+    ######################################################################
+    # Module: test_faq_table_skips_reader
+    # Description: Tests that a question close to a FAQ table question
+    #              takes its answer without the reader, and that the
+    #              other questions reuse their embeddings for retrieval.
+    ######################################################################
+    def test_faq_table_skips_reader(self):
+        self.app.faq_table = FAQTable(["q1"], ["materialized"], np.array([[1.0, 0.0]]), ["group"], {"group": "label"})
+        self.app.embeddings = np.array([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]])
+        mock_embedder = MagicMock()
+        mock_embedder.encode.return_value = np.array([[0.99, 0.05], [0.0, 1.0]])
+        self.app.ai.embedder = mock_embedder
+        self.app.ai.qa_pipeline = MagicMock(return_value=[{"answer": "read"}])
+
+        self.assertEqual(self.app.answer_questions(["q1 reworded", "q2"]), ["materialized", "read"])
+        mock_embedder.encode.assert_called_once()
+        self.assertEqual(self.app.ai.qa_pipeline.call_args.kwargs["question"], ["q2"])
+
+    ######################################################################
+    # Module: test_update_knowledge_base
+    # Description: Tests that a knowledge base edit only encodes the new
+    #              entries, gives the same retrieval results as building
+    #              the app from the new knowledge base and drops the FAQ
+    #              rows read from the changed entries.
+    ######################################################################
+    def test_update_knowledge_base(self):
+        def encode(texts, **kwargs):
+            single = isinstance(texts, str)
+            texts = [texts] if single else texts
+            vectors = np.array([[len(t), t.count("e"), t.count("s") + 1.0] for t in texts])
+            return vectors[0] if single else vectors
+
+        mock_embedder = MagicMock()
+        mock_embedder.encode.side_effect = encode
+        self.app.ai.embedder = mock_embedder
+        self.app.answer_cache = AnswerCache()
+        self.app.answer_cache.put("question", "stale answer")
+        self.app.index
+
+        # The milestones answer was read from the feeding entry, which changes
+        keys = {label: key for key, label in label_groups(self.fake_kb).items()}
+        self.app.faq_table = FAQTable(["q1", "q2"], ["a1", "a2"], np.eye(2), [keys["milestones"], keys["sleep"]],
+                                      label_groups(self.fake_kb),
+                                      row_sources=[[keys["feeding"]], [keys["milestones"], keys["sleep"]]])
+
+        new_kb = [
+            ("milestones", "Babies reach various milestones as they grow."),
+            ("feeding", "Solids can start at about 6 months."),
+            ("sleep", "As babies grow, their sleep patterns change."),
+            ("milestones - 6 months - cognitive", "Looks for objects"),
+        ]
+        diff = diff_knowledge_bases(self.fake_kb, new_kb)
+        mock_embedder.encode.reset_mock()
+
+        self.app.update_knowledge_base(new_kb, diff)
+
+        mock_embedder.encode.assert_called_once_with(["feeding: Solids can start at about 6 months.",
+                                                      "milestones - 6 months - cognitive: Looks for objects"],
+                                                     convert_to_numpy=True)
+        self.assertEqual(sorted(self.app.texts), sorted(f"{label}: {text}" for label, text in new_kb))
+        np.testing.assert_allclose(self.app.embeddings, normalize_rows(encode(self.app.texts)), rtol=1e-6)
+        self.assertIs(self.app.index.vectors, self.app.store.embeddings)
+        self.assertEqual(self.app.find_best_entries("Solids at 6 months?", top_k=1),
+                         ["feeding: Solids can start at about 6 months."])
+        self.assertEqual(self.app.milestone_index.ages(), ["6 months"])
+        self.assertEqual(len(self.app.answer_cache), 0)
+        self.assertEqual((self.app.faq_table.questions, list(self.app.faq_table.groups.values())), (["q2"], ["sleep"]))
+
+    ######################################################################
+    # Module: test_update_during_requests
+    # Description: Tests that a request keeps resolving rows against the
+    #              snapshot it captured, and that answers read while the
+    #              knowledge base changes are not cached.
+    ######################################################################
+    def test_update_during_requests(self):
+        self.app.embeddings = np.array([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]])
+        self.app.ai.embedder = MagicMock()
+        self.app.ai.embedder.encode.side_effect = lambda texts, **kwargs: np.tile([0.0, 1.0], (len(texts), 1))
+        snapshot = self.app.snapshot
+        self.app.index
+
+        # The matching entry is deleted after the snapshot is taken
+        new_kb = self.fake_kb[:1]
+        self.app.update_knowledge_base(new_kb, diff_knowledge_bases(self.fake_kb, new_kb))
+        self.assertEqual(len(self.app.store), 1)
+        self.assertEqual(self.app.find_best_entries_batch(["q"], top_k=1, snapshot=snapshot),
+                         [["feeding: Breastfeeding is recommended for the first 6 months."]])
+        self.assertIsNot(self.app.snapshot.store, snapshot.store)
+
+        # An answer read from the old snapshot is dropped
+        def read_during_update(questions, q_embeds=None, batch_size=32):
+            self.app.update_knowledge_base(self.fake_kb, diff_knowledge_bases(new_kb, self.fake_kb))
+            return ["stale answer"]
+
+        self.app.answer_cache = AnswerCache()
+        with patch.object(self.app, "read_answers", side_effect=read_during_update):
+            self.assertEqual(self.app.answer_questions(["q"]), ["stale answer"])
+        self.assertEqual(len(self.app.answer_cache), 0)
+
+    ######################################################################
+    # Module: test_sharded_embeddings
+    # Description: Tests that a sharded knowledge base keeps one embedding
+    #              store per shard, so a new shard is the only one encoded.
+    ######################################################################
+    def test_sharded_embeddings(self):
+        mock_embedder = MagicMock()
+        mock_embedder.encode.side_effect = lambda texts, **kwargs: np.array([[len(t), 1.0] for t in texts])
+
+        with TemporaryDirectory() as cache_dir:
+            app = NewParentAIAssistantApp(self.fake_kb[:2], cache_dir=cache_dir, registry=self.registry,
+                                          shard_sizes=[("a", 1), ("b", 1)])
+            app.ai.embedder = mock_embedder
+            app.embeddings
+
+            app = NewParentAIAssistantApp(self.fake_kb, cache_dir=cache_dir, registry=self.registry,
+                                          shard_sizes=[("a", 1), ("b", 1), ("c", 1)])
+            app.ai.embedder = mock_embedder
+            embeddings = app.embeddings
+
+        self.assertEqual(mock_embedder.encode.call_count, 3)
+        mock_embedder.encode.assert_called_with([app.texts[2]], convert_to_numpy=True)
+        np.testing.assert_allclose(embeddings, normalize_rows([[len(t), 1.0] for t in app.texts]), rtol=1e-6)
+
+    ######################################################################
+    # Module: test_filtered_retrieval
+    # Description: Tests that retrieval is restricted to the category and
+    #              age named in the question (entries without an age
+    #              apply to every age), that explicit filters take
+    #              precedence and that a filter matching nothing is
+    #              ignored.
+    ######################################################################
+    def test_filtered_retrieval(self):
+        kb = [
+            ("feeding - 2 months", "Babies drink 4 to 5 ounces"),
+            ("sleeping - 2 months", "Babies sleep 15 hours"),
+            ("feeding - 6 months", "Start solids"),
+            ("feeding", "Feed on demand"),
+        ]
+        app = NewParentAIAssistantApp(kb, registry=self.registry)
+        app.ai.embedder = MagicMock()
+        app.ai.embedder.encode.side_effect = lambda q, **kwargs: np.array([1.0, 0.0, 0.0] if isinstance(q, str)
+                                                                          else [[1.0, 0.0, 0.0]] * len(q))
+        app.embeddings = [[0.5, 1.0, 0.0], [1.0, 0.0, 0.0], [1.0, 0.1, 0.0], [0.9, 0.3, 0.0]]
+        question = "how much should a 2 month old eat"
+
+        self.assertEqual(app.find_best_entries(question, top_k=2),
+                         ["feeding: Feed on demand", "feeding - 2 months: Babies drink 4 to 5 ounces"])
+        self.assertEqual(app.find_best_entries(question, top_k=1, category="sleeping"),
+                         ["sleeping - 2 months: Babies sleep 15 hours"])
+        self.assertEqual(app.find_best_entries(question, top_k=1, category="teething"),
+                         ["sleeping - 2 months: Babies sleep 15 hours"])
+
+        batch = app.find_best_entries_batch([question, "how long do babies sleep"], top_k=1)
+        self.assertEqual(batch, [["feeding: Feed on demand"], ["sleeping - 2 months: Babies sleep 15 hours"]])
+
+        app.infer_filters = False
+        self.assertEqual(app.find_best_entries(question, top_k=1), ["sleeping - 2 months: Babies sleep 15 hours"])
+
+    ######################################################################
+    # Module: test_retrieval_modes
+    # Description: Tests that the lexical mode answers without the
+    #              embedder (except for questions matching no term), that
+    #              the hybrid mode fuses both rankings and that unknown
+    #              modes are rejected.
+    ######################################################################
+    def test_retrieval_modes(self):
+        kb = [
+            ("sleeping", "Place babies on their back to lower the risk of SIDS."),
+            ("feeding", "Rice cereal can be offered at about 6 months."),
+            ("milestones", "Tummy time helps babies roll over."),
+        ]
+        mock_embedder = MagicMock()
+        mock_embedder.encode.side_effect = lambda q, **kwargs: np.array([0.0, 0.0, 1.0] if isinstance(q, str)
+                                                                        else [[0.0, 0.0, 1.0]] * len(q))
+
+        lexical = NewParentAIAssistantApp(kb, registry=self.registry, retrieval_mode="lexical")
+        lexical.ai.embedder = mock_embedder
+        lexical.embeddings = np.eye(3)
+        self.assertEqual(lexical.find_best_entries("What is SIDS?", top_k=1), [lexical.texts[0]])
+        self.assertEqual(lexical.find_best_entries_batch(["rice cereal?", "SIDS"], top_k=1),
+                         [[lexical.texts[1]], [lexical.texts[0]]])
+        mock_embedder.encode.assert_not_called()
+        self.assertEqual(lexical.find_best_entries("hello", top_k=1), [lexical.texts[2]])
+        mock_embedder.encode.assert_called_once()
+
+        hybrid = NewParentAIAssistantApp(kb, registry=self.registry, retrieval_mode="hybrid")
+        hybrid.ai.embedder = mock_embedder
+        hybrid.embeddings = np.eye(3)
+        self.assertEqual(hybrid.find_best_entries("When can we start rice cereal?", top_k=2),
+                         [hybrid.texts[1], hybrid.texts[2]])
+
+        with self.assertRaises(ValueError):
+            NewParentAIAssistantApp(kb, retrieval_mode="sparse")
+
+    ######################################################################
+    # Module: test_half_precision_embeddings
+    # Description: Tests that float16 embeddings are kept in the store,
+    #              retrieve the same entries and are not copied by the
+    #              index.
+    ######################################################################
+    def test_half_precision_embeddings(self):
+        embeddings = np.array([[1.0, 0.0, 0.2], [0.3, 1.0, 0.0], [0.0, 0.4, 1.0]])
+        self.app.ai.embedder.encode.return_value = np.array([0.1, 1.0, 0.5])
+        self.app.embeddings = embeddings
+        app = NewParentAIAssistantApp(self.fake_kb, registry=self.registry, embedding_dtype="float16")
+        app.ai.embedder = self.app.ai.embedder
+        app.embeddings = embeddings
+
+        self.assertEqual(app.store.embeddings.dtype, np.float16)
+        self.assertEqual(app.find_best_entries("question", top_k=2), self.app.find_best_entries("question", top_k=2))
+
+        # The index scores against the store's normalized matrix
+        for each in (self.app, app):
+            self.assertIs(each.index.vectors, each.store.embeddings)
+            np.testing.assert_allclose(np.linalg.norm(each.embeddings.astype(np.float32), axis=1), 1.0, rtol=1e-3)
+
+    ######################################################################
+    # Module: test_direct_answer
+    # Description: Tests that a confidently retrieved entry answers the
+    #              question without the QA model, and that a close
+    #              runner-up sends it to the QA model.
+    ######################################################################
+    def test_direct_answer(self):
+        app = NewParentAIAssistantApp(self.fake_kb, registry=self.registry, direct_answer_score=0.9,
+                                      direct_answer_margin=0.1)
+        app.ai.embedder = MagicMock()
+        app.ai.qa_pipeline = MagicMock(return_value={"answer": "read"})
+        app.embeddings = [[1.0, 0.0], [0.0, 1.0], [0.8, 0.6]]
+
+        app.ai.embedder.encode.return_value = np.array([1.0, 0.0])
+        self.assertEqual(app.answer_question("What milestones do babies reach?"), self.fake_kb[0][1])
+        app.ai.qa_pipeline.assert_not_called()
+
+        app.ai.embedder.encode.return_value = np.array([0.9, 0.436])
+        self.assertEqual(app.answer_question("How does sleep change?"), "read")
+        app.ai.qa_pipeline.assert_called_once()
+        self.assertEqual(app.answer_paths, {ANSWER_DIRECT: 1, ANSWER_READER: 1})
+
+    ######################################################################
+    # Module: test_direct_answer_batch
+    # Description: Tests that only the questions the gate cannot answer
+    #              reach the batched QA model call.
+    ######################################################################
+    def test_direct_answer_batch(self):
+        app = NewParentAIAssistantApp(self.fake_kb, registry=self.registry, direct_answer_score=0.9,
+                                      direct_answer_margin=0.1)
+        app.ai.embedder = MagicMock()
+        app.ai.embedder.encode.return_value = np.array([[1.0, 0.0], [0.9, 0.436]])
+        app.ai.qa_pipeline = MagicMock(return_value={"answer": "read"})
+        app.embeddings = [[1.0, 0.0], [0.0, 1.0], [0.8, 0.6]]
+
+        answers = app.answer_questions(["q1", "q2"])
+
+        self.assertEqual(answers, [self.fake_kb[0][1], "read"])
+        self.assertEqual(app.ai.qa_pipeline.call_args.kwargs["question"], ["q2"])
+        self.assertEqual(app.answer_paths, {ANSWER_DIRECT: 1, ANSWER_READER: 1})
+
+    ######################################################################
+    # Module: test_metrics_time_request_stages
+    # Description: Tests that enabled metrics time the stages of an NLP
+    #              request and count its route, and that disabled metrics
+    #              record nothing.
+    ######################################################################
+    def test_metrics_time_request_stages(self):
+        metrics = Metrics(enabled=True)
+        app = NewParentAIAssistantApp(self.fake_kb, registry=self.registry, metrics=metrics)
+        app.ai.embedder.encode.return_value = np.array([1.0, 0.0])
+        app.ai.qa_pipeline.return_value = {"answer": "read"}
+        app.embeddings = [[1.0, 0.0], [0.0, 1.0], [0.8, 0.6]]
+
+        self.assertEqual(app.respond("Why do babies cry?"), ("nlp", "read"))
+
+        stages = metrics.snapshot()["stages"]
+        for stage in ("respond", "route", "encode", "search", "read", "index_build"):
+            self.assertEqual(stages[stage]["count"], 1, stage)
+        # The router sends a question without an age past the lookup
+        self.assertNotIn("lookup", stages)
+        self.assertEqual(stages["model_load"]["count"], 2)
+        self.assertEqual(metrics.counters, {"route_nlp": 1, "answer_direct": 0, "answer_reader": 1})
+
+        self.app.ai.qa_pipeline.return_value = {"answer": "read"}
+        self.app.embeddings = [[1.0, 0.0], [0.0, 1.0], [0.8, 0.6]]
+        self.app.respond("Why do babies cry?")
+        self.assertEqual(self.app.metrics.snapshot(), {"stages": {}, "counters": {}})
+
+    ######################################################################
+    # Module: test_respond_routes_questions
+    # Description: Tests that questions are routed to the milestone list,
+    #              the structured lookup or the NLP service.
+    ######################################################################
+    def test_respond_routes_questions(self):
+        app = NewParentAIAssistantApp([
+            ("milestones - 6 months - cognitive", "Looks for objects"),
+            ("sleeping - 5 to 6 months - naps", "Takes 3 naps per day"),
+        ], registry=ModelRegistry({}))
+
+        with patch.object(app, "answer_question", return_value="Mocked answer") as mock_answer:
+            route, answer = app.respond("What are the Milestones for a 6 month old?")
+            self.assertEqual(route, "milestone")
+            self.assertIn("Looks for objects", answer)
+
+            route, answer = app.respond("how many naps for a 5 month old?")
+            self.assertEqual(route, "lookup")
+            self.assertIn("Takes 3 naps per day", answer)
+
+            mock_answer.assert_not_called()
+            self.assertEqual(app.respond("when do babies teethe?"), ("nlp", "Mocked answer"))
+
+    ######################################################################
+    # Module: test_init_is_lazy
+    # Description: Tests that creating the app loads no model and
+    #              computes no embeddings.
+    ######################################################################
+    def test_init_is_lazy(self):
+        self.mock_loader.assert_not_called()
+        self.assertIsNone(self.app.store.embeddings)
+
+    ######################################################################
+    # Module: test_embeddings_computed_on_first_use
+    # Description: Tests that the embeddings are computed once, on first
+    #              use.
+    ######################################################################
+    def test_embeddings_computed_on_first_use(self):
+        mock_embedder = MagicMock()
+        mock_embedder.encode.return_value = np.ones((3, 4))
+        self.app.ai.embedder = mock_embedder
+
+        self.assertEqual(self.app.embeddings.shape, (3, 4))
+        self.assertEqual(self.app.embeddings.dtype, np.float32)
+        mock_embedder.encode.assert_called_once_with(list(self.app.texts), convert_to_numpy=True)
+
+    ######################################################################
+    # Module: test_main_module_does_not_import_torch
+    # Description: Tests that importing the app does not import torch, so
+    #              the milestone route never pays for it.
+    ######################################################################
+    def test_main_module_does_not_import_torch(self):
+        code = "import sys, app.main; print('torch' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "False")
+
 ###################################
 ### Entry point of test_main.py ###
 ###################################
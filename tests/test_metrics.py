@@ -0,0 +1,153 @@
+# File: test_metrics.py
+# Author: William Jahner
+
+import os
+import pstats
+import threading
+import time
+import unittest
+from tempfile import TemporaryDirectory
+from app.services.metrics import Metrics, SamplingProfiler, NULL_TIMER, METRICS_LOGGER, profile
+
+######################################################################
+# Class: TestMetrics
+# Description: This class is for testing the request path metrics.
+######################################################################
+class TestMetrics(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_disabled_metrics_record_nothing
+    # Description: Tests that disabled metrics hand out the shared no-op
+    #              timer and ignore events.
+    ######################################################################
+    def test_disabled_metrics_record_nothing(self):
+        metrics = Metrics()
+
+        with metrics.stage("read") as timer:
+            pass
+        metrics.increment("route_nlp")
+
+        self.assertIs(timer, NULL_TIMER)
+        self.assertEqual(metrics.snapshot(), {"stages": {}, "counters": {}})
+
+    ######################################################################
+    # Module: test_stage_and_counter_snapshot
+    # Description: Tests that timed stages and events are summarized.
+    ######################################################################
+    def test_stage_and_counter_snapshot(self):
+        metrics = Metrics(enabled=True)
+
+        with metrics.stage("encode"):
+            time.sleep(0.002)
+        metrics.observe("encode", 0.004)
+        metrics.increment("route_nlp", 2)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["stages"]["encode"]["count"], 2)
+        self.assertGreaterEqual(snapshot["stages"]["encode"]["total_ms"], 6)
+        self.assertAlmostEqual(snapshot["stages"]["encode"]["max_ms"], 4, delta=0.5)
+        self.assertEqual(snapshot["counters"], {"route_nlp": 2})
+
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {"stages": {}, "counters": {}})
+
+    ######################################################################
+    # Module: test_prometheus_text
+    # Description: Tests the cumulative histogram buckets, sum, count and
+    #              counters of the Prometheus export.
+    ######################################################################
+    def test_prometheus_text(self):
+        metrics = Metrics(enabled=True, buckets=(0.01, 0.1))
+        metrics.observe("read", 0.005)
+        metrics.observe("read", 0.05)
+        metrics.observe("read", 2.0)
+        metrics.increment("route_lookup")
+
+        lines = metrics.to_prometheus().splitlines()
+
+        self.assertIn("# TYPE assistant_stage_seconds histogram", lines)
+        self.assertIn('assistant_stage_seconds_bucket{stage="read",le="0.01"} 1', lines)
+        self.assertIn('assistant_stage_seconds_bucket{stage="read",le="0.1"} 2', lines)
+        self.assertIn('assistant_stage_seconds_bucket{stage="read",le="+Inf"} 3', lines)
+        self.assertIn('assistant_stage_seconds_sum{stage="read"} 2.055', lines)
+        self.assertIn('assistant_stage_seconds_count{stage="read"} 3', lines)
+        self.assertIn('assistant_events_total{event="route_lookup"} 1', lines)
+
+    ######################################################################
+    # Module: test_drain_and_merge
+    # Description: Tests that drained observations and events are added to
+    #              other metrics and dropped from the drained ones.
+    ######################################################################
+    def test_drain_and_merge(self):
+        worker, parent = Metrics(enabled=True, buckets=(0.01, 0.1)), Metrics(enabled=True, buckets=(0.01, 0.1))
+        worker.observe("read", 0.05)
+        worker.observe("read", 2.0)
+        worker.increment("answer_reader", 2)
+        parent.observe("read", 0.005)
+        parent.increment("answer_reader")
+
+        parent.merge(worker.drain())
+        self.assertEqual(worker.snapshot(), {"stages": {}, "counters": {}})
+        parent.merge(worker.drain())
+
+        lines = parent.to_prometheus().splitlines()
+        self.assertIn('assistant_stage_seconds_bucket{stage="read",le="0.1"} 2', lines)
+        self.assertIn('assistant_stage_seconds_count{stage="read"} 3', lines)
+        self.assertAlmostEqual(parent.snapshot()["stages"]["read"]["max_ms"], 2000)
+        self.assertEqual(parent.snapshot()["counters"], {"answer_reader": 3})
+
+        with self.assertRaises(ValueError):
+            Metrics(enabled=True).merge(parent.drain())
+
+    ######################################################################
+    # Module: test_json_log_records
+    # Description: Tests that observations are logged as JSON records.
+    ######################################################################
+    def test_json_log_records(self):
+        metrics = Metrics(enabled=True, log_json=True)
+
+        with self.assertLogs(METRICS_LOGGER, level="INFO") as logs:
+            metrics.observe("search", 0.0015)
+
+        self.assertIn('"event": "stage", "thread": "MainThread", "stage": "search", "ms": 1.5', logs.output[0])
+
+    ######################################################################
+    # Module: test_sampling_profiler
+    # Description: Tests that the stacks of a busy thread are sampled as
+    #              collapsed stacks.
+    ######################################################################
+    def test_sampling_profiler(self):
+        stop = threading.Event()
+
+        def busy_work():
+            while not stop.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=busy_work, name="busy")
+        with SamplingProfiler(interval_s=0.001) as profiler:
+            worker.start()
+            time.sleep(0.05)
+            stop.set()
+            worker.join()
+
+        stacks = profiler.collapsed().splitlines()
+        self.assertTrue(any(line.startswith("busy;") and "busy_work" in line for line in stacks))
+
+    ######################################################################
+    # Module: test_profile
+    # Description: Tests that cProfile statistics are written on exit.
+    ######################################################################
+    def test_profile(self):
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stats.prof")
+            with profile(path):
+                sorted(range(1000), reverse=True)
+
+            stats = pstats.Stats(path)
+            self.assertGreater(stats.total_calls, 0)
+
+######################################
+### Entry point of test_metrics.py ###
+######################################
+if __name__ == "__main__":
+    unittest.main()
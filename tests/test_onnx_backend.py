@@ -0,0 +1,354 @@
+# File: test_onnx_backend.py
+# Author: William Jahner
+
+import importlib.util
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import numpy as np
+from tokenizers import Encoding, Tokenizer, models, pre_tokenizers, processors
+from app.services.ai_service import AIService, build_context
+from app.services.model_registry import ModelRegistry, QA_MODEL_NAME, FAST_QA_MODEL_NAME, EMBEDDING_MODEL_NAME, \
+    ONNX_QA_TASK, ONNX_EMBEDDING_TASK
+from app.services.onnx_backend import OnnxEmbedder, OnnxQAPipeline, best_span
+
+# Vocabulary of the test tokenizer
+WORDS = ["when", "do", "babies", "crawl", "most", "start", "at", "about", "nine", "months", "sleep", "a", "lot"]
+VOCAB = {token: i for i, token in enumerate(["[PAD]", "[CLS]", "[SEP]", "[UNK]"] + WORDS)}
+
+# Fixed question set of the parity test
+PARITY_QUESTIONS = [
+    ("When do babies start crawling?", "Most babies start crawling between 6 and 10 months."),
+    ("How many naps does a 6 month old take?", "At 6 months most babies take 2 to 3 naps per day."),
+    ("How often should a newborn feed?", "Newborns feed every 2 to 3 hours, or 8 to 12 times a day."),
+    ("When do babies smile?", "Babies usually smile at people by 2 months of age."),
+]
+
+######################################################################
+# Module: make_tokenizer
+# Description: A helper function that returns a word-level tokenizer
+#              with BERT-style special tokens.
+######################################################################
+def make_tokenizer():
+    tokenizer = Tokenizer(models.WordLevel(VOCAB, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", pair="[CLS] $A [SEP] $B:1 [SEP]:1",
+        special_tokens=[("[CLS]", VOCAB["[CLS]"]), ("[SEP]", VOCAB["[SEP]"])])
+    return tokenizer
+
+######################################################################
+# Class: FakeSession
+# Description: An ONNX Runtime session stand-in computing its outputs
+#              with a Python function.
+######################################################################
+class FakeSession:
+
+    def __init__(self, run):
+        self._run = run
+        self.calls = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input_ids"), SimpleNamespace(name="attention_mask")]
+
+    def run(self, output_names, inputs):
+        self.calls.append(inputs)
+        return self._run(inputs)
+
+######################################################################
+# Module: models_available
+# Description: A helper function that checks whether onnxruntime is
+#              installed and both models are in the local Hugging Face
+#              cache.
+######################################################################
+def models_available():
+    if importlib.util.find_spec("onnxruntime") is None:
+        return False
+    from huggingface_hub import try_to_load_from_cache
+    repos = [QA_MODEL_NAME, f"sentence-transformers/{EMBEDDING_MODEL_NAME}"]
+    return all(isinstance(try_to_load_from_cache(repo, "config.json"), str) for repo in repos)
+
+######################################################################
+# Class: TestOnnxBackend
+# Description: This class is for testing the ONNX Runtime wrappers with
+#              fake sessions.
+######################################################################
+class TestOnnxBackend(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_best_span
+    # Description: Tests that the best span only covers context tokens,
+    #              ends after it starts and respects max_answer_len.
+    ######################################################################
+    def test_best_span(self):
+        start_logits = np.array([9.0, 0.0, 5.0, 0.0, 0.0])
+        end_logits = np.array([9.0, 5.0, 0.0, 1.0, 4.0])
+        context_mask = np.array([False, True, True, True, True])
+
+        self.assertEqual(best_span(start_logits, end_logits, context_mask)[1:], (2, 4))
+        self.assertEqual(best_span(start_logits, end_logits, context_mask, max_answer_len=2)[1:], (2, 3))
+        self.assertIsNone(best_span(start_logits, end_logits, np.zeros(5, dtype=bool)))
+
+    ######################################################################
+    # Module: test_qa_pipeline_finds_answer_in_later_window
+    # Description: Tests that long contexts are split into windows and the
+    #              best span of all windows is returned with character
+    #              offsets into the context.
+    ######################################################################
+    def test_qa_pipeline_finds_answer_in_later_window(self):
+        def run(inputs):
+            ids = inputs["input_ids"]
+            return [np.where(ids == VOCAB["nine"], 10.0, 0.0), np.where(ids == VOCAB["months"], 10.0, 0.0)]
+
+        session = FakeSession(run)
+        qa = OnnxQAPipeline(session, make_tokenizer(), {"pad_id": 0})
+        context = "babies sleep a lot most babies crawl at about nine months"
+
+        result = qa(question="when do babies crawl", context=context, max_seq_len=12, doc_stride=2, batch_size=1)
+
+        self.assertEqual(result["answer"], "nine months")
+        self.assertEqual(context[result["start"]:result["end"]], "nine months")
+        self.assertGreater(len(session.calls), 1)
+
+    ######################################################################
+    # Module: test_qa_pipeline_batches_questions
+    # Description: Tests that a list of questions returns a list of
+    #              answers from one forward pass.
+    ######################################################################
+    def test_qa_pipeline_batches_questions(self):
+        def run(inputs):
+            ids = inputs["input_ids"]
+            return [np.where(ids == VOCAB["crawl"], 10.0, 0.0), np.where(ids == VOCAB["crawl"], 10.0, 0.0)]
+
+        session = FakeSession(run)
+        qa = OnnxQAPipeline(session, make_tokenizer(), {"pad_id": 0})
+
+        results = qa(question=["when do babies crawl", "do babies crawl"], context=["babies crawl", "most crawl"])
+
+        self.assertEqual([r["answer"] for r in results], ["crawl", "crawl"])
+        self.assertEqual(len(session.calls), 1)
+
+    ######################################################################
+    # Module: test_qa_pipeline_impossible_answer
+    # Description: Tests that an empty answer is returned when the null
+    #              (CLS) score beats every span and impossible answers are
+    #              handled, like the Hugging Face QA pipeline.
+    ######################################################################
+    def test_qa_pipeline_impossible_answer(self):
+        def run(inputs):
+            ids = inputs["input_ids"]
+            logits = np.where(ids == VOCAB["[CLS]"], 10.0, np.where(ids == VOCAB["crawl"], 2.0, 0.0))
+            return [logits, logits]
+
+        qa = OnnxQAPipeline(FakeSession(run), make_tokenizer(), {"pad_id": 0})
+        context = "most babies crawl at about nine months"
+
+        result = qa(question="when do babies crawl", context=context, handle_impossible_answer=True)
+        self.assertEqual((result["answer"], result["start"], result["end"]), ("", 0, 0))
+        self.assertGreater(result["score"], 0.9)
+        self.assertEqual(qa(question="when do babies crawl", context=context)["answer"], "crawl")
+
+        # Contexts from the passage cache are scored like tokenized ones
+        passages = ["babies sleep a lot", "most babies crawl at about nine months"]
+        qa.cache_passages(passages)
+        cached = build_context(passages, None)
+        for handle_impossible_answer in (True, False):
+            expected = qa(question="when do babies crawl", context=str(cached),
+                          handle_impossible_answer=handle_impossible_answer)
+            result = qa(question="when do babies crawl", context=cached,
+                        handle_impossible_answer=handle_impossible_answer)
+            self.assertEqual((result["answer"], result["start"], result["end"]),
+                             (expected["answer"], expected["start"], expected["end"]))
+            self.assertAlmostEqual(result["score"], expected["score"], places=6)
+
+    ######################################################################
+    # Module: test_cached_passage_windows
+    # Description: Tests that the windows cut from pre-tokenized passages
+    #              match the tokenizer's windows and that answers map back
+    #              to the context exactly.
+    ######################################################################
+    def test_cached_passage_windows(self):
+        def run(inputs):
+            ids = inputs["input_ids"]
+            return [np.where(ids == VOCAB["nine"], 10.0, 0.0), np.where(ids == VOCAB["months"], 10.0, 0.0)]
+
+        qa = OnnxQAPipeline(FakeSession(run), make_tokenizer(), {"pad_id": 0})
+        passages = ["babies sleep a lot", "most babies crawl at about nine months", "babies  start"]
+        qa.cache_passages(passages)
+        question = "when do babies crawl"
+
+        for context in [build_context(passages, None), build_context(passages[::-1], None)]:
+            for max_seq_len, doc_stride in [(384, 128), (12, 2), (10, 5)]:
+                expected = qa.windows(question, context, max_seq_len, doc_stride)
+                windows = qa.reader_windows(question, context, max_seq_len, doc_stride)
+                self.assertEqual([list(w.ids) for w in windows], [e.ids for e in expected])
+                self.assertEqual([list(w.type_ids) for w in windows], [e.type_ids for e in expected])
+                self.assertEqual([[tuple(o) for o, s in zip(w.offsets, w.sequence_ids) if s == 1] for w in windows],
+                                 [[o for o, s in zip(e.offsets, e.sequence_ids) if s == 1] for e in expected])
+
+            result = qa(question=question, context=context, max_seq_len=12, doc_stride=2)
+            self.assertEqual((result["answer"], context[result["start"]:result["end"]]), ("nine months",) * 2)
+
+        # Contexts cut at the word budget or with unknown passages are
+        # tokenized
+        self.assertIsInstance(qa.reader_windows(question, build_context(passages, 2), 384, 128)[0], Encoding)
+        self.assertIsInstance(qa.reader_windows(question, build_context(["babies"], None), 384, 128)[0], Encoding)
+
+        qa.cache_passages(passages[:1])
+        self.assertEqual(list(qa.passage_tokens), passages[:1])
+
+    ######################################################################
+    # Module: test_ai_service_tokenizes_passages
+    # Description: Tests that the passages are tokenized when the reader
+    #              is loaded.
+    ######################################################################
+    def test_ai_service_tokenizes_passages(self):
+        qa = OnnxQAPipeline(FakeSession(None), make_tokenizer(), {"pad_id": 0})
+        registry = ModelRegistry({ONNX_QA_TASK: lambda model_path: qa})
+        service = AIService("babies sleep a lot\nmost babies crawl", registry=registry, backend="onnx")
+
+        service.qa_pipeline
+
+        self.assertEqual(list(qa.passage_tokens), ["babies sleep a lot", "most babies crawl"])
+        self.assertEqual(list(qa.passage_tokens["most babies crawl"][0][0]),
+                         [VOCAB["most"], VOCAB["babies"], VOCAB["crawl"]])
+
+    ######################################################################
+    # Module: test_embedder_mean_pooling
+    # Description: Tests that token embeddings are mean pooled over the
+    #              attention mask and returned in the input order.
+    ######################################################################
+    def test_embedder_mean_pooling(self):
+        session = FakeSession(lambda inputs: [np.eye(len(VOCAB))[inputs["input_ids"]]])
+        config = {"pad_id": 0, "max_seq_length": 16, "pooling": "mean", "normalize": False}
+        embedder = OnnxEmbedder(session, make_tokenizer(), config)
+
+        embeddings = embedder.encode(["crawl", "babies sleep a lot"])
+        single = embedder.encode("crawl")
+
+        self.assertEqual(embeddings.shape, (2, len(VOCAB)))
+        self.assertAlmostEqual(embeddings[0, VOCAB["crawl"]], 1 / 3)
+        self.assertAlmostEqual(embeddings[1, VOCAB["sleep"]], 1 / 6)
+        self.assertEqual(embeddings[0, VOCAB["[PAD]"]], 0.0)
+        np.testing.assert_allclose(single, embeddings[0])
+
+    ######################################################################
+    # Module: test_embedder_normalizes
+    # Description: Tests that embeddings are normalized when the exported
+    #              model normalizes.
+    ######################################################################
+    def test_embedder_normalizes(self):
+        session = FakeSession(lambda inputs: [np.eye(len(VOCAB))[inputs["input_ids"]]])
+        config = {"pad_id": 0, "max_seq_length": 16, "pooling": "mean", "normalize": True}
+        embedder = OnnxEmbedder(session, make_tokenizer(), config)
+
+        embeddings = embedder.encode(["crawl", "babies sleep a lot"], batch_size=1)
+
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), [1.0, 1.0], rtol=1e-6)
+
+    ######################################################################
+    # Module: test_ai_service_onnx_backend
+    # Description: Tests that the ONNX backend loads the exported models
+    #              through the registry and that unknown backends fail.
+    ######################################################################
+    def test_ai_service_onnx_backend(self):
+        qa_loader = MagicMock()
+        embedder_loader = MagicMock()
+        registry = ModelRegistry({ONNX_QA_TASK: qa_loader, ONNX_EMBEDDING_TASK: embedder_loader})
+        service = AIService("context", registry=registry, backend="onnx", onnx_dir="/models", quantized=True)
+
+        service.qa_pipeline
+        service.embedder
+
+        qa_loader.assert_called_once_with(str(Path("/models/qa/model.int8.onnx")))
+        embedder_loader.assert_called_once_with(str(Path("/models/embedder/model.int8.onnx")))
+
+        # The small reader of a cascade is read from its own export
+        service = AIService("context", registry=registry, backend="onnx", onnx_dir="/models",
+                            fast_qa_model_name=FAST_QA_MODEL_NAME)
+        service.fast_qa_pipeline
+        qa_loader.assert_called_with(str(Path("/models/fast_qa/model.onnx")))
+        with self.assertRaises(ValueError):
+            AIService("context", backend="tensorrt")
+
+######################################################################
+# Class: TestOnnxParity
+# Description: This class compares the exported models with the
+#              PyTorch models. It needs onnxruntime and both models in
+#              the local Hugging Face cache.
+######################################################################
+@unittest.skipUnless(models_available(), "onnxruntime or the cached models are not available")
+class TestOnnxParity(unittest.TestCase):
+
+    ######################################################################
+    # Module: setUpClass
+    # Description: Exports the cached models to a temporary directory and
+    #              loads both backends once.
+    ######################################################################
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        from app.services.onnx_backend import export_embedder, export_qa_model
+
+        cls.tmp = tempfile.TemporaryDirectory()
+        export_qa_model(QA_MODEL_NAME, Path(cls.tmp.name) / "qa", quantize=True)
+        export_embedder(EMBEDDING_MODEL_NAME, Path(cls.tmp.name) / "embedder", quantize=True)
+
+        cls.torch = AIService("", registry=ModelRegistry())
+        cls.onnx = AIService("", registry=ModelRegistry(), backend="onnx", onnx_dir=cls.tmp.name)
+        cls.int8 = AIService("", registry=ModelRegistry(), backend="onnx", onnx_dir=cls.tmp.name, quantized=True)
+
+    ######################################################################
+    # Module: tearDownClass
+    # Description: Removes the exported models.
+    ######################################################################
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    ######################################################################
+    # Module: answers
+    # Description: A helper function that answers the parity questions.
+    ######################################################################
+    def answers(self, service):
+        questions = [q for q, _ in PARITY_QUESTIONS]
+        contexts = [c for _, c in PARITY_QUESTIONS]
+        results = service.qa_pipeline(question=questions, context=contexts, **service.reader_options())
+        return [r["answer"].strip() for r in results]
+
+    ######################################################################
+    # Module: embeddings
+    # Description: A helper function that embeds the parity questions.
+    ######################################################################
+    def embeddings(self, service):
+        embeddings = service.embedder.encode([q for q, _ in PARITY_QUESTIONS], convert_to_numpy=True)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    ######################################################################
+    # Module: test_fp32_parity
+    # Description: Tests that the fp32 graphs match the PyTorch models.
+    ######################################################################
+    def test_fp32_parity(self):
+        self.assertEqual(self.answers(self.onnx), self.answers(self.torch))
+        cosines = (self.embeddings(self.onnx) * self.embeddings(self.torch)).sum(axis=1)
+        self.assertGreater(cosines.min(), 0.9999)
+
+    ######################################################################
+    # Module: test_int8_parity
+    # Description: Tests that the int8 graphs stay close to the PyTorch
+    #              models.
+    ######################################################################
+    def test_int8_parity(self):
+        agreement = np.mean([a == b for a, b in zip(self.answers(self.int8), self.answers(self.torch))])
+        self.assertGreaterEqual(agreement, 0.75)
+        cosines = (self.embeddings(self.int8) * self.embeddings(self.torch)).sum(axis=1)
+        self.assertGreater(cosines.min(), 0.98)
+
+###########################################
+### Entry point of test_onnx_backend.py ###
+###########################################
+if __name__ == "__main__":
+    unittest.main()
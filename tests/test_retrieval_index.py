@@ -0,0 +1,224 @@
+# File: test_retrieval_index.py
+# Author: William Jahner
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from app.services.retrieval_index import ExactIndex, IVFIndex, QuantizedIndex, create_index, fuse_rankings, \
+    normalize_rows
+
+######################################################################
+# Class: RetrievalIndexTests
+# Description: This class is for testing retrieval_index.py
+#              functionalities.
+######################################################################
+class RetrievalIndexTests(unittest.TestCase):
+
+    ######################################################################
+    # Module: setUp
+    # Description: A special method used to prepare the test environment
+    #              before each test method runs.
+    ######################################################################
+    def setUp(self):
+        # Three well separated clusters of entries
+        rng = np.random.default_rng(0)
+        centers = np.eye(3, 16) * 5
+        self.embeddings = np.concatenate([c + rng.normal(0, 0.5, (40, 16)) for c in centers]).astype(np.float32)
+        self.queries = self.embeddings[[3, 50, 110]] + rng.normal(0, 0.05, (3, 16)).astype(np.float32)
+
+    ######################################################################
+    # Module: brute_force
+    # Description: A helper function that ranks every entry by cosine
+    #              similarity using a full sort.
+    ######################################################################
+    def brute_force(self, queries, top_k):
+        e = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+        q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        return np.argsort(-(q @ e.T), axis=1)[:, :top_k]
+
+    ######################################################################
+    # Module: test_exact_matches_brute_force
+    # Description: Tests that the exact index returns the same entries, in
+    #              the same order, as a full sort.
+    ######################################################################
+    def test_exact_matches_brute_force(self):
+        scores, indices = ExactIndex(self.embeddings).search(self.queries, top_k=5)
+
+        np.testing.assert_array_equal(indices, self.brute_force(self.queries, 5))
+        self.assertTrue(np.all(np.diff(scores, axis=1) <= 0))
+
+    ######################################################################
+    # Module: test_exact_top_k_larger_than_index
+    # Description: Tests that asking for more entries than exist returns
+    #              every entry.
+    ######################################################################
+    def test_exact_top_k_larger_than_index(self):
+        _, indices = ExactIndex(self.embeddings[:4]).search(self.queries, top_k=10)
+        self.assertEqual(indices.shape, (3, 4))
+
+    ######################################################################
+    # Module: test_ivf_probing_every_list_is_exact
+    # Description: Tests that probing every list gives the exact results.
+    ######################################################################
+    def test_ivf_probing_every_list_is_exact(self):
+        index = IVFIndex(self.embeddings, n_lists=6, n_probe=6)
+        _, indices = index.search(self.queries, top_k=5)
+
+        np.testing.assert_array_equal(indices, self.brute_force(self.queries, 5))
+
+    ######################################################################
+    # Module: test_ivf_finds_neighbours_with_few_probes
+    # Description: Tests that the approximate index finds the nearest
+    #              entry when only a single list is probed.
+    ######################################################################
+    def test_ivf_finds_neighbours_with_few_probes(self):
+        index = IVFIndex(self.embeddings, n_lists=3, n_probe=1)
+        _, indices = index.search(self.queries, top_k=1)
+
+        np.testing.assert_array_equal(indices[:, 0], [3, 50, 110])
+        self.assertEqual(sum(len(l) for l in index.lists), len(self.embeddings))
+
+    ######################################################################
+    # Module: test_update_matches_rebuild
+    # Description: Tests that updating rows in place gives the same
+    #              results as rebuilding each index from the new rows.
+    ######################################################################
+    def test_update_matches_rebuild(self):
+        rng = np.random.default_rng(1)
+        replaced, deleted = [5, 60], [0, 7, 119]
+        replaced_embeddings = rng.normal(0, 1, (2, 16)).astype(np.float32)
+        appended_embeddings = rng.normal(0, 1, (4, 16)).astype(np.float32)
+
+        # The expected rows after the update
+        expected = self.embeddings.copy()
+        expected[replaced] = replaced_embeddings
+        expected = np.vstack([np.delete(expected, deleted, axis=0), appended_embeddings])
+        queries = np.vstack([self.queries, replaced_embeddings, appended_embeddings])
+
+        for index in (ExactIndex(self.embeddings), IVFIndex(self.embeddings, n_lists=4, n_probe=4),
+                      QuantizedIndex(self.embeddings, rescore=40), QuantizedIndex(self.embeddings, "binary", 40)):
+            index.update(replaced, replaced_embeddings, deleted, appended_embeddings)
+
+            self.assertEqual(len(index), expected.shape[0])
+            self.assertTrue(np.array_equal(index.search(queries, 5)[1], ExactIndex(expected).search(queries, 5)[1]))
+            if isinstance(index, IVFIndex):
+                self.assertEqual(sorted(np.concatenate(index.lists).tolist()), list(range(len(index))))
+
+    ######################################################################
+    # Module: test_search_restricted_to_rows
+    # Description: Tests that a search over a subset of the rows returns
+    #              the entries of an index built from those rows only.
+    ######################################################################
+    def test_search_restricted_to_rows(self):
+        rows = np.arange(0, len(self.embeddings), 3)
+        expected = rows[ExactIndex(self.embeddings[rows]).search(self.queries, 5)[1]]
+
+        for index in (ExactIndex(self.embeddings), IVFIndex(self.embeddings, n_lists=4, n_probe=4),
+                      QuantizedIndex(self.embeddings, rescore=10), QuantizedIndex(self.embeddings, "binary", 10)):
+            np.testing.assert_array_equal(index.search(self.queries, 5, rows=rows)[1], expected)
+
+    ######################################################################
+    # Module: test_quantized_rescoring
+    # Description: Tests that the candidates of the quantized scan are
+    #              rescored exactly against the full-precision rows kept
+    #              in a memory-mapped file.
+    ######################################################################
+    def test_quantized_rescoring(self):
+        expected_scores, expected = ExactIndex(self.embeddings).search(self.queries, top_k=5)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "vectors.npy")
+            for quantization in ("int8", "binary"):
+                index = QuantizedIndex(self.embeddings, quantization, rescore=4, vectors_path=path)
+                scores, indices = index.search(self.queries, top_k=5)
+
+                # 16 sign bits only rank the nearest entry reliably
+                found = 5 if quantization == "int8" else 1
+                np.testing.assert_array_equal(indices[:, :found], expected[:, :found])
+                np.testing.assert_allclose(scores[:, :found], expected_scores[:, :found], rtol=1e-6)
+                self.assertIsInstance(index.vectors, np.memmap)
+                self.assertLess(index.codes.nbytes, self.embeddings.nbytes / 3)
+
+                # An update rewrites the file and maps the new rows
+                index.update(appended_embeddings=self.queries[:1])
+                self.assertEqual(np.load(path).shape, (121, 16))
+                self.assertEqual(index.search(self.queries[:1], top_k=1)[1][0, 0], 120)
+
+            with self.assertRaises(ValueError):
+                QuantizedIndex(self.embeddings, "int4")
+
+    ######################################################################
+    # Module: test_quantized_mapped_vectors
+    # Description: Tests that a matrix mapped from vectors_path is only
+    #              used in place when its rows are declared normalized;
+    #              otherwise the normalized rows are written to the file.
+    ######################################################################
+    def test_quantized_mapped_vectors(self):
+        expected = ExactIndex(self.embeddings).search(self.queries, top_k=5)[1]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "vectors.npy")
+            np.save(path, self.embeddings)
+            index = QuantizedIndex(np.load(path, mmap_mode="r"), vectors_path=path)
+            np.testing.assert_allclose(np.linalg.norm(np.load(path), axis=1), 1.0, rtol=1e-5)
+            np.testing.assert_array_equal(index.search(self.queries, top_k=5)[1], expected)
+
+            # The file now holds unit rows, which are used without a write
+            mapped = np.load(path, mmap_mode="r")
+            before = os.stat(path).st_mtime_ns, os.stat(path).st_ino
+            index = QuantizedIndex(mapped, vectors_path=path, normalized=True)
+            self.assertEqual((os.stat(path).st_mtime_ns, os.stat(path).st_ino), before)
+            self.assertTrue(np.shares_memory(index.vectors, mapped))
+
+            # A mapping of another file is written to vectors_path
+            other = os.path.join(tmp, "other.npy")
+            index = QuantizedIndex(mapped, vectors_path=other, normalized=True)
+            self.assertTrue(os.path.exists(other))
+            self.assertFalse(np.shares_memory(index.vectors, mapped))
+
+    ######################################################################
+    # Module: test_half_precision_rows
+    # Description: Tests that normalized float16 rows are scored without a
+    #              copy and rank the entries like float32 rows.
+    ######################################################################
+    def test_half_precision_rows(self):
+        vectors = normalize_rows(self.embeddings).astype(np.float16)
+        expected = ExactIndex(self.embeddings).search(self.queries, 5)[1]
+
+        for backend, options in (("exact", {}), ("ivf", {"n_lists": 4, "n_probe": 4}), ("quantized", {})):
+            index = create_index(backend, vectors, normalized=True, **options)
+            self.assertIs(index.vectors, vectors)
+            np.testing.assert_array_equal(index.search(self.queries, 5)[1], expected)
+
+            index.update(appended_embeddings=self.queries[:1])
+            self.assertEqual(index.vectors.dtype, np.float16)
+            self.assertEqual(index.search(self.queries[:1], top_k=1)[1][0, 0], 120)
+
+    ######################################################################
+    # Module: test_fuse_rankings
+    # Description: Tests that entries ranked well by both rankings win and
+    #              that padding is skipped.
+    ######################################################################
+    def test_fuse_rankings(self):
+        self.assertEqual(fuse_rankings([[4, 1, 2], [1, 3, -1]], top_k=3), [1, 4, 3])
+        self.assertEqual(fuse_rankings([[-1], [-1]], top_k=3), [])
+
+    ######################################################################
+    # Module: test_create_index
+    # Description: Tests that backends are created by name and that an
+    #              unknown name is rejected.
+    ######################################################################
+    def test_create_index(self):
+        self.assertIsInstance(create_index("exact", self.embeddings), ExactIndex)
+        self.assertIsInstance(create_index("ivf", self.embeddings, n_probe=2), IVFIndex)
+        self.assertIsInstance(create_index("quantized", self.embeddings, quantization="binary"), QuantizedIndex)
+
+        with self.assertRaises(ValueError):
+            create_index("hnsw", self.embeddings)
+
+##############################################
+### Entry point of test_retrieval_index.py ###
+##############################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,251 @@
+# File: test_server.py
+# Author: William Jahner
+
+import asyncio
+import json
+import re
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+from app.main import NewParentAIAssistantApp
+from app.server import AssistantServer, MicroBatcher, MAX_BODY_BYTES, SERVER_LOGGER
+from app.services.kb_loader import load_knowledge_base
+from app.services.model_registry import ModelRegistry
+
+######################################################################
+# Class: MicroBatcherTests
+# Description: This class is for testing the MicroBatcher.
+######################################################################
+class MicroBatcherTests(unittest.IsolatedAsyncioTestCase):
+
+    ######################################################################
+    # Module: asyncSetUp
+    # Description: A special method used to prepare the test environment
+    #              before each test method runs.
+    ######################################################################
+    async def asyncSetUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    ######################################################################
+    # Module: asyncTearDown
+    # Description: A special method used to clean up the test environment
+    #              after each test method runs.
+    ######################################################################
+    async def asyncTearDown(self):
+        self.executor.shutdown(wait=True)
+
+    ######################################################################
+    # Module: test_coalesces_concurrent_items
+    # Description: Tests that items submitted together are processed in
+    #              one batch and each caller gets its own result.
+    ######################################################################
+    async def test_coalesces_concurrent_items(self):
+        process_batch = MagicMock(side_effect=lambda items: [item.upper() for item in items])
+        batcher = MicroBatcher(process_batch, self.executor, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+
+        results = await asyncio.gather(*(batcher.submit(q) for q in ["a", "b", "c"]))
+        await batcher.stop()
+
+        self.assertEqual(results, ["A", "B", "C"])
+        process_batch.assert_called_once_with(["a", "b", "c"])
+        self.assertEqual((batcher.batch_count, batcher.item_count), (1, 3))
+
+    ######################################################################
+    # Module: test_respects_max_batch_size
+    # Description: Tests that batches never exceed max_batch_size.
+    ######################################################################
+    async def test_respects_max_batch_size(self):
+        sizes = []
+        batcher = MicroBatcher(lambda items: sizes.append(len(items)) or items, self.executor,
+                               max_batch_size=2, max_wait_ms=50)
+        batcher.start()
+
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        await batcher.stop()
+
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+        self.assertEqual(sizes, [2, 2, 1])
+
+    ######################################################################
+    # Module: test_propagates_errors
+    # Description: Tests that a failing batch raises in every caller.
+    ######################################################################
+    async def test_propagates_errors(self):
+        batcher = MicroBatcher(MagicMock(side_effect=RuntimeError("Model failure")), self.executor)
+        batcher.start()
+
+        with self.assertRaises(RuntimeError):
+            await batcher.submit("a")
+        await batcher.stop()
+
+######################################################################
+# Class: AssistantServerTests
+# Description: This class is for testing the AssistantServer.
+######################################################################
+class AssistantServerTests(unittest.IsolatedAsyncioTestCase):
+
+    ######################################################################
+    # Module: asyncSetUp
+    # Description: A special method used to prepare the test environment
+    #              before each test method runs.
+    ######################################################################
+    async def asyncSetUp(self):
+        self.app = NewParentAIAssistantApp(load_knowledge_base(), registry=ModelRegistry({}))
+        self.app.answer_questions = MagicMock(side_effect=lambda questions: [f"answer to {q}" for q in questions])
+        self.server = AssistantServer(self.app, port=0, max_wait_ms=50)
+        await self.server.start()
+
+    ######################################################################
+    # Module: asyncTearDown
+    # Description: A special method used to clean up the test environment
+    #              after each test method runs.
+    ######################################################################
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    ######################################################################
+    # Module: request
+    # Description: A helper function that sends one HTTP request and
+    #              returns the status code and decoded JSON (or text) body.
+    ######################################################################
+    async def request(self, method, path, body=b""):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.server.port)
+        writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+
+        head, _, payload = response.partition(b"\r\n\r\n")
+        if b"application/json" not in head:
+            return int(head.split()[1]), payload.decode("utf-8")
+        return int(head.split()[1]), json.loads(payload)
+
+    ######################################################################
+    # Module: test_health
+    # Description: Tests the health check endpoint.
+    ######################################################################
+    async def test_health(self):
+        self.assertEqual(await self.request("GET", "/health"), (200, {"status": "ok"}))
+
+    ######################################################################
+    # Module: test_logs_bound_port
+    # Description: Tests that the port picked for port 0 is logged.
+    ######################################################################
+    async def test_logs_bound_port(self):
+        server = AssistantServer(self.app, port=0)
+        with self.assertLogs(SERVER_LOGGER, level="INFO") as logs:
+            await server.start()
+        await server.close()
+
+        self.assertIn(f"http://127.0.0.1:{server.port}", logs.output[0])
+
+    ######################################################################
+    # Module: test_answers_without_model
+    # Description: Tests that questions with a cheaper route never reach
+    #              the NLP service.
+    ######################################################################
+    async def test_answers_without_model(self):
+        body = json.dumps({"question": "What are the milestones for a 6 month old?"}).encode("utf-8")
+        status, payload = await self.request("POST", "/answer", body)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["route"], "milestone")
+        self.assertIn("Developmental milestones for 6 months", payload["answer"])
+        self.app.answer_questions.assert_not_called()
+
+    ######################################################################
+    # Module: test_batches_concurrent_nlp_questions
+    # Description: Tests that concurrent NLP questions are answered with a
+    #              single batched call.
+    ######################################################################
+    async def test_batches_concurrent_nlp_questions(self):
+        questions = ["When do babies teethe?", "Why do babies hiccup?", "Is spit up normal?"]
+        bodies = [json.dumps({"question": q}).encode("utf-8") for q in questions]
+
+        responses = await asyncio.gather(*(self.request("POST", "/answer", b) for b in bodies))
+
+        for question, (status, payload) in zip(questions, responses):
+            self.assertEqual(status, 200)
+            self.assertEqual(payload["route"], "nlp")
+            self.assertEqual(payload["answer"], f"answer to {question}")
+        self.app.answer_questions.assert_called_once()
+        self.assertEqual(sorted(self.app.answer_questions.call_args[0][0]), sorted(questions))
+
+    ######################################################################
+    # Module: test_metrics
+    # Description: Tests that the app's metrics are served as Prometheus
+    #              text and as JSON.
+    ######################################################################
+    async def test_metrics(self):
+        self.app.metrics.enabled = True
+        body = json.dumps({"question": "What are the milestones for a 6 month old?"}).encode("utf-8")
+        await self.request("POST", "/answer", body)
+
+        status, text = await self.request("GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertIn('assistant_stage_seconds_count{stage="milestone_list"} 1', text)
+        self.assertIn('assistant_events_total{event="route_milestone"} 1', text)
+
+        status, payload = await self.request("GET", "/metrics?format=json")
+        self.assertEqual(payload["counters"], {"route_milestone": 1})
+
+    ######################################################################
+    # Module: test_rejects_bad_requests
+    # Description: Tests the error responses for invalid requests.
+    ######################################################################
+    async def test_rejects_bad_requests(self):
+        self.assertEqual((await self.request("POST", "/answer", b"not json"))[0], 400)
+        self.assertEqual((await self.request("POST", "/answer", b'{"question": ""}'))[0], 400)
+        self.assertEqual((await self.request("GET", "/answer"))[0], 405)
+        self.assertEqual((await self.request("GET", "/unknown"))[0], 404)
+
+    ######################################################################
+    # Module: test_oversized_body_closes_connection
+    # Description: Tests that a too large body is answered with 413
+    #              without being read, and that the connection is closed
+    #              so the body is not parsed as the next request.
+    ######################################################################
+    async def test_oversized_body_closes_connection(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.server.port)
+        writer.write(f"POST /answer HTTP/1.1\r\nContent-Length: {MAX_BODY_BYTES + 1}\r\n\r\n".encode("latin-1")
+                     + b"GET /health HTTP/1.1\r\n\r\n")
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+
+        self.assertEqual(re.findall(rb"HTTP/1\.1 (\d+)", response), [b"413"])
+        self.assertIn(b"Connection: close", response)
+
+######################################################################
+# Class: ReloadTests
+# Description: This class is for testing knowledge base hot reload.
+######################################################################
+class ReloadTests(unittest.IsolatedAsyncioTestCase):
+
+    ######################################################################
+    # Module: test_applies_knowledge_base_edits
+    # Description: Tests that edits reported by the watcher are applied to
+    #              the app while serving.
+    ######################################################################
+    async def test_applies_knowledge_base_edits(self):
+        app = MagicMock()
+        watcher = MagicMock(entries=[("feeding", "Offer water")])
+        watcher.check.side_effect = lambda: "diff" if watcher.check.call_count == 2 else None
+        server = AssistantServer(app, port=0, watcher=watcher, reload_interval_s=0.01)
+        await server.start()
+
+        for _ in range(100):
+            if app.update_knowledge_base.called:
+                break
+            await asyncio.sleep(0.01)
+        await server.close()
+
+        app.update_knowledge_base.assert_called_once_with([("feeding", "Offer water")], "diff")
+
+#####################################
+### Entry point of test_server.py ###
+#####################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# File: test_workers.py
+# Author: William Jahner
+
+import os
+import unittest
+from tempfile import TemporaryDirectory
+import numpy as np
+from app.main import NewParentAIAssistantApp
+from app.services.kb_loader import load_knowledge_base
+from app.services.knowledge_store import KnowledgeStore
+from app.services.metrics import Metrics, STAGE_INDEX_BUILD, STAGE_SEARCH
+from app.services.retrieval_index import ExactIndex
+from app.services.store_snapshot import load_snapshot, save_snapshot
+from app.workers import WorkerPool
+from benchmarks.stub_models import stub_registry
+
+######################################################################
+# Class: TestStoreSnapshot
+# Description: This class is for testing the shared store snapshots.
+######################################################################
+class TestStoreSnapshot(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_round_trip
+    # Description: Tests that a mapped snapshot holds the same entries,
+    #              labels and (normalized, read-only) embeddings.
+    ######################################################################
+    def test_round_trip(self):
+        kb = [("milestones - 6 months - social_emotional", "Smiles at people"),
+              ("feeding - 6 months - solids", "Introduce purées"),
+              ("sleeping", "Newborns sleep 14 to 17 hours")]
+        store = KnowledgeStore.from_entries(kb)
+        store.embeddings = [[3.0, 4.0], [0.0, 2.0], [1.0, 0.0]]
+
+        with TemporaryDirectory() as tmp:
+            save_snapshot(store, tmp)
+            mapped = load_snapshot(tmp)
+
+            self.assertEqual(list(mapped), kb)
+            self.assertEqual(mapped.rows(category="milestones", age="6 months").tolist(), [0])
+            np.testing.assert_allclose(mapped.embeddings, [[0.6, 0.8], [0.0, 1.0], [1.0, 0.0]])
+            self.assertFalse(mapped.embeddings.flags.writeable)
+
+            # The index uses the mapped rows as they are
+            index = ExactIndex(mapped.embeddings, normalized=True)
+            self.assertTrue(np.shares_memory(index.vectors, mapped.embeddings))
+            del index, mapped
+
+    ######################################################################
+    # Module: test_requires_embeddings
+    # Description: Tests that a store without embeddings is rejected.
+    ######################################################################
+    def test_requires_embeddings(self):
+        with TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                save_snapshot(KnowledgeStore.from_entries([("sleeping", "Naps")]), tmp)
+
+######################################################################
+# Class: TestWorkerPool
+# Description: This class is for testing the process worker pool.
+######################################################################
+class TestWorkerPool(unittest.TestCase):
+
+    ######################################################################
+    # Module: test_workers_answer_like_the_app
+    # Description: Tests that worker processes give the answers of the
+    #              in-process app and remove their snapshot on close.
+    ######################################################################
+    def test_workers_answer_like_the_app(self):
+        app = NewParentAIAssistantApp(load_knowledge_base(), registry=stub_registry())
+        questions = ["When can my baby start eating rice cereal?", "Why does my baby wake up crying at night?"]
+
+        with TemporaryDirectory() as tmp:
+            with WorkerPool(app, 2, threads=1, registry_factory=stub_registry, snapshot_root=tmp) as pool:
+                self.assertEqual(len(pool.warm_up()), 2)
+                self.assertEqual(pool.answer_questions(questions), app.answer_questions(questions))
+            self.assertEqual(os.listdir(tmp), [])
+
+    ######################################################################
+    # Module: test_worker_metrics
+    # Description: Tests that the stages timed in the workers (including
+    #              their index build) are merged into the metrics of the
+    #              app.
+    ######################################################################
+    def test_worker_metrics(self):
+        app = NewParentAIAssistantApp(load_knowledge_base(), registry=stub_registry(), metrics=Metrics(enabled=True))
+        app.embeddings
+        builds = app.metrics.snapshot()["stages"][STAGE_INDEX_BUILD]["count"]
+
+        with TemporaryDirectory() as tmp:
+            with WorkerPool(app, 1, threads=1, registry_factory=stub_registry, snapshot_root=tmp) as pool:
+                pool.answer_questions(["Why does my baby wake up crying at night?"])
+                pool.answer_questions(["When can my baby start eating rice cereal?"])
+
+        stages = app.metrics.snapshot()["stages"]
+        self.assertEqual(stages[STAGE_SEARCH]["count"], 2)
+        self.assertEqual(stages[STAGE_INDEX_BUILD]["count"], builds + 1)
+
+######################################
+### Entry point of test_workers.py ###
+######################################
+if __name__ == "__main__":
+    unittest.main()